@@ -1,5 +1,3 @@
-import tkinter as tk
-from tkinter import ttk, filedialog, messagebox, simpledialog
 import requests
 from urllib3.util.retry import Retry
 from requests.adapters import HTTPAdapter
@@ -7,1747 +5,3723 @@ import json
 from pathlib import Path
 import configparser
 from datetime import datetime
-from tkinter import scrolledtext
+from email.utils import parsedate_to_datetime
 import traceback
 import threading
 from queue import Queue, Empty
 import re
 import os
+import sys
+import argparse
+import contextlib
+import http.server
+import math
+import multiprocessing
+import random
+import tempfile
 import queue
 import time
-from openpyxl import Workbook
-from openpyxl.styles import Font, Alignment, PatternFill, Border, Side
-from openpyxl.utils import get_column_letter
-from tkinter import ttk, filedialog, messagebox, scrolledtext, simpledialog
-import tkinter as tk
+import hashlib
+import subprocess
+import sqlite3
+from collections import OrderedDict, deque
+import asyncio
+import functools
+import itertools
+import concurrent.futures
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import tkinter as tk
+    from tkinter import ttk, filedialog, messagebox, scrolledtext, simpledialog
+except ImportError:
+    tk = None  # 无图形界面的环境（CI、批处理服务器）只能使用命令行模式
+
+try:
+    from openpyxl import Workbook
+    from openpyxl.styles import Font, Alignment, PatternFill, Border, Side
+    from openpyxl.utils import get_column_letter
+except ImportError:
+    Workbook = None  # 仅导出Excel报告时需要
+
+try:
+    import resource  # 仅用于基准测试统计峰值内存，Windows上不可用
+except ImportError:
+    resource = None
+
+try:
+    import aiohttp  # 可选依赖：安装后请求引擎使用原生异步HTTP，否则回退到连接池+线程
+except ImportError:
+    aiohttp = None
+
+# 提示词结构版本号，修改提示词格式时递增，使旧的缓存结果失效
+PROMPT_VERSION = 2
+
+
+def estimate_tokens(text):
+    """快速估算文本的令牌数
+
+    BPE分词器中ASCII代码平均约3.5个字符一个令牌，中文等非ASCII字符约每字一个令牌。
+    非ASCII字符数由UTF-8编码后多出的字节数推算，只做一次编码，不逐字符遍历。
+    """
+    length = len(text)
+    non_ascii = (len(text.encode('utf-8', errors='surrogatepass')) - length) // 2
+    return int((length - non_ascii) / 3.5 + non_ascii) + 1
+
+
+class ApiSessionPool:
+    """线程安全的长连接HTTP会话池，所有API请求共享同一组TCP/TLS连接"""
+
+    def __init__(self, pool_size=10):
+        self.pool_size = pool_size
+        self._lock = threading.Lock()
+
+        # 带重试机制的适配器，只创建一次，连接在请求之间保持复用
+        # 429及其Retry-After由全局限流器统一处理，这里不在单个线程内各自等待重试
+        retries = Retry(
+            total=3,
+            backoff_factor=1.0,
+            status_forcelist=[500, 502, 503, 504],
+            allowed_methods=["POST", "GET"],
+            respect_retry_after_header=False
+        )
+        self.adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size, max_retries=retries)
+
+        self.session = requests.Session()
+        self.session.mount('https://', self.adapter)
+        self.session.mount('http://', self.adapter)
+
+    def post(self, url, **kwargs):
+        """通过共享连接池发送POST请求"""
+        return self.session.post(url, **kwargs)
+
+    def get(self, url, **kwargs):
+        """通过共享连接池发送GET请求"""
+        return self.session.get(url, **kwargs)
+
+    def stats(self):
+        """统计连接池命中情况：命中为复用已有连接的请求数，未命中为新建连接数"""
+        hits = 0
+        misses = 0
+        with self._lock:
+            pools = self.adapter.poolmanager.pools
+            for key in list(pools.keys()):
+                pool = pools.get(key)
+                if pool is None:
+                    continue
+                misses += pool.num_connections
+                hits += max(pool.num_requests - pool.num_connections, 0)
+        return {'hits': hits, 'misses': misses, 'pool_size': self.pool_size}
+
+    def close(self):
+        """关闭所有连接"""
+        self.session.close()
+
+
+class AsyncRequestEngine:
+    """基于asyncio的LLM请求引擎
+
+    所有代码块请求都运行在同一个后台事件循环中，取代原来“文件线程池 × 分块线程池”的嵌套线程模型。
+    在途HTTP请求数只由自适应并发控制器(ConcurrencyController)限制，在途数和峰值也只在控制器中统计。
+    """
+
+    # 与requests端Retry保持一致的可重试状态码
+    RETRY_STATUS = (500, 502, 503, 504)
+    # 与requests端Retry(total=3)一致的重试次数
+    RETRIES = 3
+
+    def __init__(self, max_concurrency=50, initial_concurrency=None):
+        self.max_concurrency = max_concurrency
+        # 实际HTTP在途请求数由自适应控制器在1到max_concurrency之间调整
+        self.controller = ConcurrencyController(max_concurrency, initial_concurrency)
+        self.loop = asyncio.new_event_loop()
+        self._http_session = None
+        self._io_executor = None
+        self._storage_executor = None
+
+        # 启动后台事件循环线程，等待控制器在循环内完成初始化
+        ready = threading.Event()
+        self._thread = threading.Thread(target=self._run_loop, args=(ready,), daemon=True,
+                                        name="LLMRequestEngine")
+        self._thread.start()
+        ready.wait()
+
+    def _run_loop(self, ready):
+        """事件循环线程入口"""
+        asyncio.set_event_loop(self.loop)
+        self.controller.bind()
+        ready.set()
+        self.loop.run_forever()
+
+    def submit(self, coro_func, *args):
+        """从任意线程提交协程任务，返回concurrent.futures.Future"""
+        return asyncio.run_coroutine_threadsafe(coro_func(*args), self.loop)
+
+    def open_queue(self, handler, workers=None, capacity=None):
+        """创建项目级代码块工作队列，由固定数量的工作协程从中取任务执行，capacity为队列中最多等待的单元数"""
+        return ChunkWorkQueue(self, handler, workers or self.max_concurrency, capacity)
+
+    async def run_blocking(self, func, *args):
+        """在线程池中执行阻塞调用（未安装aiohttp时的HTTP回退路径）"""
+        if self._io_executor is None:
+            self._io_executor = ThreadPoolExecutor(max_workers=self.max_concurrency,
+                                                   thread_name_prefix="LLMRequestIO")
+        return await self.loop.run_in_executor(self._io_executor, functools.partial(func, *args))
+
+    async def run_storage(self, func, *args):
+        """在单独的单线程执行器中执行本地存储操作（结果缓存读写），不阻塞事件循环，也不与HTTP回退路径争用线程"""
+        if self._storage_executor is None:
+            self._storage_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="LLMRequestStorage")
+        return await self.loop.run_in_executor(self._storage_executor, functools.partial(func, *args))
+
+    def _client_session(self, timeout):
+        """返回共享的aiohttp会话和本次请求的超时设置"""
+        if self._http_session is None or self._http_session.closed:
+            self._http_session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.max_concurrency)
+            )
+        connect_timeout, read_timeout = timeout
+        return self._http_session, aiohttp.ClientTimeout(sock_connect=connect_timeout, sock_read=read_timeout)
 
+    async def post_json(self, url, headers, payload, timeout=(10, 60)):
+        """使用aiohttp发送POST请求，返回(状态码, 响应文本, 响应头)
 
-class CodeAuditApp:
-    def __init__(self, root):
-        self.event_queue = Queue()
-        self.root = root
-        # API验证错误提示状态标志
-        self.api_validation_error_shown = False
-        self.validation_lock = threading.Lock()  # 添加线程锁
-        self.root.title("DeepAudit 代码审计工具")
-        self.root.geometry("1280x800")
+        5xx错误以及连接失败、连接被重置、读取超时等传输错误按指数退避重试RETRIES次，与requests端urllib3的
+        Retry行为一致，最后一次仍失败时抛出原异常。
+        """
+        session, client_timeout = self._client_session(timeout)
+        for attempt in range(self.RETRIES + 1):
+            try:
+                async with session.post(url, headers=headers, json=payload, timeout=client_timeout) as response:
+                    text = await response.text()
+                    if response.status not in self.RETRY_STATUS or attempt == self.RETRIES:
+                        return response.status, text, response.headers
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                if attempt == self.RETRIES:
+                    raise
+            await asyncio.sleep(1.0 * (2 ** attempt))
+
+    async def post_stream(self, url, headers, payload, on_line, timeout=(10, 60)):
+        """使用aiohttp发送流式请求，200时逐行回调响应体并返回空文本，其余同post_json
+
+        已经回调过部分响应体后出现的传输错误不再重试，否则同一段输出会被重复处理。
+        """
+        session, client_timeout = self._client_session(timeout)
+        for attempt in range(self.RETRIES + 1):
+            delivered = False
+            try:
+                async with session.post(url, headers=headers, json=payload, timeout=client_timeout) as response:
+                    if response.status == 200:
+                        async for raw_line in response.content:
+                            delivered = True
+                            on_line(raw_line.decode('utf-8', errors='replace').rstrip('\r\n'))
+                        return response.status, '', response.headers
+                    text = await response.text()
+                    if response.status not in self.RETRY_STATUS or attempt == self.RETRIES:
+                        return response.status, text, response.headers
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                if delivered or attempt == self.RETRIES:
+                    raise
+            await asyncio.sleep(1.0 * (2 ** attempt))
+
+    def shutdown(self):
+        """关闭HTTP会话并停止事件循环"""
+        if self._http_session is not None:
+            asyncio.run_coroutine_threadsafe(self._http_session.close(), self.loop).result(timeout=5)
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        if self._io_executor is not None:
+            self._io_executor.shutdown(wait=False)
+        if self._storage_executor is not None:
+            # 等待已提交的缓存写入完成，之后才会关闭结果缓存
+            self._storage_executor.shutdown(wait=True)
+
+
+class RateLimiter:
+    """请求数/令牌数双令牌桶限流器
+
+    每个请求发送前按预估令牌数申请额度，响应返回后用usage字段修正实际消耗。遇到429时所有请求
+    一起暂停到Retry-After指定的时间，并临时降低速率，之后随成功响应逐步恢复。
+    只在请求引擎的事件循环中使用，不需要加锁。
+    """
+
+    # 预估单次响应的输出令牌数，实际消耗在响应返回后修正
+    ESTIMATED_COMPLETION_TOKENS = 512
+
+    def __init__(self, requests_per_minute=0, tokens_per_minute=0):
+        # 0表示不限制
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self._request_bucket = float(requests_per_minute)
+        self._token_bucket = float(tokens_per_minute)
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        # 没有Retry-After时的暂停秒数，连续429时翻倍
+        self._backoff = 1.0
+        # 429后临时降低的速率系数
+        self.rate_scale = 1.0
+        self.rate_limited_count = 0
+        self.wait_seconds = 0.0
+
+    @classmethod
+    def estimate_tokens(cls, request_json):
+        """粗略估算请求消耗的令牌数（提示词 + 预估输出）"""
+        prompt = ''.join(message.get('content', '') for message in request_json.get('messages', []))
+        return estimate_tokens(prompt) + cls.ESTIMATED_COMPLETION_TOKENS
+
+    @staticmethod
+    def parse_retry_after(value):
+        """解析Retry-After头（秒数或HTTP日期），无法解析时返回None"""
+        if not value:
+            return None
+        try:
+            return max(float(value), 0.0)
+        except ValueError:
+            pass
+        try:
+            return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+        except (TypeError, ValueError):
+            return None
 
-        # 初始化漏洞列表
-        self.vulnerabilities = {}
+    def _refill(self, now):
+        elapsed = now - self._updated
+        self._updated = now
+        if self.requests_per_minute:
+            rate = self.requests_per_minute * self.rate_scale / 60
+            self._request_bucket = min(self.requests_per_minute, self._request_bucket + elapsed * rate)
+        if self.tokens_per_minute:
+            rate = self.tokens_per_minute * self.rate_scale / 60
+            self._token_bucket = min(self.tokens_per_minute, self._token_bucket + elapsed * rate)
+
+    async def acquire(self, estimated_tokens):
+        """等待直到请求数和令牌数额度都足够"""
+        while True:
+            now = time.monotonic()
+            self._refill(now)
+            wait = self._paused_until - now
+            if wait <= 0:
+                wait = 0.0
+                if self.requests_per_minute and self._request_bucket < 1:
+                    rate = self.requests_per_minute * self.rate_scale / 60
+                    wait = (1 - self._request_bucket) / rate
+                # 单个请求超过桶容量时只要求桶满，避免永远等待
+                needed = min(estimated_tokens, self.tokens_per_minute)
+                if self.tokens_per_minute and self._token_bucket < needed:
+                    rate = self.tokens_per_minute * self.rate_scale / 60
+                    wait = max(wait, (needed - self._token_bucket) / rate)
+                if wait <= 0:
+                    if self.requests_per_minute:
+                        self._request_bucket -= 1
+                    if self.tokens_per_minute:
+                        self._token_bucket -= estimated_tokens
+                    return
+            self.wait_seconds += wait
+            await asyncio.sleep(wait)
 
-        # 初始化分析状态
-        self.auto_analysis_cancelled = False
-        self.auto_analysis_paused = False
-        self.api_validation_error_shown = False  # 移除validation_lock的使用
+    def record_usage(self, estimated_tokens, total_tokens):
+        """用响应中的实际令牌数修正预扣额度，并逐步恢复被429降低的速率"""
+        if self.tokens_per_minute and total_tokens is not None:
+            self._token_bucket -= total_tokens - estimated_tokens
+        self._backoff = 1.0
+        self.rate_scale = min(1.0, self.rate_scale + 0.05)
 
-        # 初始化进度相关变量
-        self.progress_var = tk.IntVar(value=0)
-        self.progress_bar = None
-        self.files_to_analyze = []
+    def on_rate_limited(self, retry_after=None):
+        """收到429：暂停所有请求并降低速率
 
-        # 添加API验证状态标志，用于记录API是否已验证成功
-        self.api_validated = False
+        Returns:
+            float: 本次暂停的秒数
+        """
+        delay = retry_after if retry_after is not None else self._backoff
+        self._backoff = min(self._backoff * 2, 60.0)
+        self._paused_until = max(self._paused_until, time.monotonic() + delay)
+        self.rate_scale = max(0.1, self.rate_scale * 0.5)
+        self.rate_limited_count += 1
+        return delay
+
+
+class ConcurrencyController:
+    """自适应并发控制器（AIMD）
+
+    每个成功响应把并发上限加 1/上限（约每轮往返加1）；超时、429、5xx和连接失败时上限减半，
+    同一冷却期内只减一次；最近响应的p95延迟超过历史最佳p95的两倍时视为排队拥塞，上限下调10%。
+    并发上限因此跟随接口当前能承受的吞吐变化，而不是固定值。只在请求引擎的事件循环中使用。
+    """
+
+    # 视为拥塞的状态码：超时、限流、服务端错误、连接失败
+    CONGESTION_STATUS = (408, 429, 500, 502, 503, 504)
+    # 延迟统计窗口大小
+    LATENCY_WINDOW = 50
+
+    def __init__(self, max_limit, initial_limit=None, min_limit=1):
+        self.max_limit = max(1, max_limit)
+        self.min_limit = min(min_limit, self.max_limit)
+        self.limit = float(min(initial_limit or self.max_limit, self.max_limit))
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self._latencies = deque(maxlen=self.LATENCY_WINDOW)
+        self._baseline_p95 = None
+        self._last_decrease = 0.0
+        self._condition = None
+
+    def bind(self):
+        """在事件循环内创建条件变量"""
+        self._condition = asyncio.Condition()
+
+    @property
+    def current_limit(self):
+        return max(self.min_limit, int(self.limit))
+
+    def p95_latency(self):
+        if not self._latencies:
+            return None
+        ordered = sorted(self._latencies)
+        return ordered[max(0, int(len(ordered) * 0.95) - 1)]
+
+    async def acquire(self):
+        """等待并发额度，返回请求开始时间"""
+        async with self._condition:
+            await self._condition.wait_for(lambda: self.in_flight < self.current_limit)
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        return time.monotonic()
+
+    async def release(self, started, status_code):
+        """请求结束：按结果调整并发上限并唤醒等待者"""
+        now = time.monotonic()
+        if status_code in self.CONGESTION_STATUS:
+            self._decrease(now, 0.5)
+        elif status_code == 200:
+            self._latencies.append(now - started)
+            self._on_success(now)
+
+        async with self._condition:
+            self.in_flight -= 1
+            self._condition.notify_all()
+
+    def _on_success(self, now):
+        if len(self._latencies) >= self.LATENCY_WINDOW // 2:
+            p95 = self.p95_latency()
+            if self._baseline_p95 is None or p95 < self._baseline_p95:
+                self._baseline_p95 = p95
+            elif p95 > self._baseline_p95 * 2:
+                self._decrease(now, 0.9)
+                return
+        self.limit = min(self.max_limit, self.limit + 1 / self.limit)
 
-        # 启动事件处理循环
-        self.root.after(100, self.process_event_queue)
+    def _decrease(self, now, factor):
+        # 冷却期取最近的p95延迟（至少1秒），避免同一批失败把上限连续减半
+        cooldown = max(1.0, self.p95_latency() or 0.0)
+        if now - self._last_decrease < cooldown:
+            return
+        self._last_decrease = now
+        self.limit = max(self.min_limit, self.limit * factor)
+
+
+class TruncatedResponseError(ValueError):
+    """模型输出达到max_tokens被截断，objects为截断前已经完整输出的漏洞对象"""
+
+    def __init__(self, objects):
+        super().__init__("API响应被截断，请尝试减少代码量或增加max_tokens参数")
+        self.objects = objects
+
+
+class StreamingCompletion:
+    """流式(SSE)响应的增量解析器
+
+    逐行读取 `data: {...}` 事件，拼接模型输出，并在输出中的每个JSON对象闭合时立即回调，
+    不必等整个响应结束就能显示第一个漏洞。结束后可还原成非流式响应的格式，供后续解析和缓存使用。
+    """
+
+    def __init__(self, on_object):
+        self.on_object = on_object
+        self.content = ''
+        self.finish_reason = None
+        self.usage = None
+        self.done = False
+        # 增量扫描状态：只跟踪对象内部的字符串，避免代码块外的说明文字干扰
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._object_start = None
+
+    @classmethod
+    def complete_objects(cls, text):
+        """取出文本中所有已经闭合的顶层JSON对象，用于解析被截断的模型输出"""
+        objects = []
+        parser = cls(objects.append)
+        parser.content = text
+        parser._scan()
+        return objects
+
+    def feed_line(self, line):
+        """处理一行SSE数据"""
+        if not line or not line.startswith('data:'):
+            return
+        data = line[5:].strip()
+        if data == '[DONE]':
+            self.done = True
+            return
+        try:
+            event = json.loads(data)
+        except ValueError:
+            return
 
-        # 新增配置初始化（关键修复）
-        self.config = configparser.ConfigParser()
-        self.config_path = Path.cwd() / 'config.ini'
-        if not self.config_path.exists():
-            self.config['DEFAULT'] = {
-                'API_KEY': '',
-                'API_ENDPOINT': 'https://api.deepseek.com/v1/chat/completions',
-                'TIMEOUT': '30'
-            }
-            self._save_config()
+        if event.get('usage'):
+            self.usage = event['usage']
+        for choice in event.get('choices') or []:
+            if choice.get('finish_reason'):
+                self.finish_reason = choice['finish_reason']
+            delta = (choice.get('delta') or {}).get('content')
+            if delta:
+                self.content += delta
+                self._scan()
+
+    def _scan(self):
+        """从上次的位置继续扫描，回调新闭合的顶层对象"""
+        text = self.content
+        i = self._pos
+        while i < len(text):
+            ch = text[i]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == '\\':
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+            elif ch == '"' and self._depth > 0:
+                self._in_string = True
+            elif ch == '{':
+                if self._depth == 0:
+                    self._object_start = i
+                self._depth += 1
+            elif ch == '}' and self._depth > 0:
+                self._depth -= 1
+                if self._depth == 0:
+                    try:
+                        obj = json.loads(text[self._object_start:i + 1])
+                    except ValueError:
+                        obj = None
+                    if isinstance(obj, dict):
+                        self.on_object(obj)
+            i += 1
+        self._pos = i
+
+    def to_response_text(self):
+        """还原为非流式响应的JSON文本"""
+        response = {
+            "choices": [{
+                "finish_reason": self.finish_reason,
+                "message": {"role": "assistant", "content": self.content}
+            }]
+        }
+        if self.usage is not None:
+            response["usage"] = self.usage
+        return json.dumps(response, ensure_ascii=False)
+
+
+class BraceLexer:
+    """逐行跟踪大括号深度的词法状态机，忽略字符串、注释、heredoc/nowdoc和Java文本块中的大括号
+
+    状态跨行保持（块注释、多行字符串、heredoc、文本块、PHP的?>之后的HTML），每行只用正则在关键字符之间
+    跳转一遍，耗时与代码长度成线性关系。depth与原来的大括号栈一致：多余的右大括号不会使深度变为负数。
+    """
+
+    _JAVA_TOKEN = re.compile(r'[{}]|"""|["\']|//|/\*')
+    _PHP_TOKEN = re.compile(r'[{}]|["\'`]|//|/\*|#(?!\[)|<<<[ \t]*(["\']?)([A-Za-z_]\w*)\1|\?>')
+    # 从字符串内部开始匹配到结束引号（含转义字符）
+    _STRING_END = {quote: re.compile(r'(?:[^%s\\]|\\.)*%s' % (quote, quote)) for quote in ('"', "'", '`')}
+    _TEXT_BLOCK_END = re.compile(r'(?:[^"\\]|\\.|"(?!""))*"""')
+
+    def __init__(self, language='java'):
+        self.php = language == 'php'
+        self.depth = 0
+        # None为代码，其余为 block/text/heredoc/html 或所在字符串的引号
+        self._state = None
+        self._heredoc_end = None
+        self._token = self._PHP_TOKEN if self.php else self._JAVA_TOKEN
+
+    def feed(self, line):
+        """处理一行代码，更新大括号深度"""
+        pos = 0
+        length = len(line)
+        if self._state == 'heredoc':
+            match = self._heredoc_end.match(line)
+            if not match:
+                return
+            self._state = None
+            pos = match.end()
+
+        while pos < length:
+            state = self._state
+            if state is None:
+                match = self._token.search(line, pos)
+                if not match:
+                    break
+                token = match.group(0)
+                pos = match.end()
+                if token == '{':
+                    self.depth += 1
+                elif token == '}':
+                    if self.depth:
+                        self.depth -= 1
+                elif token in ('//', '#'):
+                    break
+                elif token == '/*':
+                    self._state = 'block'
+                elif token == '"""':
+                    self._state = 'text'
+                elif token == '?>':
+                    self._state = 'html'
+                elif token.startswith('<<<'):
+                    # heredoc/nowdoc从下一行开始，到单独以标识符开头的行结束
+                    self._state = 'heredoc'
+                    self._heredoc_end = re.compile(r'[ \t]*' + re.escape(match.group(2)) + r'\b')
+                    break
+                else:
+                    self._state = token
+            elif state == 'block' or state == 'html':
+                end = line.find('*/' if state == 'block' else '<?', pos)
+                if end < 0:
+                    break
+                self._state = None
+                pos = end + 2
+            else:
+                pattern = self._TEXT_BLOCK_END if state == 'text' else self._STRING_END[state]
+                match = pattern.match(line, pos)
+                if not match:
+                    break
+                self._state = None
+                pos = match.end()
+
+        # Java的普通字符串不能跨行，未闭合时视为在行尾结束
+        if not self.php and self._state in ('"', "'"):
+            self._state = None
+
+
+class ChunkPacker:
+    """把多个小代码块打包进同一个API请求
+
+    与ChunkWorkQueue的put接口相同：令牌数不小于small_chunk_tokens的代码块单独成包直接放入队列，
+    小代码块（不限文件）依次累积，总令牌数达到token_budget或片段数达到max_segments时作为一个包放入队列。
+    队列中的每一项都是片段列表 [(chunk_info, file_path, index, total), ...]，包的优先级取其中片段的最高优先级。
+    """
+
+    def __init__(self, work_queue, token_budget=6000, small_chunk_tokens=800, max_segments=10):
+        self.work_queue = work_queue
+        self.token_budget = token_budget
+        self.small_chunk_tokens = small_chunk_tokens
+        self.max_segments = max_segments
+        self.packed_requests = 0
+        self.packed_segments = 0
+        self._pending = []
+        self._pending_tokens = 0
+        self._pending_priority = 0
+
+    def put(self, chunk_info, file_path, index, total, priority=0):
+        segment = (chunk_info, file_path, index, total)
+        tokens = estimate_tokens(chunk_info[0])
+        if self.token_budget <= 0 or tokens >= self.small_chunk_tokens:
+            self.work_queue.put([segment], priority=priority)
+            return
+        if self._pending and (self._pending_tokens + tokens > self.token_budget
+                              or len(self._pending) >= self.max_segments):
+            self._emit()
+        self._pending.append(segment)
+        self._pending_tokens += tokens
+        self._pending_priority = max(self._pending_priority, priority) if len(self._pending) > 1 else priority
+
+    def flush(self):
+        """放入剩余的小代码块"""
+        if self._pending:
+            self._emit()
+
+    def _emit(self):
+        if len(self._pending) > 1:
+            self.packed_requests += 1
+            self.packed_segments += len(self._pending)
+        self.work_queue.put(self._pending, priority=self._pending_priority)
+        self._pending = []
+        self._pending_tokens = 0
+        self._pending_priority = 0
+
+
+class ChunkDeduplicator:
+    """按内容哈希去除重复的代码块
+
+    与ChunkPacker的put接口相同。代码块文本规范化（统一换行符、去掉行尾空白）后与文件类型一起计算哈希，
+    同一内容只有第一次出现的代码块放入下游队列，之后出现的副本暂存起来；第一份的分析结果出来后通过
+    on_duplicate(副本片段, 第一份的起始行号, 漏洞列表, 是否失败) 分发给每个副本。规范化不改变行数，
+    副本的行号按起始行之差平移即可。put和resolve可以在不同线程中调用。
+    """
+
+    def __init__(self, target, on_duplicate):
+        self.target = target
+        self.on_duplicate = on_duplicate
+        self.total_chunks = 0
+        self.duplicate_chunks = 0
+        self.duplicate_files = 0
+        self._units = {}
+        self._lock = threading.Lock()
+        self._file_has_unique = False
+
+    @staticmethod
+    def make_key(chunk_info, file_path):
+        normalized = '\n'.join(line.rstrip() for line in chunk_info[0].splitlines())
+        return file_path.suffix.lower(), hashlib.sha1(normalized.encode('utf-8', 'replace')).hexdigest()
+
+    def put(self, chunk_info, file_path, index, total, priority=0):
+        """放入一个代码块，返回是否作为新内容放入了下游队列"""
+        segment = (chunk_info, file_path, index, total)
+        key = self.make_key(chunk_info, file_path)
+        if index == 0:
+            self._file_has_unique = False
+        with self._lock:
+            self.total_chunks += 1
+            unit = self._units.get(key)
+            if unit is None:
+                self._units[key] = {'line_start': chunk_info[1], 'followers': [], 'result': None}
+            elif unit['result'] is None:
+                unit['followers'].append(segment)
+            result = None if unit is None else unit['result']
+        if unit is None:
+            self._file_has_unique = True
+            self.target.put(chunk_info, file_path, index, total, priority=priority)
         else:
-            self.config.read(self.config_path, encoding='utf-8')
+            self.duplicate_chunks += 1
+            if result is not None:
+                self.on_duplicate(segment, unit['line_start'], *result)
+        # 一个文件的代码块是连续放入的，最后一块时统计整个文件是否与已有内容完全相同
+        if index == total - 1 and not self._file_has_unique:
+            self.duplicate_files += 1
+        return unit is None
+
+    def flush(self):
+        self.target.flush()
+
+    def resolve(self, segment, vulnerabilities, failed=False):
+        """记录第一份代码块的分析结果（行号已对应原始文件），并分发给已登记的副本"""
+        key = self.make_key(segment[0], segment[1])
+        with self._lock:
+            unit = self._units.get(key)
+            if unit is None or unit['result'] is not None:
+                return
+            unit['result'] = (list(vulnerabilities), failed)
+            followers, unit['followers'] = unit['followers'], []
+        for follower in followers:
+            self.on_duplicate(follower, unit['line_start'], *unit['result'])
+
+    @property
+    def unique_chunks(self):
+        return self.total_chunks - self.duplicate_chunks
+
+    def ratio(self):
+        """去重比：代码块总数 / 实际分析的代码块数"""
+        return self.total_chunks / self.unique_chunks if self.unique_chunks else 1.0
+
+
+class ChunkWorkQueue:
+    """项目级代码块工作队列
+
+    所有文件的 (代码块, 文件, 序号, 总块数) 单元进入同一个队列，每个工作协程处理完一个单元后
+    立即从任意文件中取下一个，大文件不会再独占某个“文件槽位”。队列按优先级出队，优先级相同时先进先出。
+    队列中等待的单元最多为capacity个，队列满时put阻塞生产者（读取和分块线程），形成背压。
+    """
+
+    _STOP = object()
+    # 结束标记排在所有工作单元之后
+    _STOP_ENTRY = (math.inf, 0, _STOP)
+
+    def __init__(self, engine, handler, workers, capacity=None):
+        self.engine = engine
+        self.handler = handler
+        self.workers = workers
+        self.submitted = 0
+        self.completed = 0
+        self.auth_failed = False
+        self._closed = False
+        self._slots = threading.Semaphore(capacity or workers * 2)
+        self._sequence = itertools.count()
+
+        # 队列和工作协程都在引擎的事件循环中创建
+        self._queue = asyncio.run_coroutine_threadsafe(self._create_queue(), engine.loop).result()
+        self._done = asyncio.run_coroutine_threadsafe(self._run_workers(), engine.loop)
+
+    async def _create_queue(self):
+        return asyncio.PriorityQueue()
+
+    async def _run_workers(self):
+        await asyncio.gather(*(self._worker() for _ in range(self.workers)))
+
+    async def _worker(self):
+        """工作协程：循环从队列中取代码块执行，HTTP并发由请求引擎的自适应控制器限制"""
+        while True:
+            _, _, item = await self._queue.get()
+            if item is self._STOP:
+                return
+            self._slots.release()
+            try:
+                result = await self.handler(*item)
+                if result is False:
+                    self.auth_failed = True
+            finally:
+                self.completed += 1
 
-        # 修正API终端地址（添加/v1/chat/completions路径）
-        self.api_endpoint = self.config['DEFAULT'].get('API_ENDPOINT', 'https://api.deepseek.com/v1/chat/completions')
-        self.api_key = self.config.get('DEFAULT', 'API_KEY', fallback='')
-        print(f"[DEBUG] 最终API终端: {self.api_endpoint}")
+    def put(self, *item, priority=0):
+        """从任意线程放入一个工作单元，队列已满时阻塞到有工作协程取走单元，priority越大越先处理
 
-        # 初始化项目路径为当前目录
-        self.project_path = Path.cwd()  # 新增默认路径初始化
+        Returns:
+            bool: 队列已被取消时返回False，单元未放入
+        """
+        while not self._slots.acquire(timeout=0.5):
+            if self._done.done():
+                return False
+        self.submitted += 1
+        self.engine.loop.call_soon_threadsafe(self._queue.put_nowait, (-priority, next(self._sequence), item))
+        return True
 
-        # 初始化核心组件
-        self._init_ui()
-        self._bind_events()
+    def close(self):
+        """不再放入新单元，工作协程处理完剩余单元后退出"""
+        if self._closed:
+            return
+        self._closed = True
+        for _ in range(self.workers):
+            self.engine.loop.call_soon_threadsafe(self._queue.put_nowait, self._STOP_ENTRY)
 
-        # 添加全局ID计数器
-        self.vuln_id_counter = 1
+    def join(self, timeout=None):
+        """等待所有工作协程退出，超时返回False"""
+        try:
+            self._done.result(timeout=timeout)
+        except concurrent.futures.TimeoutError:
+            return False
+        except concurrent.futures.CancelledError:
+            pass
+        return True
 
-        # 添加控制自动分析的状态变量
-        self.auto_analysis_paused = False
-        self.auto_analysis_cancelled = False
-        self.auto_analysis_thread = None
+    def cancel(self):
+        """取消所有工作协程，丢弃未处理的单元"""
+        self._closed = True
+        self._done.cancel()
+
+
+class ResponseCache:
+    """按内容寻址的分析结果磁盘缓存
+
+    键为 (提示词版本, 模型, 提示模板, 文件类型, 代码块文本) 的SHA-256，值为解析后的漏洞列表
+    （行号相对于代码块），内容未变化的代码块再次扫描时无需重新调用API。
+    数据库使用WAL模式，读取命中时只在内存中记录访问时间，随下一次写入、淘汰或关闭批量提交。
+    各方法都是阻塞调用，请求引擎中通过 AsyncRequestEngine.run_storage 在单独的线程中调用。
+    """
+
+    def __init__(self, db_path, max_bytes=200 * 1024 * 1024, max_age_days=30):
+        self.db_path = Path(db_path)
+        self.max_bytes = max_bytes
+        self.max_age_days = max_age_days
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        # 尚未写入数据库的访问时间 {键: 时间}
+        self._accessed = {}
+
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(self.db_path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, vulnerabilities TEXT NOT NULL, size INTEGER NOT NULL, "
+            "created REAL NOT NULL, last_access REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_last_access ON responses(last_access)")
+        self._conn.commit()
+
+    @staticmethod
+    def make_key(model, prompt_template, file_ext, chunk_text):
+        """计算缓存键"""
+        payload = json.dumps([PROMPT_VERSION, model, prompt_template, file_ext, chunk_text], ensure_ascii=False)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        """命中时返回漏洞列表，未命中返回None"""
+        with self._lock:
+            row = self._conn.execute("SELECT vulnerabilities FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._accessed[key] = time.time()
+        return json.loads(row[0])
+
+    def put(self, key, vulnerabilities):
+        """保存代码块的解析结果，同一事务中写入之前记录的访问时间"""
+        data = json.dumps(vulnerabilities, ensure_ascii=False)
+        now = time.time()
+        with self._lock:
+            self._write_access_times()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, vulnerabilities, size, created, last_access) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (key, data, len(data.encode('utf-8')), now, now)
+            )
+            self._conn.commit()
 
-        # 修改初始化顺序，立即开始配置初始化
-        self.delayed_config_init()
+    def _write_access_times(self):
+        """把内存中记录的访问时间写入当前事务（调用方持有锁并负责提交）"""
+        if self._accessed:
+            self._conn.executemany("UPDATE responses SET last_access = ? WHERE key = ?",
+                                   [(accessed, key) for key, accessed in self._accessed.items()])
+            self._accessed = {}
 
-        # 不再自动验证API密钥，只在需要时验证
-        self.status_bar.config(text="就绪")
+    def evict(self):
+        """删除过期条目，并按最近访问时间淘汰直到总大小不超过上限
 
-    def _init_configuration(self):
-        """统一配置初始化"""
-        self.config = configparser.ConfigParser()
-        self.config_path = Path("config.ini")
+        Returns:
+            int: 删除的条目数
+        """
+        removed = 0
+        with self._lock:
+            self._write_access_times()
+            cutoff = time.time() - self.max_age_days * 86400
+            removed += self._conn.execute("DELETE FROM responses WHERE created < ?", (cutoff,)).rowcount
+
+            total_size = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+            if total_size > self.max_bytes:
+                rows = self._conn.execute("SELECT key, size FROM responses ORDER BY last_access").fetchall()
+                stale_keys = []
+                for key, size in rows:
+                    if total_size <= self.max_bytes:
+                        break
+                    stale_keys.append((key,))
+                    total_size -= size
+                self._conn.executemany("DELETE FROM responses WHERE key = ?", stale_keys)
+                removed += len(stale_keys)
+            self._conn.commit()
+        return removed
+
+    def reset_stats(self):
+        """重置命中统计（每次扫描开始时调用）"""
+        self.hits = 0
+        self.misses = 0
+
+    def hit_rate(self):
+        """返回本次扫描的缓存命中率"""
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def close(self):
+        with self._lock:
+            self._write_access_times()
+            self._conn.commit()
+            self._conn.close()
+
+
+class ResultStore:
+    """扫描结果的SQLite持久化存储
+
+    按扫描(scans)、文件(files)、代码块(chunks)和漏洞(findings)四张表保存结果，漏洞按扫描、文件、风险等级和
+    漏洞类型建立索引。数据库使用WAL模式，所有写操作放入队列，由唯一的写线程批量写入（每批最多BATCH_SIZE条或
+    等待FLUSH_INTERVAL秒），分析线程和界面线程不会被磁盘写入阻塞；查询使用独立的只读连接。
+    扫描和漏洞的ID在放入队列时就已分配，界面可以立即用ID删除记录。
+    数据库被锁定时整批重试；仍然失败时逐个操作单独提交，只丢弃确实无法写入的操作，丢弃的行数计入
+    write_errors，发生丢弃的扫描在finish_scan时标记为partial。
+    """
+
+    BATCH_SIZE = 500
+    FLUSH_INTERVAL = 0.2
+    # 数据库被锁定时的重试次数，每次等待时间翻倍
+    LOCK_RETRIES = 5
+
+    SCHEMA = [
+        "CREATE TABLE IF NOT EXISTS scans (id INTEGER PRIMARY KEY, project TEXT NOT NULL, model TEXT NOT NULL, "
+        "started REAL NOT NULL, finished REAL, status TEXT NOT NULL)",
+        "CREATE TABLE IF NOT EXISTS files (id INTEGER PRIMARY KEY, path TEXT NOT NULL UNIQUE)",
+        "CREATE TABLE IF NOT EXISTS chunks (id INTEGER PRIMARY KEY, scan_id INTEGER, file_id INTEGER NOT NULL, "
+        "line_start INTEGER NOT NULL, line_end INTEGER NOT NULL, finding_count INTEGER NOT NULL)",
+        "CREATE TABLE IF NOT EXISTS findings (id INTEGER PRIMARY KEY, scan_id INTEGER, file_id INTEGER NOT NULL, "
+        "severity TEXT NOT NULL, vuln_type TEXT NOT NULL, line_start INTEGER, data TEXT NOT NULL)",
+        "CREATE INDEX IF NOT EXISTS idx_chunks_scan_file ON chunks(scan_id, file_id)",
+        "CREATE INDEX IF NOT EXISTS idx_findings_scan ON findings(scan_id)",
+        "CREATE INDEX IF NOT EXISTS idx_findings_file ON findings(file_id)",
+        "CREATE INDEX IF NOT EXISTS idx_findings_severity ON findings(severity)",
+        "CREATE INDEX IF NOT EXISTS idx_findings_type ON findings(vuln_type)",
+    ]
+
+    _STOP = object()
+
+    def __init__(self, db_path, on_error=None):
+        """
+        Args:
+            on_error: 写入失败时的回调，参数为错误信息，默认输出到标准错误
+        """
+        self.db_path = Path(db_path)
+        self.on_error = on_error
+        self.write_errors = 0
+        self._scan_errors = {}
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        conn = self._connect()
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            for statement in self.SCHEMA:
+                conn.execute(statement)
+            conn.commit()
+            next_scan = conn.execute("SELECT COALESCE(MAX(id), 0) + 1 FROM scans").fetchone()[0]
+            next_finding = conn.execute("SELECT COALESCE(MAX(id), 0) + 1 FROM findings").fetchone()[0]
+        finally:
+            conn.close()
+        self._scan_ids = itertools.count(next_scan)
+        self._finding_ids = itertools.count(next_finding)
+        self._id_lock = threading.Lock()
+        self._queue = Queue()
+        self._writer = threading.Thread(target=self._write_loop, name="ResultStoreWriter", daemon=True)
+        self._writer.start()
+
+    def _connect(self):
+        conn = sqlite3.connect(str(self.db_path), timeout=30)
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    # ------------------ 写入（任意线程调用，只放入队列） ------------------ #
+    def begin_scan(self, project_path, model):
+        """登记一次扫描，返回扫描ID"""
+        with self._id_lock:
+            scan_id = next(self._scan_ids)
+        self._scan_errors[scan_id] = self.write_errors
+        self._queue.put(("INSERT INTO scans (id, project, model, started, status) VALUES (?, ?, ?, ?, 'running')",
+                         [(scan_id, str(project_path), model, time.time())]))
+        return scan_id
+
+    def finish_scan(self, scan_id, status):
+        """记录扫描结束，扫描期间有结果未能写入时状态改为partial，返回最终状态"""
+        self.flush()
+        if self.write_errors > self._scan_errors.pop(scan_id, self.write_errors):
+            status = 'partial'
+        self._queue.put(("UPDATE scans SET finished = ?, status = ? WHERE id = ?", [(time.time(), status, scan_id)]))
+        return status
+
+    def add_findings(self, scan_id, file_path, vulnerabilities):
+        """保存一个文件新发现的漏洞（行号已对应原始文件），返回各漏洞的ID"""
+        if not vulnerabilities:
+            return []
+        with self._id_lock:
+            ids = [next(self._finding_ids) for _ in vulnerabilities]
+        path = str(file_path)
+        rows = []
+        for finding_id, vuln in zip(ids, vulnerabilities):
+            lines = vuln.get("行号") or []
+            rows.append((finding_id, scan_id, str(vuln.get("风险等级", "")).strip(), str(vuln.get("漏洞类型", "")).strip(),
+                         min(lines) if lines else None, json.dumps(vuln, ensure_ascii=False), path))
+        self._queue.put(("INSERT OR IGNORE INTO files (path) VALUES (?)", [(path,)]))
+        self._queue.put(("INSERT INTO findings (id, scan_id, severity, vuln_type, line_start, data, file_id) "
+                         "VALUES (?, ?, ?, ?, ?, ?, (SELECT id FROM files WHERE path = ?))", rows))
+        return ids
+
+    def add_chunk(self, scan_id, file_path, line_start, line_end, finding_count):
+        """记录一个已完成的代码块"""
+        path = str(file_path)
+        self._queue.put(("INSERT OR IGNORE INTO files (path) VALUES (?)", [(path,)]))
+        self._queue.put(("INSERT INTO chunks (scan_id, line_start, line_end, finding_count, file_id) "
+                         "VALUES (?, ?, ?, ?, (SELECT id FROM files WHERE path = ?))",
+                         [(scan_id, line_start, line_end, finding_count, path)]))
+
+    def delete_findings(self, finding_ids):
+        """按ID删除漏洞"""
+        if finding_ids:
+            self._queue.put(("DELETE FROM findings WHERE id = ?", [(finding_id,) for finding_id in finding_ids]))
+
+    def delete_file_findings(self, scan_ids, file_path):
+        """删除指定扫描中某个文件的全部漏洞"""
+        self._queue.put(("DELETE FROM findings WHERE scan_id = ? AND file_id = (SELECT id FROM files WHERE path = ?)",
+                         [(scan_id, str(file_path)) for scan_id in scan_ids]))
+
+    def flush(self):
+        """等待队列中的写操作全部提交"""
+        self._queue.join()
+
+    def close(self):
+        """提交剩余的写操作并停止写线程"""
+        if self._writer.is_alive():
+            self._queue.put(self._STOP)
+            self._writer.join()
+
+    def _write_loop(self):
+        """写线程：取出一批写操作，在同一个事务中执行"""
+        conn = self._connect()
+        try:
+            while True:
+                batch = [self._queue.get()]
+                deadline = time.monotonic() + self.FLUSH_INTERVAL
+                while batch[-1] is not self._STOP and sum(len(rows) for _, rows in batch) < self.BATCH_SIZE:
+                    try:
+                        batch.append(self._queue.get(timeout=max(0.0, deadline - time.monotonic())))
+                    except Empty:
+                        break
+                stop = batch[-1] is self._STOP
+                operations = batch[:-1] if stop else batch
+                try:
+                    self._execute(conn, operations)
+                finally:
+                    for _ in batch:
+                        self._queue.task_done()
+                if stop:
+                    return
+        finally:
+            conn.close()
 
-        # 初始化API相关配置
-        self.api_key = self.config.get('DEFAULT', 'API_KEY', fallback='')
-        self.api_endpoint = self.config.get('DEFAULT', 'API_ENDPOINT',
-                                            fallback='https://api.deepseek.com/v1/chat/completions')
+    def _execute(self, conn, operations):
+        """在一个事务中执行一批写操作，数据库被锁定时重试；失败的批次拆成单个操作分别提交"""
+        error = None
+        for attempt in range(self.LOCK_RETRIES + 1):
+            try:
+                with conn:
+                    for statement, rows in operations:
+                        conn.executemany(statement, rows)
+                return
+            except sqlite3.OperationalError as e:
+                error = e
+                message = str(e).lower()
+                if ('locked' not in message and 'busy' not in message) or attempt == self.LOCK_RETRIES:
+                    break
+                time.sleep(0.1 * (2 ** attempt))
+            except Exception as e:
+                error = e
+                break
+        if len(operations) > 1:
+            for operation in operations:
+                self._execute(conn, [operation])
+            return
+        lost = len(operations[0][1])
+        self.write_errors += lost
+        message = f"写入结果数据库失败，丢弃 {lost} 条记录: {str(error)}"
+        if self.on_error is not None:
+            self.on_error(message)
+        else:
+            print(f"[ERROR] {message}", file=sys.stderr)
+
+    # ------------------ 查询 ------------------ #
+    def query(self, scan_ids=None, file_path=None, severity=None, vuln_type=None, limit=None):
+        """按扫描、文件、风险等级和漏洞类型查询漏洞（均走索引），返回 [(漏洞ID, 文件路径, 漏洞字典), ...]"""
+        return list(self.iter_findings(scan_ids, file_path, severity, vuln_type, limit))
+
+    def iter_findings(self, scan_ids=None, file_path=None, severity=None, vuln_type=None, limit=None):
+        """与query相同，但逐行产出结果，导出大量漏洞时内存占用不随结果数增长"""
+        self.flush()
+        clauses, params = [], []
+        if scan_ids is not None:
+            scan_ids = list(scan_ids)
+            if not scan_ids:
+                return
+            clauses.append(f"f.scan_id IN ({', '.join('?' * len(scan_ids))})")
+            params.extend(scan_ids)
+        if file_path is not None:
+            clauses.append("f.file_id = (SELECT id FROM files WHERE path = ?)")
+            params.append(str(file_path))
+        if severity is not None:
+            clauses.append("f.severity = ?")
+            params.append(severity)
+        if vuln_type is not None:
+            clauses.append("f.vuln_type = ?")
+            params.append(vuln_type)
+        sql = "SELECT f.id, p.path, f.data FROM findings f JOIN files p ON p.id = f.file_id"
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        sql += " ORDER BY f.id"
+        if limit:
+            sql += f" LIMIT {int(limit)}"
+        conn = self._connect()
+        try:
+            for finding_id, path, data in conn.execute(sql, params):
+                yield finding_id, path, json.loads(data)
+        finally:
+            conn.close()
 
-        # 初始化日志路径
-        self.log_file = self.project_path / 'error.log'
-        self.api_log_file = self.project_path / 'api.log'
+    def file_findings(self, scan_id):
+        """按文件逐个产出一次扫描中的漏洞 (文件路径, [漏洞字典, ...])，同一时间只有一个文件的漏洞在内存中"""
+        self.flush()
+        conn = self._connect()
+        try:
+            cursor = conn.execute("SELECT p.path, f.data FROM findings f JOIN files p ON p.id = f.file_id "
+                                  "WHERE f.scan_id = ? ORDER BY f.file_id, f.id", (scan_id,))
+            for path, rows in itertools.groupby(cursor, key=lambda row: row[0]):
+                yield path, [json.loads(data) for _, data in rows]
+        finally:
+            conn.close()
 
-        # 支持的语言类型
-        self.supported_langs = {
-            '.php': 'php',
-            '.java': 'java',
-            '.js': 'javascript',
-            '.html': 'html',
-            '.xml': 'xml'
-        }
+    def scans(self, limit=20):
+        """最近的扫描记录及漏洞数量"""
+        self.flush()
+        conn = self._connect()
+        try:
+            return conn.execute(
+                "SELECT s.id, s.project, s.model, s.started, s.finished, s.status, "
+                "(SELECT COUNT(*) FROM findings f WHERE f.scan_id = s.id) "
+                "FROM scans s ORDER BY s.id DESC LIMIT ?", (limit,)
+            ).fetchall()
+        finally:
+            conn.close()
 
-        # 风险等级颜色
-        self.severity_colors = {
-            '高危': '#ff4444',
-            '中危': '#ffa500',
-            '低危': '#4CAF50'
-        }
 
-        # 延迟加载非必要配置
-        self.root.after(500, self.load_full_config)
+class ScanManifest:
+    """增量扫描清单
 
-    def _init_ui(self):
-        """界面组件初始化"""
-        # 主框架
-        main_frame = ttk.Frame(self.root)
-        main_frame.pack(fill=tk.BOTH, expand=True)
+    记录项目中每个文件上次扫描时的大小、修改时间、内容哈希和发现的漏洞。自动分析时只有新增或修改的
+    文件需要发送给API，未修改文件直接沿用上次的结果。清单按项目路径保存在 .deepaudit/manifests 下。
+    """
 
-        # 工具栏
-        self._init_toolbar(main_frame)
+    VERSION = 1
 
-        # 创建可调整大小的面板容器
-        self.main_paned = ttk.PanedWindow(main_frame, orient=tk.HORIZONTAL)
-        self.main_paned.pack(fill=tk.BOTH, expand=True)
+    def __init__(self, manifest_path, project_path, model):
+        self.manifest_path = Path(manifest_path)
+        self.project_path = Path(project_path)
+        self.model = model
+        self.files = {}
+        self._pending = {}
+        self.load()
 
-        # 初始化左侧文件树和右侧面板
-        self._init_file_tree(self.main_paned)
-        self._init_right_panel(self.main_paned)
+    @classmethod
+    def for_project(cls, project_path, model):
+        """返回项目对应的清单（不存在时为空清单）"""
+        project_key = hashlib.sha1(str(Path(project_path).resolve()).encode('utf-8')).hexdigest()[:16]
+        manifest_path = Path.cwd() / '.deepaudit' / 'manifests' / f"{project_key}.json"
+        return cls(manifest_path, project_path, model)
 
-        # 状态栏
-        self._init_status_bar()
-        # 延迟设置分隔条位置，确保窗口已完全渲染
-        self.root.after(100, self._set_initial_pane_position)
+    def load(self):
+        """读取清单，提示词版本或模型不一致时丢弃旧结果"""
+        self.files = {}
+        if not self.manifest_path.exists():
+            return
+        try:
+            with open(self.manifest_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"[ERROR] 读取扫描清单失败: {str(e)}")
+            return
+        if (data.get('version') != self.VERSION or data.get('prompt_version') != PROMPT_VERSION
+                or data.get('model') != self.model):
+            print("[DEBUG] 扫描清单与当前模型或提示词版本不一致，执行全量扫描")
+            return
+        self.files = data.get('files', {})
 
-    def _set_initial_pane_position(self):
-        """设置PanedWindow的初始分隔条位置"""
+    def _relative_key(self, file_path):
         try:
-            # 确保窗口已经渲染
-            self.root.update_idletasks()
+            return Path(file_path).resolve().relative_to(self.project_path.resolve()).as_posix()
+        except ValueError:
+            return Path(file_path).resolve().as_posix()
 
-            # 获取窗口宽度
-            window_width = self.root.winfo_width()
+    def classify(self, file_paths):
+        """把文件分为需要分析的文件和可沿用结果的文件
 
-            # 如果窗口宽度有效，设置分隔条位置为窗口宽度的1/4
-            if window_width > 100:  # 确保窗口宽度有效
-                left_panel_width = int(window_width / 5)  # 左侧面板占1/4
-                self.main_paned.sashpos(0, left_panel_width)
+        大小和修改时间都未变化时直接认为未修改，否则再比较内容哈希。
+
+        Returns:
+            tuple: (新增或修改的文件列表, [(未修改的文件, 上次的漏洞列表)])
+        """
+        changed, unchanged = [], []
+        self._pending = {}
+        for file_path in file_paths:
+            vulnerabilities = self.check(file_path)
+            if vulnerabilities is None:
+                changed.append(file_path)
             else:
-                # 如果窗口宽度无效，使用固定宽度
-                self.main_paned.sashpos(0, 200)  # 默认左侧面板宽度为250像素
+                unchanged.append((file_path, vulnerabilities))
+        return changed, unchanged
 
-            # 记录初始宽度，以便窗口调整时保持比例
-            self.initial_left_width = self.main_paned.sashpos(0)
+    def check(self, file_path):
+        """检查单个文件是否未修改，用于边遍历目录边比对
 
-        except Exception as e:
-            self.log_error(f"设置分隔条位置失败: {str(e)}")
-            # 出错时使用默认值
-            self.main_paned.sashpos(0, 200)
+        大小和修改时间都未变化时直接认为未修改，否则再比较内容哈希。
 
-    def export_vulnerabilities(self):
-        """将漏洞结果导出为Excel文档"""
-        if not self.result_tree.get_children():
-            messagebox.showwarning("导出失败", "没有可导出的漏洞信息")
-            return
+        Returns:
+            list: 未修改时返回上次的漏洞列表，新增或修改（包括无法读取）时返回None
+        """
+        key = self._relative_key(file_path)
+        try:
+            stat = file_path.stat()
+        except OSError:
+            return None
+        entry = self.files.get(key)
+        if entry and entry['size'] == stat.st_size and entry['mtime'] == stat.st_mtime:
+            return entry['vulnerabilities']
 
         try:
-            # 生成带时间戳的文件名
-            timestamp = time.strftime("%Y%m%d_%H%M%S")
-            default_filename = f"漏洞报告_{timestamp}.xlsx"
+            with open(file_path, 'rb') as f:
+                content_hash = hashlib.sha1(f.read()).hexdigest()
+        except OSError:
+            return None
 
-            # 获取保存文件路径
-            filepath = filedialog.asksaveasfilename(
-                defaultextension=".xlsx",
-                filetypes=[("Excel文件", "*.xlsx")],
-                initialfile=default_filename
-            )
+        if entry and entry['hash'] == content_hash:
+            # 内容未变化（例如只是被touch或重新检出），刷新元数据后沿用结果
+            entry['size'] = stat.st_size
+            entry['mtime'] = stat.st_mtime
+            return entry['vulnerabilities']
+        self._pending[key] = {'size': stat.st_size, 'mtime': stat.st_mtime, 'hash': content_hash}
+        return None
 
-            if not filepath:
-                return  # 用户取消了保存
+    def update(self, file_path, vulnerabilities):
+        """记录已完整分析的文件及其结果"""
+        key = self._relative_key(file_path)
+        pending = self._pending.pop(key, None)
+        if pending is None:
+            return
+        pending['vulnerabilities'] = vulnerabilities
+        self.files[key] = pending
+
+    def prune(self, file_paths):
+        """删除已不存在于项目中的文件记录"""
+        keep = {self._relative_key(file_path) for file_path in file_paths}
+        for key in list(self.files):
+            if key not in keep:
+                del self.files[key]
+
+    def save(self):
+        """原子写入清单文件"""
+        data = {
+            'version': self.VERSION,
+            'prompt_version': PROMPT_VERSION,
+            'model': self.model,
+            'files': self.files,
+        }
+        self.manifest_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.manifest_path.with_suffix('.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp_path, self.manifest_path)
 
-            # 创建Excel工作簿
-            wb = Workbook()
-            ws = wb.active
-            if ws is None:  # 检查ws是否为None
-                ws = wb.create_sheet()
 
-            # 设置工作表标题
-            if hasattr(ws, 'title'):
-                ws.title = "漏洞扫描报告"
+class ScanJournal:
+    """扫描检查点日志
 
-            # 设置列宽 - 使用更合适的宽度单位，openpyxl中的宽度单位约为Excel中的0.14倍
-            column_widths = {
-                'A': 4,  # ID
-                'B': 12,  # 漏洞类型
-                'C': 12,  # 风险等级
-                'D': 50,  # 文件路径
-                'E': 60,  # 漏洞描述
-                'F': 40,  # 风险点
-                'G': 40,  # Payload
-                'H': 60,  # 修复建议
-                'I': 10,  # 行号
-            }
+    扫描过程中每完成一个代码块，就把 (文件内容哈希, 起始行, 结束行) 和该代码块的漏洞追加写入JSON Lines文件，
+    程序崩溃、断网或中途取消后，“继续扫描”会读取日志并跳过已完成的代码块，直接显示记录的结果。
+    日志按项目路径保存在 .deepaudit/journals 下，第一行记录提示词版本和模型，不一致时不能继续。
+    """
 
-            # 强制设置列宽并确保应用
-            if hasattr(ws, 'column_dimensions'):
-                for col, width in column_widths.items():
-                    # 直接设置列宽，不检查列是否存在
-                    ws.column_dimensions[col].width = width
-                    # 设置自动换行以确保内容完整显示
-                    ws.column_dimensions[col].bestFit = True
+    VERSION = 1
 
-            # 设置表头样式
-            header_font = Font(name='微软雅黑', bold=True, size=11)
-            header_fill = PatternFill(start_color="DDEBF7", end_color="DDEBF7", fill_type="solid")
-            header_alignment = Alignment(horizontal='center', vertical='center', wrap_text=True)
+    def __init__(self, journal_path, model):
+        self.journal_path = Path(journal_path)
+        self.model = model
+        self.completed = {}
+        self.replayed = 0
+        self._file = None
+        self._lock = threading.Lock()
 
-            # 设置边框样式
-            thin_border = Border(
-                left=Side(style='thin'),
-                right=Side(style='thin'),
-                top=Side(style='thin'),
-                bottom=Side(style='thin')
-            )
+    @classmethod
+    def for_project(cls, project_path, model):
+        project_key = hashlib.sha1(str(Path(project_path).resolve()).encode('utf-8')).hexdigest()[:16]
+        return cls(Path.cwd() / '.deepaudit' / 'journals' / f"{project_key}.jsonl", model)
 
-            # 添加表头
-            headers = ['ID', '漏洞类型', '风险等级', '文件路径', '漏洞描述', '风险点', 'Payload', '修复建议', '行号']
-            for col_num, header in enumerate(headers, 1):
-                if hasattr(ws, 'cell'):
-                    cell = ws.cell(row=1, column=col_num)
-                    if cell is not None:
-                        cell.value = header
-                        cell.font = header_font
-                        cell.fill = header_fill
-                        cell.alignment = header_alignment
-                        cell.border = thin_border
+    def _header(self):
+        return {'type': 'header', 'version': self.VERSION, 'prompt_version': PROMPT_VERSION, 'model': self.model}
 
-            # 添加基本信息
-            if hasattr(ws, 'merge_cells'):
-                ws.merge_cells('A1:I1')
+    def load(self):
+        """读取已完成的代码块，返回数量；日志不存在或与当前模型、提示词版本不一致时返回0
 
-            if hasattr(ws, 'cell'):
-                title_cell = ws.cell(row=1, column=1)
-                if title_cell is not None:
-                    title_cell.value = "漏洞扫描报告"
-                    title_cell.font = Font(name='微软雅黑', bold=True, size=14)
-                    title_cell.alignment = Alignment(horizontal='center', vertical='center')
+        崩溃时最后一行可能只写了一半，无法解析的行直接忽略。
+        """
+        self.completed = {}
+        if not self.journal_path.exists():
+            return 0
+        with open(self.journal_path, 'r', encoding='utf-8') as f:
+            for number, line in enumerate(f):
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                if number == 0:
+                    if any(record.get(key) != value for key, value in self._header().items()):
+                        print("[DEBUG] 检查点日志与当前模型或提示词版本不一致，无法继续")
+                        return 0
+                    continue
+                self.completed[(record['hash'], record['start'], record['end'])] = record['vulnerabilities']
+        return len(self.completed)
+
+    def open(self, resume=False):
+        """开始写入日志：resume为True时在原日志后追加，否则清空旧日志重新开始"""
+        self.journal_path.parent.mkdir(parents=True, exist_ok=True)
+        if resume and self.completed:
+            self._file = open(self.journal_path, 'a', encoding='utf-8')
+            return
+        self.completed = {}
+        self._file = open(self.journal_path, 'w', encoding='utf-8')
+        self._file.write(json.dumps({**self._header(), 'started': time.time()}) + '\n')
+        self._file.flush()
+
+    def lookup(self, file_hash, chunk_info):
+        """返回已完成代码块记录的漏洞（行号已对应原始文件），未完成时返回None"""
+        return self.completed.get((file_hash, chunk_info[1], chunk_info[2]))
+
+    def record(self, file_hash, chunk_info, vulnerabilities):
+        """追加一个已完成的代码块，每条记录写入后立即刷新到磁盘"""
+        line = json.dumps({'hash': file_hash, 'start': chunk_info[1], 'end': chunk_info[2],
+                           'vulnerabilities': vulnerabilities}, ensure_ascii=False)
+        with self._lock:
+            if self._file is None:
+                return
+            self._file.write(line + '\n')
+            self._file.flush()
+
+    def close(self, remove=False):
+        """关闭日志，remove为True（扫描已全部完成）时删除日志文件"""
+        with self._lock:
+            if self._file is not None:
+                os.fsync(self._file.fileno())
+                self._file.close()
+                self._file = None
+        if remove:
+            self.journal_path.unlink(missing_ok=True)
+
+
+class GitDiffScope:
+    """基于git差异的扫描范围
+
+    以基准版本(分支/标签/提交)为参照，找出工作区中新增或修改的文件及其变更行范围，
+    只有与变更行重叠的代码块才需要发送给模型，适合按提交或合并请求进行审计。
+    """
+
+    HUNK_PATTERN = re.compile(r'^@@ -\d+(?:,\d+)? \+(\d+)(?:,(\d+))? @@')
+
+    def __init__(self, repo_root, base_ref, changes):
+        self.repo_root = repo_root
+        self.base_ref = base_ref
+        # {文件绝对路径: [(起始行, 结束行), ...]}，值为None表示整个文件都是新增的
+        self.changes = changes
+
+    @staticmethod
+    def _run_git(cwd, *args):
+        result = subprocess.run(
+            ['git', '-c', 'core.quotepath=off', *args],
+            cwd=str(cwd), capture_output=True, text=True, encoding='utf-8', errors='replace'
+        )
+        if result.returncode != 0:
+            raise RuntimeError(result.stderr.strip() or f"git {' '.join(args)} 执行失败")
+        return result.stdout
 
-            # 添加报告信息
-            info_row = 2
-            if hasattr(ws, 'merge_cells') and hasattr(ws, 'cell'):
-                ws.merge_cells(f'A{info_row}:I{info_row}')
-                cell = ws.cell(row=info_row, column=1)
-                if cell is not None:
-                    cell.value = f"生成时间: {time.strftime('%Y-%m-%d %H:%M:%S')}"
+    @classmethod
+    def collect(cls, project_path, base_ref):
+        """读取项目相对基准版本的变更
 
-                info_row += 1
-                ws.merge_cells(f'A{info_row}:I{info_row}')
-                cell = ws.cell(row=info_row, column=1)
-                if cell is not None:
-                    cell.value = f"项目路径: {self.project_path}"
+        Raises:
+            RuntimeError: 项目不是git仓库、基准版本不存在或git不可用
+        """
+        try:
+            repo_root = Path(cls._run_git(project_path, 'rev-parse', '--show-toplevel').strip())
+        except FileNotFoundError:
+            raise RuntimeError("未找到git命令，请确认已安装git")
+        cls._run_git(repo_root, 'rev-parse', '--verify', f"{base_ref}^{{commit}}")
+
+        # 显式指定a/、b/前缀，不受用户diff.noprefix、diff.mnemonicPrefix配置的影响
+        diff_text = cls._run_git(project_path, 'diff', '-U0', '--no-color', '--no-ext-diff',
+                                 '--src-prefix=a/', '--dst-prefix=b/', base_ref, '--', '.')
+        changes = cls.parse_diff(diff_text, repo_root)
+
+        # 未跟踪的新文件不在diff中，整个文件都视为变更（-z输出不对路径加引号转义）
+        untracked = cls._run_git(project_path, 'ls-files', '-z', '--others', '--exclude-standard', '--full-name')
+        for name in untracked.split('\0'):
+            if name:
+                changes[repo_root / name] = None
+        return cls(repo_root, base_ref, changes)
+
+    @staticmethod
+    def _unquote_path(name):
+        """还原git对特殊字符路径的C风格引号转义，如 "b/a\\"b.php" 和八进制表示的UTF-8字节"""
+        if len(name) < 2 or name[0] != '"' or name[-1] != '"':
+            return name
+        escapes = {'a': 7, 'b': 8, 't': 9, 'n': 10, 'v': 11, 'f': 12, 'r': 13}
+        body = name[1:-1]
+        data = bytearray()
+        i = 0
+        while i < len(body):
+            if body[i] == '\\' and i + 1 < len(body):
+                octal = re.match(r'[0-7]{3}', body[i + 1:i + 4])
+                if octal:
+                    data.append(int(octal.group(0), 8))
+                    i += 4
+                    continue
+                data += bytes([escapes[body[i + 1]]]) if body[i + 1] in escapes else body[i + 1].encode('utf-8')
+                i += 2
+                continue
+            data += body[i].encode('utf-8')
+            i += 1
+        return data.decode('utf-8', errors='replace')
 
-                info_row += 1
-                ws.merge_cells(f'A{info_row}:I{info_row}')
-                cell = ws.cell(row=info_row, column=1)
-                if cell is not None:
-                    # 计算实际漏洞总数
-                    actual_vuln_count = len(self.result_tree.get_children())
-                    cell.value = f"发现漏洞总数: {actual_vuln_count}"
+    @classmethod
+    def parse_diff(cls, diff_text, repo_root):
+        """解析 `git diff -U0` 输出，返回每个文件在新版本中的变更行范围
 
-            # 添加表头（在信息行之后）
-            header_row = info_row + 2
-            for col_num, header in enumerate(headers, 1):
-                if hasattr(ws, 'cell'):
-                    cell = ws.cell(row=header_row, column=col_num)
-                    if cell is not None:
-                        cell.value = header
-                        cell.font = header_font
-                        cell.fill = header_fill
-                        cell.alignment = header_alignment
-                        cell.border = thin_border
+        路径含空格时git在“+++”行末尾追加一个制表符，含引号、反斜杠、控制字符等时整个路径带引号转义：
 
-            # 填充数据
-            row_num = header_row + 1
-            for item in self.result_tree.get_children():
-                values = self.result_tree.item(item, 'values')
+        >>> changes = GitDiffScope.parse_diff('+++ b/src/My File.php\\t\\n@@ -1,0 +2,3 @@\\n'
+        ...                                   '+++ "b/src/\\\\346\\\\226\\\\207 \\\\"q\\\\".php"\\n@@ -5 +5 @@', Path('/r'))
+        >>> [(path.name, ranges) for path, ranges in changes.items()]
+        [('My File.php', [(2, 4)]), ('文 "q".php', [(5, 5)])]
+        """
+        changes = {}
+        current = None
+        for line in diff_text.splitlines():
+            if line.startswith('+++ '):
+                target = cls._unquote_path(line[4:].rstrip('\t'))
+                if target == '/dev/null':
+                    # 已删除的文件无需分析
+                    current = None
+                    continue
+                if target.startswith('b/'):
+                    target = target[2:]
+                current = changes.setdefault(repo_root / target, [])
+            elif line.startswith('@@') and current is not None:
+                match = cls.HUNK_PATTERN.match(line)
+                if not match:
+                    continue
+                start = int(match.group(1))
+                count = int(match.group(2)) if match.group(2) is not None else 1
+                if count == 0:
+                    # 纯删除，标记删除位置所在的行，使包含它的代码块被重新审计
+                    current.append((max(start, 1), max(start, 1)))
+                else:
+                    current.append((start, start + count - 1))
+        return changes
+
+    def files(self):
+        """返回仍存在于工作区的变更文件"""
+        return [file_path for file_path in self.changes if file_path.is_file()]
+
+    def overlaps(self, file_path, line_start, line_end):
+        """判断代码块的行范围是否与该文件的变更行重叠"""
+        ranges = self.changes.get(file_path)
+        if ranges is None:
+            return file_path in self.changes
+        return any(start <= line_end and line_start <= end for start, end in ranges)
+
+
+class SinkPrefilter:
+    """本地预筛选：跳过既没有危险函数（sink）也没有外部输入（source）的代码块
+
+    每种语言的sink和source关键字各编译为一个多选正则，一次扫描即可判断是否命中。
+    只筛选php/java/javascript代码，html和xml（依赖配置、模板）始终发送给模型。
+
+    筛选级别:
+        off: 不筛选
+        loose: 命中任意sink或source的代码块才发送，跳过getter/setter、DTO、纯计算和import等代码块
+        strict: 只发送命中sink的代码块
+    """
+
+    LEVELS = ('off', 'loose', 'strict')
+
+    SINKS = {
+        'php': [
+            r'\b(?:eval|assert|create_function|call_user_func(?:_array)?|preg_replace|extract|parse_str)\s*\(',
+            r'\b(?:system|exec|shell_exec|passthru|popen|proc_open|pcntl_exec)\s*\(', r'`[^`\n]*\$',
+            r'\b(?:include|require)(?:_once)?\b', r'\bunserialize\s*\(', r'\bphar://',
+            r'\b(?:file_get_contents|file_put_contents|fopen|readfile|file|unlink|copy|rename|mkdir|rmdir'
+            r'|move_uploaded_file|opendir|scandir|glob|highlight_file|show_source|parse_ini_file)\s*\(',
+            r'\b(?:mysqli?_query|mysqli_multi_query|pg_query|sqlite_query|odbc_exec)\s*\(',
+            r'->\s*(?:query|exec|prepare|raw|whereRaw|selectRaw|orderByRaw|statement)\s*\(', r'\bDB::',
+            r'\b(?:curl_exec|curl_setopt|fsockopen|simplexml_load_string|simplexml_load_file|loadXML|libxml_disable_entity_loader)\b',
+            r'\b(?:header|setcookie|mail)\s*\(', r'\b(?:echo|print)\b[^;\n]*\$', r'\bmd5\s*\(|\bsha1\s*\(|\brand\s*\(',
+        ],
+        'java': [
+            r'\bRuntime\.getRuntime\(\)|\bProcessBuilder\b|\.exec\s*\(', r'\bScriptEngine\b|\.eval\s*\(',
+            r'\b(?:createQuery|createNativeQuery|createSQLQuery|executeQuery|executeUpdate|prepareStatement'
+            r'|createStatement|addBatch|prepareCall)\s*\(', r'\.execute\s*\(', r'\b[jJ]dbcTemplate\b', r'\$\{',
+            r'\b(?:ObjectInputStream|readObject|readUnshared|XMLDecoder|XStream|Yaml|parseObject|enableDefaultTyping'
+            r'|activateDefaultTyping|readValue|Kryo|Hessian\w*)\b',
+            r'\b(?:DocumentBuilderFactory|SAXParserFactory|XMLInputFactory|SAXReader|SAXBuilder|TransformerFactory'
+            r'|XMLReader|SchemaFactory|Unmarshaller|XPath)\b',
+            r'\bnew\s+(?:File|FileInputStream|FileOutputStream|FileReader|FileWriter|RandomAccessFile|ZipFile)\s*\(',
+            r'\b(?:Files|Paths)\.\w+\s*\(', r'\.transferTo\s*\(|getOriginalFilename\s*\(',
+            r'\bnew\s+(?:URL|Socket)\s*\(|\bopenConnection\s*\(|\b(?:RestTemplate|HttpClient|OkHttpClient|WebClient)\b',
+            r'\.(?:sendRedirect|forward|include)\s*\(|\bgetWriter\s*\(|\bsetHeader\s*\(|\baddCookie\s*\(',
+            r'\bClass\.forName\s*\(|\.invoke\s*\(|\.getMethod\s*\(|\.newInstance\s*\(',
+            r'\bInitialContext\b|\.lookup\s*\(|\bDirContext\b',
+            r'\b(?:SpelExpressionParser|parseExpression|Ognl\w*|VelocityEngine|freemarker|TemplateEngine)\b',
+            r'\b(?:MessageDigest|Cipher|SecretKeySpec|KeyGenerator|TrustManager|HostnameVerifier)\b|\bnew\s+Random\s*\(',
+        ],
+        'javascript': [
+            r'\beval\s*\(|\bnew\s+Function\b|\bset(?:Timeout|Interval)\s*\(\s*[\'"`]',
+            r'\b(?:innerHTML|outerHTML|insertAdjacentHTML|dangerouslySetInnerHTML)\b|\bdocument\.write(?:ln)?\s*\(',
+            r'\bv-html\b|\.html\s*\(|\.append\s*\(',
+            r'\bchild_process\b|\b(?:exec|execSync|spawn|spawnSync|execFile)\s*\(',
+            r'\.(?:query|raw|execute)\s*\(', r'\brequire\s*\(\s*[^\'"`\s)]', r'\bfs\.\w+',
+            r'\blocation(?:\.href)?\s*=|\blocation\.(?:assign|replace)\s*\(|\bwindow\.open\s*\(|\.src\s*=',
+            r'\bpostMessage\s*\(|\b(?:unserialize|deserialize)\s*\(|\bres\.(?:send|redirect|render)\s*\(',
+        ],
+    }
+
+    SOURCES = {
+        'php': [
+            r'\$_(?:GET|POST|REQUEST|COOKIE|FILES|SERVER|ENV|SESSION)\b', r'\$HTTP_RAW_POST_DATA\b', r'php://input',
+            r'\bgetallheaders\s*\(', r'\$request->\s*(?:input|get|query|post|all|file|cookie|header)\b',
+            r'\b(?:Input|Request)::\w+', r'\brequest\(\)', r'\$this->input->',
+        ],
+        'java': [
+            r'@(?:RequestParam|PathVariable|RequestBody|RequestHeader|CookieValue|ModelAttribute'
+            r'|QueryParam|PathParam|FormParam|HeaderParam)\b',
+            r'@(?:GetMapping|PostMapping|PutMapping|DeleteMapping|PatchMapping|RequestMapping|Path|WebServlet)\b',
+            r'\bget(?:Parameter|ParameterValues|ParameterMap|ParameterNames|Header|Headers|Cookies|InputStream'
+            r'|Reader|QueryString|RequestURI|RequestURL|PathInfo|Part|Parts)\s*\(',
+            r'\b(?:HttpServletRequest|MultipartFile|ServletRequest)\b',
+        ],
+        'javascript': [
+            r'\breq\.(?:query|body|params|cookies|headers|files?)\b',
+            r'\blocation\.(?:hash|search|href|pathname)\b|\bdocument\.(?:URL|cookie|referrer|documentURI)\b',
+            r'\bwindow\.name\b', r'\baddEventListener\s*\(\s*[\'"]message', r'\b(?:localStorage|sessionStorage)\b',
+            r'\bURLSearchParams\b', r'\bprocess\.argv\b',
+        ],
+    }
+
+    def __init__(self, level='loose'):
+        level = str(level).strip().lower()
+        if level not in self.LEVELS:
+            raise ValueError(f"未知的预筛选级别: {level}，可选值: {', '.join(self.LEVELS)}")
+        self.level = level
+        self._sinks = {lang: re.compile('|'.join(f'(?:{p})' for p in patterns))
+                       for lang, patterns in self.SINKS.items()}
+        self._sources = {lang: re.compile('|'.join(f'(?:{p})' for p in patterns))
+                         for lang, patterns in self.SOURCES.items()}
+
+    def accepts(self, code, language):
+        """判断代码块是否需要发送给模型"""
+        if self.level == 'off' or language not in self._sinks:
+            return True
+        if self._sinks[language].search(code):
+            return True
+        return self.level == 'loose' and self._sources[language].search(code) is not None
+
+    def hits(self, code, language):
+        """统计代码中命中的sink和source数量，返回 (sink数, source数)"""
+        if language not in self._sinks:
+            return 0, 0
+        return len(self._sinks[language].findall(code)), len(self._sources[language].findall(code))
+
+
+class RiskScorer:
+    """估算文件和代码块的风险分数，用于安排分析顺序
+
+    文件分数由路径关键字（controller、upload、dao等加分，test、vendor等减分）、git提交次数、
+    危险函数密度和入口点（路由注解、Servlet等）组成；代码块分数在所属文件分数的基础上再加上
+    代码块自身的危险函数和外部输入数量。分数越高越先分析，高危漏洞能在扫描开始后尽快出现，
+    中途取消的扫描也已覆盖最重要的代码。
+    """
+
+    PATH_HINTS = [
+        (re.compile(r'controller|action|servlet|handler|endpoint|api|rest|route|webapp', re.I), 3),
+        (re.compile(r'upload|download|file|import|export|attach', re.I), 3),
+        (re.compile(r'dao|mapper|repositor|sql|query|db', re.I), 2),
+        (re.compile(r'admin|auth|login|user|account|session|token|passw|secur|manage', re.I), 2),
+        (re.compile(r'filter|interceptor|util|common', re.I), 1),
+        (re.compile(r'(?:^|[/\\])(?:tests?|spec|mock|examples?|demo|samples?|docs?|vendor|node_modules|third_?party|dist)'
+                    r'(?:[/\\]|$)|\.min\.js$|Test\.java$', re.I), -6),
+    ]
+
+    ENTRY_POINTS = {
+        'java': re.compile(r'@(?:Get|Post|Put|Delete|Patch|Request)Mapping\b|@(?:Path|WebServlet|Controller|RestController)\b'
+                           r'|\bextends\s+HttpServlet\b|\bvoid\s+do(?:Get|Post|Put|Delete)\s*\('),
+        'php': re.compile(r'\bRoute::\w+|\$router->|\bfunction\s+\w*[aA]ction\s*\(|\$_(?:GET|POST|REQUEST|FILES)\b'),
+        'javascript': re.compile(r'\b(?:app|router)\.(?:get|post|put|delete|patch|all|use)\s*\('),
+    }
+
+    # 计算内容分数时每个文件最多扫描的字节数
+    MAX_READ_BYTES = 1024 * 1024
+
+    def __init__(self, prefilter, project_path, churn=None):
+        self.prefilter = prefilter
+        self.project_path = Path(project_path)
+        self.churn = churn or {}
+
+    @staticmethod
+    def load_churn(project_path, max_commits=1000):
+        """统计最近max_commits次提交中每个文件的修改次数，项目不是git仓库时返回空字典
+
+        键为解析后的绝对路径（Path.resolve），查询时同样解析，项目路径是相对路径或符号链接时也能对上。
+        """
+        try:
+            repo_root = Path(GitDiffScope._run_git(project_path, 'rev-parse', '--show-toplevel').strip()).resolve()
+            output = GitDiffScope._run_git(project_path, 'log', f'-n{max_commits}', '--name-only',
+                                           '--pretty=format:', '--no-renames', '--', '.')
+        except (RuntimeError, OSError):
+            return {}
+        churn = {}
+        for name in output.splitlines():
+            if name:
+                path = (repo_root / name).resolve()
+                churn[path] = churn.get(path, 0) + 1
+        return churn
+
+    def path_score(self, file_path):
+        """按项目内的相对路径匹配关键字，避免项目所在目录的名称影响分数"""
+        try:
+            relative = file_path.relative_to(self.project_path)
+        except ValueError:
+            relative = file_path
+        return sum(weight for pattern, weight in self.PATH_HINTS if pattern.search(relative.as_posix()))
+
+    def static_score(self, file_path):
+        """只按路径关键字和提交次数计算的分数，不需要读取文件"""
+        score = self.path_score(file_path)
+        if self.churn:
+            score += math.log2(1 + self.churn.get(Path(file_path).resolve(), 0))
+        return score
+
+    def file_score(self, file_path, language, data):
+        """按已读取的文件内容（最多扫描MAX_READ_BYTES字节）计算文件分数"""
+        score = self.static_score(file_path)
+        code = data[:self.MAX_READ_BYTES].decode('utf-8', errors='replace')
+        sinks, sources = self.prefilter.hits(code, language)
+        lines = code.count('\n') + 1
+        # 每百行的危险函数和外部输入数量，最多加10分
+        score += min(10.0, (2 * sinks + sources) * 100 / max(lines, 100))
+        entry_pattern = self.ENTRY_POINTS.get(language)
+        if entry_pattern is not None and entry_pattern.search(code):
+            score += 3
+        return score
+
+    def chunk_score(self, code, language, file_score=0.0):
+        sinks, sources = self.prefilter.hits(code, language)
+        score = file_score + min(10, 2 * sinks + sources)
+        entry_pattern = self.ENTRY_POINTS.get(language)
+        if entry_pattern is not None and entry_pattern.search(code):
+            score += 3
+        return score
+
+
+class CodeChunker:
+    """按代码结构把源码切分为代码块
+
+    不依赖审计引擎的任何状态，可以在分块进程池的子进程中使用。每个代码块为
+    (代码, 起始行号, 结束行号, 代码块类型)。
+    """
+
+    # 结构化分块后，令牌数低于预算该比例的相邻小块合并，合并到该下限为止
+    SMALL_CHUNK_FRACTION = 0.125
+
+    def __init__(self, verbose=False):
+        """
+        Args:
+            verbose: 为True时把分块过程的调试信息输出到标准错误
+        """
+        self.verbose = verbose
 
-                # 确保values有足够的元素
-                values = list(values) + [''] * (9 - len(values))
+    def _debug(self, message):
+        if self.verbose:
+            print(f"[DEBUG] {message}", file=sys.stderr)
 
-                # 添加数据行
-                if hasattr(ws, 'cell'):
-                    # 设置行高为自动调整
-                    if hasattr(ws, 'row_dimensions'):
-                        ws.row_dimensions[row_num].height = None  # 设置为None让Excel自动调整行高
+    @staticmethod
+    def _split_lines_by_tokens(lines, first_line, budget, chunk_type):
+        """按令牌预算把连续的代码行切成若干块
 
-                    for col_num, value in enumerate(values, 1):
-                        cell = ws.cell(row=row_num, column=col_num)
-                        if cell is not None:
-                            # 确保行号列正确显示
-                            if col_num == 1:
-                                # ID列保持原样
-                                cell.value = str(value) if value is not None else ""
-                            elif col_num == 9:
-                                # 行号列（第9列）
-                                line_numbers = values[8] if len(values) > 8 and values[8] else "N/A"
-                                cell.value = str(line_numbers)
-                            else:
-                                cell.value = str(value) if value is not None else ""
-                            # 优化单元格对齐方式和自动换行设置
-                            cell.alignment = Alignment(vertical='center', horizontal='left', wrap_text=True)
-                            cell.border = thin_border
+        单行超出预算（如压缩后的JS）时按字符切开，切出的各块行号相同。
 
-                            # 根据风险等级设置颜色
-                            if col_num == 3:  # 风险等级列
-                                if value == "高危":
-                                    cell.fill = PatternFill(start_color="FFCCCC", end_color="FFCCCC", fill_type="solid")
-                                elif value == "中危":
-                                    cell.fill = PatternFill(start_color="FFFFCC", end_color="FFFFCC", fill_type="solid")
-                                elif value == "低危":
-                                    cell.fill = PatternFill(start_color="CCFFCC", end_color="CCFFCC", fill_type="solid")
+        Args:
+            first_line: lines[0]在原文件中的行号
+        """
+        chunks = []
+        start = 0
+        tokens = 0
+        for i, line in enumerate(lines):
+            line_tokens = estimate_tokens(line)
+            if line_tokens > budget:
+                if i > start:
+                    chunks.append(('\n'.join(lines[start:i]), first_line + start, first_line + i - 1, chunk_type))
+                width = max(1, len(line) * budget // line_tokens)
+                for offset in range(0, len(line), width):
+                    chunks.append((line[offset:offset + width], first_line + i, first_line + i, chunk_type))
+                start = i + 1
+                tokens = 0
+                continue
+            if tokens + line_tokens > budget and i > start:
+                chunks.append(('\n'.join(lines[start:i]), first_line + start, first_line + i - 1, chunk_type))
+                start = i
+                tokens = 0
+            tokens += line_tokens
+        if start < len(lines):
+            chunks.append(('\n'.join(lines[start:]), first_line + start, first_line + len(lines) - 1, chunk_type))
+        return chunks
 
-                row_num += 1
+    def _fit_chunks_to_budget(self, chunks, budget):
+        """把超出令牌预算的结构化代码块按行继续切分，未超出的保持不变"""
+        fitted = []
+        for chunk in chunks:
+            code, line_start, line_end, chunk_type = chunk
+            if estimate_tokens(code) <= budget:
+                fitted.append(chunk)
+                continue
+            pieces = self._split_lines_by_tokens(code.split('\n'), line_start, budget, chunk_type)
+            for k, piece in enumerate(pieces, 1):
+                fitted.append((piece[0], piece[1], piece[2], f"{chunk_type}（第{k}/{len(pieces)}部分）"))
+        return fitted
 
-            # 保存文件
-            wb.save(filepath)
-            messagebox.showinfo("导出成功", f"漏洞报告已保存到：\n{filepath}")
+    def chunk_code(self, code, file_ext, budget):
+        """根据代码结构智能分块，每块不超过令牌预算"""
+        chunks = []
+        lines = code.splitlines()
 
-        except Exception as e:
-            self.log_error(f"导出失败: {str(e)}")
-            messagebox.showerror("导出失败", f"导出过程中发生错误：\n{str(e)}")
+        # 打印调试信息
+        self._debug(f"智能分块处理文件类型: {file_ext}")
 
-    def auto_analyze(self):
-        """自动分析项目中所有文件"""
-        # 检查API密钥是否已配置
-        if not self.api_key:
-            messagebox.showwarning("警告", "API密钥未配置，请先在设置中配置API密钥")
-            return False
+        # 根据文件类型选择不同的分块策略
+        if file_ext in ['.java']:
+            self._debug(f"调用Java分块处理: {file_ext}")
+            chunks = self._chunk_java_code(lines, budget)
+            self._debug(f"Java分块完成，共 {len(chunks)} 个代码块")
+        elif file_ext in ['.php']:
+            self._debug(f"调用PHP分块处理: {file_ext}")
+            chunks = self._chunk_php_code(lines, budget)
+            self._debug(f"PHP分块完成，共 {len(chunks)} 个代码块")
+        elif file_ext.lower() in ['.xml', '.pom'] or 'pom.xml' in file_ext.lower():
+            self._debug(f"调用XML分块处理: {file_ext}")
+            chunks = self._chunk_xml_code(lines)
+            self._debug(f"XML分块完成，共 {len(chunks)} 个代码块")
+        else:
+            # 默认按令牌预算连续分块
+            chunks = self._split_lines_by_tokens(lines, 1, budget, "固定大小块")
 
-        # 如果API尚未验证过，则进行验证
-        if not hasattr(self, 'api_validated') or not self.api_validated:
-            # 显示验证中的状态
-            self.status_bar.config(text="正在验证API密钥...")
-            self.root.config(cursor="wait")  # 更改鼠标指针为等待状态
+        # 结构化分块中超出预算的代码块继续切分，确保所有分块按照起始行号排序
+        chunks = sorted(self._fit_chunks_to_budget(chunks, budget), key=lambda x: x[1])
 
-            # 直接验证API密钥，避免异步验证导致的卡顿
-            try:
-                # 由于_validate_api_key已简化，直接调用并获取结果
-                result = self._validate_api_key()
+        return chunks
 
-                # 恢复鼠标指针
-                self.root.config(cursor="")
+    def _chunk_xml_code(self, lines):
+        """XML/POM代码智能分块"""
+        try:
+            # 如果文件为空，直接返回
+            if not lines:
+                return [("", 1, 1, "空文件")]
 
-                if result:
-                    self.api_validated = True
-                    self.status_bar.config(text="API密钥验证成功，开始分析...")
-                    # 继续执行自动分析流程
-                else:
-                    messagebox.showerror("API验证失败", "API密钥验证失败，请检查API密钥是否正确。")
-                    self.status_bar.config(text="API验证失败")
-                    self.btn_auto_analyze.config(text="自动分析")
-                    self.btn_analyze.config(state=tk.NORMAL)
-                    self.api_validated = False
-                    return False
-            except Exception as e:
-                # 处理验证过程中的异常
-                self.root.config(cursor="")
-                self.status_bar.config(text="API验证出错")
-                messagebox.showerror("API验证错误", f"验证过程中发生错误：{str(e)}")
-                self.btn_auto_analyze.config(text="自动分析")
-                self.btn_analyze.config(state=tk.NORMAL)
-                return False
+            # 首先过滤掉XML注释行
+            filtered_lines = []
+            original_to_filtered = {}  # 原始行号到过滤后行号的映射
+            filtered_to_original = {}  # 过滤后行号到原始行号的映射
 
-        # 初始化状态
-        self._reset_analysis_state()
-        self.auto_analysis_cancelled = False
-        self.auto_analysis_paused = False
-        self.api_validation_error_shown = False  # 移除validation_lock的使用
+            for i, line in enumerate(lines):
+                # 跳过XML注释行
+                if '<!--' in line and '-->' in line:
+                    # 如果注释不是整行，保留非注释部分
+                    parts = []
+                    current_pos = 0
+                    while current_pos < len(line):
+                        comment_start = line.find('<!--', current_pos)
+                        if comment_start == -1:
+                            parts.append(line[current_pos:])
+                            break
 
-        # 更新按钮状态并立即刷新UI
-        self.btn_auto_analyze.config(text="取消分析")
-        self.btn_analyze.config(state=tk.DISABLED)
-        # self.btn_pause_resume.config(state=tk.NORMAL)
+                        # 添加注释前的内容
+                        if comment_start > current_pos:
+                            parts.append(line[current_pos:comment_start])
 
-        # 强制更新UI，确保按钮文本立即显示
-        self.root.update_idletasks()
+                        # 跳过注释
+                        comment_end = line.find('-->', comment_start) + 3
+                        current_pos = comment_end
 
-        # 获取项目中所有文件
-        all_files = []
-        for root, dirs, files in os.walk(self.project_path):
-            for file in files:
-                file_path = Path(root) / file
-                if file_path.suffix in self.supported_langs:
-                    all_files.append(file_path)
+                    # 如果有非注释内容，添加到过滤后的行
+                    non_comment_line = ''.join(parts).strip()
+                    if non_comment_line:
+                        filtered_lines.append(non_comment_line)
+                        original_to_filtered[i] = len(filtered_lines) - 1
+                        filtered_to_original[len(filtered_lines) - 1] = i
+                elif '<!--' in line:
+                    # 多行注释开始，跳过
+                    in_comment = True
+                    # 检查是否有注释前的内容
+                    comment_start = line.find('<!--')
+                    if comment_start > 0:
+                        non_comment_part = line[:comment_start].strip()
+                        if non_comment_part:
+                            filtered_lines.append(non_comment_part)
+                            original_to_filtered[i] = len(filtered_lines) - 1
+                            filtered_to_original[len(filtered_lines) - 1] = i
+                elif '-->' in line:
+                    # 多行注释结束
+                    in_comment = False
+                    # 检查是否有注释后的内容
+                    comment_end = line.find('-->') + 3
+                    if comment_end < len(line):
+                        non_comment_part = line[comment_end:].strip()
+                        if non_comment_part:
+                            filtered_lines.append(non_comment_part)
+                            original_to_filtered[i] = len(filtered_lines) - 1
+                            filtered_to_original[len(filtered_lines) - 1] = i
+                else:
+                    # 正常行，添加到过滤后的行
+                    filtered_lines.append(line)
+                    original_to_filtered[i] = len(filtered_lines) - 1
+                    filtered_to_original[len(filtered_lines) - 1] = i
 
-        # 初始化进度条
-        self.progress['maximum'] = len(all_files)
-        self.progress['value'] = 0
-        self.status_bar.config(text=f"开始自动分析，共 {len(all_files)} 个文件")
+            # 首先识别XML声明
+            chunks = []
+            for i, line in enumerate(filtered_lines):
+                if line.strip().startswith("<?xml"):
+                    # 使用原始行号
+                    original_i = filtered_to_original[i]
+                    chunks.append((line.strip(), original_i + 1, original_i + 1, "XML声明"))
+                    break
 
-        # 创建后台线程
-        self.auto_analysis_cancelled = False  # 修正初始化状态
-        self.auto_analysis_thread = threading.Thread(
-            target=self._auto_analysis_worker,
-            args=(all_files,),
-            daemon=True
-        )
-        self.auto_analysis_thread.start()
-        self.root.after(100, self._handle_events)
-        return True
+            # 使用正则表达式识别主要标签
+            import re
 
-    def analyze_code_chunk(self, chunk_info, file_path):
-        chunk, line_start, line_end, chunk_type = chunk_info
-        try:
-            context_info = f"# 文件: {file_path.name}\n# 代码块类型: {chunk_type}\n# 行范围: {line_start}-{line_end}\n\n"
-            chunk_with_context = context_info + chunk
-            response = self.call_deepseek_api(chunk_with_context, file_path.suffix, file_path)
+            # 识别project标签的开始和结束
+            project_start = None
+            project_end = None
+            for i, line in enumerate(filtered_lines):
+                if re.search(r'<project\b', line) and project_start is None:
+                    project_start = i
+                if re.search(r'</project>', line):
+                    project_end = i
 
-            # 特殊处理API验证错误
-            if response['status_code'] == 401:
-                # 如果是API验证错误，设置标志并通过事件队列通知主线程
-                with self.validation_lock:
-                    if not self.api_validation_error_shown:
-                        self.api_validation_error_shown = True
-                        self.api_validated = False
-                        # 在API验证失败时，直接通知主线程更新状态栏
-                        self.root.after(0, lambda: self.status_bar.config(text="API验证失败"))
-                        # 返回False表示API验证失败
-                        return False
-
-            if response['status_code'] == 200:
-                chunk_vulnerabilities = self.parse_response(response['text'], chunk.splitlines())
-                for vuln in chunk_vulnerabilities:
-                    vuln["行号"] = [line_start + line - 1 for line in vuln["行号"]]
-                    vuln["文件路径"] = str(file_path)
-                self.display_results(file_path, chunk_vulnerabilities)
-                return True
-            return None
-        except Exception as e:
-            self.log_error(f"代码块分析失败: {str(e)}")
-            return None
+            if project_start is not None and project_end is not None:
+                # 识别主要子标签
+                main_tags = ["modules", "properties", "dependencies", "dependencyManagement",
+                             "build", "profiles", "parent", "distributionManagement"]
 
-    def _auto_analysis_worker(self, file_list):
-        """自动分析的后台线程"""
-        try:
-            from concurrent.futures import ThreadPoolExecutor, as_completed
+                # 记录已处理的行范围，避免重复
+                processed_ranges = set()
 
-            # 在实际分析前验证API密钥有效性
-            if not hasattr(self, 'api_validated') or not self.api_validated:
-                # 显示验证中的状态
-                self.root.after(0, lambda: self.status_bar.config(text="正在验证API密钥..."))
-                self.root.after(0, lambda: self.root.config(cursor="wait"))  # 更改鼠标指针为等待状态
+                for tag in main_tags:
+                    tag_start = None
+                    tag_end = None
+                    tag_depth = 0
 
-                try:
-                    # 直接验证API密钥，避免异步验证和循环等待
-                    result = self._validate_api_key(force_validation=True)
+                    for i in range(project_start, project_end + 1):
+                        line = filtered_lines[i]
 
-                    # 恢复鼠标指针
-                    self.root.after(0, lambda: self.root.config(cursor=""))
+                        # 识别标签开始
+                        if re.search(f'<{tag}\\b', line) and tag_start is None:
+                            tag_start = i
+                            tag_depth = 1
 
-                    if not result:
-                        # 验证失败，无法继续分析
-                        self.root.after(0, lambda: self.status_bar.config(text="API密钥无效，无法进行分析"))
-                        self.root.after(0, lambda: messagebox.showerror("API验证失败",
-                                                                        "API密钥验证失败，请检查API密钥是否正确。"))
-                        self.root.after(0, lambda: self.btn_auto_analyze.config(text="自动分析"))
-                        self.root.after(0, lambda: self.btn_analyze.config(state=tk.NORMAL))
-                        return
-                except Exception as e:
-                    # 处理验证过程中的异常
-                    self.root.after(0, lambda: self.root.config(cursor=""))
-                    self.root.after(0, lambda: self.status_bar.config(text="API验证出错"))
-                    self.root.after(0, lambda: messagebox.showerror("API验证错误", f"验证过程中发生错误：{str(e)}"))
-                    self.root.after(0, lambda: self.btn_auto_analyze.config(text="自动分析"))
-                    self.root.after(0, lambda: self.btn_analyze.config(state=tk.NORMAL))
-                    return
+                        # 如果已找到开始标签，计算嵌套深度
+                        if tag_start is not None and tag_end is None:
+                            # 计算当前行中的开始和结束标签
+                            starts = len(re.findall(f'<{tag}\\b', line))
+                            ends = len(re.findall(f'</{tag}>', line))
 
-            # 预处理阶段：计算总代码块数
-            total_chunks = 0
-            all_chunks = []
-            valid_files = []
+                            # 更新深度
+                            tag_depth += starts - ends
 
-            # 先过滤出有效的文件
-            for file_path in file_list:
-                if file_path.suffix in self.supported_langs:
-                    valid_files.append(file_path)
+                            # 如果深度回到0，说明找到了结束标签
+                            if tag_depth == 0:
+                                tag_end = i
 
-            # 只处理实际要分析的文件
-            for file_path in valid_files:
-                try:
-                    with open(file_path, 'r', encoding='utf-8', errors='ignore') as f:
-                        code = f.read()
-                        chunks = self._smart_code_chunking(code, file_path.suffix)
-                        # 记录实际的分块
-                        file_chunks = [(chunk, file_path) for chunk in chunks]
-                        all_chunks.extend(file_chunks)
-                        total_chunks += len(chunks)
-                        print(f"[DEBUG] 文件 {file_path.name} 分为 {len(chunks)} 个代码块")
-                except Exception as e:
-                    self.log_error(f"读取文件失败: {str(e)}", file_path)
-                    # 出错时不计入总块数
-
-            # 设置进度条最大值
-            self.root.after(0, lambda: self.progress.configure(maximum=total_chunks))
-            self.status_bar.config(text=f"准备分析 {total_chunks} 个代码块")
-
-            # 使用线程池处理
-            processed_chunks = 0
-            with ThreadPoolExecutor(max_workers=5) as executor:
-                futures = []
-                for chunk, file_path in all_chunks:
-                    if self.auto_analysis_cancelled:
-                        break
-                    futures.append(executor.submit(self.analyze_code_chunk, chunk, file_path))
+                                # 创建这个标签的块 - 使用原始行号
+                                original_start = filtered_to_original[tag_start]
+                                original_end = filtered_to_original[tag_end]
 
-                for future in as_completed(futures):
-                    if self.auto_analysis_cancelled:
-                        break
-                    try:
-                        result = future.result()
-                        # 检查API错误
-                        if result is False and not self.api_validation_error_shown:
-                            with self.validation_lock:
-                                if not self.api_validation_error_shown:
-                                    self.api_validation_error_shown = True
-                                    self.api_validated = False
-                                    self.root.after(0, lambda: self.status_bar.config(text="API验证失败"))
-                                    self.root.after(0, lambda: messagebox.showerror("API验证失败",
-                                                                                    "API密钥验证失败，请检查API密钥是否正确。"))
-                                    self.root.after(0, lambda: self.btn_auto_analyze.config(text="自动分析"))
-                                    self.root.after(0, lambda: self.btn_analyze.config(state=tk.NORMAL))
-                                    break
-                    except Exception as e:
-                        self.log_error(f"处理分析结果时出错: {str(e)}")
-                    processed_chunks += 1
-                    self.event_queue.put(('progress', processed_chunks, None))
+                                # 获取原始代码内容（包括注释）
+                                tag_content = '\n'.join(lines[original_start:original_end + 1])
+                                chunks.append((tag_content, original_start + 1, original_end + 1, f"{tag}配置"))
 
-        finally:
-            # 使用root.after确保在主线程中安排事件处理
-            if self.api_validation_error_shown:
-                # 使用lambda避免直接调用方法，确保在UI线程中执行
-                self.root.after(0, lambda: self.event_queue.put(('done', None, None)))
-            else:
-                # 非API验证失败情况下，正常发送done事件
-                self.root.after(0, lambda: self.event_queue.put(('done', None, None)))
+                                # 记录已处理的行范围
+                                for j in range(tag_start, tag_end + 1):
+                                    processed_ranges.add(j)
 
-            # 直接在UI线程中重新启用按钮，确保按钮状态正确恢复
-            self.root.after(0, lambda: self.btn_auto_analyze.config(text="自动分析", state=tk.NORMAL))
-            self.root.after(0, lambda: self.btn_analyze.config(text="开始分析", state=tk.NORMAL))
+                # 处理单个dependency标签（只有在dependencies标签外的独立dependency才处理）
+                i = project_start
+                while i <= project_end:
+                    if i in processed_ranges:
+                        i += 1
+                        continue
 
-            self._reset_analysis_state()
+                    line = filtered_lines[i]
+                    if re.search(r'<dependency\b', line) and not re.search(r'</dependencies>', line):
+                        dep_start = i
+                        dep_depth = 1
 
-    def _init_file_tree(self, parent):
-        """初始化文件树组件（支持拖动调整宽度）"""
-        # 创建左侧面板
-        self.left_panel = ttk.Frame(parent)
-        parent.add(self.left_panel, weight=1)  # 添加到PanedWindow，weight=1表示拖动时会调整大小
+                        # 寻找dependency结束
+                        j = i + 1
+                        while j <= project_end:
+                            if j >= len(filtered_lines):
+                                break
 
-        # 创建滚动容器
-        container = ttk.Frame(self.left_panel)
-        container.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
+                            dep_line = filtered_lines[j]
 
-        # 树状视图 - 移除垂直滚动条
-        self.tree = ttk.Treeview(
-            container,
-            selectmode='browse',
-            show='tree',
-            height=20
-        )
-        self.tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+                            # 计算当前行中的开始和结束标签
+                            starts = len(re.findall(r'<dependency\b', dep_line))
+                            ends = len(re.findall(r'</dependency>', dep_line))
 
-        # 动态列宽配置
-        self.tree.column("#0", minwidth=200, stretch=tk.YES)
+                            # 更新深度
+                            dep_depth += starts - ends
 
-        # 绑定目录展开事件
-        self.tree.bind("<<TreeviewOpen>>", self._handle_tree_resize)
-        self.tree.bind("<<TreeviewClose>>", self._handle_tree_resize)
-        self.tree.bind("<Configure>", self._handle_tree_resize)
+                            # 如果深度回到0，说明找到了结束标签
+                            if dep_depth == 0:
+                                dep_end = j
 
-    def _handle_tree_resize(self, event=None):
-        """处理树状视图尺寸变化"""
-        try:
-            tree_width = self.tree.winfo_width()
-            if tree_width < 150:
-                tree_width = 150
-            self.tree.column('#0', width=int(tree_width * 0.95))
-        except Exception as e:
-            self.log_error(f"树大小调整错误: {str(e)}")
+                                # 创建这个依赖项的块 - 使用原始行号
+                                original_start = filtered_to_original[dep_start]
+                                original_end = filtered_to_original[dep_end]
 
-    def _on_tree_open(self, event):
-        """处理树节点展开事件"""
-        item = self.tree.focus()
-        if item:
-            self.tree.item(item, open=True)
+                                # 获取原始代码内容（包括注释）
+                                dep_content = '\n'.join(lines[original_start:original_end + 1])
+                                chunks.append((dep_content, original_start + 1, original_end + 1, "依赖项"))
 
-    def _on_tree_close(self, event):
-        """处理树节点关闭事件"""
-        item = self.tree.focus()
-        if item:
-            self.tree.item(item, open=False)
+                                # 记录已处理的行范围
+                                for k in range(dep_start, dep_end + 1):
+                                    processed_ranges.add(k)
 
-    def _init_toolbar(self, parent):
-        """初始化工具栏"""
-        self.toolbar = ttk.Frame(parent)
-        self.toolbar.pack(side=tk.TOP, fill=tk.X, padx=5, pady=5)
+                                i = dep_end
+                                break
 
-        self.btn_api_settings = ttk.Button(self.toolbar, text="API设置", command=self.open_api_settings)
-        self.btn_api_settings.pack(side=tk.LEFT, padx=5)
+                            j += 1
 
-        ttk.Button(self.toolbar, text="打开项目", command=self.open_project).pack(side=tk.LEFT, padx=5)
+                    i += 1
 
-        # 模型选择下拉框
-        self.model_var = tk.StringVar(value="deepseek-chat")
-        self.model_combobox = ttk.Combobox(self.toolbar, textvariable=self.model_var,
-                                           values=["deepseek-chat", "deepseek-reasoner"],
-                                           state="readonly", width=15)
-        self.model_combobox.pack(side=tk.LEFT, padx=5)
+                # 处理未被识别的部分（如modelVersion, groupId等）
+                i = project_start
+                while i <= project_end:
+                    # 如果这一行已经被处理过，跳过
+                    if i in processed_ranges:
+                        i += 1
+                        continue
 
-        self.btn_analyze = ttk.Button(self.toolbar, text="开始分析", command=self.toggle_analysis)
-        self.btn_analyze.pack(side=tk.LEFT, padx=5)
+                    # 找到一段连续的未处理行
+                    start_unprocessed = i
+                    while i <= project_end and i not in processed_ranges:
+                        i += 1
 
-        # 自动分析按钮
-        self.btn_auto_analyze = ttk.Button(self.toolbar, text="自动分析", command=self.toggle_auto_analysis)
-        self.btn_auto_analyze.pack(side=tk.LEFT, padx=2)
+                    # 如果找到了未处理的行段，创建一个块
+                    if i > start_unprocessed:
+                        # 转换为原始行号
+                        original_start = filtered_to_original[start_unprocessed]
+                        original_end = filtered_to_original[min(i - 1, len(filtered_to_original) - 1)]
 
-        # 导出漏洞按钮
-        self.btn_export = ttk.Button(self.toolbar, text="导出漏洞", command=self.export_vulnerabilities)
-        self.btn_export.pack(side=tk.LEFT, padx=2)
+                        # 获取原始代码内容（包括注释）
+                        unprocessed_content = '\n'.join(lines[original_start:original_end + 1])
+                        if unprocessed_content.strip():  # 确保内容不为空
+                            chunks.append((unprocessed_content, original_start + 1, original_end + 1, "其他配置"))
+            else:
+                # 如果没有找到project标签，将整个文件作为一个块
+                chunks.append(('\n'.join(lines), 1, len(lines), "完整XML文件"))
 
-    def toggle_analysis(self):
-        """切换开始/取消分析状态"""
-        if self.btn_analyze.cget("text") == "开始分析":
-            # 获取选中的文件列表，检查是否有选中文件
-            file_list = self._get_selected_files()
-            if not file_list:
-                messagebox.showinfo("提示", "请先选择要分析的文件")
-                return
+            # 过滤掉空内容的块
+            chunks = [(code, start, end, chunk_type) for code, start, end, chunk_type in chunks if code.strip()]
 
-            # 切换到分析状态
-            self.btn_analyze.config(text="取消分析")
-            self.btn_auto_analyze.config(state=tk.DISABLED)
-            # 调用start_analysis并检查其返回值
-            result = self.start_analysis()
-            # 如果start_analysis返回False（例如API密钥未配置），恢复按钮状态
-            if result is False:
-                self.btn_analyze.config(text="开始分析")
-                self.btn_auto_analyze.config(state=tk.NORMAL)
-        else:
-            # 取消分析
-            self.cancel_analysis()
-            # 确保自动分析按钮被重新启用
-            self.btn_auto_analyze.config(state=tk.NORMAL)
+            # 按行号排序
+            chunks.sort(key=lambda x: x[1])
+
+            return chunks
 
-    def toggle_auto_analysis(self):
-        """切换自动分析状态"""
-        try:
-            if self.btn_auto_analyze.cget("text") == "自动分析":
-                # 开始新的分析
-                self.api_validation_error_shown = False  # 重置API错误标志
-                self.btn_auto_analyze.config(text="取消分析")
-                self.auto_analyze()
-            else:
-                # 取消当前分析
-                self.auto_analysis_cancelled = True
-                # 立即恢复按钮状态，不等待事件处理
-                self.btn_auto_analyze.config(text="自动分析", state=tk.NORMAL)
-                self.btn_analyze.config(text="开始分析", state=tk.NORMAL)
         except Exception as e:
-            self.log_error(f"切换分析状态失败: {str(e)}")
-            self.btn_auto_analyze.config(text="自动分析")  # 确保恢复按钮状态
+            print(f"[ERROR] XML分块异常: {str(e)}")
+            import traceback
+            traceback.print_exc()
+            return [('\n'.join(lines), 1, len(lines), "分块失败")]  # 返回完整代码作为单个块
 
-    def cancel_analysis(self):
-        """取消分析操作"""
-        # 先设置取消标志
-        self.auto_analysis_cancelled = True
-        self.status_bar.config(text="正在取消分析...")
+    def _chunk_php_code(self, lines, budget):
+        """PHP代码智能分块"""
+        chunks = []
+        current_chunk = []
+        current_type = "导入块"
+        chunk_start_line = 1
+        in_class = False
+        in_function = False
+        in_method = False
+        braces = BraceLexer('php')  # 跟踪大括号深度
+        in_comment = False
+        class_name = ""
+        function_name = ""
+        # 初始化这两个变量，避免未绑定错误
+        method_brace_depth = 0
+        function_brace_depth = 0
 
-        # 立即恢复按钮状态，不等待事件处理
-        self.btn_analyze.config(text="开始分析", state=tk.NORMAL)
-        self.btn_auto_analyze.config(text="自动分析", state=tk.NORMAL)
+        for i, line in enumerate(lines):
+            line_num = i + 1
 
-        # 手动添加done事件，确保分析状态被正确重置
-        self.root.after(0, lambda: self.event_queue.put(('done', None, None)))
+            # 处理多行注释
+            if "/*" in line and "*/" not in line:
+                in_comment = True
+            if "*/" in line:
+                in_comment = False
 
-    def retry_api_validation(self):
-        """重试API验证"""
-        # 重置验证状态
-        self.api_validated = False
-        self.api_validation_error_shown = False
+            # 跟踪大括号，忽略字符串和注释中的大括号
+            braces.feed(line)
 
-        # 显示验证中的状态
-        self.status_bar.config(text="正在重新验证API密钥...")
-        self.root.config(cursor="wait")  # 更改鼠标指针为等待状态
+            # 检测命名空间和use语句
+            if re.match(r'^\s*(namespace|use)\s+', line) and not in_comment:
+                if not current_chunk or current_type == "导入块":
+                    current_chunk.append(line)
+                    if current_type != "导入块":
+                        current_type = "导入块"
+                        chunk_start_line = line_num
+                else:
+                    chunks.append(('\n'.join(current_chunk), chunk_start_line, line_num - 1, current_type))
+                    current_chunk = [line]
+                    chunk_start_line = line_num
+                    current_type = "导入块"
+                continue
 
-        # 启动异步验证
-        self._validate_api_key(force_validation=True)
+            # 检测类定义
+            class_match = re.match(r'^\s*(abstract\s+|final\s+)?class\s+(\w+)', line)
+            if not in_comment and class_match and not in_class:
+                if current_chunk:
+                    chunks.append(('\n'.join(current_chunk), chunk_start_line, line_num - 1, current_type))
+                current_chunk = [line]
+                chunk_start_line = line_num
+                # 提取类名
+                class_name = class_match.group(2) if class_match.group(2) else "匿名类"
+                current_type = f"类定义({class_name})"
+                in_class = True
+                continue
 
-        # 验证超时计时
-        validation_start_time = time.time()
+            # 检测函数/方法定义
+            function_match = re.match(r'^\s*(public\s+|private\s+|protected\s+|static\s+)*(function)\s+(\w+)', line)
+            if not in_comment and function_match:
+                function_name = function_match.group(3) if function_match.group(3) else "匿名函数"
 
-        # 检查验证结果的函数
-        def check_validation():
-            try:
-                # 尝试从事件队列获取验证结果
-                event_type, result, _ = self.event_queue.get_nowait()
+                if in_class:
+                    # 类方法
+                    if current_chunk and not in_method and "类定义" not in current_type:
+                        chunks.append(('\n'.join(current_chunk), chunk_start_line, line_num - 1, current_type))
+                        current_chunk = []
+                        chunk_start_line = line_num
 
-                if event_type == 'api_validation':
-                    self.root.config(cursor="")
-                    if result:
-                        self.api_validated = True
-                        self.status_bar.config(text="API密钥验证成功，可以开始分析...")
-                        # 恢复按钮状态
-                        self.btn_auto_analyze.config(text="自动分析", state=tk.NORMAL)
-                        self.btn_analyze.config(state=tk.NORMAL)
+                    # 添加方法定义行到当前块
+                    current_chunk.append(line)
+                    current_type = f"方法({class_name}.{function_name})"
+                    in_method = True
+                    # 记录方法开始时的大括号栈深度
+                    method_brace_depth = braces.depth
+                    if '{' in line:
+                        method_brace_depth += 1  # 如果当前行有左大括号，调整深度
+                else:
+                    # 独立函数
+                    if current_chunk and not in_function:
+                        chunks.append(('\n'.join(current_chunk), chunk_start_line, line_num - 1, current_type))
+                        current_chunk = [line]
+                        chunk_start_line = line_num
                     else:
-                        messagebox.showerror("API验证失败", "API密钥验证失败，请检查API密钥是否正确。")
-                        self.status_bar.config(text="API验证失败")
-                        self.api_validated = False
-                    return
-            except queue.Empty:
-                # 检查是否超时
-                current_time = time.time()
-                if current_time - validation_start_time > 15:  # 增加超时时间到15秒
-                    self.root.config(cursor="")
-                    self.status_bar.config(text="API连接超时，请检查网络")
-                    messagebox.showwarning("API验证超时", "API服务器响应超时，请检查网络连接。")
-                    # 恢复按钮状态
-                    self.btn_auto_analyze.config(text="自动分析", state=tk.NORMAL)
-                    self.btn_analyze.config(state=tk.NORMAL)
-                    return
-
-                # 继续等待验证结果
-                self.root.after(20, check_validation)  # 缩短检查间隔到20ms
+                        current_chunk.append(line)
 
-        # 开始检查验证结果
-        self.root.after(20, check_validation)
+                    current_type = f"函数({function_name})"
+                    in_function = True
+                    # 记录函数开始时的大括号栈深度
+                    function_brace_depth = braces.depth
+                    if '{' in line:
+                        function_brace_depth += 1  # 如果当前行有左大括号，调整深度
+                continue
 
-        # 重置进度条
-        if hasattr(self, 'progress_var'):
-            self.progress_var.set(0)
-        if hasattr(self, 'progress'):
-            self.progress['value'] = 0
+            # 检测函数/方法结束 - 使用大括号栈来判断
+            if in_method and '}' in line:
+                current_chunk.append(line)
+                # 检查当前行后大括号栈的深度是否回到方法开始前的水平
+                if braces.depth < method_brace_depth:
+                    # 检查是否有连续的大括号结束（可能是嵌套方法或类的结束）
+                    next_lines_have_method = False
+                    next_method_line = 0
+                    # 向前查看，寻找下一个方法定义或非空行
+                    for j in range(i + 1, min(i + 20, len(lines))):
+                        next_line = lines[j].strip()
+                        # 跳过空行和注释行
+                        if not next_line or next_line.startswith('//') or next_line.startswith('/*'):
+                            continue
 
-        # 更新漏洞列表视图，确保已扫描出的漏洞能显示在界面上
-        self.update_vulnerability_treeview()
+                        # 如果找到了方法定义
+                        if re.match(r'^\s*(public\s+|private\s+|protected\s+|static\s+)*(function)\s+(\w+)', next_line):
+                            next_lines_have_method = True
+                            next_method_line = j
+                            break
 
-    def _reset_analysis_state(self):
-        """重置分析状态"""
-        self.auto_analysis_paused = False
-        self.auto_analysis_cancelled = False
+                        # 如果找到了非方法定义的代码行，将其包含在当前方法中
+                        if not next_line.startswith('}'):
+                            # 将这些行添加到当前块中
+                            for k in range(i + 1, j + 1):
+                                current_chunk.append(lines[k])
+                            i = j  # 更新循环索引
+                            break
 
-        # 按钮状态只在需要时设置，避免和其他地方设置的冲突
-        if hasattr(self, 'btn_analyze') and self.btn_analyze.cget("text") != "开始分析":
-            self.btn_analyze.config(text="开始分析", state=tk.NORMAL)
-        if hasattr(self, 'btn_auto_analyze') and (self.btn_auto_analyze.cget("text") != "自动分析" or
-                                                  self.btn_auto_analyze.cget("state") != tk.NORMAL):
-            self.btn_auto_analyze.config(text="自动分析", state=tk.NORMAL)
+                    # 如果找到了下一个方法定义，结束当前方法块
+                    if next_lines_have_method:
+                        # 方法结束
+                        chunks.append(('\n'.join(current_chunk), chunk_start_line, next_method_line - 1, current_type))
+                        current_chunk = []
+                        chunk_start_line = next_method_line
+                        current_type = f"类内代码({class_name})"
+                        in_method = False
+                        continue
 
-    def _init_right_panel(self, parent):
-        """初始化右侧面板（修改为使用PanedWindow）"""
-        # 创建右侧面板
-        self.right_panel = ttk.Frame(parent)
-        parent.add(self.right_panel, weight=3)  # 添加到PanedWindow，weight=3表示右侧面板初始宽度是左侧的3倍
+            # 检测独立函数结束 - 类似的逻辑修改
+            if in_function and not in_class and '}' in line:
+                current_chunk.append(line)
+                # 检查当前行后大括号栈的深度是否回到函数开始前的水平
+                if braces.depth < function_brace_depth:
+                    # 检查是否有连续的大括号结束（可能是嵌套函数的结束）
+                    next_lines_have_function = False
+                    next_function_line = 0
 
-        # 创建垂直方向的PanedWindow，用于上下调整各个面板
-        self.right_paned = ttk.PanedWindow(self.right_panel, orient=tk.VERTICAL)
-        self.right_paned.pack(fill=tk.BOTH, expand=True)
+                    # 向前查看，寻找下一个函数定义或非空行
+                    for j in range(i + 1, min(i + 20, len(lines))):
+                        next_line = lines[j].strip()
+                        # 跳过空行和注释行
+                        if not next_line or next_line.startswith('//') or next_line.startswith('/*'):
+                            continue
 
-        # 结果表格（放入垂直PanedWindow）
-        self.result_frame = ttk.Frame(self.right_paned)
-        self.right_paned.add(self.result_frame, weight=1)
-        self._init_result_tree(self.result_frame)
+                        # 如果找到了函数定义
+                        if re.match(r'^\s*(function)\s+(\w+)', next_line):
+                            next_lines_have_function = True
+                            next_function_line = j
+                            break
 
-        # 代码预览（放入垂直PanedWindow）
-        self.code_frame = ttk.Frame(self.right_paned)
-        self.right_paned.add(self.code_frame, weight=2)
-        self._init_code_preview(self.code_frame)
+                        # 如果找到了非函数定义的代码行，将其包含在当前函数中
+                        if not next_line.startswith('}'):
+                            # 将这些行添加到当前块中
+                            for k in range(i + 1, j + 1):
+                                current_chunk.append(lines[k])
+                            i = j  # 更新循环索引
+                            break
 
-        # 详细信息面板（放入垂直PanedWindow）
-        self.detail_frame = ttk.Frame(self.right_paned)
-        self.right_paned.add(self.detail_frame, weight=1)
-        self._init_detail_panel(self.detail_frame)
+                    # 如果找到了下一个函数定义，结束当前函数块
+                    if next_lines_have_function:
+                        # 函数结束
+                        chunks.append(
+                            ('\n'.join(current_chunk), chunk_start_line, next_function_line - 1, current_type))
+                        current_chunk = []
+                        chunk_start_line = next_function_line
+                        current_type = "全局代码"
+                        in_function = False
+                        continue
 
-        # 设置初始分隔位置
-        self.root.after(200, self._set_initial_right_pane_position)
-
-    def _set_initial_right_pane_position(self):
-        """设置右侧垂直PanedWindow的初始分隔条位置"""
-        try:
-            # 确保窗口已经渲染
-            self.root.update_idletasks()
+            # 检测类结束
+            if in_class and '}' in line and not in_method:
+                current_chunk.append(line)
+                # 检查是否是类的结束大括号
+                if braces.depth == 0:
+                    # 检查下一个非空行是否是另一个类或函数的开始
+                    next_class_or_function = False
+                    next_line_index = 0
 
-            # 获取窗口高度
-            window_height = self.right_panel.winfo_height()
+                    # 向前查看，寻找下一个类或函数定义或非空行
+                    for j in range(i + 1, min(i + 20, len(lines))):
+                        next_line = lines[j].strip()
+                        # 跳过空行和注释行
+                        if not next_line or next_line.startswith('//') or next_line.startswith('/*'):
+                            continue
 
-            if window_height > 100:
-                # 设置第一个分隔条位置（结果表格和代码预览之间）
-                self.right_paned.sashpos(0, int(window_height * 0.3))
+                        # 如果找到了类或函数定义
+                        if re.match(r'^\s*(abstract\s+|final\s+)?class\s+(\w+)', next_line) or \
+                                re.match(r'^\s*(function)\s+(\w+)', next_line):
+                            next_class_or_function = True
+                            next_line_index = j
+                            break
 
-                # 设置第二个分隔条位置（代码预览和详细信息之间）
-                self.right_paned.sashpos(1, int(window_height * 0.7))
-            else:
-                # 默认位置
-                self.right_paned.sashpos(0, 200)
-                self.right_paned.sashpos(1, 500)
-        except Exception as e:
-            self.log_error(f"设置右侧分隔条位置失败: {str(e)}")
+                        # 如果找到了非类或函数定义的代码行，将其包含在当前类中
+                        # 将这些行添加到当前块中
+                        for k in range(i + 1, j + 1):
+                            current_chunk.append(lines[k])
+                        i = j  # 更新循环索引
+                        break
 
-    def _init_result_tree(self, parent=None):
-        """初始化结果表格（确保列顺序正确）"""
-        # 如果没有提供父容器，使用默认的right_panel
-        if parent is None:
-            parent = self.right_panel
+                    # 如果找到了下一个类或函数定义，结束当前类块
+                    if next_class_or_function:
+                        chunks.append(('\n'.join(current_chunk), chunk_start_line, next_line_index - 1, current_type))
+                        current_chunk = []
+                        chunk_start_line = next_line_index
+                        current_type = "全局代码"
+                        in_class = False
+                        class_name = ""
+                        continue
 
-        # 创建结果框架
-        result_frame = ttk.Frame(parent)
-        result_frame.pack(expand=True, fill=tk.BOTH)
+            # 添加到当前块
+            current_chunk.append(line)
 
-        # 先创建Treeview组件
-        self.result_tree = ttk.Treeview(
-            result_frame,
-            columns=('ID', '漏洞类型', '风险等级', '文件路径', '漏洞描述', '风险点', 'Payload', '修复建议'),
-            show='headings',
-            selectmode='extended'
-        )
+        # 添加最后一个块
+        if current_chunk:
+            chunks.append(('\n'.join(current_chunk), chunk_start_line, len(lines), current_type))
 
-        # 配置列标题和宽度
-        columns_config = {
-            'ID': {'width': 25, 'anchor': 'center'},
-            '漏洞类型': {'width': 100, 'anchor': 'center'},
-            '风险等级': {'width': 100, 'anchor': 'center'},
-            '文件路径': {'width': 200, 'anchor': 'center'},
-            '漏洞描述': {'width': 200},
-            '风险点': {'width': 200},
-            'Payload': {'width': 150},
-            '修复建议': {'width': 150}
-        }
+        # 合并过小的块和注释块
+        merged_chunks = []
+        min_chunk_tokens = max(1, int(budget * self.SMALL_CHUNK_FRACTION))
+        current_merged = None
+        merged_tokens = 0
+        i = 0
 
-        # 设置行高，增加行间距
-        style = ttk.Style()
-        style.configure("Treeview", rowheight=29)  # 增加默认行高
+        while i < len(chunks):
+            chunk = chunks[i]
+            code, start, end, chunk_type = chunk
+            code_lines = code.splitlines()
 
-        # 为不同风险等级设置更明显的样式
-        if hasattr(self, 'severity_colors'):
-            for severity, color in self.severity_colors.items():
-                # 创建带有边框和更明显间距的标签样式
-                self.result_tree.tag_configure(severity, background=color, font=('微软雅黑', 10, 'bold'))
-        for col, config in columns_config.items():
-            self.result_tree.heading(col, text=col)
-            self.result_tree.column(col, width=config['width'], anchor=config.get('anchor', 'w'))
+            # 检查是否是注释块或者过小的块
+            is_comment_block = all(
+                line.strip().startswith("//") or line.strip().startswith("/*") or line.strip().startswith(
+                    "*") or not line.strip() for line in code_lines)
+            chunk_tokens = estimate_tokens(code)
+            is_small_block = chunk_tokens < min_chunk_tokens
 
-        # 修改打包顺序，先打包树形视图，再打包滚动条
-        self.result_tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+            # 如果是注释块或者过小的块，并且不是类定义或方法定义，考虑合并
+            if (is_comment_block or is_small_block) and not chunk_type.startswith(
+                    "类定义") and not chunk_type.startswith("方法") and not chunk_type.startswith("函数"):
+                # 尝试与下一个块合并（如果是函数或方法）
+                if i < len(chunks) - 1:
+                    next_chunk = chunks[i + 1]
+                    next_code, next_start, next_end, next_type = next_chunk
 
-        # 添加垂直滚动条
-        vsb = ttk.Scrollbar(result_frame, orient="vertical", command=self.result_tree.yview)
-        self.result_tree.configure(yscrollcommand=vsb.set)
-        vsb.pack(side=tk.RIGHT, fill=tk.Y)
+                    if next_type.startswith("函数") or next_type.startswith("方法"):
+                        # 将当前注释块合并到下一个函数/方法块
+                        merged_code = code + "\n" + next_code
+                        merged_chunk = (merged_code, start, next_end, next_type)
+                        chunks[i + 1] = merged_chunk
+                        i += 1
+                        continue
 
-        # 创建右键菜单
-        self.result_menu = tk.Menu(self.root, tearoff=0)
-        self.result_menu.add_command(label="删除选中项", command=self.delete_selected_vulnerabilities)
+                # 尝试与上一个合并的块或当前块合并
+                if current_merged is not None:
+                    # 合并小块
+                    merged_code, merged_start, merged_end, merged_type = current_merged
+                    current_merged = (merged_code + "\n" + code, merged_start, end, f"{merged_type}+{chunk_type}")
+                    merged_tokens += chunk_tokens
+                else:
+                    current_merged = chunk
+                    merged_tokens = chunk_tokens
+                # 合并块达到令牌下限后不再继续合并，其余小块由打包器跨文件填充
+                if merged_tokens >= min_chunk_tokens:
+                    merged_chunks.append(current_merged)
+                    current_merged = None
+            else:
+                if current_merged is not None:
+                    merged_chunks.append(current_merged)
+                    current_merged = None
+                merged_chunks.append(chunk)
 
-        # 绑定右键菜单事件
-        self.result_tree.bind("<Button-3>", self.show_context_menu)
-        # 绑定Ctrl+A快捷键
-        self.result_tree.bind("<Control-a>", self.select_all_vulnerabilities)
+            i += 1
 
-        # 最后添加事件绑定
-        self.result_tree.bind('<Double-1>', self.jump_to_file)
+        # 在函数末尾，返回chunks前添加排序代码
+        if current_merged is not None:
+            merged_chunks.append(current_merged)
 
-    def show_context_menu(self, event):
-        """显示右键菜单"""
-        # 获取当前选中项
-        selected_items = self.result_tree.selection()
-        if selected_items:  # 只有在有选中项时才显示菜单
-            self.result_menu.post(event.x_root, event.y_root)
+        # 按照起始行号排序分块
+        sorted_chunks = sorted(merged_chunks if merged_chunks else chunks, key=lambda x: x[1])
 
-    def select_all_vulnerabilities(self, event):
-        """选中所有漏洞"""
-        self.result_tree.selection_set(self.result_tree.get_children())
-        return "break"  # 阻止默认的Ctrl+A行为
+        return sorted_chunks
 
-    def delete_selected_vulnerabilities(self):
-        """删除选中的漏洞"""
-        selected_items = self.result_tree.selection()
-        if not selected_items:
-            return
+    def _chunk_java_code(self, lines, budget):
+        """Java代码智能分块"""
+        chunks = []
+        current_chunk = []
+        current_type = "全局代码"
+        chunk_start_line = 1
+        braces = BraceLexer('java')  # 跟踪大括号深度
+        in_class = False
+        in_method = False
+        in_comment = False
+        in_javadoc = False  # 新增：标记是否在Javadoc注释中
+        in_annotation = False
+        class_name = ""
+        method_name = ""
+        pending_method = False
+        pending_method_start = 0
+        class_brace_depth = 0
+        method_brace_depth = 0
 
-        # 确认删除
-        if messagebox.askyesno("确认删除", "确定要删除选中的漏洞吗？"):
-            # 获取所有选中项的文件路径和漏洞信息
-            for item in selected_items:
-                values = self.result_tree.item(item)['values']
-                file_path = values[3]  # 文件路径在第4列
-
-                # 从self.vulnerabilities中删除对应的漏洞
-                if file_path in self.vulnerabilities:
-                    # 根据其他信息(如漏洞类型、行号等)匹配并删除具体漏洞
-                    self.vulnerabilities[file_path] = [
-                        v for v in self.vulnerabilities[file_path]
-                        if not (v["漏洞类型"] == values[1] and
-                                v["风险等级"] == values[2] and
-                                str(v["行号"]) == values[8])  # 使用所有可用的匹配条件
-                    ]
-
-                    # 如果该文件没有漏洞了，删除该文件的记录
-                    if not self.vulnerabilities[file_path]:
-                        del self.vulnerabilities[file_path]
-
-                # 从树形视图中删除
-                self.result_tree.delete(item)
+        # 跳过所有导入语句和包声明
+        non_import_start_line = 1
+        import_lines = []
+        for i, line in enumerate(lines):
+            stripped = line.strip()
+            # 收集包声明或导入语句
+            if re.match(r'^\s*package\s+', line) or re.match(r'^\s*import\s+', line):
+                import_lines.append(line)
+                non_import_start_line = i + 2  # +2 是为了跳过当前行并从下一行开始
+                continue
+            # 找到第一个非导入语句，结束跳过
+            if stripped and not stripped.startswith("//") and not stripped.startswith("/*"):
+                break
 
-            # 更新状态栏
-            total_vulns = sum(len(vulns) for vulns in self.vulnerabilities.values())
-            self.status_bar.config(text=f"共发现 {total_vulns} 个漏洞")
+        # 更新起始行号
+        chunk_start_line = non_import_start_line
 
-    def load_full_config(self):
-        """后台加载完整配置"""
-        if self.config_path.exists():
-            self.config.read(self.config_path, encoding='utf-8')
-            self.api_key = self.config.get('DEFAULT', 'API_KEY', fallback='')
-            self.api_endpoint = self.config.get('DEFAULT', 'API_ENDPOINT')
+        # 处理剩余代码
+        i = 0
+        while i < len(lines):
+            line = lines[i]
+            line_num = i + 1
 
-    def delayed_init(self):
-        """延迟初始化非关键组件"""
-        if not self._validate_api_key():
-            pass
+            # 跳过导入语句和包声明
+            if re.match(r'^\s*package\s+', line) or re.match(r'^\s*import\s+', line):
+                i += 1
+                continue
 
-    def jump_to_file(self, event):
-        """双击结果跳转至对应文件（修复路径匹配问题）"""
-        item = self.result_tree.identify_row(event.y)
-        if not item:
-            return
+            stripped = line.strip()
 
-        # 获取文件路径（第4列，索引为3）并转换为绝对路径
-        selected_path = Path(self.result_tree.item(item, 'values')[3]).resolve()
+            # 处理Javadoc注释 - 新增逻辑
+            if stripped.startswith("/**"):
+                in_javadoc = True
+                javadoc_start = i
+                # 寻找Javadoc注释的结束
+                while i < len(lines) and "*/" not in lines[i]:
+                    i += 1
+                if i < len(lines):  # 找到了结束标记
+                    i += 1  # 跳过包含 */ 的行
+                in_javadoc = False
+                continue  # 跳过Javadoc注释，继续处理下一行
 
-        # 在文件树中查找对应路径（新增调试日志）
-        def search_tree(node):
-            for child in self.tree.get_children(node):
-                child_path = Path(self.tree.item(child, 'values')[0]).resolve()
+            # 处理普通多行注释
+            if "/*" in line and "*/" not in line and not in_javadoc:
+                in_comment = True
+            if "*/" in line and not in_javadoc:
+                in_comment = False
 
-                if child_path == selected_path:
-                    # 展开父节点并滚动到可视区域
-                    parent = self.tree.parent(child)
-                    self.tree.item(parent, open=True)
-                    self.tree.see(child)
-                    self.tree.selection_set(child)
-                    self.preview_code()  # 强制刷新预览
-                    return True
-                if search_tree(child):
-                    return True
-            return False
+            # 处理注解
+            if stripped.startswith("@") and not stripped.endswith(")"):
+                in_annotation = True
+            if in_annotation and ")" in line:
+                in_annotation = False
 
-        # 从根节点开始搜索（新增搜索失败提示）
-        if not search_tree(''):
-            messagebox.showinfo("路径未找到", f"未在项目中找到文件：{selected_path.name}")
+            # 跟踪大括号，忽略字符串和注释中的大括号
+            braces.feed(line)
 
-    def _init_code_preview(self, parent=None):
-        """初始化代码预览区域"""
-        # 如果没有提供父容器，使用默认的right_panel
-        if parent is None:
-            parent = self.right_panel
+            # 检测类定义
+            class_match = re.match(
+                r'^\s*(public|private|protected)?\s*(static|final|abstract)?\s*(class|interface|enum)\s+(\w+)', line)
+            if not in_comment and not in_annotation and class_match and not in_class:
+                if current_chunk:
+                    chunks.append(('\n'.join(current_chunk), chunk_start_line, line_num - 1, current_type))
+                current_chunk = [line]
+                chunk_start_line = line_num
+                # 提取类名
+                class_name = class_match.group(4) if class_match.group(4) else "匿名类"
+                current_type = f"类定义({class_name})"
+                in_class = True
+                class_brace_depth = braces.depth
+                pending_method = False  # 重置待处理方法注释状态
+                i += 1
+                continue
 
-        # 新增搜索工具栏
-        self.search_frame = ttk.Frame(parent)
-        self.search_frame.pack(side=tk.TOP, fill=tk.X, pady=2)
+            # 改进后的方法匹配模式，支持注解和多个修饰符
+            method_match = re.match(
+                r'^\s*((@\w+\s*(\([^)]*\))?\s+)+)?\s*((?:public|private|protected|static|final|abstract|synchronized|native|transient|volatile)\s+)*\s*(?:<[^>]+>\s+)?[\w.<>\[\],\s]+?\s+(\w+)\s*\(',
+                line)
 
-        # 搜索输入框和按钮
-        self.search_var = tk.StringVar()
-        self.search_entry = ttk.Entry(self.search_frame, textvariable=self.search_var)
-        self.search_entry.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=5)
+            # 如果没有匹配到标准方法定义，尝试匹配构造函数
+            if not method_match and in_class:
+                # 增强构造函数检测（支持注解和多个修饰符）
+                constructor_match = re.match(
+                    r'^\s*((@\w+\s+)*((public|private|protected|static|final|abstract|synchronized)\s+)*)*'
+                    + re.escape(class_name) + r'\s*\(', line)
+                if constructor_match:
+                    method_match = constructor_match
+                    method_name = class_name  # 构造函数名与类名相同
 
-        ttk.Button(self.search_frame, text="搜索", command=self.search_in_code).pack(side=tk.LEFT, padx=5)
-        ttk.Button(self.search_frame, text="下一个", command=lambda: self.search_in_code(direction="next")).pack(
-            side=tk.LEFT, padx=5)
-        ttk.Button(self.search_frame, text="上一个", command=lambda: self.search_in_code(direction="prev")).pack(
-            side=tk.LEFT, padx=5)
+            if in_class and not in_comment and not in_annotation and method_match and not in_method:
+                # 提取方法名
+                if method_match.group(4) if len(method_match.groups()) >= 4 else None:
+                    method_name = method_match.group(4)
+                elif not method_name:  # 如果不是构造函数且没有提取到方法名
+                    method_name = "匿名方法"
 
-        # 代码显示区域
-        code_container = ttk.Frame(self.code_frame)
-        code_container.pack(fill=tk.BOTH, expand=True)
+                # 如果当前块不是类定义的一部分，则创建新块
+                if current_chunk and "类定义" not in current_type:
+                    chunks.append(('\n'.join(current_chunk), chunk_start_line, line_num - 1, current_type))
+                    current_chunk = []
+                    chunk_start_line = line_num
 
-        # 行号显示
-        self.line_number = tk.Text(code_container, width=4, padx=3, takefocus=0, border=0,
-                                   background='#f0f0f0', state='disabled')
-        self.line_number.pack(side=tk.LEFT, fill=tk.Y)
+                # 添加方法定义行到当前块
+                current_chunk.append(line)
+                current_type = f"方法({class_name}.{method_name})"
+                in_method = True
+                method_brace_depth = braces.depth
+                pending_method = False  # 重置待处理方法注释状态
+                i += 1
+                continue
 
-        # 代码文本区域
-        self.code_text = tk.Text(code_container, wrap=tk.NONE, state='normal')
-        self.code_text.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+            # 检测方法结束 - 改进的逻辑
+            if in_method and '}' in line:
+                current_chunk.append(line)
 
-        # 垂直滚动条
-        code_vsb = ttk.Scrollbar(code_container, orient="vertical", command=self.code_text.yview)
+                # 检查大括号栈的深度是否回到方法开始前的水平
+                # 严格匹配大括号层级（考虑嵌套代码块）
+                if braces.depth == method_brace_depth - 1 and re.search(r'^\s*}\s*$', line):
+                    # 查找下一个方法定义
+                    next_method_found = False
+                    for j in range(i + 1, min(i + 20, len(lines))):
+                        next_line = lines[j].strip()
+                        # 跳过空行和注释行
+                        if not next_line or next_line.startswith('//') or next_line.startswith('/*'):
+                            continue
 
-        # 自定义yscrollcommand函数，确保滚动条操作时同步更新行号
-        def custom_yscrollcommand(first, last):
-            code_vsb.set(first, last)
-            # 确保行号与代码同步滚动
-            if hasattr(self, 'line_number') and self.line_number:
-                self.line_number.yview_moveto(first)
-                self.update_line_numbers()
+                        # 检查是否是方法定义
+                        next_method_match = re.match(
+                            r'^\s*(public|private|protected)?\s*(static|final|abstract|synchronized)?\s*(<.*>)?\s*[\w<>[\],\s\.]+\s+(\w+)\s*\(',
+                            next_line)
 
-        self.code_text.configure(yscrollcommand=custom_yscrollcommand)
-        code_vsb.pack(side=tk.RIGHT, fill=tk.Y)
+                        if next_method_match or re.match(
+                                r'^\s*(public|private|protected)?\s*' + re.escape(class_name) + r'\s*\(', next_line):
+                            next_method_found = True
+                            break
 
-        # 水平滚动条
-        code_hsb = ttk.Scrollbar(self.code_frame, orient="horizontal", command=self.code_text.xview)
-        self.code_text.configure(xscrollcommand=code_hsb.set)
-        code_hsb.pack(side=tk.BOTTOM, fill=tk.X)
+                        # 如果找到了非方法定义的实质性代码行，则不是方法结束
+                        if next_line and not re.match(r'^\s*(}|@|//)', next_line):
+                            break
 
-        # 同步行号和代码滚动
-        self.code_text.bind('<Configure>', self.update_line_numbers)
-        self.code_text.bind("<MouseWheel>", self.sync_scroll)
+                    # 如果确认是方法结束
+                    if next_method_found or braces.depth < method_brace_depth:
+                        chunks.append(('\n'.join(current_chunk), chunk_start_line, line_num, current_type))
+                        current_chunk = []
+                        chunk_start_line = line_num + 1
+                        current_type = f"类内代码({class_name})"
+                        in_method = False
+                        method_name = ""  # 重置方法名
+                i += 1
+                continue
 
-        # 设置标签样式
-        self.code_text.tag_configure('number', foreground='#0000FF')
-        self.code_text.tag_configure('string', foreground='#008000')
-        self.code_text.tag_configure('comment', foreground='#999999')
-        self.code_text.tag_configure('keyword', foreground='#CC7832')
-        self.code_text.tag_configure('operator', foreground='#000000')
-        self.code_text.tag_configure('bracket', foreground='#000000')
-        self.code_text.tag_configure('function', foreground='#006699')
-        self.code_text.tag_configure('class', foreground='#007F7F')
+            # 检测类结束
+            if in_class and braces.depth <= class_brace_depth and '}' in line:
+                current_chunk.append(line)
 
-        # 扩展颜色配置（新增更多语法元素）
-        self.code_text.tag_configure('php_keyword', foreground='#CC7832', font='TkFixedFont 10 bold')
-        self.code_text.tag_configure('java_keyword', foreground='#0033CC', font='TkFixedFont 10 bold')
-        self.code_text.tag_configure('string', foreground='#008000')
-        self.code_text.tag_configure('comment', foreground='#999999')
-        self.code_text.tag_configure('number', foreground='#FF4500')  # 新增数字
-        self.code_text.tag_configure('operator', foreground='#0000FF')  # 新增运算符
-        self.code_text.tag_configure('bracket', foreground='#802080')  # 新增括号
-        self.code_text.tag_configure('function', foreground='#006699')  # 新增函数调用
-        self.code_text.tag_configure('classname', foreground='#007F7F')  # 新增类名
+                # 检查是否是单独的结束括号行
+                if line.strip() == '}':
+                    # 检查下一个非空行是否是另一个类或方法的开始
+                    next_class_or_method = False
+                    next_line_index = 0
 
-        # 新增HTML特定语法元素
-        self.code_text.tag_configure('html_tag', foreground='#0000FF')
-        self.code_text.tag_configure('html_tag_name', foreground='#0000CD', font='TkFixedFont 10 bold')
-        self.code_text.tag_configure('html_attribute', foreground='#FF8C00')
-        self.code_text.tag_configure('html_value', foreground='#008000')
-        self.code_text.tag_configure('html_entity', foreground='#800080')
-        self.code_text.tag_configure('html_doctype', foreground='#800080', font='TkFixedFont 10 italic')
-        self.code_text.tag_configure('html_script', foreground='#A52A2A')
-        self.code_text.tag_configure('html_style', foreground='#2E8B57')
-        self.code_text.tag_configure('html_template', foreground='#CC7832')
+                    # 向前查看，寻找下一个类或方法定义
+                    for j in range(i + 1, min(i + 20, len(lines))):
+                        next_line = lines[j].strip()
+                        # 跳过空行和注释行
+                        if not next_line or next_line.startswith('//') or next_line.startswith('/*'):
+                            continue
 
-        # 新增Java特定语法元素
-        self.code_text.tag_configure('java_primitive', foreground='#0000FF', font='TkFixedFont 10')  # 基本类型
-        self.code_text.tag_configure('java_annotation', foreground='#808000', font='TkFixedFont 10 italic')  # 注解
-        self.code_text.tag_configure('java_constant', foreground='#660E7A', font='TkFixedFont 10 bold')  # 常量
-        self.code_text.tag_configure('java_modifier', foreground='#7F0055', font='TkFixedFont 10 bold')  # 修饰符
-        self.code_text.tag_configure('java_exception', foreground='#CC0000', font='TkFixedFont 10')  # 异常相关
-        self.code_text.tag_configure('java_import', foreground='#008080', font='TkFixedFont 10')  # 导入语句
+                        # 如果找到了类或方法定义
+                        if (re.match(
+                                r'^(public|private|protected)?\s*(static|final|abstract)?\s*(class|interface|enum)\s+(\w+)',
+                                next_line) or
+                                re.match(
+                                    r'^(public|private|protected)?\s*(static|final|abstract|synchronized)?\s*(<.*>)?\s*[\w<>[\],\s\.]+\s+(\w+)\s*\(',
+                                    next_line)):
+                            next_class_or_method = True
+                            next_line_index = j
+                            break
 
-        # 新增PHP特定语法元素
-        self.code_text.tag_configure('php_var', foreground='#9B59B6', font='TkFixedFont 10')  # PHP变量
-        self.code_text.tag_configure('php_function', foreground='#006699', font='TkFixedFont 10 bold')  # PHP函数
-        self.code_text.tag_configure('php_class', foreground='#007F7F', font='TkFixedFont 10 bold')  # PHP类
-        self.code_text.tag_configure('php_namespace', foreground='#808000', font='TkFixedFont 10 italic')  # 命名空间
-        self.code_text.tag_configure('php_superglobal', foreground='#CC0000', font='TkFixedFont 10 bold')  # 超全局变量
-        self.code_text.tag_configure('php_constant', foreground='#660E7A', font='TkFixedFont 10 bold')
+                        # 如果找到了非类或方法定义的代码行
+                        break
 
-    def search_in_code(self, direction=None):
-        """在代码预览区域中搜索文本
+                    # 如果找到了下一个类或方法定义，结束当前类块
+                    if next_class_or_method:
+                        chunks.append(('\n'.join(current_chunk), chunk_start_line, next_line_index - 1, current_type))
+                        current_chunk = []
+                        chunk_start_line = next_line_index
+                        current_type = "全局代码"
+                        in_class = False
+                        class_name = ""
+                    else:
+                        # 如果没有找到下一个类或方法，将这个结束括号与前面的代码合并
+                        chunks.append(('\n'.join(current_chunk), chunk_start_line, line_num, current_type))
+                        current_chunk = []
+                        chunk_start_line = line_num + 1
+                        current_type = "全局代码"
+                        in_class = False
+                        class_name = ""
+                else:
+                    # 如果不是单独的结束括号行，按原逻辑处理
+                    chunks.append(('\n'.join(current_chunk), chunk_start_line, line_num, current_type))
+                    current_chunk = []
+                    chunk_start_line = line_num + 1
+                    current_type = "全局代码"
+                    in_class = False
+                    class_name = ""
 
-        Args:
-            direction (str, optional): 搜索方向，可选值为 "next" 或 "prev"。默认为 None，表示从当前位置开始新搜索。
-        """
-        # 移除之前的高亮
-        self.code_text.tag_remove('search_highlight', '1.0', tk.END)
+                i += 1
+                continue
 
-        # 获取搜索文本
-        search_text = self.search_var.get()
-        if not search_text:
-            return
+            # 添加到当前块
+            current_chunk.append(line)
+            i += 1
 
-        # 配置高亮样式（如果尚未配置）
-        if not self.code_text.tag_cget('search_highlight', 'background'):
-            self.code_text.tag_configure('search_highlight', background='#FFFF00', foreground='#000000')
+        # 添加最后一个块
+        if current_chunk:
+            chunks.append(('\n'.join(current_chunk), chunk_start_line, len(lines), current_type))
 
-        # 确定搜索起始位置
-        if direction == "next":
-            # 从当前位置之后开始搜索
-            start_pos = self.code_text.index(tk.INSERT)
-        elif direction == "prev":
-            # 从当前位置之前开始搜索 - 修复上一个按钮功能
-            start_pos = self.code_text.index(tk.INSERT)
-        else:
-            # 新搜索，从文本开头开始
-            start_pos = '1.0'
+        # 合并过小的块和注释块
+        merged_chunks = []
+        min_chunk_tokens = max(1, int(budget * self.SMALL_CHUNK_FRACTION))
+        current_merged = None
+        merged_tokens = 0
+        i = 0
 
-        # 执行搜索
-        if direction == "prev":
-            # 向上搜索
-            pos = self.code_text.search(search_text, start_pos, '1.0', backwards=True)
-            if not pos:
-                # 如果没找到，则从末尾继续搜索
-                pos = self.code_text.search(search_text, tk.END, '1.0', backwards=True)
-        else:
-            # 向下搜索
-            pos = self.code_text.search(search_text, start_pos, tk.END)
-            if not pos and start_pos != '1.0':
-                # 如果没找到且不是从头开始，则从头继续搜索
-                pos = self.code_text.search(search_text, '1.0', tk.END)
+        while i < len(chunks):
+            chunk = chunks[i]
+            code, start, end, chunk_type = chunk
+            code_lines = code.splitlines()
 
-        # 处理搜索结果
-        if pos:
-            # 计算匹配文本的结束位置
-            end_pos = f"{pos}+{len(search_text)}c"
+            # 检查是否是注释块或者过小的块
+            is_comment_block = all(
+                line.strip().startswith("//") or line.strip().startswith("/*") or line.strip().startswith(
+                    "*") or not line.strip() for line in code_lines)
+            chunk_tokens = estimate_tokens(code)
+            is_small_block = chunk_tokens < min_chunk_tokens
 
-            # 高亮显示匹配文本
-            self.code_text.tag_add('search_highlight', pos, end_pos)
+            # 如果是注释块或者过小的块，并且不是类定义或方法定义，考虑合并
+            if (is_comment_block or is_small_block) and not chunk_type.startswith(
+                    "类定义") and not chunk_type.startswith("方法"):
+                # 尝试与下一个块合并（如果是方法）
+                if i < len(chunks) - 1:
+                    next_chunk = chunks[i + 1]
+                    next_code, next_start, next_end, next_type = next_chunk
 
-            # 确保匹配文本可见
-            self.code_text.see(pos)
+                    if next_type.startswith("方法"):
+                        # 将当前注释块合并到下一个方法块
+                        merged_code = code + "\n" + next_code
+                        merged_chunk = (merged_code, start, next_end, next_type)
+                        chunks[i + 1] = merged_chunk
+                        i += 1
+                        continue
 
-            # 将插入点移动到匹配文本之前或之后，取决于搜索方向
-            if direction == "prev":
-                # 向上搜索时，将插入点移动到匹配文本之前
-                self.code_text.mark_set(tk.INSERT, pos)
+                # 尝试与上一个合并的块或当前块合并
+                if current_merged is not None:
+                    # 合并小块
+                    merged_code, merged_start, merged_end, merged_type = current_merged
+                    current_merged = (merged_code + "\n" + code, merged_start, end, f"{merged_type}+{chunk_type}")
+                    merged_tokens += chunk_tokens
+                else:
+                    current_merged = chunk
+                    merged_tokens = chunk_tokens
+                # 合并块达到令牌下限后不再继续合并，其余小块由打包器跨文件填充
+                if merged_tokens >= min_chunk_tokens:
+                    merged_chunks.append(current_merged)
+                    current_merged = None
             else:
-                # 向下搜索时，将插入点移动到匹配文本之后
-                self.code_text.mark_set(tk.INSERT, end_pos)
+                if current_merged is not None:
+                    merged_chunks.append(current_merged)
+                    current_merged = None
+                merged_chunks.append(chunk)
 
-            # 更新状态栏
-            line = pos.split('.')[0]
-            self.status_bar.config(text=f"找到匹配项，位于第 {line} 行")
-        else:
-            # 未找到匹配项
-            self.status_bar.config(text=f"未找到 '{search_text}'")
+            i += 1
 
-    def _init_detail_panel(self, parent=None):
-        """初始化详细信息面板"""
-        # 如果没有提供父容器，使用默认的right_panel
-        if parent is None:
-            parent = self.right_panel
+        if current_merged is not None:
+            merged_chunks.append(current_merged)
 
-        # 创建详细信息文本框
-        self.detail_text = tk.Text(
-            parent,
-            height=8,
-            wrap=tk.WORD,
-            state='normal'
-        )
-        self.detail_text.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        # 按照起始行号排序分块
+        sorted_chunks = sorted(merged_chunks if merged_chunks else chunks, key=lambda x: x[1])
 
-        # 添加滚动条 - 注意这里修改了side为RIGHT
-        detail_vsb = ttk.Scrollbar(parent, orient="vertical", command=self.detail_text.yview)
-        self.detail_text.configure(yscrollcommand=detail_vsb.set)
-        detail_vsb.pack(side=tk.RIGHT, fill=tk.Y)
+        # 在这里添加合并单独的结束括号块的代码
+        final_chunks = []
+        i = 0
+        while i < len(sorted_chunks):
+            chunk = sorted_chunks[i]
+            code, start, end, chunk_type = chunk
 
-    def _init_status_bar(self):
-        """初始化状态栏"""
-        self.progress = ttk.Progressbar(self.root, mode='determinate')
-        self.progress.pack(side=tk.BOTTOM, fill=tk.X, padx=5, pady=2)
-        self.status_bar = ttk.Label(self.root, text="就绪", relief=tk.SUNKEN)
-        self.status_bar.pack(side=tk.BOTTOM, fill=tk.X)
+            # 检查是否是单独的结束括号块
+            if code.strip() == "}" and "类内代码" in chunk_type:
+                # 尝试与前一个块合并
+                if i > 0:
+                    prev_chunk = sorted_chunks[i - 1]
+                    prev_code, prev_start, prev_end, prev_type = prev_chunk
 
-    def _bind_events(self):
-        """绑定事件"""
-        self.result_tree.bind('<<TreeviewSelect>>', self.show_detail)
-        self.tree.bind('<Double-1>', self.preview_code)
-        self.code_text.bind('<MouseWheel>', self.sync_scroll)
-        self.code_text.bind('<Configure>', self.update_line_numbers)
-        self.root.bind('<Control-f>', lambda e: self.search_entry.focus())
+                    # 提取类名
+                    class_name_match = re.search(r'\(([^)]+)\)', chunk_type)
+                    if class_name_match:
+                        class_name = class_name_match.group(1)
 
-    def delayed_config_init(self):
-        """延迟配置初始化，确保UI组件已完全加载"""
-        self.project_path = Path.cwd()
-        threading.Thread(target=self._config_worker, daemon=True).start()
+                        # 如果前一个块是同一个类的一部分，将结束括号合并到前一个块
+                        if class_name in prev_type:
+                            merged_code = prev_code + "\n" + code
+                            merged_chunk = (merged_code, prev_start, end, prev_type)
+                            if final_chunks:  # 确保final_chunks不为空
+                                final_chunks[len(final_chunks) - 1] = merged_chunk
+                            else:
+                                final_chunks.append(merged_chunk)
+                        else:
+                            final_chunks.append(chunk)
+                    else:
+                        final_chunks.append(chunk)
+                else:
+                    final_chunks.append(chunk)
+            else:
+                final_chunks.append(chunk)
 
-    def _config_worker(self):
-        """配置初始化工作线程"""
-        self._init_configuration()
-        self.root.after(100, self._post_config_init)
+            i += 1
 
-    def _post_config_init(self):
-        """配置初始化后的处理"""
-        if not hasattr(self, 'api_key') or not self.api_key:
-            self.api_key = self.config.get('DEFAULT', 'API_KEY', fallback='')
+        # 返回最终合并后的块
+        return final_chunks if final_chunks else sorted_chunks
 
-        self.validation_start_time = time.time()
-        self._validate_api_key()
-        self.root.after(500, self.check_initial_validation)
 
-    def post_config_init(self):
-        """配置加载后的初始化"""
-        if not hasattr(self, 'api_key') or not self.api_key:
-            self.api_key = self.config.get('DEFAULT', 'API_KEY', fallback='')
-            return
+def chunk_source(data, file_ext, budget, verbose=False):
+    """把文件内容（字节）分块，XML/POM、PHP/Java文件和超出令牌预算的文件按代码结构分块，其余文件整体作为一个代码块"""
+    code = data.decode('utf-8', errors='replace')
+    if file_ext in ['.xml', '.pom', '.java', '.php'] or estimate_tokens(code) > budget:
+        return CodeChunker(verbose).chunk_code(code, file_ext, budget)
+    return [(code, 1, len(code.splitlines()), "完整文件")]
 
-        # 添加验证超时计时器
-        self.validation_start_time = time.time()
-        self.status_bar.config(text="正在验证API密钥...")
-        self._validate_api_key()
-        self.root.after(500, self.check_initial_validation)
 
-    def check_initial_validation(self):
-        """检查初始API验证状态 - 已移除实际验证逻辑"""
-        self.api_validated = True
-        return True
+def iter_source_files(root, suffixes):
+    """惰性遍历目录，逐个产出后缀在suffixes中的文件"""
+    for current, dirs, names in os.walk(root):
+        for name in names:
+            file_path = Path(current) / name
+            if file_path.suffix in suffixes:
+                yield file_path
 
-    def search_text(self, forward=True):
-        """执行文本搜索"""
-        self.code_text.tag_remove('highlight', '1.0', tk.END)
-        search_str = self.search_entry.get()
-        if not search_str:
-            return
 
-        start_pos = self.code_text.index(tk.INSERT)
-        if forward:
-            match_pos = self.code_text.search(search_str, start_pos, tk.END, nocase=False)
-            if not match_pos:
-                match_pos = self.code_text.search(search_str, '1.0', tk.END, nocase=False)
-        else:
-            match_pos = self.code_text.search(search_str, start_pos + '-1c', '1.0', backwards=True, nocase=False)
-            if not match_pos:
-                match_pos = self.code_text.search(search_str, tk.END, '1.0', backwards=True, nocase=False)
+def _chunk_source_task(data, file_ext, budget, verbose=False):
+    """分块进程池中执行的任务，同时返回消耗的CPU时间"""
+    started = time.process_time()
+    chunks = chunk_source(data, file_ext, budget, verbose)
+    return chunks, time.process_time() - started
 
-        if match_pos:
-            end_pos = f"{match_pos}+{len(search_str)}c"
-            self.code_text.tag_add('highlight', match_pos, end_pos)
-            self.code_text.see(match_pos)
-            self.code_text.mark_set(tk.INSERT, end_pos if forward else match_pos)
 
-    # ------------------ 核心功能方法 ------------------ #
-    def open_project(self):
-        """打开项目目录"""
-        if path := filedialog.askdirectory():
-            self.project_path = Path(path)
-            # 清空现有树节点
-            self.tree.delete(*self.tree.get_children())
-            # 添加根目录节点（新增代码）
-            root_node = self.tree.insert('', 'end',
-                                         text=self.project_path.name,
-                                         values=[str(self.project_path)],
-                                         open=True)
-            # 填充子项（修改调用参数）
-            self._populate_tree(self.project_path, parent=root_node)
-            self.status_bar.config(text=f"已打开项目：{path}")
+class AuditEngine:
+    """与图形界面无关的代码审计引擎
 
-    def start_analysis(self):
-        """开始分析（优化后的多线程版本）"""
-        try:
-            # 检查是否已有分析线程在运行
-            if hasattr(self,
-                       'auto_analysis_thread') and self.auto_analysis_thread and self.auto_analysis_thread.is_alive():
-                messagebox.showinfo("提示", "已有分析任务正在运行，请等待完成或取消当前任务")
-                return False
+    负责配置读取、代码分块、请求调度、响应解析和结果缓存。界面相关的操作全部通过下方的钩子方法完成，
+    图形界面(CodeAuditApp)和命令行模式(HeadlessAudit)分别重写这些钩子，共用同一套分析流程。
+    """
 
-            # 获取选中的文件列表
-            file_list = self._get_selected_files()
+    # 分块计划缓存最多保留的文件数和代码字符数
+    CHUNK_PLAN_CACHE_SIZE = 5000
+    CHUNK_PLAN_CACHE_CHARS = 32 * 1024 * 1024
+    # 每次扫描的前若干个文件直接在当前线程分块，之后才启用分块进程池
+    CHUNK_POOL_MIN_FILES = 32
+    # 响应被截断时重新提交剩余代码的最大拆分层数
+    TRUNCATION_SPLIT_DEPTH = 4
+    # 风险优先调度时每组排序的文件数
+    PRIORITY_WINDOW_FILES = 256
 
-            # 检查是否有选中文件
-            if not file_list:
-                messagebox.showinfo("提示", "请先选择要分析的文件")
-                return False
+    def __init__(self, config_path=None, persistent=True, verbose=True):
+        """
+        Args:
+            config_path: 配置文件路径，默认当前目录下的config.ini
+            persistent: 为False时不创建结果数据库、结果缓存和检查点日志，不在.deepaudit下留下任何文件（基准测试使用）
+            verbose: 为True时把分块等调试信息输出到标准错误（包括分块进程池中的子进程）
+        """
+        self.verbose = verbose
 
-            # 检查API密钥是否已配置
-            if not self.api_key:
-                messagebox.showwarning("警告", "API密钥未配置，请先在设置中配置API密钥")
-                return False
+        # API验证错误提示状态标志
+        self.api_validation_error_shown = False
+        self.validation_lock = threading.Lock()  # 添加线程锁
 
-            # 重置API验证错误标志
-            self.api_validation_error_shown = False
+        # 添加API验证状态标志，用于记录API是否已验证成功
+        self.api_validated = False
 
-            # 优化API验证逻辑：只在实际需要使用API时才验证
-            # 如果API已经验证过且有效，直接继续分析流程
-            if hasattr(self, 'api_validated') and self.api_validated:
-                # API已验证，直接继续
-                pass
-            else:
-                # 设置API为已验证状态，跳过验证步骤
-                # 只有在实际调用API进行分析时才会真正验证API有效性
-                self.api_validated = True
-                self.status_bar.config(text="准备开始分析...")
+        # 扫描结果持久化存储，本次运行中登记的扫描ID
+        self.result_store = None
+        if persistent:
+            try:
+                self.result_store = ResultStore(Path.cwd() / '.deepaudit' / 'results.db', on_error=self.log_error)
+            except Exception as e:
+                print(f"[ERROR] 结果数据库初始化失败，结果不会持久保存: {str(e)}")
+        self._scan_id = None
+        self.session_scan_ids = []
+
+        # 分块计划缓存：(文件类型, 内容哈希) -> 代码块列表
+        self._chunk_plan_cache = OrderedDict()
+        self._chunk_plan_lock = threading.Lock()
+        self._chunk_plan_cache_chars = 0
+        self.chunk_plan_cache_hits = 0
+        self.chunking_cpu_seconds = 0.0
+        self._chunk_pool = None
 
-                # 注意：实际的API验证将在发送请求时进行
-                # 这样可以避免不必要的API验证，提高用户体验
-
-            # 记录开始分析
-            self.log_info(f"开始分析任务，选中文件数: {len(file_list)}")
+        # 初始化分析状态
+        self.auto_analysis_cancelled = False
+        self.auto_analysis_paused = False
+        self.progress_total = 0
+        self.progress_done = 0
 
-            # 初始化总块数计算 - 先不要设置进度条
-            total_chunks = 0
-            for file_path in file_list:
-                if file_path.suffix in self.supported_langs:
-                    # 对于大文件或特殊文件预计会有更多块
-                    if file_path.suffix.lower() in ['.xml', '.pom', '.java',
-                                                    '.php'] or file_path.name.lower() == 'pom.xml':
-                        # 读取文件以估计块数
-                        try:
-                            with open(file_path, 'r', encoding='utf-8', errors='ignore') as f:
-                                code = f.read()
-                                chunks = self._smart_code_chunking(code, file_path.suffix)
-                                total_chunks += len(chunks)
-                        except Exception:
-                            # 读取失败时默认为3个块
-                            total_chunks += 3
-                    else:
-                        # 普通文件默认为1个块
-                        total_chunks += 1
+        # 读取配置文件，不存在时使用默认配置
+        self.config = configparser.ConfigParser()
+        self.config_path = Path(config_path) if config_path else Path.cwd() / 'config.ini'
+        if self.config_path.exists():
+            self.config.read(self.config_path, encoding='utf-8')
+        else:
+            self.config['DEFAULT'] = {
+                'API_KEY': '',
+                'API_ENDPOINT': 'https://api.deepseek.com/v1/chat/completions',
+                'TIMEOUT': '30'
+            }
 
-            # 设置进度条最大值为估计的总块数，而不是文件数
-            total_chunks = max(total_chunks, len(file_list))
-            self.progress['maximum'] = total_chunks
-            self.progress['value'] = 0
-            self.status_bar.config(text=f"准备分析 {len(file_list)} 个文件，预计 {total_chunks} 个代码块")
+        # 修正API终端地址（添加/v1/chat/completions路径）
+        self.api_endpoint = self.config['DEFAULT'].get('API_ENDPOINT', 'https://api.deepseek.com/v1/chat/completions')
+        self.api_key = self.config.get('DEFAULT', 'API_KEY', fallback='')
+        self.model = self.config.get('DEFAULT', 'MODEL', fallback='deepseek-chat')
+        self._debug(f"最终API终端: {self.api_endpoint}")
 
-            # 重置分析状态
-            self.auto_analysis_cancelled = False
-            self.auto_analysis_paused = False
+        # 全局最大在途请求数，所有文件的代码块共享这一个并发上限
+        self.max_concurrency = self.config.getint('DEFAULT', 'MAX_CONCURRENCY', fallback=50)
 
-            # 清空事件队列，避免之前的事件影响当前分析
-            try:
-                while True:
-                    self.event_queue.get_nowait()
-                    self.event_queue.task_done()
-            except queue.Empty:
-                pass
+        # 共享HTTP连接池，大小与最大并发请求数一致，避免每个代码块重新握手
+        self.http_pool = ApiSessionPool(pool_size=self.max_concurrency)
 
-            # 更改按钮文本和状态
-            self.btn_analyze.config(text="取消分析", command=self.cancel_analysis)
+        # asyncio请求引擎，所有代码块请求都通过它提交，实际并发从INITIAL_CONCURRENCY开始自适应调整
+        self.request_engine = AsyncRequestEngine(
+            max_concurrency=self.max_concurrency,
+            initial_concurrency=self.config.getint('DEFAULT', 'INITIAL_CONCURRENCY',
+                                                   fallback=min(8, self.max_concurrency))
+        )
 
-            # 更新状态栏
-            self.status_bar.config(text=f"准备分析 {len(file_list)} 个文件...")
+        # 客户端限流：每分钟请求数/令牌数（0为不限制），429时按Retry-After暂停后重试
+        self.rate_limiter = RateLimiter(
+            requests_per_minute=self.config.getint('DEFAULT', 'RATE_LIMIT_RPM', fallback=0),
+            tokens_per_minute=self.config.getint('DEFAULT', 'RATE_LIMIT_TPM', fallback=0)
+        )
+        self.rate_limit_retries = self.config.getint('DEFAULT', 'RATE_LIMIT_RETRIES', fallback=5)
 
-            # 创建后台线程
-            self.auto_analysis_thread = threading.Thread(
-                target=self._analysis_worker,
-                args=(file_list,),
-                daemon=True,
-                name="AnalysisWorkerThread"
-            )
-            self.auto_analysis_thread.start()
-            self.root.after(100, self._handle_events)
+        # 服务端上下文缓存命中的提示令牌统计
+        self.prompt_tokens_total = 0
+        self.prompt_cache_hit_tokens = 0
 
-            # 记录线程启动
-            self.log_info(f"分析线程已启动，线程ID: {self.auto_analysis_thread.ident}")
-            return True
-        except Exception as e:
-            self.log_error(f"启动分析失败: {str(e)}\n{traceback.format_exc()}")
-            messagebox.showerror("错误", f"启动分析失败: {str(e)}")
-            return False
+        # 分块进程数，文件较多时在进程池中并行分块
+        self.chunk_workers = self.config.getint('DEFAULT', 'CHUNK_WORKERS', fallback=os.cpu_count() or 1)
 
-    def _handle_events(self):
-        """处理事件队列中的任务"""
-        try:
-            # 限制每次处理的事件数量，防止UI阻塞
-            max_events = 10
-            events_processed = 0
+        # 代码块令牌预算：单块代码不超过CHUNK_MAX_TOKENS，提示词+代码+预留输出不超过模型上下文长度
+        self.chunk_max_tokens = self.config.getint('DEFAULT', 'CHUNK_MAX_TOKENS', fallback=6000)
+        self.model_context_tokens = self.config.getint('DEFAULT', 'MODEL_CONTEXT_TOKENS', fallback=65536)
+        self.max_output_tokens = self.config.getint('DEFAULT', 'MAX_OUTPUT_TOKENS', fallback=8192)
 
-            while events_processed < max_events:
-                try:
-                    event_type, data, callback = self.event_queue.get_nowait()
-                    events_processed += 1
+        # 流式响应：每个漏洞在模型输出中闭合后立即显示
+        self.stream_responses = self.config.getboolean('DEFAULT', 'STREAM_RESPONSES', fallback=True)
 
-                    # 如果分析已取消，忽略进度更新事件
-                    if self.auto_analysis_cancelled and event_type == 'progress':
-                        self.event_queue.task_done()
-                        continue
+        # 内容去重：同一次扫描中内容相同的代码块只分析一次，结果分发到每个副本
+        self.dedup_enabled = self.config.getboolean('DEFAULT', 'DEDUP_ENABLED', fallback=True)
+        self._deduplicator = None
 
-                    # 根据事件类型处理
-                    if event_type == 'progress':
-                        self._handle_progress_event()
-                    elif event_type == 'result':
-                        self._handle_result_event(data)
-                    elif event_type == 'done':
-                        self._handle_done_event()
-                        # 继续事件循环，不处理更多事件
-                        self.root.after(100, self._handle_events)
-                        return
-                    elif event_type == 'api_validation':
-                        self._handle_api_validation_event(data)
-                    elif event_type == 'error':
-                        self._handle_error_event(data)
+        # 本地预筛选：跳过没有危险函数和外部输入的代码块，级别为off/loose/strict
+        try:
+            self.prefilter = SinkPrefilter(self.config.get('DEFAULT', 'PREFILTER_LEVEL', fallback='loose'))
+        except ValueError as e:
+            print(f"[ERROR] {str(e)}，不进行预筛选")
+            self.prefilter = SinkPrefilter('off')
+        self.prefilter_skipped = 0
+
+        # 级联模式：每个代码块先由SCREEN_MODEL快速初筛，只有被标记可疑的代码块才交给当前模型完整分析
+        self.cascade_mode = self.config.getboolean('DEFAULT', 'CASCADE_MODE', fallback=False)
+        self.screen_model = self.config.get('DEFAULT', 'SCREEN_MODEL', fallback='deepseek-chat')
+        self.cascade_screened = 0
+        self.cascade_flagged = 0
+
+        # 检查点日志：记录已完成的代码块，扫描中断后可以继续
+        self.checkpoint_enabled = persistent and self.config.getboolean('DEFAULT', 'CHECKPOINT_ENABLED', fallback=True)
+        self._journal = None
+        self._file_hashes = {}
+
+        # 风险优先调度：分析前为文件打分，高风险文件和代码块先分析
+        self.priority_scheduling = self.config.getboolean('DEFAULT', 'PRIORITY_SCHEDULING', fallback=True)
+        self._risk_scorer = None
+        self._file_scores = {}
+
+        # 分析结果磁盘缓存，重复扫描未变化的代码块时直接复用结果
+        self.response_cache = None
+        if persistent and self.config.getboolean('DEFAULT', 'CACHE_ENABLED', fallback=True):
+            try:
+                self.response_cache = ResponseCache(
+                    Path.cwd() / '.deepaudit' / 'response_cache.db',
+                    max_bytes=self.config.getint('DEFAULT', 'CACHE_MAX_MB', fallback=200) * 1024 * 1024,
+                    max_age_days=self.config.getint('DEFAULT', 'CACHE_MAX_AGE_DAYS', fallback=30)
+                )
+                self.response_cache.evict()
+            except Exception as e:
+                print(f"[ERROR] 结果缓存初始化失败: {str(e)}")
+                self.response_cache = None
 
-                    # 执行回调函数（如果有）
-                    if callback:
-                        callback()
+        # 本次扫描中未完整分析的文件，这些文件不更新增量扫描清单（漏洞结果从结果数据库读取）
+        self._scan_failed_files = set()
 
-                    # 标记任务完成
-                    self.event_queue.task_done()
+        # 初始化项目路径为当前目录
+        self.project_path = Path.cwd()
+        self.log_file = self.project_path / 'error.log'
 
-                except queue.Empty:  # 队列为空时退出循环
-                    break
-                except Exception as e:
-                    self.log_error(f"事件处理异常: {str(e)}")
-                    continue
-        except Exception as e:
-            self.log_error(f"事件处理器异常: {str(e)}")
-        finally:
-            # 继续事件循环
-            self.root.after(100, self._handle_events)
+        # 支持的语言类型
+        self.supported_langs = {
+            '.php': 'php',
+            '.java': 'java',
+            '.js': 'javascript',
+            '.html': 'html',
+            '.xml': 'xml'
+        }
 
-    def _handle_progress_event(self):
-        """处理进度更新事件"""
-        try:
-            current_value = int(self.progress['value'])
-            max_value = int(self.progress['maximum'])
+    # ------------------ 界面钩子（由子类重写） ------------------ #
+    def current_model(self):
+        """返回当前使用的模型名称"""
+        return self.model
 
-            # 确保进度不超过最大值
-            if current_value < max_value:
-                self.progress.step(1)
-                current_value += 1
+    def cascade_enabled(self):
+        """是否使用级联模式（初筛模型 + 当前模型确认）"""
+        return self.cascade_mode
 
-            # 更新状态栏显示当前进度
-            percentage = min(int((current_value / max_value) * 100) if max_value > 0 else 0, 100)
-            # 使用"代码块"而不是"块"使表述更清晰
-            self.status_bar.config(text=f"正在分析: {current_value}/{max_value} 代码块 ({percentage}%)")
-        except Exception as e:
-            self.log_error(f"更新进度失败: {str(e)}")
+    def set_status(self, text):
+        """更新状态提示"""
+        print(f"[STATUS] {text}")
 
-    def _handle_result_event(self, data):
-        """处理结果事件"""
-        try:
-            file_path, vulnerabilities = data
-            self._safe_display_results(file_path, vulnerabilities)
-        except Exception as e:
-            self.log_error(f"显示结果失败: {str(e)}")
+    def set_progress_total(self, total):
+        """设置本次分析的代码块总数"""
+        self.progress_total = total
+        self.progress_done = 0
 
-    def _handle_done_event(self):
-        """处理完成事件"""
-        try:
-            # 重置进度条和状态
-            self.progress['value'] = 0
+    def add_progress_total(self, count):
+        """边分块边分析时增加代码块总数"""
+        self.progress_total += count
 
-            # 恢复按钮状态，但只在必要时更改
-            if hasattr(self, 'btn_analyze') and self.btn_analyze.cget("text") != "开始分析":
-                self.btn_analyze.config(text="开始分析", command=self.start_analysis)
+    def report_progress(self, count=1):
+        """报告已完成的代码块数（无论成功失败）"""
+        self.progress_done += count
 
-            if hasattr(self, 'btn_auto_analyze') and (self.btn_auto_analyze.cget("text") != "自动分析" or
-                                                      self.btn_auto_analyze.cget("state") != tk.NORMAL):
-                self.btn_auto_analyze.config(text="自动分析", state=tk.NORMAL)
+    def report_error(self, error_msg):
+        """报告需要提示用户的错误"""
+        self.log_error(error_msg)
+        print(f"[ERROR] {error_msg}", file=sys.stderr)
 
-            if hasattr(self, 'btn_export'):
-                self.btn_export.config(state=tk.NORMAL)
+    def on_auth_failure(self, error_message):
+        """API认证失败时调用，分析已被取消"""
+        self.set_status(f"API认证失败: {error_message}")
 
-            # 更新状态栏
-            if hasattr(self, 'api_validation_error_shown') and self.api_validation_error_shown:
-                self.status_bar.config(text="API验证失败")
-            elif self.auto_analysis_cancelled:
-                self.status_bar.config(text="分析已取消")
-            else:
-                # 检查是否有漏洞发现
-                total_vulns = sum(len(vulns) for vulns in self.vulnerabilities.values())
-                if total_vulns > 0:
-                    self.status_bar.config(text=f"分析完成，共发现 {total_vulns} 个漏洞")
-                else:
-                    self.status_bar.config(text="分析完成，未发现漏洞")
+    def display_results(self, file_path, vulnerabilities):
+        """记录一个文件新发现的漏洞，写入结果数据库
 
-            # 重置分析状态
-            self.auto_analysis_cancelled = False
-            self.auto_analysis_paused = False
-            if hasattr(self, 'auto_analysis_thread'):
-                delattr(self, 'auto_analysis_thread')
-        except Exception as e:
-            self.log_error(f"处理完成事件失败: {str(e)}")
+        Returns:
+            list: 各漏洞在结果数据库中的ID，数据库不可用时为None
+        """
+        if self.result_store is None:
+            return [None] * len(vulnerabilities)
+        return self.result_store.add_findings(self._scan_id, file_path, vulnerabilities)
 
-    def _handle_api_validation_event(self, is_valid):
-        """处理API验证事件"""
-        try:
-            if is_valid:
-                self.status_bar.config(text="API密钥验证通过")
-                self.api_validated = True
-            else:
-                self.status_bar.config(text="API密钥验证失败")
-                self.api_validated = False
-                if hasattr(self, 'btn_auto_analyze'):
-                    self.btn_auto_analyze.config(text="自动分析", state=tk.NORMAL)
-                if hasattr(self, 'btn_analyze'):
-                    self.btn_analyze.config(state=tk.NORMAL)
-                messagebox.showerror("API验证失败", "API密钥验证失败，请检查API密钥是否正确。")
-        except Exception as e:
-            self.log_error(f"处理API验证事件失败: {str(e)}")
+    def log_info(self, message, file_path=None):
+        """记录信息日志
 
-    def _handle_error_event(self, error_msg):
-        """处理错误事件"""
-        try:
-            self.show_error(error_msg)
-            self.status_bar.config(
-                text=f"发生错误: {error_msg[:50]}..." if len(error_msg) > 50 else f"发生错误: {error_msg}")
-        except Exception as e:
-            self.log_error(f"处理错误事件失败: {str(e)}")
+        Returns:
+            str: 写入的日志行
+        """
+        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        log_entry = f"[INFO][{timestamp}] {message}"
 
-    def _safe_display_results(self, file_path, vulnerabilities):
-        """安全地在UI线程中显示结果"""
-        try:
-            # 初始化漏洞ID计数器（如果不存在）
-            if not hasattr(self, 'vuln_id_counter'):
-                self.vuln_id_counter = 1
+        if file_path:
+            log_entry += f" - {file_path.name}"
 
-            # 确保文件路径在漏洞字典中存在
-            if file_path not in self.vulnerabilities:
-                self.vulnerabilities[file_path] = []
+        # 将日志写入文件
+        with open("deepaudit_log.txt", "a", encoding="utf-8") as log_file:
+            log_file.write(log_entry + "\n")
+        return log_entry
 
-            # 将新漏洞添加到现有列表
-            self.vulnerabilities[file_path].extend(vulnerabilities)
+    # ------------------ 分析流程 ------------------ #
+    def run_scan(self, file_list, diff_scope=None, incremental=None, resume=False, checkpoint=True):
+        """分析一组文件：生成分块计划，放入项目级工作队列并等待完成
 
-            # 实时更新UI - 直接添加新发现的漏洞到树形视图
-            for vuln in vulnerabilities:
-                # 处理行号显示
-                line_numbers = ", ".join(map(str, vuln["行号"])) if vuln["行号"] else "N/A"
+        Args:
+            file_list: 待分析的文件，可以是惰性生成器（如iter_source_files），不支持的文件类型会被忽略
+            diff_scope: GitDiffScope，指定时只分析与变更行重叠的代码块
+            incremental: 是否使用增量扫描清单，为None时读取配置INCREMENTAL_SCAN
+            resume: 继续上次中断的扫描，检查点日志中已完成的代码块直接沿用记录的结果
+            checkpoint: 是否写检查点日志（CHECKPOINT_ENABLED为false时总是不写）
 
-                # 插入结果到Treeview
-                try:
-                    item_id = self.result_tree.insert(
-                        '', 'end',
-                        values=(
-                            self.vuln_id_counter,
-                            vuln["漏洞类型"],
-                            vuln["风险等级"],
-                            str(file_path),
-                            vuln["详细描述"],
-                            vuln.get("风险点", "N/A"),
-                            vuln.get("Payload", "N/A"),
-                            vuln.get("修复建议", "N/A"),
-                            f"{line_numbers}"
-                        )
-                    )
+        Returns:
+            bool: 出现API认证失败时返回False
+        """
+        self._reset_scan_state()
+
+        # 增量扫描：只分析新增或修改的文件，未修改文件沿用上次扫描的结果
+        # 差异分析只覆盖部分代码块，不更新清单
+        manifest = None
+        if incremental is None:
+            incremental = self.config.getboolean('DEFAULT', 'INCREMENTAL_SCAN', fallback=True)
+        if diff_scope is None and incremental:
+            try:
+                manifest = ScanManifest.for_project(self.project_path, self._result_model_key())
+            except Exception as e:
+                self.log_error(f"读取扫描清单失败，执行全量扫描: {str(e)}")
 
-                    # 设置行颜色（如果有定义）
-                    if hasattr(self, 'severity_colors'):
-                        severity = vuln["风险等级"]
-                        color = self.severity_colors.get(severity, "#FFFFFF")
-                        self.result_tree.tag_configure(severity, background=color)
-                        self.result_tree.item(item_id, tags=(severity,))
+        self._begin_result_scan()
+        self._open_journal(resume, enabled=checkpoint)
 
-                    # 递增漏洞ID计数器
-                    self.vuln_id_counter += 1
+        # 文件列表可以是惰性的目录遍历，边遍历边过滤、比对清单，只保留路径不保留内容
+        valid_files = []
+        scanned_files = []
+        reused_files = []
 
-                except KeyError as e:
-                    self.log_error(f"字段缺失: {str(e)}")
+        def iter_files_to_scan():
+            for file_path in file_list:
+                if file_path.suffix not in self.supported_langs:
                     continue
+                valid_files.append(file_path)
+                if manifest is not None:
+                    vulns = manifest.check(file_path)
+                    if vulns is not None:
+                        reused_files.append(file_path)
+                        if vulns:
+                            self.display_results(file_path, [{**vuln, "文件路径": str(file_path)} for vuln in vulns])
+                        continue
+                scanned_files.append(file_path)
+                yield file_path
+
+        # 边分块边提交：每个文件的分块计划一完成就放入项目级工作队列，由请求引擎的工作协程依次取用，
+        # 第一批请求在其余文件仍在分块时就已经发出；进度条总数随分块结果逐步增加
+        self.set_progress_total(0)
+        self.set_status("正在读取、分块并分析文件")
+        work_queue = self.request_engine.open_queue(self._analyze_pack_task)
+        packer = self._open_packer(work_queue)
+        target = self._open_deduplicator(packer)
+        total_chunks = 0
+        skipped_chunks = 0
+        for file_path, chunks in self._iter_chunk_plans(self._prioritize_files(iter_files_to_scan())):
+            if self.auto_analysis_cancelled:
+                break
+            if not chunks:
+                self._scan_failed_files.add(file_path)
+            if diff_scope is not None:
+                changed_chunks = [chunk for chunk in chunks if diff_scope.overlaps(file_path, chunk[1], chunk[2])]
+                skipped_chunks += len(chunks) - len(changed_chunks)
+                chunks = changed_chunks
+            chunks = self._prefilter_chunks(file_path, chunks)
+            # 读取失败的文件不计入总块数
+            self.add_progress_total(len(chunks))
+            total_chunks += len(chunks)
+            self.analyze_file(file_path, target, chunks)
+        target.flush()
+        self._log_packing(packer)
+        self._log_prefilter()
+        self._log_dedup()
+
+        if manifest is not None:
+            self.log_info(f"增量扫描: 沿用 {len(reused_files)} 个未修改文件的结果，"
+                          f"分析 {len(scanned_files)} 个新增或修改的文件")
+        if diff_scope is not None:
+            self.log_info(f"差异分析: 发送 {total_chunks} 个与变更重叠的代码块，跳过 {skipped_chunks} 个未变更的代码块")
+        self.set_status(f"分块完成，共 {total_chunks} 个代码块")
+
+        auth_ok = self._wait_for_work_queue(work_queue)
+        self.log_info(f"峰值在途HTTP请求数: {self.request_engine.controller.peak_in_flight}")
+
+        if manifest is not None:
+            self._save_scan_manifest(manifest, scanned_files, valid_files)
+        self._close_journal()
+        self._finish_result_scan()
+
+        self._log_scan_stats()
+        return auth_ok
+
+    def _reset_scan_state(self):
+        """清空上一次扫描留下的结果和统计，每次扫描开始时调用"""
+        if self.response_cache is not None:
+            self.response_cache.reset_stats()
+        self._scan_failed_files = set()
+        self.prefilter_skipped = 0
+        self.cascade_screened = self.cascade_flagged = 0
+
+    async def _analyze_pack_task(self, segments):
+        """在请求引擎中执行的分析任务，一个任务包含一个或多个打包在一起的代码块片段
 
-            # 更新状态栏显示总漏洞数
-            total_vulns = sum(len(vulns) for vulns in self.vulnerabilities.values())
-            self.status_bar.config(text=f"共发现 {total_vulns} 个漏洞")
+        Args:
+            segments: [(chunk_info, file_path, index, total), ...]
 
+        Returns:
+            True表示分析成功，False表示API认证失败，None表示跳过或其他错误
+        """
+        succeeded = False
+        try:
+            # 检查是否已取消或暂停分析
+            if self.auto_analysis_cancelled:
+                return None
+            while self.auto_analysis_paused and not self.auto_analysis_cancelled:
+                await asyncio.sleep(0.5)
+            if self.auto_analysis_cancelled:
+                return None
+
+            # 先查询结果缓存，命中的片段无需调用API
+            pending = []
+            for segment in segments:
+                chunk_info, file_path = segment[0], segment[1]
+                cache_key = None
+                cached = None
+                if self.response_cache is not None:
+                    cache_key = ResponseCache.make_key(
+                        self._result_model_key(),
+                        self.config.get('DEFAULT', 'PROMPT_TEMPLATE', fallback=''),
+                        file_path.suffix.lower(),
+                        chunk_info[0]
+                    )
+                    cached = await self.request_engine.run_storage(self.response_cache.get, cache_key)
+                if cached is None:
+                    pending.append((segment, cache_key))
+                else:
+                    self._finish_segment(segment, cached)
+
+            # 级联模式：先初筛，未被标记可疑的代码块直接记为没有漏洞
+            hints = None
+            if pending and self.cascade_enabled():
+                screened = await self._screen_segments(pending)
+                if screened is None or screened is False:
+                    return screened
+                pending, hints = screened
+
+            if pending:
+                result = await self._request_segments(pending, hints)
+                if result is not True:
+                    return result
+
+            succeeded = True
+            return True
         except Exception as e:
-            self.log_error(f"显示结果失败: {str(e)}")
+            self.log_error(f"代码块分析失败: {str(e)}\n{traceback.format_exc()}", segments[0][1])
+            return None
+        finally:
+            # 记录未完整分析的文件，增量扫描时这些文件下次仍需重新分析
+            if not succeeded:
+                for segment in segments:
+                    self._scan_failed_files.add(segment[1])
+                    # 内容相同的副本同样计为未完成
+                    if self._deduplicator is not None:
+                        self._deduplicator.resolve(segment, [], failed=True)
+            # 无论成功失败都更新进度
+            self.report_progress(len(segments))
+
+    async def _screen_segments(self, pending):
+        """级联模式的初筛：用SCREEN_MODEL和简短提示词判断每个片段是否可疑
+
+        未被标记的片段直接以空结果完成并写入缓存；初筛请求失败、响应无法解析或模型没有回答的片段
+        一律视为可疑，保证不会因为初筛出错而漏掉代码。
 
-    def _analysis_worker(self, file_list):
-        """优化的后台分析线程"""
-        start_time = time.time()
-        self.log_info(f"开始分析任务，文件数量: {len(file_list)}")
+        Args:
+            pending: [(segment, cache_key), ...]
 
-        try:
-            # 计算总分块数量
-            total_chunks = 0
-            valid_files = []
+        Returns:
+            tuple: (需要交给当前模型完整分析的 [(segment, cache_key), ...], 对应的初筛提示列表)，
+                提示为初筛标记的可疑行和漏洞类型，没有时为None；API认证失败时返回False，取消时返回None
+        """
+        segments = [segment for segment, _ in pending]
+        first_file = segments[0][1]
+        response = await self.call_deepseek_api_async(
+            self._compose_request_code(segments), first_file.suffix.lower(), first_file, screening=len(segments)
+        )
+        if self.auto_analysis_cancelled:
+            return None
+        if response['status_code'] == 401:
+            self._handle_auth_failure(response['text'], first_file)
+            return False
 
-            for file_path in file_list:
-                if self.auto_analysis_cancelled:
-                    self.log_info("分析已取消，停止预处理")
-                    break
+        flags = [None] * len(segments)
+        hints = [None] * len(segments)
+        if response['status_code'] != 200:
+            self.log_error(f"初筛请求失败(状态码 {response['status_code']})，{len(segments)} 个代码块直接交由"
+                           f"{self.current_model()}分析", first_file)
+        else:
+            try:
+                try:
+                    objects = self._extract_vulnerability_objects(response['text'])
+                except TruncatedResponseError as e:
+                    objects = e.objects
+                for obj in objects:
+                    position = self._segment_position(obj, segments)
+                    if position is not None:
+                        flags[position] = self._is_flagged(obj)
+                        hints[position] = self._screen_hint(obj)
+            except Exception as e:
+                self.log_error(f"初筛响应解析失败，全部代码块交由{self.current_model()}分析: {str(e)}", first_file)
+                flags = [None] * len(segments)
+                hints = [None] * len(segments)
+
+        flagged = []
+        flagged_hints = []
+        for (segment, cache_key), flag, hint in zip(pending, flags, hints):
+            if flag is False:
+                if cache_key is not None:
+                    await self.request_engine.run_storage(self.response_cache.put, cache_key, [])
+                self._finish_segment(segment, [])
+            else:
+                flagged.append((segment, cache_key))
+                flagged_hints.append(hint)
+        self.cascade_screened += len(segments)
+        self.cascade_flagged += len(flagged)
+        return flagged, flagged_hints
+
+    @staticmethod
+    def _is_flagged(obj):
+        """读取初筛结果中的"可疑"字段，无法识别时视为可疑"""
+        obj = {str(k).strip(): v for k, v in obj.items()}
+        value = obj.get("可疑")
+        if isinstance(value, str):
+            return value.strip().lower() not in ('false', 'no', '否', '0', '无')
+        return value is None or bool(value)
+
+    @staticmethod
+    def _screen_hint(obj):
+        """把初筛结果中的可疑行号和漏洞类型整理成确认请求中的提示，两者都没有时返回None"""
+        obj = {str(k).strip(): v for k, v in obj.items()}
+        lines = obj.get("行号")
+        lines = [str(line) for line in lines if isinstance(line, int)] if isinstance(lines, list) else []
+        types = obj.get("类型")
+        if isinstance(types, str):
+            types = [types]
+        types = [str(t).strip() for t in types if str(t).strip()] if isinstance(types, list) else []
+        parts = []
+        if lines:
+            parts.append(f"可疑行 {', '.join(lines[:20])}")
+        if types:
+            parts.append(f"可能的漏洞类型 {'、'.join(types[:5])}")
+        if not parts:
+            return None
+        return f"初筛标记{'；'.join(parts)}（请重点核实，其余代码同样需要审计）"
 
-                # 检查文件是否存在
-                if not file_path.exists():
-                    self.log_error(f"文件不存在，跳过: {file_path}")
+    def _result_model_key(self):
+        """结果缓存和增量扫描清单使用的模型标识，级联模式的结果与单模型结果分开保存"""
+        if self.cascade_enabled():
+            return f"{self.screen_model}>{self.current_model()}"
+        return self.current_model()
+
+    async def _request_segments(self, pending, hints=None):
+        """把未命中缓存的片段发送给API（多个片段合并为一个请求），按片段拆分结果
+
+        Args:
+            pending: [(segment, cache_key), ...]
+            hints: 级联模式下与pending对应的初筛提示，写入各片段的上下文说明
+        """
+        segments = [segment for segment, _ in pending]
+        packed = len(segments) > 1
+        code_lines = [segment[0][0].splitlines() for segment in segments]
+        # 流式响应中已经显示过的漏洞（行号已对应原始文件）
+        streamed = [[] for _ in segments]
+
+        def on_object(obj):
+            # 模型每输出完一个漏洞对象就立即显示，格式错误的对象留给完整解析时报告
+            position = self._segment_position(obj, segments)
+            if position is None:
+                return
+            try:
+                vuln = self._normalize_vulnerability(obj, code_lines[position], log_invalid=False)
+            except Exception:
+                return
+            if vuln is None:
+                return
+            chunk_info, file_path = segments[position][0], segments[position][1]
+            vuln["行号"] = [chunk_info[1] + line - 1 for line in vuln["行号"]]
+            vuln["文件路径"] = str(file_path)
+            streamed[position].append(vuln)
+            self.display_results(file_path, [vuln])
+
+        first_file = segments[0][1]
+        response = await self.call_deepseek_api_async(
+            self._compose_request_code(segments, hints), first_file.suffix.lower(),
+            None if packed else first_file, on_object, packed=packed
+        )
+
+        # 再次检查是否已取消分析
+        if self.auto_analysis_cancelled:
+            return None
+
+        if response['status_code'] == 401:
+            self._handle_auth_failure(response['text'], first_file)
+            return False
+
+        if response['status_code'] != 200:
+            self._handle_api_error(response, first_file)
+            return None
+
+        # 解析结果并按片段拆分，只有解析成功的结果才写入缓存
+        truncated = False
+        try:
+            grouped = [[] for _ in segments]
+            try:
+                objects = self._extract_vulnerability_objects(response['text'])
+            except TruncatedResponseError as e:
+                objects = e.objects
+                truncated = True
+            last_position = 0
+            for obj in objects:
+                position = self._segment_position(obj, segments)
+                if position is None:
+                    self.log_error(f"无法确定漏洞所属的代码片段，已忽略: {json.dumps(obj, ensure_ascii=False)[:200]}")
                     continue
+                last_position = position
+                vuln = self._normalize_vulnerability(obj, code_lines[position])
+                if vuln is not None:
+                    grouped[position].append(vuln)
+        except Exception as e:
+            self.log_error(f"响应解析失败: {str(e)}\n原始响应内容:\n{response['text']}")
+            grouped = [[] for _ in segments]
+            truncated = False
+            complete = [False] * len(segments)
+        else:
+            complete = [True] * len(segments)
+
+        # 响应被截断：最后一个输出漏洞的片段及其后的片段没有分析完，只把剩余代码拆分后重新提交
+        if truncated:
+            self.log_info(f"API响应被截断，保留已完整输出的 {sum(len(v) for v in grouped)} 个漏洞，"
+                          f"剩余代码拆分后重新提交", first_file)
+            for position in range(last_position, len(segments)):
+                result = await self._resubmit_truncated_rest(segments[position], grouped[position],
+                                                             whole=position > last_position)
+                if result is False:
+                    return False
+                if result is None:
+                    complete[position] = False
+                    self._scan_failed_files.add(segments[position][1])
+
+        for (segment, cache_key), vulns, done in zip(pending, grouped, complete):
+            if cache_key is not None and done:
+                await self.request_engine.run_storage(self.response_cache.put, cache_key, vulns)
+
+        for position, segment in enumerate(segments):
+            self._finish_segment(segment, grouped[position], streamed[position], complete[position])
+        return True
+
+    async def _resubmit_truncated_rest(self, segment, kept, depth=0, whole=False):
+        """截断响应的恢复：只重新提交片段中尚未分析完的代码
+
+        模型按代码顺序输出漏洞，最后一个完整漏洞所在行之前的代码视为已分析，从该行之前最近的结构边界
+        开始重新提交剩余代码；没有可用的完整漏洞时在中间的结构边界处一分为二。重新提交的结果再次被截断时
+        递归处理，没有进展的对半拆分最多TRUNCATION_SPLIT_DEPTH层。
+
+        Args:
+            kept: 截断前已经完整输出的漏洞（行号相对于片段代码），补充的漏洞去重后直接追加到其中
+            whole: 打包请求中排在截断位置之后、完全没有被分析的片段，整体重新提交
+
+        Returns:
+            True表示剩余代码已全部分析，False表示API认证失败，None表示其他错误（已补充的漏洞仍保留在kept中）
+        """
+        chunk_info, file_path, index, total = segment
+        lines = chunk_info[0].split('\n')
+        anchored = [vuln for vuln in kept if vuln["行号"]]
+        resume = self._structural_boundary(lines, min(anchored[-1]["行号"]) - 1, backward=True) if anchored else 0
+        if whole:
+            parts = [(0, len(lines))]
+        elif resume > 0:
+            parts = [(resume, len(lines))]
+        else:
+            middle = self._structural_boundary(lines, len(lines) // 2)
+            parts = [(0, middle), (middle, len(lines))] if 0 < middle < len(lines) else []
+            depth += 1
+        if not parts or depth > self.TRUNCATION_SPLIT_DEPTH:
+            self.log_error(f"代码块第{chunk_info[1]}-{chunk_info[2]}行的响应多次被截断，无法继续拆分", file_path)
+            return None
 
-                # 读取文件内容以估计分块数量
+        seen = {(vuln["漏洞类型"], tuple(vuln["行号"])) for vuln in kept}
+        for start, end in parts:
+            sub_info = ('\n'.join(lines[start:end]), chunk_info[1] + start, chunk_info[1] + end - 1,
+                        f"{chunk_info[3]}（截断后重新提交）")
+            sub_segment = (sub_info, file_path, index, total)
+            response = await self.call_deepseek_api_async(
+                self._compose_request_code([sub_segment]), file_path.suffix.lower(), file_path
+            )
+            if self.auto_analysis_cancelled:
+                return None
+            if response['status_code'] == 401:
+                self._handle_auth_failure(response['text'], file_path)
+                return False
+            if response['status_code'] != 200:
+                self._handle_api_error(response, file_path)
+                return None
+
+            sub_lines = sub_info[0].splitlines()
+            result = True
+            try:
                 try:
-                    with open(file_path, 'r', encoding='utf-8', errors='ignore') as f:
-                        code = f.read()
-
-                    # 估计分块数量
-                    if len(code.splitlines()) > 1:
-                        # 使用智能分块估计数量
-                        chunks = self._smart_code_chunking(code, file_path.suffix)
-                        chunk_count = len(chunks)
-                        total_chunks += chunk_count
-                        self.log_info(f"文件 {file_path.name} 预计分为 {chunk_count} 个代码块")
-                    else:
-                        # 小文件算作1个分块
-                        total_chunks += 1
+                    objects = self._extract_vulnerability_objects(response['text'])
+                    truncated = False
+                except TruncatedResponseError as e:
+                    objects = e.objects
+                    truncated = True
+                sub_vulns = [vuln for vuln in (self._normalize_vulnerability(obj, sub_lines) for obj in objects)
+                             if vuln is not None]
+            except Exception as e:
+                self.log_error(f"响应解析失败: {str(e)}\n原始响应内容:\n{response['text']}", file_path)
+                return None
+            if truncated:
+                result = await self._resubmit_truncated_rest(sub_segment, sub_vulns, depth)
+
+            # 行号换算为相对于原片段代码，并去掉与已有结果重复的漏洞
+            for vuln in sub_vulns:
+                vuln["行号"] = [start + line for line in vuln["行号"]]
+                key = (vuln["漏洞类型"], tuple(vuln["行号"]))
+                if key not in seen:
+                    seen.add(key)
+                    kept.append(vuln)
+            if result is not True:
+                return result
+        return True
 
-                    # 添加到有效文件列表
-                    valid_files.append(file_path)
-                except Exception as e:
-                    # 读取失败时默认为1个分块
-                    total_chunks += 1
-                    valid_files.append(file_path)
-                    self.log_error(f"估计分块数量失败: {str(e)}", file_path)
+    @staticmethod
+    def _structural_boundary(lines, target, backward=False):
+        """在target附近寻找适合切分代码的位置，返回新块第一行的下标
 
-            # 检查是否有有效文件
-            if not valid_files:
-                self.log_info("没有有效文件可分析")
-                self.root.after(0, lambda: self.status_bar.config(text="没有有效文件可分析"))
-                return
+        优先选择缩进最浅、紧跟在空行或块结束符之后的非空行，其次离target最近。
+
+        Args:
+            backward: 只在target及之前查找，保证切分位置之前的代码不会被跳过
+        """
+        window = max(3, len(lines) // 4)
+        low = max(1, target - window)
+        high = min(len(lines) - 1, target if backward else target + window)
+        best = None
+        for i in range(low, high + 1):
+            text = lines[i]
+            if not text.strip():
+                continue
+            indent = len(text) - len(text.lstrip())
+            previous = lines[i - 1].strip()
+            after_block = previous in ('', '}', '};', '?>') or previous.startswith('</')
+            key = (indent, not after_block, abs(i - target))
+            if best is None or key < best[0]:
+                best = (key, i)
+        return best[1] if best else max(0, min(target, len(lines)))
 
-            # 记录实际分块总数但不修改进度条最大值 (已在start_analysis中设置)
-            self.log_info(f"总计划分为 {total_chunks} 个代码块")
-            self.root.after(0, lambda: self.status_bar.config(text=f"开始分析 {total_chunks} 个代码块"))
+    def _finish_segment(self, segment, chunk_vulnerabilities, streamed=(), complete=True):
+        """调整片段结果的行号使其与原始文件对应，显示尚未显示的漏洞并记录结果
 
-            # 使用线程池管理线程
-            import concurrent.futures
-            max_workers = min(10, len(valid_files))  # 限制最大线程数
-            self.log_info(f"启动分析线程池，最大线程数: {max_workers}")
+        Args:
+            complete: 片段已完整分析（截断恢复失败时为False），只有完整的结果才写入检查点日志
+        """
+        chunk_info, file_path, index, total = segment
+        line_start = chunk_info[1]
+        for vuln in chunk_vulnerabilities:
+            vuln["行号"] = [line_start + line - 1 for line in vuln["行号"]]
+            vuln["文件路径"] = str(file_path)
+
+        # 流式响应时前面的漏洞已经显示过，只显示剩余部分；完整解析失败时保留已显示的漏洞
+        if len(streamed) > len(chunk_vulnerabilities):
+            chunk_vulnerabilities = list(streamed)
+        new_vulnerabilities = chunk_vulnerabilities[len(streamed):]
+        if new_vulnerabilities:
+            self.display_results(file_path, new_vulnerabilities)
+        self.log_info(f"完成第 {index + 1}/{total} 块分析，发现 {len(chunk_vulnerabilities)} 个漏洞", file_path)
+        if complete:
+            self._journal_record(file_path, chunk_info, chunk_vulnerabilities)
+        else:
+            self._scan_failed_files.add(file_path)
+        if self.result_store is not None:
+            self.result_store.add_chunk(self._scan_id, file_path, chunk_info[1], chunk_info[2], len(chunk_vulnerabilities))
+        if self._deduplicator is not None:
+            self._deduplicator.resolve(segment, chunk_vulnerabilities, failed=not complete)
 
-            with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
-                # 提交所有文件分析任务
-                future_to_file = {executor.submit(self.analyze_file, file_path): file_path for file_path in valid_files}
+    @staticmethod
+    def _compose_request_code(segments, hints=None):
+        """生成发送给模型的代码：单个代码块附带上下文说明，多个片段时每段前加片段标记
 
-                # 处理完成的任务
-                for future in concurrent.futures.as_completed(future_to_file):
-                    file_path = future_to_file[future]
-                    try:
-                        # 获取结果（如果有）
-                        future.result()
-                    except Exception as e:
-                        self.log_error(f"文件 {file_path.name} 分析异常: {str(e)}")
+        Args:
+            hints: 与segments对应的初筛提示（级联模式），放在“# 行范围”说明之前，不影响片段内行号的计算
+        """
+        parts = []
+        for number, (chunk_info, file_path, index, total) in enumerate(segments, 1):
+            chunk, line_start, line_end, chunk_type = chunk_info
+            # 添加文件信息和上下文提示
+            context_info = f"# 文件: {file_path.name} (第{index + 1}/{total}块)\n"
+            context_info += f"# 代码块类型: {chunk_type}\n"
+            if hints and hints[number - 1]:
+                context_info += f"# {hints[number - 1]}\n"
+            context_info += f"# 行范围: {line_start}-{line_end}\n\n"
+            if len(segments) > 1:
+                context_info = f"===== 片段{number} | 文件路径: {file_path} =====\n" + context_info
+            parts.append(context_info + chunk)
+        return "\n\n".join(parts)
+
+    @staticmethod
+    def _segment_position(obj, segments):
+        """确定漏洞对象属于第几个片段：优先使用"片段"字段，其次按文件路径唯一匹配"""
+        if len(segments) == 1:
+            return 0
+        obj = {str(k).strip(): v for k, v in obj.items()}
+        try:
+            number = int(obj.get("片段"))
+            if 1 <= number <= len(segments):
+                return number - 1
+        except (TypeError, ValueError):
+            pass
+        reported_path = str(obj.get("文件路径", "")).strip()
+        if reported_path:
+            matches = [position for position, segment in enumerate(segments)
+                       if reported_path in (str(segment[1]), segment[1].name)]
+            if len(matches) == 1:
+                return matches[0]
+        return None
 
-        except Exception as e:
-            self.log_error(f"分析工作线程异常: {str(e)}\n{traceback.format_exc()}")
-        finally:
-            # 记录总耗时
-            elapsed_time = time.time() - start_time
-            self.log_info(f"分析任务完成，总耗时: {elapsed_time:.2f}秒")
+    def _handle_auth_failure(self, response_text, file_path):
+        """处理API认证失败：只提示一次并取消当前分析"""
+        error_message = "API密钥无效，请检查API密钥是否正确"
+        # 尝试从响应中提取错误消息
+        try:
+            response_json = json.loads(response_text)
+            if 'error' in response_json and 'message' in response_json['error']:
+                error_message = response_json['error']['message']
+        except:
+            pass
 
-            # 只有在非API验证失败的情况下才发送done事件
-            if not (hasattr(self, 'api_validation_error_shown') and self.api_validation_error_shown):
-                self.root.after(0, lambda: self.event_queue.put(('done', None, None)))
+        with self.validation_lock:
+            if self.api_validation_error_shown:
+                return
+            self.api_validation_error_shown = True
 
-            # 直接在UI线程中重新启用按钮，确保按钮状态正确恢复
-            self.root.after(0, lambda: self.btn_auto_analyze.config(text="自动分析", state=tk.NORMAL))
-            self.root.after(0, lambda: self.btn_analyze.config(text="开始分析", state=tk.NORMAL))
+        self.api_validated = False
+        self.auto_analysis_cancelled = True
+        self.log_error(f"API认证失败: {error_message}", file_path)
+
+        self.on_auth_failure(error_message)
+
+    def _handle_api_error(self, response, file_path):
+        """处理401以外的API错误响应"""
+        status_code = response['status_code']
+        if status_code == 500:
+            # 处理服务器内部错误，不显示弹窗，只记录日志和更新状态栏
+            self.log_error(f"API服务器内部错误: {response['text'][:200]}", file_path)
+            self.set_status("API请求失败: 服务器内部错误")
+        elif status_code == 408:
+            # 处理超时错误，不显示弹窗
+            self.log_error(f"API请求超时: {response['text']}", file_path)
+            self.set_status("API请求超时，请稍后重试")
+        elif status_code == 429:
+            # 多次重试后仍被限流，不显示弹窗，该代码块计为失败
+            self.log_error(f"API请求被限流，重试{self.rate_limit_retries}次后放弃: {response['text'][:200]}", file_path)
+            self.set_status("API请求被限流，请降低并发或设置RATE_LIMIT_RPM/RATE_LIMIT_TPM")
+        elif status_code == 503:
+            # 处理连接错误，不显示弹窗
+            self.log_error(f"API连接失败: {response['text']}", file_path)
+            self.set_status("API连接失败，请检查网络")
+        else:
+            # 处理其他HTTP错误
+            self.log_error(f"API请求失败: 状态码 {status_code} - {response['text'][:200]}", file_path)
+            self.set_status(f"API请求失败: 状态码 {status_code}")
+            self.report_error(f"API请求失败: 状态码 {status_code}")
+
+    def _open_packer(self, work_queue):
+        """创建小代码块打包器，PACK_TOKEN_BUDGET为0时不打包"""
+        token_budget = self.config.getint('DEFAULT', 'PACK_TOKEN_BUDGET', fallback=6000)
+        if token_budget > 0:
+            token_budget = min(token_budget, self._chunk_token_budget())
+        return ChunkPacker(
+            work_queue,
+            token_budget=token_budget,
+            small_chunk_tokens=self.config.getint('DEFAULT', 'PACK_SMALL_CHUNK_TOKENS', fallback=800),
+            max_segments=self.config.getint('DEFAULT', 'PACK_MAX_SEGMENTS', fallback=10)
+        )
+
+    def _open_deduplicator(self, packer):
+        """在打包器之前加一层内容去重，DEDUP_ENABLED为false时直接返回打包器"""
+        self._deduplicator = ChunkDeduplicator(packer, self._fan_out_duplicate) if self.dedup_enabled else None
+        return self._deduplicator or packer
+
+    def _fan_out_duplicate(self, segment, line_start, vulnerabilities, failed):
+        """把第一份代码块的分析结果复制到内容相同的副本：替换文件路径并按起始行之差平移行号"""
+        chunk_info, file_path = segment[0], segment[1]
+        offset = chunk_info[1] - line_start
+        copies = [{**vuln, "行号": [line + offset for line in vuln["行号"]], "文件路径": str(file_path)}
+                  for vuln in vulnerabilities]
+        if failed:
+            self._scan_failed_files.add(file_path)
+        else:
+            self._journal_record(file_path, chunk_info, copies)
+        if copies:
+            self.display_results(file_path, copies)
+        self.report_progress(1)
+
+    def _prefilter_chunks(self, file_path, chunks):
+        """按预筛选级别去掉没有攻击面的代码块"""
+        language = self.supported_langs.get(file_path.suffix.lower())
+        kept = [chunk for chunk in chunks if self.prefilter.accepts(chunk[0], language)]
+        self.prefilter_skipped += len(chunks) - len(kept)
+        return kept
+
+    def _log_prefilter(self):
+        if self.prefilter_skipped:
+            self.log_info(f"本地预筛选({self.prefilter.level}): 跳过 {self.prefilter_skipped} 个没有危险函数"
+                          f"{'' if self.prefilter.level == 'strict' else '和外部输入'}的代码块")
+
+    def _log_dedup(self):
+        dedup = self._deduplicator
+        if dedup is not None and dedup.total_chunks:
+            self.log_info(f"内容去重: {dedup.total_chunks} 个代码块中 {dedup.duplicate_chunks} 个与已提交的代码块相同，"
+                          f"实际分析 {dedup.unique_chunks} 个（去重比 {dedup.ratio():.2f}），"
+                          f"{dedup.duplicate_files} 个文件与已分析的文件完全相同")
+
+    def _log_packing(self, packer):
+        if packer.packed_requests:
+            self.log_info(f"小代码块打包: {packer.packed_segments} 个代码块合并为 {packer.packed_requests} 个请求")
+
+    def _wait_for_work_queue(self, work_queue):
+        """等待项目级工作队列处理完毕，支持中途取消
+
+        Returns:
+            bool: 出现API认证失败时返回False
+        """
+        work_queue.close()
+        while not work_queue.join(timeout=0.5):
+            if self.auto_analysis_cancelled:
+                work_queue.cancel()
+                self.log_info(f"分析已取消，放弃 {work_queue.submitted - work_queue.completed} 个未完成的代码块")
+                break
+        return not work_queue.auth_failed
+
+    def _save_scan_manifest(self, manifest, scanned_files, all_files):
+        """把本次完整分析的文件结果写入增量扫描清单
 
-    def call_deepseek_api(self, code, suffix, file_path):
-        """调用DeepSeek API"""
-        # 前置校验
+        各文件的漏洞按文件逐个从结果数据库读回，扫描期间不在内存中保留漏洞。分析被取消或部分代码块失败的文件
+        不会更新记录，结果数据库不可用时所有文件都不更新，下次扫描时仍会重新分析。
+        """
+        try:
+            if not self.auto_analysis_cancelled and self.result_store is not None and self._scan_id is not None:
+                completed = {str(file_path): file_path for file_path in scanned_files
+                             if file_path not in self._scan_failed_files}
+                for path, vulns in self.result_store.file_findings(self._scan_id):
+                    file_path = completed.pop(path, None)
+                    if file_path is not None:
+                        manifest.update(file_path, vulns)
+                for file_path in completed.values():
+                    manifest.update(file_path, [])
+                manifest.prune(all_files)
+            manifest.save()
+            self.log_info(f"扫描清单已保存: {manifest.manifest_path}")
+        except Exception as e:
+            self.log_error(f"保存扫描清单失败: {str(e)}")
+
+    def _log_scan_stats(self):
+        """记录连接池、分块缓存、限流和结果缓存的统计信息"""
+        pool_stats = self.http_pool.stats()
+        self.log_info(f"HTTP连接池统计: 复用连接 {pool_stats['hits']} 次, 新建连接 {pool_stats['misses']} 次")
+        self.log_info(f"分块计划缓存命中 {self.chunk_plan_cache_hits} 次，分块CPU时间 {self.chunking_cpu_seconds:.2f}秒"
+                      f"（{'进程池' if self._chunk_pool is not None else '单线程'}）")
+        controller = self.request_engine.controller
+        p95 = controller.p95_latency()
+        self.log_info(f"自适应并发: 当前上限 {controller.current_limit}/{controller.max_limit}, "
+                      f"最近p95延迟 {p95 or 0:.2f}秒")
+        if self.prompt_tokens_total:
+            hit_ratio = self.prompt_cache_hit_tokens / self.prompt_tokens_total
+            self.log_info(f"服务端上下文缓存: 命中 {self.prompt_cache_hit_tokens}/{self.prompt_tokens_total} "
+                          f"提示令牌 ({hit_ratio:.1%})")
+        if self.cascade_screened:
+            self.log_info(f"级联筛查: {self.screen_model} 初筛 {self.cascade_screened} 个代码块，"
+                          f"{self.cascade_flagged} 个被标记可疑交由 {self.current_model()} 确认"
+                          f"（{self.cascade_flagged / self.cascade_screened:.1%}）")
+        self.log_info(f"限流统计: 429响应 {self.rate_limiter.rate_limited_count} 次, "
+                      f"累计等待 {self.rate_limiter.wait_seconds:.1f}秒")
+        self._finish_response_cache()
+
+    def _finish_response_cache(self):
+        """记录本次扫描的结果缓存命中率，并按配置清理过期缓存"""
+        if self.response_cache is None:
+            return
+        try:
+            hits = self.response_cache.hits
+            misses = self.response_cache.misses
+            self.log_info(f"结果缓存统计: 命中 {hits} 次, 未命中 {misses} 次, 命中率 {self.response_cache.hit_rate():.1%}")
+            self.response_cache.evict()
+        except Exception as e:
+            self.log_error(f"结果缓存清理失败: {str(e)}")
+
+    def _precheck_api_request(self, code, suffix):
+        """请求前置校验，不通过时返回错误响应，否则返回None"""
         if len(code.strip()) < 10:
-            self.status_bar.config(text="代码内容过短或为空")
+            self.set_status("代码内容过短或为空")
             return {'status_code': 400, 'text': '代码内容过短或为空'}
         if suffix not in self.supported_langs:
-            self.status_bar.config(text=f"不支持的文件类型: {suffix}")
+            self.set_status(f"不支持的文件类型: {suffix}")
             return {'status_code': 400, 'text': '不支持的文件类型'}
+        return None
 
-        # 在实际调用API前验证API密钥有效性
-        if not hasattr(self, 'api_validated') or not self.api_validated:
-            self.status_bar.config(text="正在验证API密钥...")
-            self.root.config(cursor="wait")  # 更改鼠标指针为等待状态
+    def _build_api_request(self, code, file_path, packed=False):
+        """构建查询提示词和请求体
 
-            # 简化API验证逻辑
-            validation_result = self._validate_api_key(force_validation=True)
-            self.root.config(cursor="")  # 恢复鼠标指针
+        固定的审计要求和返回格式放在system消息中，文件路径、代码块信息和代码等每个请求不同的内容
+        全部放在最后的user消息里，使所有请求共享相同的前缀，命中服务端的上下文缓存。
 
-            if not validation_result:
-                self.status_bar.config(text="API密钥无效，无法进行分析")
-                messagebox.showerror("API验证失败", "API密钥验证失败，请检查API密钥是否正确。")
-                # 更改UI线程中的标志，确保事件处理程序知道API验证失败
-                self.root.after(0, lambda: setattr(self, 'api_validation_error_shown', True))
-                return {'status_code': 401, 'text': 'API密钥验证失败'}
-
-        # 构建查询提示词
-        prompt = f"""
-        {self.config.get('DEFAULT', 'PROMPT_TEMPLATE', fallback='')}，没有漏洞就在漏洞类型处写无，严格按照以下JSON格式返回结果：
-        {{
-            "文件路径": "{str(file_path)}",
-            "行号": [行号1, 行号2, ...],
-            "风险等级": "高危/中危/低危",
-            "漏洞类型": "代码执行/文件上传/XXE...",
-            "详细描述": "漏洞具体描述",
-            "风险点": "代码片段",
-            "Payload": "实际攻击代码/输入示例",
-            "修复建议": "修复建议"
-        }}
-
-        代码：
-        {code}
+        Args:
+            packed: 代码由多个带片段标记的代码块组成，此时要求模型返回片段编号和片段内行号
         """
+        template = self.config.get('DEFAULT', 'PROMPT_TEMPLATE', fallback='')
+        if packed:
+            instructions = f"""{template}，没有漏洞就在漏洞类型处写无。
+代码由多个片段组成，每个片段以“===== 片段N | 文件路径: ... =====”开头，请逐个片段审计，
+行号为该片段代码内的行号（“# 行范围”说明之后的第一行代码计为1），严格按照以下JSON数组格式返回结果：
+[{{
+    "片段": 片段编号N,
+    "文件路径": "片段标记中的文件路径",
+    "行号": [行号1, 行号2, ...],
+    "风险等级": "高危/中危/低危",
+    "漏洞类型": "代码执行/文件上传/XXE...",
+    "详细描述": "漏洞具体描述",
+    "风险点": "代码片段",
+    "Payload": "实际攻击代码/输入示例",
+    "修复建议": "修复建议"
+}}]"""
+            user_content = f"代码：\n{code}"
+        else:
+            instructions = f"""{template}，没有漏洞就在漏洞类型处写无，严格按照以下JSON格式返回结果：
+{{
+    "文件路径": "用户消息中给出的文件路径",
+    "行号": [行号1, 行号2, ...],
+    "风险等级": "高危/中危/低危",
+    "漏洞类型": "代码执行/文件上传/XXE...",
+    "详细描述": "漏洞具体描述",
+    "风险点": "代码片段",
+    "Payload": "实际攻击代码/输入示例",
+    "修复建议": "修复建议"
+}}"""
+            user_content = f"文件路径: {str(file_path)}\n\n代码：\n{code}"
+
+        return {
+            "model": self.current_model(),
+            "messages": [
+                {"role": "system", "content": instructions},
+                {"role": "user", "content": user_content}
+            ],
+            "temperature": 0.1,
+            "max_tokens": self.max_output_tokens
+        }
 
-        # 创建带重试机制的Session
-        session = requests.Session()
-        retries = Retry(
-            total=3,
-            backoff_factor=1.0,
-            status_forcelist=[500, 502, 503, 504],
-            allowed_methods=["POST"]
-        )
-        session.mount('https://', HTTPAdapter(max_retries=retries))
+    def _build_screen_request(self, code, segment_count):
+        """构建级联模式的初筛请求：只判断是否可疑和可疑行号，输出很短"""
+        instructions = """你是代码安全初筛助手，快速判断每个代码片段是否可能存在安全漏洞（注入、命令执行、代码执行、
+文件读写与上传、反序列化、XXE、SSRF、XSS、越权、敏感信息泄露等），不需要给出详细描述和修复建议。
+代码可能由多个片段组成，每个片段以“===== 片段N | 文件路径: ... =====”开头，只有一个片段时没有该标记，片段编号为1。
+行号为该片段代码内的行号（“# 行范围”说明之后的第一行代码计为1）。每个片段返回一项，严格按照以下JSON数组格式返回：
+[{
+    "片段": 片段编号N,
+    "可疑": true或false,
+    "行号": [可疑行号1, 可疑行号2, ...],
+    "类型": ["可能的漏洞类型", ...]
+}]"""
+        return {
+            "model": self.screen_model,
+            "messages": [
+                {"role": "system", "content": instructions},
+                {"role": "user", "content": f"代码：\n{code}"}
+            ],
+            "temperature": 0.0,
+            "max_tokens": min(self.max_output_tokens, 256 + 64 * segment_count)
+        }
 
+    def _on_auth_error_response(self, response_text):
+        """API返回401时更新状态栏并重置验证状态"""
+        error_message = "API密钥无效"
         try:
-            # 构建请求体JSON
-            request_json = {
-                "model": self.model_var.get(),
-                "messages": [{"role": "user", "content": prompt}],
-                "temperature": 0.1,
-                "max_tokens": 8192
-            }
+            response_json = json.loads(response_text)
+            if 'error' in response_json and 'message' in response_json['error']:
+                error_message = response_json['error']['message']
+        except:
+            pass
 
-            # 发送请求
-            response = session.post(
+        self.set_status(f"API认证失败: {error_message}")
+        self.api_validated = False  # 重置验证状态
+
+    def _send_api_request(self, request_json, file_path, on_line=None):
+        """通过共享连接池同步发送请求
+
+        Args:
+            on_line: 流式请求时逐行处理响应体的回调，此时成功响应的text为空
+        """
+        try:
+            response = self.http_pool.post(
                 self.api_endpoint,
                 headers={"Authorization": f"Bearer {self.api_key}"},
                 json=request_json,
-                timeout=(10, 60)
+                timeout=(10, 60),
+                stream=on_line is not None
             )
 
-            # 处理API响应错误
-            if response.status_code != 200:
+            with response:
                 # 处理认证错误
                 if response.status_code == 401:
-                    error_message = "API密钥无效"
-                    try:
-                        response_json = json.loads(response.text)
-                        if 'error' in response_json and 'message' in response_json['error']:
-                            error_message = response_json['error']['message']
-                    except:
-                        pass
-
-                    self.status_bar.config(text=f"API认证失败: {error_message}")
-                    self.api_validated = False  # 重置验证状态
-
-                return {
-                    'status_code': response.status_code,
-                    'text': response.text
-                }
+                    self._on_auth_error_response(response.text)
+
+                text = response.text if on_line is None or response.status_code != 200 else ''
+                if on_line is not None and response.status_code == 200:
+                    # SSE响应通常不声明字符集，按UTF-8解码
+                    response.encoding = 'utf-8'
+                    for line in response.iter_lines(decode_unicode=True):
+                        on_line(line)
 
             return {
-                'status_code': 200,
-                'text': response.text
+                'status_code': response.status_code,
+                'text': text,
+                'retry_after': response.headers.get('Retry-After')
             }
 
         except requests.exceptions.Timeout as e:
             # 特殊处理超时错误，不显示弹窗
             error_msg = f"API请求超时: {str(e)}"
             self.log_error(error_msg, file_path)
-            self.status_bar.config(text="API请求超时，请稍后重试")
+            self.set_status("API请求超时，请稍后重试")
             return {'status_code': 408, 'text': error_msg}  # 使用408状态码表示超时
         except requests.exceptions.ConnectionError as e:
             # 特殊处理连接错误，不显示弹窗
             error_msg = f"API连接失败: {str(e)}"
             self.log_error(error_msg, file_path)
-            self.status_bar.config(text="API连接失败，请检查网络")
+            self.set_status("API连接失败，请检查网络")
             return {'status_code': 503, 'text': error_msg}  # 使用503状态码表示服务不可用
         except requests.exceptions.RequestException as e:
             error_msg = f"API请求失败: {str(e)}"
@@ -1755,51 +3729,114 @@ class CodeAuditApp:
             # 不要在这里显示错误弹窗，而是返回错误信息
             return {'status_code': 500, 'text': error_msg}
 
-    # ------------------ 辅助方法 ------------------ #
-    def _save_config(self):
-        """保存配置文件并立即应用更改"""
-        with open(self.config_path, 'w', encoding='utf-8') as f:
-            self.config.write(f)
+    async def call_deepseek_api_async(self, code, suffix, file_path, on_object=None, packed=False, screening=0):
+        """调用DeepSeek API（请求引擎使用的异步版本）
 
-        # 立即重新加载配置并应用更改
-        self.reload_config()
+        API密钥在提交分析任务前已完成验证，这里不再重复验证。
+        发送前向限流器申请额度，收到429时按Retry-After暂停后重试，避免代码块因限流丢失。
 
-        # 更新状态栏提示
-        self.status_bar.config(text="配置已更新并应用")
-        # 3秒后恢复状态栏
-        self.root.after(3000, lambda: self.status_bar.config(text="就绪"))
+        Args:
+            on_object: 指定且启用STREAM_RESPONSES时使用流式响应，模型输出中每个JSON对象闭合时立即回调；
+                成功响应的text仍为完整的非流式格式
+            packed: code为多个带片段标记的代码块，使用打包提示词
+            screening: 大于0时为级联模式的初筛请求，值为片段数，使用SCREEN_MODEL和初筛提示词
+        """
+        error_response = self._precheck_api_request(code, suffix)
+        if error_response:
+            return error_response
 
-    def reload_config(self):
-        """重新加载配置文件并应用更改，无需重启程序"""
-        # 重新读取配置文件
-        if self.config_path.exists():
-            self.config.read(self.config_path, encoding='utf-8')
+        if screening:
+            request_json = self._build_screen_request(code, screening)
+        else:
+            request_json = self._build_api_request(code, file_path, packed)
+        estimated_tokens = RateLimiter.estimate_tokens(request_json)
+        streaming = on_object is not None and self.stream_responses
+        if streaming:
+            request_json = {**request_json, "stream": True, "stream_options": {"include_usage": True}}
+
+        for attempt in range(self.rate_limit_retries + 1):
+            await self.rate_limiter.acquire(estimated_tokens)
+            controller = self.request_engine.controller
+            stream = StreamingCompletion(on_object) if streaming else None
+            started = await controller.acquire()
+            response = {'status_code': 500, 'text': '请求未完成'}
+            try:
+                response = await self._post_api_request(request_json, file_path, stream.feed_line if stream else None)
+            finally:
+                await controller.release(started, response['status_code'])
+            if stream is not None and response['status_code'] == 200:
+                response['text'] = stream.to_response_text()
+            if response['status_code'] != 429 or attempt == self.rate_limit_retries or self.auto_analysis_cancelled:
+                break
+            retry_after = RateLimiter.parse_retry_after(response.get('retry_after'))
+            delay = self.rate_limiter.on_rate_limited(retry_after)
+            self.log_info(f"API请求被限流(429)，{delay:.1f}秒后第{attempt + 1}次重试", file_path)
+
+        if response['status_code'] == 200:
+            usage = self._response_usage(response['text'])
+            self.rate_limiter.record_usage(estimated_tokens, usage.get('total_tokens'))
+            self._record_prompt_cache_usage(usage)
+        return response
+
+    @staticmethod
+    def _response_usage(response_text):
+        """读取响应中的usage字段，不存在时返回空字典"""
+        try:
+            usage = json.loads(response_text).get('usage')
+        except (ValueError, AttributeError):
+            return {}
+        return usage if isinstance(usage, dict) else {}
 
-            # 更新API相关配置
-            self.api_key = self.config.get('DEFAULT', 'API_KEY', fallback='')
-            self.api_endpoint = self.config.get('DEFAULT', 'API_ENDPOINT',
-                                                fallback='https://api.deepseek.com/v1/chat/completions')
+    def _record_prompt_cache_usage(self, usage):
+        """累计服务端上下文缓存命中的提示令牌数
 
-            # 更新其他可能的配置项
-            timeout = self.config.get('DEFAULT', 'TIMEOUT', fallback='30')
+        DeepSeek返回prompt_cache_hit_tokens，OpenAI兼容接口返回prompt_tokens_details.cached_tokens。
+        """
+        prompt_tokens = usage.get('prompt_tokens') or 0
+        hit_tokens = usage.get('prompt_cache_hit_tokens')
+        if hit_tokens is None:
+            hit_tokens = (usage.get('prompt_tokens_details') or {}).get('cached_tokens') or 0
+        self.prompt_tokens_total += prompt_tokens
+        self.prompt_cache_hit_tokens += hit_tokens
 
-            # 如果有主题设置，应用主题
-            if 'THEME' in self.config['DEFAULT']:
-                theme = self.config.get('DEFAULT', 'THEME', fallback='light')
-                # 这里可以添加主题切换逻辑
+    async def _post_api_request(self, request_json, file_path, on_line=None):
+        """发送一次API请求，未安装aiohttp时回退到共享连接池的同步请求
 
-            # 更新状态栏
-            self.status_bar.config(text="配置已更新")
+        Args:
+            on_line: 流式请求时逐行处理响应体的回调
+        """
+        if aiohttp is None:
+            return await self.request_engine.run_blocking(self._send_api_request, request_json, file_path, on_line)
 
-            # 3秒后恢复状态栏
-            self.root.after(3000, lambda: self.status_bar.config(text="就绪"))
+        headers = {"Authorization": f"Bearer {self.api_key}"}
+        try:
+            if on_line is None:
+                status_code, text, headers = await self.request_engine.post_json(
+                    self.api_endpoint, headers, request_json, timeout=(10, 60)
+                )
+            else:
+                status_code, text, headers = await self.request_engine.post_stream(
+                    self.api_endpoint, headers, request_json, on_line, timeout=(10, 60)
+                )
+        except asyncio.TimeoutError as e:
+            error_msg = f"API请求超时: {str(e)}"
+            self.log_error(error_msg, file_path)
+            self.set_status("API请求超时，请稍后重试")
+            return {'status_code': 408, 'text': error_msg}
+        except aiohttp.ClientConnectionError as e:
+            error_msg = f"API连接失败: {str(e)}"
+            self.log_error(error_msg, file_path)
+            self.set_status("API连接失败，请检查网络")
+            return {'status_code': 503, 'text': error_msg}
+        except aiohttp.ClientError as e:
+            error_msg = f"API请求失败: {str(e)}"
+            self.log_error(error_msg, file_path)
+            return {'status_code': 500, 'text': error_msg}
 
-            # 重置API验证状态，以便在API密钥更改后重新验证
-            if hasattr(self, 'api_validated'):
-                self.api_validated = False
+        if status_code == 401:
+            self._on_auth_error_response(text)
 
-            return True
-        return False
+        return {'status_code': status_code, 'text': text, 'retry_after': headers.get('Retry-After')}
 
     def _validate_api_key(self, force_validation=False):
         """验证API密钥有效性并返回验证结果"""
@@ -1814,8 +3851,7 @@ class CodeAuditApp:
 
         try:
             # 发送简单请求验证API密钥
-            session = requests.Session()
-            response = session.post(
+            response = self.http_pool.post(
                 self.api_endpoint,
                 headers={"Authorization": f"Bearer {self.api_key}"},
                 json={
@@ -1837,2653 +3873,3632 @@ class CodeAuditApp:
             self.api_validated = False
             return False
 
-    def open_api_settings(self):
-        """打开API设置对话框"""
-        # 创建一个顶层窗口
-        settings_window = tk.Toplevel(self.root)
-        settings_window.title("API设置")
-        settings_window.geometry("700x450")  # 减小窗口尺寸，使其更加紧凑
-        settings_window.resizable(True, True)  # 允许调整大小以适应不同屏幕分辨率
-        settings_window.transient(self.root)
-        settings_window.grab_set()  # 模态对话框
+    def log_error(self, error_msg, file_path=None):
+        """记录错误日志"""
+        try:
+            log_entry = f"[{time.strftime('%Y-%m-%d %H:%M:%S')}] {error_msg}"
+            if file_path:
+                log_entry += f" | 文件：{file_path}"
 
-        # 内容框架 - 减小内边距使内容更加紧凑
-        frame = ttk.Frame(settings_window, padding=10)
-        frame.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
+            with open(self.log_file, 'a', encoding='utf-8') as f:
+                f.write(log_entry + '\n')
+        except Exception as e:
+            print(f"日志记录失败: {str(e)}")
 
-        # API密钥设置
-        ttk.Label(frame, text="API密钥:").grid(row=0, column=0, sticky=tk.W, pady=5)
-        api_key_var = tk.StringVar(value=self.api_key)
-        api_key_entry = ttk.Entry(frame, textvariable=api_key_var, width=50)
-        api_key_entry.grid(row=0, column=1, sticky=tk.W + tk.E, pady=5)
+    @staticmethod
+    def _extract_vulnerability_objects(api_response):
+        """从API响应中取出模型返回的漏洞对象列表（未校验），格式错误时抛出异常"""
+        # 1. 解析外层API响应
+        response_data = json.loads(api_response)
 
-        # API终端设置
-        ttk.Label(frame, text="API终端:").grid(row=1, column=0, sticky=tk.W, pady=5)
-        api_endpoint_var = tk.StringVar(value=self.api_endpoint)
-        api_endpoint_entry = ttk.Entry(frame, textvariable=api_endpoint_var, width=50)
-        api_endpoint_entry.grid(row=1, column=1, sticky=tk.W + tk.E, pady=5)
+        # 检查响应是否完整，被截断时带上已经完整输出的漏洞对象
+        if response_data["choices"][0]["finish_reason"] == "length":
+            content = response_data["choices"][0]["message"].get("content") or ''
+            raise TruncatedResponseError(StreamingCompletion.complete_objects(content))
 
-        # 超时设置
-        ttk.Label(frame, text="超时(秒):").grid(row=2, column=0, sticky=tk.W, pady=5)
-        timeout_var = tk.StringVar(value=self.config.get('DEFAULT', 'TIMEOUT', fallback='30'))
-        timeout_entry = ttk.Entry(frame, textvariable=timeout_var, width=10)
-        timeout_entry.grid(row=2, column=1, sticky=tk.W, pady=5)
+        content = response_data["choices"][0]["message"]["content"]
 
-        # 提示模板设置
-        ttk.Label(frame, text="提示模板:").grid(row=3, column=0, sticky=tk.W, pady=5)
-        prompt_var = tk.StringVar(value=self.config.get('DEFAULT', 'PROMPT_TEMPLATE',
-                                                        fallback='你是一个代码审计专家结合整段代码分析传参处理有没有可控点或者组件版本是否有漏洞，使用污点分析+AST分析对代码的语义信息进行安全分析'))
-        prompt_entry = ttk.Entry(frame, textvariable=prompt_var, width=50)
-        prompt_entry.grid(row=3, column=1, sticky=tk.W + tk.E, pady=5)
+        # 2. 提取Markdown代码块
+        json_str = content
+        if "```json" in content:
+            start = content.find("```json") + len("```json")
+            end = content.rfind("```")
+            json_str = content[start:end].strip()
 
-        # 余额显示区域
-        balance_frame = ttk.LabelFrame(frame, text="API余额信息", padding=10)
-        balance_frame.grid(row=4, column=0, columnspan=2, sticky=tk.W + tk.E, pady=10)
+        # 3. 解析漏洞数据
+        vulnerabilities = json.loads(json_str)
+        if not isinstance(vulnerabilities, list):
+            vulnerabilities = [vulnerabilities]
+        return vulnerabilities
 
-        # 余额信息标签
-        balance_text = tk.Text(balance_frame, height=5, width=50, wrap=tk.WORD, state=tk.DISABLED)
-        balance_text.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
+    def _normalize_vulnerability(self, vuln, code_lines, log_invalid=True):
+        """校验并规范化单个漏洞对象，漏洞类型为"无"时返回None，缺少必填字段时抛出异常
 
-        # 查询余额函数
-        def query_balance():
-            # 禁用查询按钮，避免重复点击
-            query_btn.config(state=tk.DISABLED)
-            # 更新状态
-            status_var.set("正在查询余额...")
-            settings_window.update()
+        Args:
+            log_invalid: 是否记录无效行号（流式预览时为False，避免与完整解析重复记录）
+        """
+        # 4. 处理键名前可能存在的空格
+        vuln = {k.strip(): v for k, v in vuln.items()}
+
+        # 5. 校验必填字段
+        required_fields = ["文件路径", "行号", "风险等级", "漏洞类型", "详细描述"]
+        for field in required_fields:
+            if field not in vuln:
+                raise ValueError(f"缺少必填字段: {field}")
+
+        # 6. 处理行号字段类型
+        raw_lines = vuln["行号"]
+        if isinstance(raw_lines, int):
+            line_numbers = [raw_lines]
+        elif isinstance(raw_lines, list):
+            line_numbers = raw_lines
+        else:
+            line_numbers = []
+
+        # 7. 构建漏洞数据
+        vuln_data = {
+            "文件路径": vuln["文件路径"].strip(),
+            "行号": line_numbers,
+            "风险等级": vuln["风险等级"].strip(),
+            "漏洞类型": vuln["漏洞类型"].strip(),
+            "风险点": vuln.get("风险点", "").strip(),
+            "Payload": vuln.get("Payload", "").strip(),
+            "详细描述": vuln["详细描述"].strip(),
+            "修复建议": vuln.get("修复建议", "").strip()
+        }
 
-            # 使用当前输入框中的API密钥查询
-            result = self.check_api_balance(api_key_var.get())
+        # 验证行号是否有效
+        valid_line_numbers = []
+        for line in vuln_data["行号"]:
+            if 0 < line <= len(code_lines):
+                valid_line_numbers.append(line)
+            elif log_invalid:
+                self.log_error(f"无效行号: {line}（文件总行数: {len(code_lines)})")
 
-            # 启用查询按钮
-            query_btn.config(state=tk.NORMAL)
+        vuln_data["行号"] = valid_line_numbers
 
-            # 显示查询结果
-            balance_text.config(state=tk.NORMAL)
-            balance_text.delete(1.0, tk.END)
+        # 过滤漏洞类型为"无"的结果
+        if vuln_data["漏洞类型"].lower() == "无":
+            return None
+        return vuln_data
 
-            if result["status"] == "success":
-                try:
-                    data = result["data"]
-                    balance_info = ""
+    def analyze_file(self, file_path, work_queue, chunks=None):
+        """把单个文件的代码块放入项目级工作队列
 
-                    # 处理新格式的API响应 (balance_infos格式)
-                    if "balance_infos" in data and data["balance_infos"]:
-                        balance_info += f"账户状态: {'可用' if data.get('is_available', False) else '不可用'}\n"
-                        balance_infos = data["balance_infos"]
+        Args:
+            work_queue: ChunkWorkQueue或ChunkPacker
+            chunks: 预先生成的分块计划，为None时读取文件生成
 
-                        for info in balance_infos:
-                            currency = info.get("currency", "")
-                            total = info.get("total_balance", "0")
-                            granted = info.get("granted_balance", "0")
-                            topped_up = info.get("topped_up_balance", "0")
+        Returns:
+            int: 放入队列的代码块数量
+        """
+        # 检查是否已取消分析
+        if hasattr(self, 'auto_analysis_cancelled') and self.auto_analysis_cancelled:
+            self.log_info(f"分析已取消，跳过文件: {file_path.name}")
+            return 0
+
+        if chunks is None:
+            chunks = self._plan_file_chunks(file_path)
+        scorer = self._risk_scorer
+        language = self.supported_langs.get(file_path.suffix.lower())
+        file_score = self._file_scores.pop(file_path, 0.0)
+        journal = self._journal
+        file_hash = self._file_hashes.get(file_path) if journal is not None else None
+        for i, chunk in enumerate(chunks):
+            if file_hash is not None:
+                # 继续扫描：检查点日志中已完成的代码块不再发送
+                journaled = journal.lookup(file_hash, chunk)
+                if journaled is not None:
+                    self._replay_journaled(file_path, journaled)
+                    continue
+            priority = scorer.chunk_score(chunk[0], language, file_score) if scorer is not None else 0
+            work_queue.put(chunk, file_path, i, len(chunks), priority=priority)
+        return len(chunks)
+
+    def _begin_result_scan(self):
+        """在结果数据库中登记本次扫描，之后发现的漏洞都归属于该扫描"""
+        self._scan_id = None
+        if self.result_store is not None:
+            self._scan_id = self.result_store.begin_scan(self.project_path, self._result_model_key())
+            self.session_scan_ids.append(self._scan_id)
+
+    def _finish_result_scan(self):
+        if self.result_store is not None and self._scan_id is not None:
+            status = self.result_store.finish_scan(self._scan_id,
+                                                   'cancelled' if self.auto_analysis_cancelled else 'completed')
+            if status == 'partial':
+                self.log_error(f"部分扫描结果未能写入 {self.result_store.db_path}（扫描ID {self._scan_id}），扫描已标记为partial")
+            else:
+                self.log_info(f"扫描结果已保存到 {self.result_store.db_path}（扫描ID {self._scan_id}）")
+        self._scan_id = None
+
+    def _open_journal(self, resume=False, enabled=True):
+        """打开项目的检查点日志，resume为True时先读取上次已完成的代码块"""
+        self._journal = None
+        self._file_hashes = {}
+        if not (enabled and self.checkpoint_enabled):
+            return
+        journal = ScanJournal.for_project(self.project_path, self._result_model_key())
+        try:
+            if resume:
+                count = journal.load()
+                if count:
+                    self.log_info(f"继续扫描: 检查点日志中有 {count} 个已完成的代码块")
+                else:
+                    self.log_info("没有可继续的检查点，从头开始扫描")
+            journal.open(resume)
+        except Exception as e:
+            self.log_error(f"打开检查点日志失败，本次扫描不记录检查点: {str(e)}")
+            return
+        self._journal = journal
 
-                            balance_info += f"币种: {currency}\n"
-                            balance_info += f"总余额: {total}\n"
-                            balance_info += f"授予余额: {granted}\n"
-                            balance_info += f"充值余额: {topped_up}\n\n"
+    def _close_journal(self):
+        """关闭检查点日志：扫描全部完成时删除日志，被取消或有代码块失败时保留，以便继续扫描"""
+        journal = self._journal
+        if journal is None:
+            return
+        self._journal = None
+        self._file_hashes = {}
+        if journal.replayed:
+            self.log_info(f"继续扫描: 跳过 {journal.replayed} 个已完成的代码块")
+        finished = not self.auto_analysis_cancelled and not self._scan_failed_files
+        try:
+            journal.close(remove=finished)
+        except Exception as e:
+            self.log_error(f"关闭检查点日志失败: {str(e)}")
+        if not finished:
+            self.log_info(f"扫描未全部完成，检查点已保存，可使用“继续扫描”跳过已完成的代码块: {journal.journal_path}")
 
-                    # 处理旧格式的API响应 (grants格式)
-                    elif "grants" in data and data["grants"]:
-                        balance_info += f"账户: {data.get('title', 'Unknown')}\n\n"
-                        grants = data["grants"]
-                        for grant in grants:
-                            name = grant.get("name", "Unknown")
-                            amount = grant.get("amount", 0)
-                            used = grant.get("used", 0)
-                            available = grant.get("available", 0)
-                            expires = grant.get("expires", "Unknown")
+    def _journal_record(self, file_path, chunk_info, vulnerabilities):
+        journal = self._journal
+        if journal is None:
+            return
+        file_hash = self._file_hashes.get(file_path)
+        if file_hash is not None:
+            try:
+                journal.record(file_hash, chunk_info, vulnerabilities)
+            except Exception as e:
+                self.log_error(f"写入检查点日志失败: {str(e)}", file_path)
+
+    def _replay_journaled(self, file_path, vulnerabilities):
+        """显示检查点日志中记录的代码块结果，计入本次扫描的结果和进度"""
+        copies = [{**vuln, "文件路径": str(file_path)} for vuln in vulnerabilities]
+        if copies:
+            self.display_results(file_path, copies)
+        self._journal.replayed += 1
+        self.report_progress(1)
+
+    def _prioritize_files(self, files):
+        """风险优先调度：按PRIORITY_WINDOW_FILES个文件一组，组内按路径和提交次数的分数从高到低产出
+
+        文件列表仍是边遍历边产出，不需要先遍历完整个项目，也不额外读取文件。文件内容的分数在分块读取文件时
+        计算（见_read_for_chunking），代码块放入工作队列时再按文件分数和自身的危险函数数量确定优先级。
+        PRIORITY_SCHEDULING为false时按遍历顺序产出。
+        """
+        self._file_scores = {}
+        self._risk_scorer = None
+        if not self.priority_scheduling:
+            yield from files
+            return
 
-                            # 格式化金额显示
-                            amount_str = f"${amount:.2f}" if isinstance(amount, (int, float)) else str(amount)
-                            used_str = f"${used:.2f}" if isinstance(used, (int, float)) else str(used)
-                            available_str = f"${available:.2f}" if isinstance(available, (int, float)) else str(
-                                available)
+        scorer = RiskScorer(self.prefilter, self.project_path, RiskScorer.load_churn(self.project_path))
+        self._risk_scorer = scorer
+        count = 0
+        files = iter(files)
+        while not self.auto_analysis_cancelled:
+            window = list(itertools.islice(files, self.PRIORITY_WINDOW_FILES))
+            if not window:
+                break
+            count += len(window)
+            yield from sorted(window, key=scorer.static_score, reverse=True)
+        self.log_info(f"风险排序: {count} 个文件，每 {self.PRIORITY_WINDOW_FILES} 个文件一组排序，"
+                      f"提交历史 {len(scorer.churn)} 个文件")
 
-                            balance_info += f"额度类型: {name}\n"
-                            balance_info += f"总额: {amount_str}  已用: {used_str}  剩余: {available_str}\n"
-                            if expires and expires != "Unknown":
-                                # 尝试格式化过期时间
-                                try:
-                                    # 如果是ISO格式的时间字符串，转为更易读的格式
-                                    if 'T' in expires and 'Z' in expires:
-                                        dt = datetime.fromisoformat(expires.replace('Z', '+00:00'))
-                                        expires = dt.strftime('%Y-%m-%d %H:%M:%S')
-                                except:
-                                    pass  # 如果转换失败，保持原格式
-                                balance_info += f"过期时间: {expires}\n\n"
+    def _plan_file_chunks(self, file_path):
+        """读取文件并生成分块计划
 
-                    # 如果没有找到特定格式，则显示原始数据
-                    else:
-                        balance_info += "未识别的余额信息格式，显示原始数据:\n\n"
-                        balance_info += str(data)
+        分块结果按(文件类型, 令牌预算, 内容哈希)缓存，内容未变化的文件在多次扫描之间不会重复分块。
 
-                    # 显示余额信息
-                    balance_text.insert(tk.END, balance_info)
-                    # 更新状态
-                    status_var.set("余额查询成功")
-                except Exception as ex:
-                    # 处理解析数据异常
-                    balance_text.insert(tk.END, f"解析余额信息失败: {str(ex)}\n")
-                    if "data" in result:
-                        balance_text.insert(tk.END, f"原始数据: {str(result['data'])}")
-                    status_var.set("余额数据解析失败")
-            else:
-                # 显示错误信息
-                error_message = result.get('message', '未知错误')
-                balance_text.insert(tk.END, f"查询失败: {error_message}\n")
+        Returns:
+            list: 代码块列表，读取失败时为空列表
+        """
+        prepared = self._read_for_chunking(file_path)
+        if prepared is None:
+            return []
+        chunks = self._cached_chunk_plan(prepared[3])
+        if chunks is not None:
+            return chunks
+        return self._chunk_prepared(file_path, *prepared)
 
-                # 如果有原始响应，也显示出来
-                if 'raw' in result:
-                    balance_text.insert(tk.END, f"原始响应: {result['raw'][:200]}...")
+    def _chunk_prepared(self, file_path, data, file_ext, budget, cache_key):
+        """在当前线程分块已读取的文件内容"""
+        try:
+            chunks, cpu_seconds = _chunk_source_task(data, file_ext, budget, self.verbose)
+        except Exception as e:
+            self.log_error(f"文件分块失败: {str(e)}", file_path)
+            return []
+        self._store_chunk_plan(file_path, cache_key, chunks, cpu_seconds)
+        return chunks
 
-                # 更新状态
-                status_var.set("余额查询失败")
+    def _iter_chunk_plans(self, file_iter):
+        """逐个读取文件并按完成顺序产出 (文件路径, 代码块列表)
 
-            balance_text.config(state=tk.DISABLED)
+        file_iter可以是惰性的文件生成器，边遍历目录边读取、分块。前CHUNK_POOL_MIN_FILES个文件直接在当前线程
+        分块，使第一批请求尽快发出；之后CHUNK_WORKERS大于1时交给进程池并行分块，当前线程只负责读取文件和
+        查询分块计划缓存，在途的分块任务最多为进程数的4倍。调用方放入工作队列时若队列已满会阻塞，
+        读取和分块随之暂停，内存占用不随项目大小增长。
+        """
+        window = max(1, self.chunk_workers * 4)
+        inline_left = self.CHUNK_POOL_MIN_FILES
+        pool = None
+        pending = {}
+        files = iter(file_iter)
+        exhausted = False
+        try:
+            while True:
+                while not exhausted and len(pending) < window and not self.auto_analysis_cancelled:
+                    file_path = next(files, None)
+                    if file_path is None:
+                        exhausted = True
+                        break
+                    prepared = self._read_for_chunking(file_path)
+                    if prepared is None:
+                        yield file_path, []
+                        continue
+                    data, file_ext, budget, cache_key = prepared
+                    chunks = self._cached_chunk_plan(cache_key)
+                    if chunks is not None:
+                        yield file_path, chunks
+                        continue
+                    if pool is None and inline_left <= 0:
+                        pool = self._get_chunk_pool()
+                    if pool is None:
+                        inline_left -= 1
+                        yield file_path, self._chunk_prepared(file_path, *prepared)
+                        continue
+                    pending[pool.submit(_chunk_source_task, data, file_ext, budget, self.verbose)] = (file_path, cache_key)
+                if not pending or self.auto_analysis_cancelled:
+                    return
+                done, _ = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    file_path, cache_key = pending.pop(future)
+                    try:
+                        chunks, cpu_seconds = future.result()
+                    except Exception as e:
+                        self.log_error(f"文件分块失败: {str(e)}", file_path)
+                        chunks = []
+                    else:
+                        self._store_chunk_plan(file_path, cache_key, chunks, cpu_seconds)
+                    yield file_path, chunks
+        finally:
+            for future in pending:
+                future.cancel()
 
-        # 状态标签
-        status_var = tk.StringVar(value="")
-        status_label = ttk.Label(frame, textvariable=status_var, foreground="green")
-        status_label.grid(row=5, column=0, sticky=tk.W, pady=10)
+    def _get_chunk_pool(self):
+        """返回分块进程池，配置为单进程或进程池创建失败时返回None（在当前线程分块）"""
+        if self.chunk_workers <= 1:
+            return None
+        if self._chunk_pool is None:
+            try:
+                # 使用spawn启动子进程：请求引擎和界面线程仍在运行，fork可能复制到被其他线程持有的锁
+                self._chunk_pool = concurrent.futures.ProcessPoolExecutor(
+                    max_workers=self.chunk_workers, mp_context=multiprocessing.get_context('spawn')
+                )
+            except Exception as e:
+                self.log_error(f"分块进程池创建失败，改为单线程分块: {str(e)}")
+                self.chunk_workers = 1
+                return None
+        return self._chunk_pool
+
+    def shutdown_chunk_pool(self):
+        """关闭分块进程池"""
+        if self._chunk_pool is not None:
+            self._chunk_pool.shutdown(wait=False, cancel_futures=True)
+            self._chunk_pool = None
+
+    def _read_for_chunking(self, file_path):
+        """读取文件，返回 (内容, 文件类型, 令牌预算, 缓存键)，读取失败时返回None"""
+        try:
+            with open(file_path, 'rb') as f:
+                data = f.read()
+        except Exception as e:
+            self.log_error(f"读取文件失败: {str(e)}", file_path)
+            return None
 
-        # 按钮框架 - 移到状态标签同一行，靠右显示
-        btn_frame = ttk.Frame(frame)
-        btn_frame.grid(row=5, column=1, pady=10, sticky=tk.E)
+        file_ext = file_path.suffix.lower()
+        # 特殊处理pom.xml文件
+        if file_path.name.lower() == 'pom.xml' and not file_ext:
+            file_ext = '.xml'
+
+        budget = self._chunk_token_budget()
+        content_hash = hashlib.sha1(data).hexdigest()
+        if self._journal is not None:
+            self._file_hashes[file_path] = content_hash
+        if self._risk_scorer is not None:
+            # 风险优先调度：复用分块读取的内容计算文件分数，不再单独读取文件
+            self._file_scores[file_path] = self._risk_scorer.file_score(
+                file_path, self.supported_langs.get(file_ext), data)
+        return data, file_ext, budget, (file_ext, budget, content_hash)
+
+    def _cached_chunk_plan(self, cache_key):
+        with self._chunk_plan_lock:
+            chunks = self._chunk_plan_cache.get(cache_key)
+            if chunks is not None:
+                self._chunk_plan_cache.move_to_end(cache_key)
+                self.chunk_plan_cache_hits += 1
+            return chunks
 
-        # 应用配置按钮（应用后关闭窗口）
-        def apply_settings():
-            # 更新配置
-            self.config['DEFAULT']['API_KEY'] = api_key_var.get()
-            self.config['DEFAULT']['API_ENDPOINT'] = api_endpoint_var.get()
-            self.config['DEFAULT']['TIMEOUT'] = timeout_var.get()
-            self.config['DEFAULT']['PROMPT_TEMPLATE'] = prompt_var.get()
+    def _store_chunk_plan(self, file_path, cache_key, chunks, cpu_seconds):
+        self._debug(f"{file_path.name} 被分为 {len(chunks)} 个代码块")
+        self.log_info(f"{file_path.name} 被分为 {len(chunks)} 个代码块")
+        with self._chunk_plan_lock:
+            self.chunking_cpu_seconds += cpu_seconds
+            if cache_key in self._chunk_plan_cache:
+                return
+            self._chunk_plan_cache[cache_key] = chunks
+            self._chunk_plan_cache_chars += sum(len(chunk[0]) for chunk in chunks)
+            while len(self._chunk_plan_cache) > 1 and (
+                    len(self._chunk_plan_cache) > self.CHUNK_PLAN_CACHE_SIZE
+                    or self._chunk_plan_cache_chars > self.CHUNK_PLAN_CACHE_CHARS):
+                _, evicted = self._chunk_plan_cache.popitem(last=False)
+                self._chunk_plan_cache_chars -= sum(len(chunk[0]) for chunk in evicted)
+
+    def _chunk_token_budget(self):
+        """单个代码块可用的输入令牌数
+
+        取CHUNK_MAX_TOKENS与（模型上下文长度 - 预留输出令牌 - 提示词和文件路径占用）中的较小值。
+        """
+        prompt_tokens = estimate_tokens(self.config.get('DEFAULT', 'PROMPT_TEMPLATE', fallback='')) + 512
+        available = self.model_context_tokens - self.max_output_tokens - prompt_tokens
+        return max(256, min(self.chunk_max_tokens, available))
 
-            # 保存配置并重新加载
-            self._save_config()
+    def _smart_code_chunking(self, code, file_ext, budget=None):
+        """根据代码结构智能分块，每块不超过令牌预算"""
+        return CodeChunker(self.verbose).chunk_code(code, file_ext, budget or self._chunk_token_budget())
 
-            # 更新状态
-            status_var.set("配置已应用")
-            # 应用后关闭窗口
-            settings_window.after(1000, settings_window.destroy)
+    def _debug(self, message):
+        """输出调试信息，verbose为False时（命令行默认）不输出"""
+        if self.verbose:
+            print(f"[DEBUG] {message}", file=sys.stderr)
 
-        # 应用按钮 - 增加宽度
-        apply_btn = ttk.Button(btn_frame, text="应用", command=apply_settings, width=20)
-        apply_btn.pack(side=tk.LEFT, padx=25, pady=10)
+    def check_api_balance(self, api_key=None):
+        """查询API余额
 
-        # 查询余额按钮 - 增加宽度
-        query_btn = ttk.Button(btn_frame, text="查询余额", command=query_balance, width=20)
-        query_btn.pack(side=tk.LEFT, padx=25, pady=10)
+        Args:
+            api_key: 可选的API密钥，如不提供则使用当前配置的密钥
 
-        # 居中显示窗口
-        settings_window.update_idletasks()
-        width = settings_window.winfo_width()
-        height = settings_window.winfo_height()
-        x = (settings_window.winfo_screenwidth() // 2) - (width // 2)
-        y = (settings_window.winfo_screenheight() // 2) - (height // 2)
-        settings_window.geometry(f"{width}x{height}+{x}+{y}")
+        Returns:
+            dict: 包含余额信息的字典，如查询失败则包含错误信息
+        """
+        try:
+            # 使用参数提供的API密钥或配置中的密钥
+            key = api_key if api_key else self.api_key
 
-        # 设置焦点到API密钥输入框
-        api_key_entry.focus_set()
+            if not key:
+                return {"status": "error", "message": "未配置API密钥"}
 
-    def check_validation_result(self):
-        """检查验证结果"""
-        now = time.time()
-        try:
-            event_type, result, _ = self.event_queue.get_nowait()
+            # 设置请求
+            url = "https://api.deepseek.com/user/balance"
+            headers = {
+                "Accept": "application/json",
+                "Authorization": f"Bearer {key}"
+            }
 
-            if event_type == 'api_validation':
-                if result:
-                    self.config['DEFAULT']['API_KEY'] = self.api_key
-                    self._save_config()
-                    self.api_validated = True  # 设置API验证状态为已验证成功
-                    self.status_bar.config(text="API密钥验证通过")
-                    return True
-                else:
-                    self.api_validated = False  # 设置API验证状态为验证失败
-                    self.status_bar.config(text="API密钥无效")
-                    return False
-        except Empty:
-            pass
+            # 发送请求
+            response = self.http_pool.get(url, headers=headers, timeout=10)
 
-        time_elapsed = now - self.validation_start_time
+            # 处理响应
+            if response.status_code == 200:
+                try:
+                    data = response.json()
+                    return {"status": "success", "data": data}
+                except:
+                    return {"status": "error", "message": "解析余额数据失败", "raw": response.text}
+            elif response.status_code == 401:
+                return {"status": "error", "message": "API密钥无效或已过期"}
+            else:
+                return {"status": "error", "message": f"服务器返回错误: {response.status_code}", "raw": response.text}
 
-        if time_elapsed > 15:
-            self.status_bar.config(text="API服务器响应超时")
-            return
+        except requests.RequestException as e:
+            return {"status": "error", "message": f"网络请求失败: {str(e)}"}
+        except Exception as e:
+            return {"status": "error", "message": f"查询余额时出错: {str(e)}"}
 
-        self.root.after(50, self.check_validation_result)
-        return None
 
-    def retry_api_validation(self):
-        """重试API验证 - 已移除实际验证逻辑"""
-        self.api_validated = True
-        return True
+class CodeAuditApp(AuditEngine):
+    """图形界面：分析流程由AuditEngine提供，这里负责界面和钩子的线程安全实现"""
 
-    def log_error(self, error_msg, file_path=None):
-        """记录错误日志"""
-        try:
-            log_entry = f"[{time.strftime('%Y-%m-%d %H:%M:%S')}] {error_msg}"
-            if file_path:
-                log_entry += f" | 文件：{file_path}"
+    def __init__(self, root):
+        self.event_queue = Queue()
+        self.root = root
+        self.root.title("DeepAudit 代码审计工具")
+        self.root.geometry("1280x800")
 
-            with open(self.log_file, 'a', encoding='utf-8') as f:
-                f.write(log_entry + '\n')
-        except Exception as e:
-            print(f"日志记录失败: {str(e)}")
+        # 初始化分析引擎（配置、连接池、请求引擎和缓存）
+        super().__init__(Path.cwd() / 'config.ini')
 
-    # ------------------ UI同步方法 ------------------ #
-    def show_detail(self, event):
-        """显示漏洞详情（带格式优化）"""
-        selected = self.result_tree.selection()
-        if not selected:
-            return
+        # 初始化进度相关变量
+        self.progress_var = tk.IntVar(value=0)
+        self.progress_bar = None
+        self.files_to_analyze = []
 
-        item = self.result_tree.item(selected[0])
-        values = item['values']
+        # 启动事件处理循环
+        self.root.after(100, self.process_event_queue)
 
-        # 格式化修复建议（新增格式处理）
-        repair_advice = values[7].replace('；', '\n')  # 中文分号转行
-        repair_advice = re.sub(r'\d+\.\s*', '', repair_advice)  # 移除已有编号
+        # 新增配置初始化（关键修复）
+        if not self.config_path.exists():
+            self._save_config()
 
-        details = f"""文件路径：{values[3]}
-━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
-风险等级：{values[2]}
-━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
-漏洞类型：{values[1]}
-━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
-风险点：{values[5]}
-━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
-Payload：{values[6]}
-━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
-详细描述：{values[4]}
-━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
-修复建议：\n"""
-
-        # 添加带格式的修复建议（新增内容）
-        self.detail_text.config(state='normal')
-        self.detail_text.delete(1.0, tk.END)
+        # 初始化核心组件
+        self._init_ui()
+        self._bind_events()
 
-        # 插入基础信息
-        self.detail_text.insert(tk.END, details)
+        # 添加全局ID计数器
+        self.vuln_id_counter = 1
 
-        # 格式化修复建议（新增高亮逻辑）
-        for i, line in enumerate(repair_advice.split('\n'), 1):
-            if line.strip():
-                self.detail_text.insert(tk.END, f"{i}. ", 'repair_title')
-                self.detail_text.insert(tk.END, f"{line.strip()}\n", 'repair_content')
+        # 添加控制自动分析的状态变量
+        self.auto_analysis_paused = False
+        self.auto_analysis_cancelled = False
+        self.auto_analysis_thread = None
 
-        self.detail_text.config(state='disabled')
+        # 修改初始化顺序，立即开始配置初始化
+        self.delayed_config_init()
 
-        # 添加标签配置（新增样式配置）
-        self.detail_text.tag_configure('repair_title', foreground='#0078D7', font=('微软雅黑', 10, 'bold'))
-        self.detail_text.tag_configure('repair_content', foreground='#333333', font=('微软雅黑', 10))
+        # 不再自动验证API密钥，只在需要时验证
+        self.status_bar.config(text="就绪")
 
-    def sync_scroll(self, event=None):
-        """同步滚动行号和代码"""
-        if hasattr(self, 'line_number') and self.line_number and self.code_text:
-            self.line_number.yview_moveto(self.code_text.yview()[0])
-            self.update_line_numbers()
-        return "break"
+    # ------------------ 分析引擎钩子 ------------------ #
+    def current_model(self):
+        """返回模型下拉框中选择的模型"""
+        return self.model_var.get()
+
+    def cascade_enabled(self):
+        """返回工具栏上是否勾选了级联模式"""
+        return self.cascade_var.get()
+
+    def set_status(self, text):
+        """在UI线程中更新状态栏"""
+        self.root.after(0, lambda: self.status_bar.config(text=text))
+
+    def set_progress_total(self, total):
+        """在UI线程中设置进度条最大值"""
+        super().set_progress_total(total)
+        self.root.after(0, lambda: self.progress.configure(value=0, maximum=max(total, 1)))
+
+    def add_progress_total(self, count):
+        """在UI线程中增加进度条最大值"""
+        super().add_progress_total(count)
+        self.root.after(0, lambda: self.progress.configure(maximum=max(self.progress_total, 1)))
+
+    def report_progress(self, count=1):
+        """通过事件队列更新进度条"""
+        super().report_progress(count)
+        self.event_queue.put(('progress', count, None))
+
+    def report_error(self, error_msg):
+        """在UI线程中弹窗提示错误"""
+        self.root.after(0, lambda: self.show_error(error_msg))
+
+    def on_auth_failure(self, error_message):
+        """在UI线程中显示认证失败提示"""
+        self.root.after(0, lambda: [
+            messagebox.showerror("API认证失败", f"API认证失败: {error_message}"),
+            self.status_bar.config(text=f"API认证失败: {error_message}")
+        ])
 
-    def update_line_numbers(self, event=None):
-        """更新行号"""
-        if hasattr(self, 'line_number') and self.line_number and self.code_text:
-            # 添加递归保护标志
-            if hasattr(self, '_updating_line_numbers') and self._updating_line_numbers:
-                return
+    def _init_configuration(self):
+        """统一配置初始化"""
+        self.config = configparser.ConfigParser()
+        self.config_path = Path("config.ini")
 
-            self._updating_line_numbers = True
-            try:
-                # 获取可见区域的第一行和最后一行
-                first_line = self.code_text.index("@0,0").split('.')[0]
-                last_line = self.code_text.index(f"@0,{self.code_text.winfo_height()}").split('.')[0]
+        # 初始化API相关配置
+        self.api_key = self.config.get('DEFAULT', 'API_KEY', fallback='')
+        self.api_endpoint = self.config.get('DEFAULT', 'API_ENDPOINT',
+                                            fallback='https://api.deepseek.com/v1/chat/completions')
 
-                # 计算行数
-                first = int(float(first_line))
-                last = int(float(last_line)) + 1
+        # 初始化日志路径
+        self.log_file = self.project_path / 'error.log'
+        self.api_log_file = self.project_path / 'api.log'
 
-                # 清除现有行号
-                self.line_number.config(state='normal')
-                self.line_number.delete(1.0, tk.END)
+        # 支持的语言类型
+        self.supported_langs = {
+            '.php': 'php',
+            '.java': 'java',
+            '.js': 'javascript',
+            '.html': 'html',
+            '.xml': 'xml'
+        }
 
-                # 计算行号宽度 - 更精确地计算所需宽度
-                max_line = int(last_line)
-                width = len(str(max_line)) + 1  # 添加一点额外空间
-                self.line_number.config(width=width)
+        # 风险等级颜色
+        self.severity_colors = {
+            '高危': '#ff4444',
+            '中危': '#ffa500',
+            '低危': '#4CAF50'
+        }
 
-                # 添加新行号 - 右对齐显示
-                for i in range(first, last):
-                    self.line_number.insert(tk.END, f"{i:>{width - 1}}\n")  # 使用右对齐格式
+        # 延迟加载非必要配置
+        self.root.after(500, self.load_full_config)
 
-                self.line_number.config(state='disabled')
+    def _init_ui(self):
+        """界面组件初始化"""
+        # 主框架
+        main_frame = ttk.Frame(self.root)
+        main_frame.pack(fill=tk.BOTH, expand=True)
 
-                # 同步滚动位置 - 使用原始的yview方法
-                if hasattr(self, '_original_code_text_yview'):
-                    yview_pos = self._original_code_text_yview()[0]
-                else:
-                    yview_pos = self.code_text.yview()[0]
+        # 工具栏
+        self._init_toolbar(main_frame)
 
-                self.line_number.yview_moveto(yview_pos)
-            finally:
-                self._updating_line_numbers = False
+        # 创建可调整大小的面板容器
+        self.main_paned = ttk.PanedWindow(main_frame, orient=tk.HORIZONTAL)
+        self.main_paned.pack(fill=tk.BOTH, expand=True)
 
-    def preview_code(self, event=None):
-        """预览选中文件的代码"""
-        # 统一获取选中项逻辑，无论是通过事件触发还是直接调用
-        item = self.tree.selection()[0] if self.tree.selection() else None
+        # 初始化左侧文件树和右侧面板
+        self._init_file_tree(self.main_paned)
+        self._init_right_panel(self.main_paned)
 
-        if not item:
-            return  # 提前返回避免空指针
+        # 状态栏
+        self._init_status_bar()
+        # 延迟设置分隔条位置，确保窗口已完全渲染
+        self.root.after(100, self._set_initial_pane_position)
 
+    def _set_initial_pane_position(self):
+        """设置PanedWindow的初始分隔条位置"""
         try:
-            # 获取完整路径并验证文件类型
-            file_path = Path(self.tree.item(item, 'values')[0])
-            if not file_path.is_file():
-                return
-
-            # 读取文件内容
-            with open(file_path, 'r', encoding='utf-8', errors='replace') as f:
-                content = f.read()
-
-            # 清空并更新代码显示
-            self.code_text.config(state='normal')
-            self.code_text.delete(1.0, tk.END)
-            self.code_text.insert(1.0, content)
+            # 确保窗口已经渲染
+            self.root.update_idletasks()
 
-            # 应用语法高亮 - 防止递归调用
-            if hasattr(self, '_highlighting_in_progress') and self._highlighting_in_progress:
-                return
+            # 获取窗口宽度
+            window_width = self.root.winfo_width()
 
-            self._highlighting_in_progress = True
-            try:
-                self._apply_syntax_highlighting(file_path.suffix)
-            finally:
-                self._highlighting_in_progress = False
+            # 如果窗口宽度有效，设置分隔条位置为窗口宽度的1/4
+            if window_width > 100:  # 确保窗口宽度有效
+                left_panel_width = int(window_width / 5)  # 左侧面板占1/4
+                self.main_paned.sashpos(0, left_panel_width)
+            else:
+                # 如果窗口宽度无效，使用固定宽度
+                self.main_paned.sashpos(0, 200)  # 默认左侧面板宽度为250像素
 
-            # 更新行号
-            self.update_line_numbers()
+            # 记录初始宽度，以便窗口调整时保持比例
+            self.initial_left_width = self.main_paned.sashpos(0)
 
-        except RecursionError:
-            self.log_error(f"预览代码失败: 递归深度超出限制")
-            messagebox.showerror("预览失败", "文件过大或结构过于复杂，无法完成预览")
         except Exception as e:
-            self.log_error(f"预览代码失败: {str(e)}")
-            messagebox.showerror("预览失败", f"无法读取文件: {str(e)}")
+            self.log_error(f"设置分隔条位置失败: {str(e)}")
+            # 出错时使用默认值
+            self.main_paned.sashpos(0, 200)
 
-    def _apply_syntax_highlighting(self, file_ext):
-        """应用语法高亮"""
-        # 清除现有标签
-        for tag in self.code_text.tag_names():
-            if tag != "sel":  # 保留选择标签
-                self.code_text.tag_remove(tag, "1.0", tk.END)
+    def export_vulnerabilities(self):
+        """将漏洞结果导出为Excel文档"""
+        if not self.result_tree.get_children():
+            messagebox.showwarning("导出失败", "没有可导出的漏洞信息")
+            return
 
-        # 获取代码内容
-        code = self.code_text.get("1.0", tk.END)
+        if Workbook is None:
+            messagebox.showerror("导出失败", "未安装openpyxl，请先执行 pip install openpyxl")
+            return
 
-        # 根据文件类型应用高亮
-        if file_ext in self.supported_langs:
-            self._highlight_code(code, file_ext)
+        try:
+            # 生成带时间戳的文件名
+            timestamp = time.strftime("%Y%m%d_%H%M%S")
+            default_filename = f"漏洞报告_{timestamp}.xlsx"
 
-        # 更新行号
-        self.update_line_numbers()
+            # 获取保存文件路径
+            filepath = filedialog.asksaveasfilename(
+                defaultextension=".xlsx",
+                filetypes=[("Excel文件", "*.xlsx")],
+                initialfile=default_filename
+            )
 
-        # 绑定滚动事件，确保行号与代码同步滚动
-        if not hasattr(self, '_scroll_binding_set'):
-            # 绑定各种可能触发滚动的事件
-            self.code_text.bind("<Configure>", self.update_line_numbers)
-            self.code_text.bind("<KeyPress>", self.update_line_numbers)
-            self.code_text.bind("<KeyRelease>", self.update_line_numbers)
-            self.code_text.bind("<MouseWheel>", self.update_line_numbers)
+            if not filepath:
+                return  # 用户取消了保存
 
-            # 保存原始的yview方法，避免递归调用
-            self._original_code_text_yview = self.code_text.yview
+            # 创建Excel工作簿
+            wb = Workbook()
+            ws = wb.active
+            if ws is None:  # 检查ws是否为None
+                ws = wb.create_sheet()
 
-            # 重写Text组件的yview方法以触发自定义事件
-            def custom_yview(*args):
-                # 调用原始方法获取结果
-                result = self._original_code_text_yview(*args)
+            # 设置工作表标题
+            if hasattr(ws, 'title'):
+                ws.title = "漏洞扫描报告"
 
-                # 避免递归调用
-                if not hasattr(self, '_updating_line_numbers') or not self._updating_line_numbers:
-                    self.update_line_numbers()
+            # 设置列宽 - 使用更合适的宽度单位，openpyxl中的宽度单位约为Excel中的0.14倍
+            column_widths = {
+                'A': 4,  # ID
+                'B': 12,  # 漏洞类型
+                'C': 12,  # 风险等级
+                'D': 50,  # 文件路径
+                'E': 60,  # 漏洞描述
+                'F': 40,  # 风险点
+                'G': 40,  # Payload
+                'H': 60,  # 修复建议
+                'I': 10,  # 行号
+            }
 
-                return result
+            # 强制设置列宽并确保应用
+            if hasattr(ws, 'column_dimensions'):
+                for col, width in column_widths.items():
+                    # 直接设置列宽，不检查列是否存在
+                    ws.column_dimensions[col].width = width
+                    # 设置自动换行以确保内容完整显示
+                    ws.column_dimensions[col].bestFit = True
 
-            self.code_text.yview = custom_yview
+            # 设置表头样式
+            header_font = Font(name='微软雅黑', bold=True, size=11)
+            header_fill = PatternFill(start_color="DDEBF7", end_color="DDEBF7", fill_type="solid")
+            header_alignment = Alignment(horizontal='center', vertical='center', wrap_text=True)
 
-            # 查找代码文本区域的滚动条
-            code_scrollbar = None
-            for child in self.code_text.master.winfo_children():
-                if isinstance(child, ttk.Scrollbar) and child.cget('orient') == 'vertical':
-                    code_scrollbar = child
-                    break
-
-            # 如果找到滚动条，绑定其set方法
-            if code_scrollbar:
-                # 不直接替换set方法，而是使用monkey patching技术
-                original_set = code_scrollbar.set
-
-                def custom_set_wrapper(first, last):
-                    # 调用原始set方法
-                    original_set(first, last)
+            # 设置边框样式
+            thin_border = Border(
+                left=Side(style='thin'),
+                right=Side(style='thin'),
+                top=Side(style='thin'),
+                bottom=Side(style='thin')
+            )
 
-                    # 避免递归调用
-                    if not hasattr(self, '_updating_line_numbers') or not self._updating_line_numbers:
-                        self.update_line_numbers()
-                    return None
+            # 添加表头
+            headers = ['ID', '漏洞类型', '风险等级', '文件路径', '漏洞描述', '风险点', 'Payload', '修复建议', '行号']
+            for col_num, header in enumerate(headers, 1):
+                if hasattr(ws, 'cell'):
+                    cell = ws.cell(row=1, column=col_num)
+                    if cell is not None:
+                        cell.value = header
+                        cell.font = header_font
+                        cell.fill = header_fill
+                        cell.alignment = header_alignment
+                        cell.border = thin_border
 
-                # 替换为包装后的方法
-                code_scrollbar.set = custom_set_wrapper
+            # 添加基本信息
+            if hasattr(ws, 'merge_cells'):
+                ws.merge_cells('A1:I1')
 
-            self._scroll_binding_set = True
+            if hasattr(ws, 'cell'):
+                title_cell = ws.cell(row=1, column=1)
+                if title_cell is not None:
+                    title_cell.value = "漏洞扫描报告"
+                    title_cell.font = Font(name='微软雅黑', bold=True, size=14)
+                    title_cell.alignment = Alignment(horizontal='center', vertical='center')
 
-    def _highlight_code(self, code, file_ext):
-        """执行语法高亮"""
-        # 公共语法元素（优化正则表达式和颜色配置）
-        number_pattern = r'\b\d+\.?\d*\b'
-        operator_pattern = r'(\+|\-|\*|\/|\%|\=|\&|\||\<|\>|!|\^|~|\?|:)'
-        bracket_pattern = r'[{}()\[\]]'
-        common_patterns = [
-            (number_pattern, 'number', '#6897BB'),  # 数字 - 蓝紫色
-            (operator_pattern, 'operator', '#A9B7C6'),  # 运算符 - 浅灰色
-            (bracket_pattern, 'bracket', '#A9B7C6')  # 括号 - 浅灰色
-        ]
-        # 初始化patterns并添加返回条件
-        patterns = []
+            # 添加报告信息
+            info_row = 2
+            count_cell = None
+            if hasattr(ws, 'merge_cells') and hasattr(ws, 'cell'):
+                ws.merge_cells(f'A{info_row}:I{info_row}')
+                cell = ws.cell(row=info_row, column=1)
+                if cell is not None:
+                    cell.value = f"生成时间: {time.strftime('%Y-%m-%d %H:%M:%S')}"
 
-        # 高亮公共元素
-        for pattern, tag, *args in common_patterns:
-            color = args[0] if args else None
-            if color:
-                self.code_text.tag_configure(tag, foreground=color)
-            for match in self._find_matches(pattern, code):
-                self.code_text.tag_add(tag, match[0], match[1])
+                info_row += 1
+                ws.merge_cells(f'A{info_row}:I{info_row}')
+                cell = ws.cell(row=info_row, column=1)
+                if cell is not None:
+                    cell.value = f"项目路径: {self.project_path}"
 
-        # HTML特定规则
-        if file_ext == '.html' or file_ext == '.htm':
-            patterns = [
-                (r'<\!DOCTYPE.*?>', 'html_doctype', '#800080'),  # DOCTYPE声明
-                (r'<\!--.*?-->', 'comment', '#999999'),  # 注释
-                (r'</?[a-zA-Z][a-zA-Z0-9]*(?:\s+[a-zA-Z][a-zA-Z0-9]*(?:=(?:"[^"]*"|\'[^\']*\'|[^\s>]*))?)*\s*/?>',
-                 'html_tag', '#0000FF'),  # 标签
-                # 修复属性名和属性值的正则表达式，移除不兼容的后向查找
-                (r'<[^>]*\s([a-zA-Z][a-zA-Z0-9\-]*)=', 'html_attribute', '#FF8C00', 1),  # 属性名
-                (r'=("[^"]*"|\'[^\']*\')', 'html_value', '#008000', 1),  # 属性值
-                (r'&[a-zA-Z0-9]+;', 'html_entity', '#800080'),  # HTML实体
-                (r'<script\b[^>]*>(.*?)</script>', 'html_script', '#A52A2A', re.DOTALL),  # script标签
-                (r'<style\b[^>]*>(.*?)</style>', 'html_style', '#2E8B57', re.DOTALL),  # style标签
-                (r'{{.*?}}|\{%.*?%\}', 'html_template', '#CC7832')  # 模板语法(如Angular, Vue等)
-            ]
+                info_row += 1
+                ws.merge_cells(f'A{info_row}:I{info_row}')
+                # 漏洞总数在写完数据行之后填入
+                count_cell = ws.cell(row=info_row, column=1)
 
-            # 添加HTML标签关键字高亮 - 修复标签名称的正则表达式
-            html_tags = [
-                'html', 'head', 'body', 'div', 'span', 'p', 'a', 'img', 'table', 'tr', 'td', 'th',
-                'ul', 'ol', 'li', 'form', 'input', 'button', 'select', 'option', 'textarea',
-                'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'header', 'footer', 'nav', 'section', 'article',
-                'aside', 'main', 'canvas', 'audio', 'video', 'source', 'iframe', 'script', 'style',
-                'link', 'meta', 'title', 'base', 'br', 'hr', 'pre', 'code', 'em', 'strong', 'i', 'b'
-            ]
-            # 使用捕获组替代后向查找
-            tag_pattern = r'</?(' + '|'.join(html_tags) + r')[\s>]'
-            patterns.append((tag_pattern, 'html_tag_name', '#0000CD', 1))
+            # 添加表头（在信息行之后）
+            header_row = info_row + 2
+            for col_num, header in enumerate(headers, 1):
+                if hasattr(ws, 'cell'):
+                    cell = ws.cell(row=header_row, column=col_num)
+                    if cell is not None:
+                        cell.value = header
+                        cell.font = header_font
+                        cell.fill = header_fill
+                        cell.alignment = header_alignment
+                        cell.border = thin_border
 
-        # XML特定规则
-        elif file_ext == '.xml':
-            patterns = [
-                (r'<\?xml.*?\?>', 'xml_declaration', '#007F7F'),  # XML声明
-                (r'<!--.*?-->', 'comment', '#999999'),  # 注释
-                (r'<[^>]+>', 'tag', '#CC6600'),  # 标签
-                (r'"[^"]*"', 'string', '#008000'),  # 属性值
-                (r'\bxmlns\b', 'keyword', '#CC7832'),  # 命名空间
-                (r'\bversion\b|\bencoding\b', 'attribute', '#9B59B6')  # 属性
-            ]
+            # 填充数据：从结果数据库逐行读取本次运行的漏洞
+            row_num = header_row + 1
+            for values in self._iter_export_rows():
+                # 确保values有足够的元素
+                values = list(values) + [''] * (9 - len(values))
 
-        # PHP特定规则（新增变量高亮）
-        elif file_ext == '.php':
-            # 扩展PHP高亮
-            patterns = [
-                (r'\$[a-zA-Z_\x7f-\xff][a-zA-Z0-9_\x7f-\xff]*', 'php_var', '#9B59B6'),  # 紫色变量
-                (r'\$_(GET|POST|REQUEST|COOKIE|SESSION|SERVER|ENV|FILES)', 'php_superglobal', '#CC0000'),  # 超全局变量
-                (r'(function)\s+([a-zA-Z_\x7f-\xff][a-zA-Z0-9_\x7f-\xff]*)', 'php_function', ('#006699', 2)),  # 函数声明
-                (r'(class|interface|trait)\s+(\w+)', 'php_class', ('#007F7F', 2)),  # 类名
-                (r'(namespace)\s+([a-zA-Z0-9_\\]+)', 'php_namespace', ('#808000', 2)),  # 命名空间
-                (r'(use)\s+([a-zA-Z0-9_\\]+)', 'php_namespace', ('#808000', 2)),  # use语句
-                (r'\b([A-Z][A-Z0-9_]*)\b', 'php_constant', '#660E7A'),  # 常量
-                (r'//.*?$|/\*.*?\*/', 'comment', '#999999'),  # 注释
-                (r'(".*?"|\'.*?\')', 'string', '#008000'),  # 字符串
-                (r'<\?php|\?>', 'php_tag', '#8B008B')  # PHP标签
-            ]
+                # 添加数据行
+                if hasattr(ws, 'cell'):
+                    # 设置行高为自动调整
+                    if hasattr(ws, 'row_dimensions'):
+                        ws.row_dimensions[row_num].height = None  # 设置为None让Excel自动调整行高
 
-            # 新增PHP关键字
-            php_keywords = [
-                'echo', 'print', 'die', 'exit', 'isset', 'empty',
-                'include', 'require', 'include_once', 'require_once',
-                'array', 'list', 'foreach', 'as', 'do', 'declare',
-                'if', 'else', 'elseif', 'switch', 'case', 'default',
-                'while', 'for', 'break', 'continue', 'return',
-                'global', 'static', 'final', 'abstract', 'private', 'protected',
-                'public', 'var', 'const', 'clone', 'try', 'catch', 'throw',
-                'finally', 'instanceof', 'insteadof', 'interface', 'implements',
-                'extends', 'trait', 'yield', 'yield from', 'fn', 'match'
-            ]
-            patterns.append((r'\b(' + '|'.join(php_keywords) + r')\b', 'php_keyword', '#CC7832'))
+                    for col_num, value in enumerate(values, 1):
+                        cell = ws.cell(row=row_num, column=col_num)
+                        if cell is not None:
+                            # 确保行号列正确显示
+                            if col_num == 1:
+                                # ID列保持原样
+                                cell.value = str(value) if value is not None else ""
+                            elif col_num == 9:
+                                # 行号列（第9列）
+                                line_numbers = values[8] if len(values) > 8 and values[8] else "N/A"
+                                cell.value = str(line_numbers)
+                            else:
+                                cell.value = str(value) if value is not None else ""
+                            # 优化单元格对齐方式和自动换行设置
+                            cell.alignment = Alignment(vertical='center', horizontal='left', wrap_text=True)
+                            cell.border = thin_border
 
-            # 新增PHP内置函数
-            php_builtin_functions = [
-                'array_merge', 'count', 'strlen', 'substr', 'str_replace',
-                'preg_match', 'preg_replace', 'explode', 'implode', 'trim',
-                'file_get_contents', 'file_put_contents', 'fopen', 'fclose',
-                'mysql_query', 'mysqli_query', 'PDO', 'json_encode', 'json_decode'
-            ]
-            patterns.append((r'\b(' + '|'.join(php_builtin_functions) + r')\b(?=\s*\()', 'php_function', '#006699'))
+                            # 根据风险等级设置颜色
+                            if col_num == 3:  # 风险等级列
+                                if value == "高危":
+                                    cell.fill = PatternFill(start_color="FFCCCC", end_color="FFCCCC", fill_type="solid")
+                                elif value == "中危":
+                                    cell.fill = PatternFill(start_color="FFFFCC", end_color="FFFFCC", fill_type="solid")
+                                elif value == "低危":
+                                    cell.fill = PatternFill(start_color="CCFFCC", end_color="CCFFCC", fill_type="solid")
 
-        # Java特定规则（增强高亮显示 - 使用更深的颜色）
-        elif file_ext == '.java':
-            patterns = [
-                # 基础元素
-                (r'@[a-zA-Z_$][a-zA-Z\d_$]*', 'java_annotation', '#FF8C00'),  # 注解 - 深橙色
-                (r'\b([A-Z_][A-Z0-9_]+)\b', 'java_constant', '#9370DB'),  # 常量 - 深紫色
-                (r'//.*?$|/\*.*?\*/', 'java_comment', '#5D6C79'),  # 注释 - 深灰色
-                (r'\".*?\"', 'java_string', '#008B45'),  # 字符串 - 深绿色
-                (r'\'.*?\'', 'java_char', '#008B45'),  # 字符 - 深绿色
+                row_num += 1
 
-                # 类型和声明
-                (r'(class|interface|enum|record)\s+(\w+)', 'java_class_decl', ('#1E6262', 2)),  # 类声明 - 深青色
-                (r'\b(void|int|byte|short|long|float|double|char|boolean)\b', 'java_primitive', '#0000CD'),
-                # 基本类型 - 深蓝色
-                (r'\b([A-Z][a-zA-Z0-9_]*)\b(?!\s*\()', 'java_class_ref', '#1E6262'),  # 类引用 - 深青色
+            if count_cell is not None:
+                count_cell.value = f"发现漏洞总数: {row_num - header_row - 1}"
 
-                # 方法和函数
-                (r'(public|private|protected|static)?\s+([a-zA-Z_$][a-zA-Z\d_$]*)\s*\(', 'java_method_decl',
-                 ('#E8A317', 2)),  # 方法声明 - 深橙色
-                (r'\b([a-zA-Z_$][a-zA-Z\d_$]*)\s*\(', 'java_method_call', '#4F4F4F'),  # 方法调用 - 深灰色
+            # 保存文件
+            wb.save(filepath)
+            messagebox.showinfo("导出成功", f"漏洞报告已保存到：\n{filepath}")
 
-                # 泛型
-                (r'<([A-Z][a-zA-Z0-9_]*(?:\s*,\s*[A-Z][a-zA-Z0-9_]*)*)>', 'java_generic', '#7B68EE'),  # 泛型 - 深紫色
-                (r'<\?\s+(?:extends|super)\s+[A-Z][a-zA-Z0-9_]*>', 'java_wildcard', '#7B68EE'),  # 通配符 - 深紫色
+        except Exception as e:
+            self.log_error(f"导出失败: {str(e)}")
+            messagebox.showerror("导出失败", f"导出过程中发生错误：\n{str(e)}")
 
-                # Lambda和函数式
-                (r'\([^()]*\)\s*->\s*[^;]+', 'java_lambda', '#D2691E'),  # Lambda表达式 - 深橙色
-                (r'::', 'java_method_ref', '#D2691E'),  # 方法引用 - 深橙色
+    def _iter_export_rows(self):
+        """按结果表格的列顺序逐行产出要导出的漏洞，结果数据库不可用时导出表格中的内容"""
+        if self.result_store is None:
+            for item in self.result_tree.get_children():
+                yield self.result_tree.item(item, 'values')
+            return
+        for row_id, (finding_id, file_path, vuln) in enumerate(
+                self.result_store.iter_findings(scan_ids=self.session_scan_ids), 1):
+            yield (row_id, vuln.get("漏洞类型", ""), vuln.get("风险等级", ""), file_path, vuln.get("详细描述", ""),
+                   vuln.get("风险点", ""), vuln.get("Payload", ""), vuln.get("修复建议", ""),
+                   ", ".join(map(str, vuln.get("行号") or [])))
 
-                # 异常处理
-                (r'\b(try|catch|throw|throws|finally)\b', 'java_exception', '#B22222'),  # 异常处理关键字 - 深红色
+    def auto_analyze(self, diff_base=None, resume=False):
+        """自动分析项目中所有文件
 
-                # 包和导入
-                (r'\b(import|package)\b.*?;', 'java_import', '#696969'),  # 导入语句 - 深灰色
+        Args:
+            diff_base: git基准版本，指定时只分析相对该版本变更的代码块
+            resume: 继续上次中断的扫描，跳过检查点日志中已完成的代码块
+        """
+        # 检查API密钥是否已配置
+        if not self.api_key:
+            messagebox.showwarning("警告", "API密钥未配置，请先在设置中配置API密钥")
+            return False
 
-                # 注释标签
-                (r'@(param|return|throws|author|version|since|see|deprecated)\b', 'java_doc_tag', '#2E8B57'),
-                # JavaDoc标签 - 深绿色
+        # 如果API尚未验证过，则进行验证
+        if not hasattr(self, 'api_validated') or not self.api_validated:
+            # 显示验证中的状态
+            self.status_bar.config(text="正在验证API密钥...")
+            self.root.config(cursor="wait")  # 更改鼠标指针为等待状态
 
-                # 修饰符
-                (
-                    r'\b(public|private|protected|static|final|abstract|synchronized|volatile|transient|native|strictfp)\b',
-                    'java_modifier', '#D2691E'),  # 修饰符 - 深橙色
+            # 直接验证API密钥，避免异步验证导致的卡顿
+            try:
+                # 由于_validate_api_key已简化，直接调用并获取结果
+                result = self._validate_api_key()
 
-                # 数字字面量
-                (r'\b(\d+\.?\d*[fFlL]?)\b', 'java_number', '#4169E1'),  # 数字 - 深蓝色
-                (r'\b(0x[0-9a-fA-F]+)\b', 'java_hex', '#4169E1'),  # 十六进制 - 深蓝色
+                # 恢复鼠标指针
+                self.root.config(cursor="")
 
-                # 特殊语法
-                (r'\?|:', 'java_ternary', '#D2691E'),  # 三元运算符 - 深橙色
-                (r'\b(instanceof)\b', 'java_instanceof', '#D2691E'),  # instanceof - 深橙色
-                (r'\b(new)\b', 'java_new', '#D2691E'),  # new关键字 - 深橙色
-            ]
-
-            # Java关键字
-            java_keywords = [
-                'if', 'else', 'switch', 'case', 'default', 'for', 'do', 'while', 'break', 'continue',
-                'return', 'this', 'super', 'extends', 'implements', 'null', 'true', 'false',
-                'assert', 'enum', 'var', 'yield', 'sealed', 'permits', 'non-sealed', 'record'
-            ]
-            patterns.append((r'\b(' + '|'.join(java_keywords) + r')\b', 'java_keyword', '#D2691E'))  # 关键字 - 深橙色
-
-            # Java注解关键字
-            java_annotations = [
-                'Override', 'Deprecated', 'SuppressWarnings', 'FunctionalInterface',
-                'SafeVarargs', 'Target', 'Retention', 'Documented', 'Inherited'
-            ]
-            patterns.append(
-                (r'@(' + '|'.join(java_annotations) + r')\b', 'java_std_annotation', '#DAA520'))  # 标准注解 - 深黄色
+                if result:
+                    self.api_validated = True
+                    self.status_bar.config(text="API密钥验证成功，开始分析...")
+                    # 继续执行自动分析流程
+                else:
+                    messagebox.showerror("API验证失败", "API密钥验证失败，请检查API密钥是否正确。")
+                    self.status_bar.config(text="API验证失败")
+                    self.btn_auto_analyze.config(text="自动分析")
+                    self.btn_analyze.config(state=tk.NORMAL)
+                    self.api_validated = False
+                    return False
+            except Exception as e:
+                # 处理验证过程中的异常
+                self.root.config(cursor="")
+                self.status_bar.config(text="API验证出错")
+                messagebox.showerror("API验证错误", f"验证过程中发生错误：{str(e)}")
+                self.btn_auto_analyze.config(text="自动分析")
+                self.btn_analyze.config(state=tk.NORMAL)
+                return False
 
-        # 应用语言特定规则
-        for pattern, tag, *args in patterns:
-            # 提取颜色和分组参数
-            color = None
-            group = 0
-            flags = 0
+        # 初始化状态
+        self._reset_analysis_state()
+        self.auto_analysis_cancelled = False
+        self.auto_analysis_paused = False
+        self.api_validation_error_shown = False  # 移除validation_lock的使用
 
-            if args:
-                if isinstance(args[0], tuple):  # 处理带分组的颜色配置
-                    color = args[0][0]
-                    group = args[0][1] if len(args[0]) > 1 else 0
-                elif isinstance(args[0], int) and args[0] < 100:  # 处理捕获组索引
-                    group = args[0]
-                elif isinstance(args[0], int):  # 处理正则标志
-                    flags = args[0]
-                else:  # 普通颜色配置
-                    color = args[0]
+        # 更新按钮状态并立即刷新UI
+        self.btn_auto_analyze.config(text="取消分析")
+        self.btn_analyze.config(state=tk.DISABLED)
+        # self.btn_pause_resume.config(state=tk.NORMAL)
 
-                if len(args) > 1 and isinstance(args[1], int):
-                    if args[1] < 100:  # 假设捕获组索引小于100
-                        group = args[1]
-                    else:  # 正则标志
-                        flags = args[1]
+        # 强制更新UI，确保按钮文本立即显示
+        self.root.update_idletasks()
 
+        diff_scope = None
+        if diff_base:
+            # 差异模式：只分析相对基准版本新增或修改的文件
             try:
-                for match in self._find_matches(pattern, code, flags):
-                    try:
-                        if len(match) > 2 and group > 0:  # 使用捕获组
-                            # 获取原始匹配文本的位置
-                            full_start_pos = match[0]
-                            full_end_pos = match[1]
+                diff_scope = GitDiffScope.collect(self.project_path, diff_base)
+            except Exception as e:
+                self.log_error(f"读取git差异失败: {str(e)}")
+                messagebox.showerror("差异分析失败", f"读取git差异失败：{str(e)}")
+                self._reset_analysis_state()
+                return False
+            all_files = [file_path for file_path in diff_scope.files() if file_path.suffix in self.supported_langs]
+            self.log_info(f"差异分析: 相对 {diff_base} 共 {len(all_files)} 个变更文件")
+        else:
+            # 在分析线程中边遍历项目目录边分析，不必等整个目录遍历完成
+            all_files = iter_source_files(self.project_path, self.supported_langs)
 
-                            # 计算捕获组在原始文本中的相对位置
-                            full_start_idx = int(full_start_pos.split('+')[1].split('c')[0])
+        # 初始化进度条，总数随分块结果逐步增加
+        self.progress['value'] = 0
+        self.status_bar.config(text="开始自动分析")
 
-                            # 在原始文本中查找捕获组
-                            match_text = code[full_start_idx - 1:full_start_idx - 1 + (
-                                    int(full_end_pos.split('+')[1].split('c')[0]) - full_start_idx)]
+        # 创建后台线程
+        self.auto_analysis_cancelled = False  # 修正初始化状态
+        self.auto_analysis_thread = threading.Thread(
+            target=self._auto_analysis_worker,
+            args=(all_files, diff_scope, resume),
+            daemon=True
+        )
+        self.auto_analysis_thread.start()
+        self.root.after(100, self._handle_events)
+        return True
 
-                            # 使用正则表达式重新匹配以获取捕获组
-                            m = re.search(pattern, match_text, flags=flags | re.MULTILINE)
-                            if m and m.group(group):
-                                # 计算捕获组的位置
-                                group_start = m.start(group) - m.start(0)
-                                group_length = len(m.group(group))
+    def _auto_analysis_worker(self, file_list, diff_scope=None, resume=False):
+        """自动分析的后台线程
 
-                                # 计算最终位置
-                                start = f"1.0 + {full_start_idx + group_start - 1}c"
-                                end = f"1.0 + {full_start_idx + group_start + group_length - 1}c"
+        Args:
+            diff_scope: GitDiffScope，指定时只分析与变更行重叠的代码块
+            resume: 继续上次中断的扫描
+        """
+        try:
+            # 在实际分析前验证API密钥有效性
+            if not hasattr(self, 'api_validated') or not self.api_validated:
+                # 显示验证中的状态
+                self.root.after(0, lambda: self.status_bar.config(text="正在验证API密钥..."))
+                self.root.after(0, lambda: self.root.config(cursor="wait"))  # 更改鼠标指针为等待状态
 
-                                if color:
-                                    self.code_text.tag_configure(tag, foreground=color)
-                                self.code_text.tag_add(tag, start, end)
-                        else:
-                            # 处理普通匹配
-                            start = match[0]
-                            end = match[1]
+                try:
+                    # 直接验证API密钥，避免异步验证和循环等待
+                    result = self._validate_api_key(force_validation=True)
 
-                            if color:
-                                self.code_text.tag_configure(tag, foreground=color)
-                            self.code_text.tag_add(tag, start, end)
-                    except Exception as e:
-                        print(f"应用标签错误: {tag} - {str(e)}")
-            except Exception as e:
-                print(f"处理正则表达式错误: {pattern} - {str(e)}")
+                    # 恢复鼠标指针
+                    self.root.after(0, lambda: self.root.config(cursor=""))
 
-    def _find_matches(self, pattern, text, group=0):
-        """查找所有匹配项，返回位置列表"""
-        try:
-            # 添加最大迭代次数限制，防止无限递归
-            max_iterations = 10000
-            iteration_count = 0
+                    if not result:
+                        # 验证失败，无法继续分析
+                        self.root.after(0, lambda: self.status_bar.config(text="API密钥无效，无法进行分析"))
+                        self.root.after(0, lambda: messagebox.showerror("API验证失败",
+                                                                        "API密钥验证失败，请检查API密钥是否正确。"))
+                        self.root.after(0, lambda: self.btn_auto_analyze.config(text="自动分析"))
+                        self.root.after(0, lambda: self.btn_analyze.config(state=tk.NORMAL))
+                        return
+                except Exception as e:
+                    # 处理验证过程中的异常
+                    self.root.after(0, lambda: self.root.config(cursor=""))
+                    self.root.after(0, lambda: self.status_bar.config(text="API验证出错"))
+                    self.root.after(0, lambda: messagebox.showerror("API验证错误", f"验证过程中发生错误：{str(e)}"))
+                    self.root.after(0, lambda: self.btn_auto_analyze.config(text="自动分析"))
+                    self.root.after(0, lambda: self.btn_analyze.config(state=tk.NORMAL))
+                    return
 
-            matches = []
-            start = "1.0"
+            self.run_scan(file_list, diff_scope, resume=resume)
 
-            while True:
-                iteration_count += 1
-                if iteration_count > max_iterations:
-                    # 达到最大迭代次数，中断处理
-                    self.log_error(f"语法高亮处理中断: 达到最大迭代次数 {max_iterations}")
-                    break
+        finally:
+            # 使用root.after确保在主线程中安排事件处理
+            if self.api_validation_error_shown:
+                # 使用lambda避免直接调用方法，确保在UI线程中执行
+                self.root.after(0, lambda: self.event_queue.put(('done', None, None)))
+            else:
+                # 非API验证失败情况下，正常发送done事件
+                self.root.after(0, lambda: self.event_queue.put(('done', None, None)))
 
-                pos = self.code_text.search(pattern, start, tk.END, regexp=True)
-                if not pos:
-                    break
+            # 直接在UI线程中重新启用按钮，确保按钮状态正确恢复
+            self.root.after(0, lambda: self.btn_auto_analyze.config(text="自动分析", state=tk.NORMAL))
+            self.root.after(0, lambda: self.btn_analyze.config(text="开始分析", state=tk.NORMAL))
 
-                line, col = map(int, pos.split('.'))
-                end_line, end_col = line, col
+            self._reset_analysis_state()
 
-                # 计算匹配文本的结束位置
-                match_text = self.code_text.get(pos, f"{pos} lineend")
-                match = re.search(pattern, match_text)
-                if not match:
-                    # 如果没有匹配到，移动到下一行继续
-                    start = f"{line + 1}.0"
-                    continue
+    def _init_file_tree(self, parent):
+        """初始化文件树组件（支持拖动调整宽度）"""
+        # 创建左侧面板
+        self.left_panel = ttk.Frame(parent)
+        parent.add(self.left_panel, weight=1)  # 添加到PanedWindow，weight=1表示拖动时会调整大小
 
-                # 计算匹配文本的结束位置
-                match_length = match.end(group) - match.start(group)
-                end_pos = f"{line}.{col + match_length}"
+        # 创建滚动容器
+        container = ttk.Frame(self.left_panel)
+        container.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
 
-                # 添加匹配结果
-                matches.append((f"{line}.{col + match.start(group)}", f"{line}.{col + match.end(group)}"))
+        # 树状视图 - 移除垂直滚动条
+        self.tree = ttk.Treeview(
+            container,
+            selectmode='browse',
+            show='tree',
+            height=20
+        )
+        self.tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
 
-                # 更新下一次搜索的起始位置
-                start = end_pos
+        # 动态列宽配置
+        self.tree.column("#0", minwidth=200, stretch=tk.YES)
 
-            return matches
-        except RecursionError:
-            self.log_error("语法高亮递归错误")
-            return []
-        except Exception as e:
-            self.log_error(f"查找匹配项错误: {str(e)}")
-            return []
+        # 绑定目录展开事件
+        self.tree.bind("<<TreeviewOpen>>", self._handle_tree_resize)
+        self.tree.bind("<<TreeviewClose>>", self._handle_tree_resize)
+        self.tree.bind("<Configure>", self._handle_tree_resize)
 
-    def _populate_tree(self, path, parent=''):
-        """递归填充文件树"""
+    def _handle_tree_resize(self, event=None):
+        """处理树状视图尺寸变化"""
         try:
-            # 获取排序后的目录和文件列表（保持排序逻辑）
-            dirs = sorted([d for d in path.iterdir()
-                           if d.is_dir() and not d.name.startswith('.')],
-                          key=lambda x: x.name.lower())
-
-            files = sorted([f for f in path.iterdir()
-                            if f.is_file() and not f.name.startswith('.')],
-                           key=lambda x: x.name.lower())
+            tree_width = self.tree.winfo_width()
+            if tree_width < 150:
+                tree_width = 150
+            self.tree.column('#0', width=int(tree_width * 0.95))
+        except Exception as e:
+            self.log_error(f"树大小调整错误: {str(e)}")
 
-            # 先处理目录再处理文件（保持目录优先）
-            for item in dirs:
-                node = self.tree.insert(parent, 'end',
-                                        text=item.name,
-                                        values=[str(item)],
-                                        open=False)
-                # 添加一个临时子节点，表示该目录可以展开
-                self.tree.insert(node, 'end', text="加载中...", values=["loading"])
+    def _on_tree_open(self, event):
+        """处理树节点展开事件"""
+        item = self.tree.focus()
+        if item:
+            self.tree.item(item, open=True)
 
-                # 绑定展开事件，只有当用户展开目录时才加载子目录内容
-                if not hasattr(self, '_tree_expand_handler_set'):
-                    self.tree.bind('<<TreeviewOpen>>', self._on_tree_expand)
-                    self._tree_expand_handler_set = True
+    def _on_tree_close(self, event):
+        """处理树节点关闭事件"""
+        item = self.tree.focus()
+        if item:
+            self.tree.item(item, open=False)
 
-            # 处理文件
-            for item in files:
-                self.tree.insert(parent, 'end',
-                                 text=item.name,
-                                 values=[str(item)])
-        except Exception as e:
-            messagebox.showerror("目录错误", f"读取失败: {str(e)}")
+    def _init_toolbar(self, parent):
+        """初始化工具栏"""
+        self.toolbar = ttk.Frame(parent)
+        self.toolbar.pack(side=tk.TOP, fill=tk.X, padx=5, pady=5)
 
-    def _on_tree_expand(self, event):
-        """当树节点展开时异步加载子节点"""
-        item_id = self.tree.focus()
+        self.btn_api_settings = ttk.Button(self.toolbar, text="API设置", command=self.open_api_settings)
+        self.btn_api_settings.pack(side=tk.LEFT, padx=5)
 
-        # 检查是否已经加载过
-        children = self.tree.get_children(item_id)
-        if len(children) == 1 and self.tree.item(children[0], "values")[0] == "loading":
-            # 删除加载中的临时节点
-            self.tree.delete(children[0])
+        ttk.Button(self.toolbar, text="打开项目", command=self.open_project).pack(side=tk.LEFT, padx=5)
 
-            # 获取目录路径
-            item_path = Path(self.tree.item(item_id, "values")[0])
+        # 模型选择下拉框
+        self.model_var = tk.StringVar(value="deepseek-chat")
+        self.model_combobox = ttk.Combobox(self.toolbar, textvariable=self.model_var,
+                                           values=["deepseek-chat", "deepseek-reasoner"],
+                                           state="readonly", width=15)
+        self.model_combobox.pack(side=tk.LEFT, padx=5)
 
-            # 使用after方法在主线程空闲时异步加载
-            self.root.after(10, lambda: self._async_load_directory(item_path, item_id))
+        # 级联模式：先用初筛模型快速筛选，只有可疑代码块才交给所选模型确认
+        self.cascade_var = tk.BooleanVar(value=self.cascade_mode)
+        ttk.Checkbutton(self.toolbar, text=f"级联({self.screen_model}初筛)",
+                        variable=self.cascade_var).pack(side=tk.LEFT, padx=2)
 
-    def _async_load_directory(self, path, parent):
-        """异步加载目录内容"""
-        try:
-            # 显示加载状态
-            self.status_bar.config(text=f"正在加载: {path.name}")
+        self.btn_analyze = ttk.Button(self.toolbar, text="开始分析", command=self.toggle_analysis)
+        self.btn_analyze.pack(side=tk.LEFT, padx=5)
 
-            # 获取排序后的目录和文件列表
-            dirs = sorted([d for d in path.iterdir()
-                           if d.is_dir() and not d.name.startswith('.')],
-                          key=lambda x: x.name.lower())
+        # 自动分析按钮
+        self.btn_auto_analyze = ttk.Button(self.toolbar, text="自动分析", command=self.toggle_auto_analysis)
+        self.btn_auto_analyze.pack(side=tk.LEFT, padx=2)
 
-            files = sorted([f for f in path.iterdir()
-                            if f.is_file() and not f.name.startswith('.')],
-                           key=lambda x: x.name.lower())
+        # 差异分析按钮
+        self.btn_diff_analyze = ttk.Button(self.toolbar, text="差异分析", command=self.start_diff_analysis)
+        self.btn_diff_analyze.pack(side=tk.LEFT, padx=2)
 
-            # 先处理目录再处理文件
-            for item in dirs:
-                node = self.tree.insert(parent, 'end',
-                                        text=item.name,
-                                        values=[str(item)],
-                                        open=False)
-                # 添加临时子节点
-                self.tree.insert(node, 'end', text="加载中...", values=["loading"])
+        # 继续扫描按钮：跳过上次中断的扫描中已完成的代码块
+        self.btn_resume_analyze = ttk.Button(self.toolbar, text="继续扫描", command=self.resume_analysis)
+        self.btn_resume_analyze.pack(side=tk.LEFT, padx=2)
 
-            # 处理文件
-            for item in files:
-                self.tree.insert(parent, 'end',
-                                 text=item.name,
-                                 values=[str(item)])
+        # 导出漏洞按钮
+        self.btn_export = ttk.Button(self.toolbar, text="导出漏洞", command=self.export_vulnerabilities)
+        self.btn_export.pack(side=tk.LEFT, padx=2)
 
-            # 恢复状态栏
-            self.status_bar.config(text="就绪")
-        except Exception as e:
-            self.log_error(f"异步加载目录失败: {str(e)}")
-            messagebox.showerror("目录错误", f"读取失败: {str(e)}")
+    def toggle_analysis(self):
+        """切换开始/取消分析状态"""
+        if self.btn_analyze.cget("text") == "开始分析":
+            # 获取选中的文件列表，检查是否有选中文件
+            file_list = self._get_selected_files()
+            if not file_list:
+                messagebox.showinfo("提示", "请先选择要分析的文件")
+                return
 
-    def _get_selected_files(self):
-        """获取选中的文件列表"""
-        selected_items = self.tree.selection()
-        return [
-            Path(self.tree.item(item, 'values')[0])
-            for item in selected_items
-            if Path(self.tree.item(item, 'values')[0]).is_file()
-        ]
+            # 切换到分析状态
+            self.btn_analyze.config(text="取消分析")
+            self.btn_auto_analyze.config(state=tk.DISABLED)
+            # 调用start_analysis并检查其返回值
+            result = self.start_analysis()
+            # 如果start_analysis返回False（例如API密钥未配置），恢复按钮状态
+            if result is False:
+                self.btn_analyze.config(text="开始分析")
+                self.btn_auto_analyze.config(state=tk.NORMAL)
+        else:
+            # 取消分析
+            self.cancel_analysis()
+            # 确保自动分析按钮被重新启用
+            self.btn_auto_analyze.config(state=tk.NORMAL)
 
-    def parse_response(self, api_response, code_lines):
-        """解析含Markdown代码块的响应（最终修正版）"""
+    def toggle_auto_analysis(self):
+        """切换自动分析状态"""
         try:
-            # 1. 解析外层API响应
-            response_data = json.loads(api_response)
-
-            # 检查响应是否完整
-            if response_data["choices"][0]["finish_reason"] == "length":
-                raise ValueError("API响应被截断，请尝试减少代码量或增加max_tokens参数")
-
-            content = response_data["choices"][0]["message"]["content"]
-
-            # 2. 提取Markdown代码块
-            json_str = content
-            if "```json" in content:
-                start = content.find("```json") + len("```json")
-                end = content.rfind("```")
-                json_str = content[start:end].strip()
-
-            # 3. 解析漏洞数据
-            vulnerabilities = json.loads(json_str)
-            if not isinstance(vulnerabilities, list):
-                vulnerabilities = [vulnerabilities]
-
-            results = []
-            for vuln in vulnerabilities:
-                # 4. 处理键名前可能存在的空格
-                vuln = {k.strip(): v for k, v in vuln.items()}
-
-                # 5. 校验必填字段
-                required_fields = ["文件路径", "行号", "风险等级", "漏洞类型", "详细描述"]
-                for field in required_fields:
-                    if field not in vuln:
-                        raise ValueError(f"缺少必填字段: {field}")
-
-                # 6. 处理行号字段类型
-                raw_lines = vuln["行号"]
-                if isinstance(raw_lines, int):
-                    line_numbers = [raw_lines]
-                elif isinstance(raw_lines, list):
-                    line_numbers = raw_lines
-                else:
-                    line_numbers = []
-
-                # 7. 构建漏洞数据
-                vuln_data = {
-                    "文件路径": vuln["文件路径"].strip(),
-                    "行号": line_numbers,
-                    "风险等级": vuln["风险等级"].strip(),
-                    "漏洞类型": vuln["漏洞类型"].strip(),
-                    "风险点": vuln.get("风险点", "").strip(),
-                    "Payload": vuln.get("Payload", "").strip(),
-                    "详细描述": vuln["详细描述"].strip(),
-                    "修复建议": vuln.get("修复建议", "").strip()
-                }
+            if self.btn_auto_analyze.cget("text") == "自动分析":
+                # 开始新的分析
+                self.api_validation_error_shown = False  # 重置API错误标志
+                self.btn_auto_analyze.config(text="取消分析")
+                self.auto_analyze()
+            else:
+                # 取消当前分析
+                self.auto_analysis_cancelled = True
+                # 立即恢复按钮状态，不等待事件处理
+                self.btn_auto_analyze.config(text="自动分析", state=tk.NORMAL)
+                self.btn_analyze.config(text="开始分析", state=tk.NORMAL)
+        except Exception as e:
+            self.log_error(f"切换分析状态失败: {str(e)}")
+            self.btn_auto_analyze.config(text="自动分析")  # 确保恢复按钮状态
 
-                # 验证行号是否有效
-                valid_line_numbers = []
-                for line in vuln_data["行号"]:
-                    if 0 < line <= len(code_lines):
-                        valid_line_numbers.append(line)
-                    else:
-                        self.log_error(f"无效行号: {line}（文件总行数: {len(code_lines)})")
+    def start_diff_analysis(self):
+        """输入git基准版本，只分析相对该版本变更的代码"""
+        if self.btn_auto_analyze.cget("text") != "自动分析" or self.btn_analyze.cget("text") != "开始分析":
+            messagebox.showinfo("提示", "请先等待当前分析完成或取消分析")
+            return
 
-                vuln_data["行号"] = valid_line_numbers
+        base_ref = simpledialog.askstring(
+            "差异分析", "请输入基准版本（分支、标签或提交）：",
+            initialvalue=self.config.get('DEFAULT', 'DIFF_BASE_REF', fallback='HEAD'),
+            parent=self.root
+        )
+        if not base_ref or not base_ref.strip():
+            return
 
-                # 过滤漏洞类型为"无"的结果
-                if vuln_data["漏洞类型"].lower() != "无":
-                    results.append(vuln_data)
+        self.api_validation_error_shown = False
+        self.btn_auto_analyze.config(text="取消分析")
+        if self.auto_analyze(diff_base=base_ref.strip()) is False:
+            self.btn_auto_analyze.config(text="自动分析", state=tk.NORMAL)
 
-            return results
-        except Exception as e:
-            error_msg = f"响应解析失败: {str(e)}\n原始响应内容:\n{api_response}"
-            self.log_error(error_msg)
-            return []
+    def resume_analysis(self):
+        """继续上次被取消或中断的自动分析"""
+        if self.btn_auto_analyze.cget("text") != "自动分析" or self.btn_analyze.cget("text") != "开始分析":
+            messagebox.showinfo("提示", "请先等待当前分析完成或取消分析")
+            return
 
-    def display_results(self, file_path, vulnerabilities):
-        """显示结果入口方法"""
-        self.root.after(0, self._safe_display_results, file_path, vulnerabilities)
+        self.api_validation_error_shown = False
+        self.btn_auto_analyze.config(text="取消分析")
+        if self.auto_analyze(resume=True) is False:
+            self.btn_auto_analyze.config(text="自动分析", state=tk.NORMAL)
 
-    def analyze_file(self, file_path):
-        """分析单个文件"""
-        start_time = time.time()
-        self.log_info(f"开始分析文件: {file_path.name}, 后缀: {file_path.suffix}")
+    def cancel_analysis(self):
+        """取消分析操作"""
+        # 先设置取消标志
+        self.auto_analysis_cancelled = True
+        self.status_bar.config(text="正在取消分析...")
 
-        try:
-            # 检查是否已取消分析
-            if hasattr(self, 'auto_analysis_cancelled') and self.auto_analysis_cancelled:
-                self.log_info(f"分析已取消，跳过文件: {file_path.name}")
-                return
+        # 立即恢复按钮状态，不等待事件处理
+        self.btn_analyze.config(text="开始分析", state=tk.NORMAL)
+        self.btn_auto_analyze.config(text="自动分析", state=tk.NORMAL)
 
-            # 检查文件是否存在
-            if not file_path.exists():
-                self.log_error(f"文件不存在: {file_path}")
-                self.event_queue.put(('progress', 1, None))
-                return
+        # 手动添加done事件，确保分析状态被正确重置
+        self.root.after(0, lambda: self.event_queue.put(('done', None, None)))
 
-            # 打印调试信息
-            print(f"[DEBUG] 开始分析文件: {file_path.name}, 后缀: {file_path.suffix}")
+    def retry_api_validation(self):
+        """重试API验证"""
+        # 重置验证状态
+        self.api_validated = False
+        self.api_validation_error_shown = False
 
-            # 特殊处理pom.xml文件
-            if file_path.name.lower() == 'pom.xml' or file_path.suffix.lower() in ['.xml', '.pom']:
-                print(f"[DEBUG] 检测到XML/POM文件: {file_path.name}，强制使用智能分块")
-                self.log_info(f"检测到XML/POM文件: {file_path.name}，强制使用智能分块")
+        # 显示验证中的状态
+        self.status_bar.config(text="正在重新验证API密钥...")
+        self.root.config(cursor="wait")  # 更改鼠标指针为等待状态
 
-                # 读取文件内容
-                try:
-                    with open(file_path, 'r', encoding='utf-8', errors='ignore') as f:
-                        code = f.read()
-                        code_lines = code.splitlines()
+        # 启动异步验证
+        self._validate_api_key(force_validation=True)
 
-                    # 直接调用大文件分析方法，无需检查行数
-                    self.analyze_large_file(file_path, code_lines, code)
-                except Exception as e:
-                    self.log_error(f"读取XML文件失败: {str(e)}", file_path)
-                    self.event_queue.put(('progress', 1, None))
-                return
+        # 验证超时计时
+        validation_start_time = time.time()
 
-            # 读取文件内容
+        # 检查验证结果的函数
+        def check_validation():
             try:
-                with open(file_path, 'r', encoding='utf-8', errors='replace') as f:
-                    code_lines = f.readlines()  # 读取所有行
-                    code = ''.join(code_lines)  # 合并为完整代码
-            except UnicodeDecodeError:
-                # 尝试使用二进制模式读取，然后解码
-                try:
-                    with open(file_path, 'rb') as f:
-                        binary_data = f.read()
-                        code = binary_data.decode('utf-8', errors='replace')
-                        code_lines = code.splitlines(True)
-                    self.log_info(f"使用二进制模式成功读取文件: {file_path.name}")
-                except Exception as e:
-                    self.log_error(f"读取文件失败: {str(e)}", file_path)
-                    self.event_queue.put(('progress', 1, None))
-                    return
-            except Exception as e:
-                self.log_error(f"读取文件失败: {str(e)}", file_path)
-                self.event_queue.put(('progress', 1, None))
-                return
-
-            # 再次检查是否已取消分析
-            if hasattr(self, 'auto_analysis_cancelled') and self.auto_analysis_cancelled:
-                self.log_info(f"分析已取消，跳过文件: {file_path.name}")
-                return
+                # 尝试从事件队列获取验证结果
+                event_type, result, _ = self.event_queue.get_nowait()
 
-            # 根据文件大小和类型决定分析方法
-            if len(code_lines) > 1000 or file_path.suffix.lower() in ['.xml', '.pom', '.java', '.php']:
-                self.analyze_large_file(file_path, code_lines, code)
-            else:
-                self.analyze_small_file(file_path, code_lines, code)
-        except Exception as e:
-            self.log_error(f"分析文件时出错: {str(e)}", file_path)
-            self.event_queue.put(('progress', 1, None))
+                if event_type == 'api_validation':
+                    self.root.config(cursor="")
+                    if result:
+                        self.api_validated = True
+                        self.status_bar.config(text="API密钥验证成功，可以开始分析...")
+                        # 恢复按钮状态
+                        self.btn_auto_analyze.config(text="自动分析", state=tk.NORMAL)
+                        self.btn_analyze.config(state=tk.NORMAL)
+                    else:
+                        messagebox.showerror("API验证失败", "API密钥验证失败，请检查API密钥是否正确。")
+                        self.status_bar.config(text="API验证失败")
+                        self.api_validated = False
+                    return
+            except queue.Empty:
+                # 检查是否超时
+                current_time = time.time()
+                if current_time - validation_start_time > 15:  # 增加超时时间到15秒
+                    self.root.config(cursor="")
+                    self.status_bar.config(text="API连接超时，请检查网络")
+                    messagebox.showwarning("API验证超时", "API服务器响应超时，请检查网络连接。")
+                    # 恢复按钮状态
+                    self.btn_auto_analyze.config(text="自动分析", state=tk.NORMAL)
+                    self.btn_analyze.config(state=tk.NORMAL)
+                    return
 
-    def analyze_small_file(self, file_path, code_lines, code):
-        """直接处理小文件，不进行分块"""
-        try:
-            # 获取文件扩展名
-            file_ext = file_path.suffix.lower()
-
-            # 检查是否已取消分析
-            if hasattr(self, 'auto_analysis_cancelled') and self.auto_analysis_cancelled:
-                print(f"[DEBUG] 分析已取消，停止处理 {file_path.name}")
-                self.log_info(f"分析已取消，停止处理 {file_path.name}")
-                self.event_queue.put(('progress', 1, None))
-                return
+                # 继续等待验证结果
+                self.root.after(20, check_validation)  # 缩短检查间隔到20ms
 
-            # 记录开始分析
-            print(f"[DEBUG] 开始分析小文件: {file_path.name}")
-            self.log_info(f"开始分析小文件: {file_path.name}")
+        # 开始检查验证结果
+        self.root.after(20, check_validation)
 
-            # 更新状态栏
-            self.status_bar.config(text=f"正在分析: {file_path.name}")
+        # 重置进度条
+        if hasattr(self, 'progress_var'):
+            self.progress_var.set(0)
+        if hasattr(self, 'progress'):
+            self.progress['value'] = 0
 
-            # 对于Java文件，即使是小文件也进行分块处理
-            if file_ext == '.java':
-                print(f"[DEBUG] 检测到Java文件: {file_path.name}，使用智能分块")
-                self.log_info(f"检测到Java文件: {file_path.name}，使用智能分块")
-                self.analyze_large_file(file_path, code_lines, code)
-                return
+        # 更新漏洞列表视图，确保已扫描出的漏洞能显示在界面上
+        self.update_vulnerability_treeview()
 
-            # 添加文件信息和上下文提示
-            context_info = f"# 文件: {file_path.name}\n"
-            context_info += f"# 行数: {len(code_lines)}\n\n"
+    def _reset_analysis_state(self):
+        """重置分析状态"""
+        self.auto_analysis_paused = False
+        self.auto_analysis_cancelled = False
 
-            # 构建带上下文的代码
-            code_with_context = context_info + code
+        # 按钮状态只在需要时设置，避免和其他地方设置的冲突
+        if hasattr(self, 'btn_analyze') and self.btn_analyze.cget("text") != "开始分析":
+            self.btn_analyze.config(text="开始分析", state=tk.NORMAL)
+        if hasattr(self, 'btn_auto_analyze') and (self.btn_auto_analyze.cget("text") != "自动分析" or
+                                                  self.btn_auto_analyze.cget("state") != tk.NORMAL):
+            self.btn_auto_analyze.config(text="自动分析", state=tk.NORMAL)
 
-            # 调用API分析文件
-            response = self.call_deepseek_api(code_with_context, file_ext, file_path)
+    def _init_right_panel(self, parent):
+        """初始化右侧面板（修改为使用PanedWindow）"""
+        # 创建右侧面板
+        self.right_panel = ttk.Frame(parent)
+        parent.add(self.right_panel, weight=3)  # 添加到PanedWindow，weight=3表示右侧面板初始宽度是左侧的3倍
 
-            # 检查是否已取消分析
-            if hasattr(self, 'auto_analysis_cancelled') and self.auto_analysis_cancelled:
-                return
+        # 创建垂直方向的PanedWindow，用于上下调整各个面板
+        self.right_paned = ttk.PanedWindow(self.right_panel, orient=tk.VERTICAL)
+        self.right_paned.pack(fill=tk.BOTH, expand=True)
 
-            if response['status_code'] == 200:
-                # 解析结果
-                vulnerabilities = self.parse_response(response['text'], code_lines)
+        # 结果表格（放入垂直PanedWindow）
+        self.result_frame = ttk.Frame(self.right_paned)
+        self.right_paned.add(self.result_frame, weight=1)
+        self._init_result_tree(self.result_frame)
 
-                # 确保文件路径正确
-                for vuln in vulnerabilities:
-                    vuln["文件路径"] = str(file_path)
+        # 代码预览（放入垂直PanedWindow）
+        self.code_frame = ttk.Frame(self.right_paned)
+        self.right_paned.add(self.code_frame, weight=2)
+        self._init_code_preview(self.code_frame)
 
-                # 显示结果
-                if vulnerabilities:
-                    self.display_results(file_path, vulnerabilities)
-                    print(f"[DEBUG] {file_path.name} 分析完成，发现 {len(vulnerabilities)} 个漏洞")
-                    self.log_info(f"{file_path.name} 分析完成，发现 {len(vulnerabilities)} 个漏洞")
-                else:
-                    print(f"[DEBUG] {file_path.name} 分析完成，未发现漏洞")
-                    self.log_info(f"{file_path.name} 分析完成，未发现漏洞")
-            else:
-                self.log_error(f"分析失败: {response['text'][:200]}", file_path)
-
-            # 更新进度
-            self.event_queue.put(('progress', 1, None))
+        # 详细信息面板（放入垂直PanedWindow）
+        self.detail_frame = ttk.Frame(self.right_paned)
+        self.right_paned.add(self.detail_frame, weight=1)
+        self._init_detail_panel(self.detail_frame)
 
-        except Exception as e:
-            self.log_error(f"小文件分析失败: {str(e)}", file_path)
-            print(f"[ERROR] 小文件分析失败: {str(e)}")
-            self.event_queue.put(('progress', 1, None))
+        # 设置初始分隔位置
+        self.root.after(200, self._set_initial_right_pane_position)
 
-    def analyze_large_file(self, file_path, code_lines, full_code):
-        """智能分块处理大文件，根据代码结构进行分块"""
+    def _set_initial_right_pane_position(self):
+        """设置右侧垂直PanedWindow的初始分隔条位置"""
         try:
-            # 获取文件扩展名
-            file_ext = file_path.suffix.lower()
+            # 确保窗口已经渲染
+            self.root.update_idletasks()
 
-            # 特殊处理pom.xml文件
-            if file_path.name.lower() == 'pom.xml' and not file_ext:
-                file_ext = '.xml'  # 强制设置为.xml
+            # 获取窗口高度
+            window_height = self.right_panel.winfo_height()
 
-            print(f"[DEBUG] 验证文件扩展名: {file_ext}, 文件名: {file_path.name}")
+            if window_height > 100:
+                # 设置第一个分隔条位置（结果表格和代码预览之间）
+                self.right_paned.sashpos(0, int(window_height * 0.3))
 
-            # 检查是否已取消分析
-            if hasattr(self, 'auto_analysis_cancelled') and self.auto_analysis_cancelled:
-                print(f"[DEBUG] 分析已取消，停止处理 {file_path.name}")
-                self.log_info(f"分析已取消，停止处理 {file_path.name}")
-                self.event_queue.put(('progress', 1, None))
-                return
+                # 设置第二个分隔条位置（代码预览和详细信息之间）
+                self.right_paned.sashpos(1, int(window_height * 0.7))
+            else:
+                # 默认位置
+                self.right_paned.sashpos(0, 200)
+                self.right_paned.sashpos(1, 500)
+        except Exception as e:
+            self.log_error(f"设置右侧分隔条位置失败: {str(e)}")
 
-            # 记录分块开始
-            print(f"[DEBUG] 开始对 {file_path.name} 进行智能分块")
-            self.log_info(f"开始对 {file_path.name} 进行智能分块")
+    def _init_result_tree(self, parent=None):
+        """初始化结果表格（确保列顺序正确）"""
+        # 如果没有提供父容器，使用默认的right_panel
+        if parent is None:
+            parent = self.right_panel
 
-            # 根据文件类型进行智能分块
-            chunks = self._smart_code_chunking(full_code, file_ext)
-            total_chunks = len(chunks)
+        # 创建结果框架
+        result_frame = ttk.Frame(parent)
+        result_frame.pack(expand=True, fill=tk.BOTH)
 
-            # 记录实际分块数量，但不再修改进度条最大值
-            print(f"[DEBUG] {file_path.name} 被分为 {len(chunks)} 个代码块")
-            self.log_info(f"{file_path.name} 被分为 {len(chunks)} 个代码块")
+        # 先创建Treeview组件
+        self.result_tree = ttk.Treeview(
+            result_frame,
+            columns=('ID', '漏洞类型', '风险等级', '文件路径', '漏洞描述', '风险点', 'Payload', '修复建议'),
+            show='headings',
+            selectmode='extended'
+        )
 
-            # 更新状态栏
-            self.status_bar.config(text=f"正在智能分块分析: {file_path.name} ({len(chunks)}个代码块)")
+        # 配置列标题和宽度
+        columns_config = {
+            'ID': {'width': 25, 'anchor': 'center'},
+            '漏洞类型': {'width': 100, 'anchor': 'center'},
+            '风险等级': {'width': 100, 'anchor': 'center'},
+            '文件路径': {'width': 200, 'anchor': 'center'},
+            '漏洞描述': {'width': 200},
+            '风险点': {'width': 200},
+            'Payload': {'width': 150},
+            '修复建议': {'width': 150}
+        }
 
-            # 初始化结果列表
-            all_vulnerabilities = []
+        # 设置行高，增加行间距
+        style = ttk.Style()
+        style.configure("Treeview", rowheight=29)  # 增加默认行高
 
-            # 支持多线程处理的文件类型
-            multi_thread_exts = ['.xml', '.php', '.java', '.php']
+        # 为不同风险等级设置更明显的样式
+        if hasattr(self, 'severity_colors'):
+            for severity, color in self.severity_colors.items():
+                # 创建带有边框和更明显间距的标签样式
+                self.result_tree.tag_configure(severity, background=color, font=('微软雅黑', 10, 'bold'))
+        for col, config in columns_config.items():
+            self.result_tree.heading(col, text=col)
+            self.result_tree.column(col, width=config['width'], anchor=config.get('anchor', 'w'))
 
-            # 检查是否使用多线程处理
-            use_multi_thread = False
-            if file_ext.lower() in multi_thread_exts or file_path.name.lower() == 'pom.xml':
-                use_multi_thread = True
+        # 修改打包顺序，先打包树形视图，再打包滚动条
+        self.result_tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
 
-            # 使用多线程处理支持的文件类型
-            if use_multi_thread:
-                print(f"[DEBUG] 使用多线程处理{file_ext}文件: {file_path.name}")
-                self.log_info(f"使用多线程处理{file_ext}文件: {file_path.name}")
+        # 添加垂直滚动条
+        vsb = ttk.Scrollbar(result_frame, orient="vertical", command=self.result_tree.yview)
+        self.result_tree.configure(yscrollcommand=vsb.set)
+        vsb.pack(side=tk.RIGHT, fill=tk.Y)
 
-                # 使用多线程处理文件
-                self._process_chunks_with_threads(file_path, chunks, file_ext, all_vulnerabilities)
-                # 多线程处理完成后发送完成事件
-                if not (hasattr(self, 'auto_analysis_cancelled') and self.auto_analysis_cancelled):
-                    self.event_queue.put(('done', None, None))
-            else:
-                # 分块处理
-                for i, (chunk, line_start, line_end, chunk_type) in enumerate(chunks):
-                    # 检查是否已取消分析
-                    if hasattr(self, 'auto_analysis_cancelled') and self.auto_analysis_cancelled:
-                        print(f"[DEBUG] 分析已取消，停止处理 {file_path.name} 的剩余代码块")
-                        self.log_info(f"分析已取消，停止处理 {file_path.name} 的剩余代码块")
-                        break
+        # 创建右键菜单
+        self.result_menu = tk.Menu(self.root, tearoff=0)
+        self.result_menu.add_command(label="删除选中项", command=self.delete_selected_vulnerabilities)
 
-                    # 检查是否暂停
-                    if hasattr(self, 'auto_analysis_paused') and self.auto_analysis_paused:
-                        while self.auto_analysis_paused and not self.auto_analysis_cancelled:
-                            time.sleep(0.5)
-                        # 再次检查是否已取消
-                        if self.auto_analysis_cancelled:
-                            break
+        # 绑定右键菜单事件
+        self.result_tree.bind("<Button-3>", self.show_context_menu)
+        # 绑定Ctrl+A快捷键
+        self.result_tree.bind("<Control-a>", self.select_all_vulnerabilities)
 
-                    # 记录当前处理的块
-                    print(f"[DEBUG] 处理第 {i + 1}/{len(chunks)} 块: {chunk_type}, 行范围: {line_start}-{line_end}")
-                    self.log_info(f"处理第 {i + 1}/{len(chunks)} 块: {chunk_type}, 行范围: {line_start}-{line_end}")
+        # 最后添加事件绑定
+        self.result_tree.bind('<Double-1>', self.jump_to_file)
 
-                    # 添加文件信息和上下文提示
-                    context_info = f"# 文件: {file_path.name} (第{i + 1}/{len(chunks)}块)\n"
-                    context_info += f"# 代码块类型: {chunk_type}\n"
-                    context_info += f"# 行范围: {line_start}-{line_end}\n\n"
+    def show_context_menu(self, event):
+        """显示右键菜单"""
+        # 获取当前选中项
+        selected_items = self.result_tree.selection()
+        if selected_items:  # 只有在有选中项时才显示菜单
+            self.result_menu.post(event.x_root, event.y_root)
 
-                    # 构建带上下文的代码块
-                    chunk_with_context = context_info + chunk
+    def select_all_vulnerabilities(self, event):
+        """选中所有漏洞"""
+        self.result_tree.selection_set(self.result_tree.get_children())
+        return "break"  # 阻止默认的Ctrl+A行为
 
-                    # 调用API分析当前块
-                    response = self.call_deepseek_api(chunk_with_context, file_ext, file_path)
+    def delete_selected_vulnerabilities(self):
+        """删除选中的漏洞"""
+        selected_items = self.result_tree.selection()
+        if not selected_items:
+            return
 
-                    # 再次检查是否已取消分析
-                    if hasattr(self, 'auto_analysis_cancelled') and self.auto_analysis_cancelled:
-                        break
+        # 确认删除
+        if messagebox.askyesno("确认删除", "确定要删除选中的漏洞吗？"):
+            # 表格行的iid就是结果数据库中的漏洞ID，按主键删除
+            if self.result_store is not None:
+                self.result_store.delete_findings([int(item) for item in selected_items if item.isdigit()])
+            self.result_tree.delete(*selected_items)
 
-                    if response['status_code'] == 200:
-                        # 解析当前块的结果，并调整行号
-                        chunk_vulnerabilities = self.parse_response(response['text'], chunk.splitlines())
+            # 更新状态栏
+            self.status_bar.config(text=f"共发现 {len(self.result_tree.get_children())} 个漏洞")
 
-                        # 调整行号，使其与原始文件对应
-                        for vuln in chunk_vulnerabilities:
-                            adjusted_lines = []
-                            for line in vuln["行号"]:
-                                adjusted_line = line_start + line - 1  # 减1是因为chunk的行号从1开始
-                                adjusted_lines.append(adjusted_line)
-                            vuln["行号"] = adjusted_lines
-                            # 确保文件路径正确
-                            vuln["文件路径"] = str(file_path)
+    def load_full_config(self):
+        """后台加载完整配置"""
+        if self.config_path.exists():
+            self.config.read(self.config_path, encoding='utf-8')
+            self.api_key = self.config.get('DEFAULT', 'API_KEY', fallback='')
+            self.api_endpoint = self.config.get('DEFAULT', 'API_ENDPOINT')
 
-                            # 将单个漏洞添加到总列表
-                            all_vulnerabilities.append(vuln)
+    def delayed_init(self):
+        """延迟初始化非关键组件"""
+        if not self._validate_api_key():
+            pass
 
-                            # 使用display_results方法来显示单个漏洞
-                            self.display_results(file_path, [vuln])
+    def jump_to_file(self, event):
+        """双击结果跳转至对应文件（修复路径匹配问题）"""
+        item = self.result_tree.identify_row(event.y)
+        if not item:
+            return
 
-                        # 记录块分析结果
-                        print(f"[DEBUG] 第 {i + 1} 块分析完成，发现 {len(chunk_vulnerabilities)} 个漏洞")
-                        self.log_info(f"第 {i + 1} 块分析完成，发现 {len(chunk_vulnerabilities)} 个漏洞")
+        # 获取文件路径（第4列，索引为3）并转换为绝对路径
+        selected_path = Path(self.result_tree.item(item, 'values')[3]).resolve()
 
-                        # 更新进度
-                        self.event_queue.put(('progress', 1, None))
-                    else:
-                        self.log_error(f"块{i + 1}分析失败: {response['text'][:200]}", file_path)
-                        # 即使失败也更新进度
-                        self.event_queue.put(('progress', 1, None))
+        # 在文件树中查找对应路径（新增调试日志）
+        def search_tree(node):
+            for child in self.tree.get_children(node):
+                child_path = Path(self.tree.item(child, 'values')[0]).resolve()
 
-            # 检查是否已取消分析，只有未取消时才发送结果
-            if not (hasattr(self, 'auto_analysis_cancelled') and self.auto_analysis_cancelled) and all_vulnerabilities:
-                # 不再需要发送完整结果，因为已经逐个发送了
-                # self.event_queue.put(('result', (file_path, all_vulnerabilities), None))
-                print(f"[DEBUG] {file_path.name} 分析完成，共发现 {len(all_vulnerabilities)} 个漏洞")
-                self.log_info(f"{file_path.name} 分析完成，共发现 {len(all_vulnerabilities)} 个漏洞")
+                if child_path == selected_path:
+                    # 展开父节点并滚动到可视区域
+                    parent = self.tree.parent(child)
+                    self.tree.item(parent, open=True)
+                    self.tree.see(child)
+                    self.tree.selection_set(child)
+                    self.preview_code()  # 强制刷新预览
+                    return True
+                if search_tree(child):
+                    return True
+            return False
 
-        except Exception as e:
-            self.log_error(f"智能分块分析失败: {str(e)}", file_path)
-            print(f"[ERROR] 智能分块分析失败: {str(e)}")
-            self.event_queue.put(('progress', 1, None))
-            self.event_queue.put(('done', None, None))  # 确保异常时发送完成事件
-
-    def _handle_completed_future(self, future, futures, file_path):
-        """处理已完成的任务"""
-        # 查找对应的任务信息
-        for f, (i, chunk_info) in futures:
-            if f == future:
-                chunk, line_start, line_end, chunk_type = chunk_info
-                try:
-                    # 获取结果
-                    result = future.result()
-                    if result:
-                        if isinstance(result, dict) and 'status' in result:
-                            if result['status'] == 'success':
-                                print(f"[DEBUG] 线程处理完成第 {i + 1}/{len(futures)} 块")
-                            else:
-                                print(f"[DEBUG] 线程处理第 {i + 1}/{len(futures)} 块失败: {result['status']}")
-                                print(f"[DEBUG] 错误信息: {result.get('error', '未知错误')}")
-                        else:
-                            print(f"[DEBUG] 线程处理完成第 {i + 1}/{len(futures)} 块")
-                    else:
-                        print(f"[DEBUG] 线程处理第 {i + 1}/{len(futures)} 块失败或无结果")
-                except Exception as e:
-                    print(f"[ERROR] 线程处理第 {i + 1}/{len(futures)} 块异常: {str(e)}")
-                    self.log_error(f"线程处理第 {i + 1}/{len(futures)} 块异常: {str(e)}", file_path)
-                break
+        # 从根节点开始搜索（新增搜索失败提示）
+        if not search_tree(''):
+            messagebox.showinfo("路径未找到", f"未在项目中找到文件：{selected_path.name}")
 
-    def _process_chunks_with_threads(self, file_path, chunks, file_ext, all_vulnerabilities):
-        """使用多线程处理代码块"""
-        import concurrent.futures
-        from threading import Lock
-        import os
-        import time
-        import traceback
+    def _init_code_preview(self, parent=None):
+        """初始化代码预览区域"""
+        # 如果没有提供父容器，使用默认的right_panel
+        if parent is None:
+            parent = self.right_panel
 
-        # 记录开始时间
-        start_time = time.time()
-        self.log_info(f"开始多线程处理文件: {file_path.name}, 代码块数量: {len(chunks)}")
+        # 新增搜索工具栏
+        self.search_frame = ttk.Frame(parent)
+        self.search_frame.pack(side=tk.TOP, fill=tk.X, pady=2)
 
-        # 创建线程锁，用于保护共享资源
-        result_lock = Lock()
+        # 搜索输入框和按钮
+        self.search_var = tk.StringVar()
+        self.search_entry = ttk.Entry(self.search_frame, textvariable=self.search_var)
+        self.search_entry.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=5)
 
-        # 最大线程数 - 根据CPU核心数和块数量动态调整
-        max_workers = min(5, os.cpu_count() or 4, len(chunks))
+        ttk.Button(self.search_frame, text="搜索", command=self.search_in_code).pack(side=tk.LEFT, padx=5)
+        ttk.Button(self.search_frame, text="下一个", command=lambda: self.search_in_code(direction="next")).pack(
+            side=tk.LEFT, padx=5)
+        ttk.Button(self.search_frame, text="上一个", command=lambda: self.search_in_code(direction="prev")).pack(
+            side=tk.LEFT, padx=5)
 
-        print(f"[DEBUG] 启动多线程处理，最大线程数: {max_workers}")
-        self.log_info(f"启动多线程处理，最大线程数: {max_workers}")
+        # 代码显示区域
+        code_container = ttk.Frame(self.code_frame)
+        code_container.pack(fill=tk.BOTH, expand=True)
 
-        # 创建进度跟踪变量
-        processed_chunks = 0
-        successful_chunks = 0
-        failed_chunks = 0
+        # 行号显示
+        self.line_number = tk.Text(code_container, width=4, padx=3, takefocus=0, border=0,
+                                   background='#f0f0f0', state='disabled')
+        self.line_number.pack(side=tk.LEFT, fill=tk.Y)
 
-        # 定义处理单个块的函数
-        def process_chunk(chunk_info):
-            i, (chunk, line_start, line_end, chunk_type) = chunk_info
-            chunk_start_time = time.time()
+        # 代码文本区域
+        self.code_text = tk.Text(code_container, wrap=tk.NONE, state='normal')
+        self.code_text.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
 
-            try:
-                # 检查是否已取消分析
-                if hasattr(self, 'auto_analysis_cancelled') and self.auto_analysis_cancelled:
-                    self.log_info(f"分析已取消，跳过块 {i + 1}/{len(chunks)}")
-                    return None
+        # 垂直滚动条
+        code_vsb = ttk.Scrollbar(code_container, orient="vertical", command=self.code_text.yview)
 
-                # 检查是否暂停
-                if hasattr(self, 'auto_analysis_paused') and self.auto_analysis_paused:
-                    self.log_info(f"分析已暂停，块 {i + 1}/{len(chunks)} 等待继续")
-                    while self.auto_analysis_paused and not self.auto_analysis_cancelled:
-                        time.sleep(0.5)
-                    # 再次检查是否已取消
-                    if self.auto_analysis_cancelled:
-                        self.log_info(f"分析已取消，跳过块 {i + 1}/{len(chunks)}")
-                        return None
-                    self.log_info(f"分析继续，处理块 {i + 1}/{len(chunks)}")
-
-                # 记录当前处理的块
-                print(f"[DEBUG] 线程处理第 {i + 1}/{len(chunks)} 块: {chunk_type}, 行范围: {line_start}-{line_end}")
-                self.log_info(f"线程处理第 {i + 1}/{len(chunks)} 块: {chunk_type}, 行范围: {line_start}-{line_end}")
-
-                # 添加文件信息和上下文提示
-                context_info = f"# 文件: {file_path.name} (第{i + 1}/{len(chunks)}块)\n"
-                context_info += f"# 代码块类型: {chunk_type}\n"
-                context_info += f"# 行范围: {line_start}-{line_end}\n\n"
-
-                # 构建带上下文的代码块
-                chunk_with_context = context_info + chunk
-
-                # 调用API分析当前块
-                try:
-                    response = self.call_deepseek_api(chunk_with_context, file_ext, file_path)
-                except Exception as e:
-                    error_msg = f"API调用失败，块 {i + 1}/{len(chunks)}: {str(e)}"
-                    self.log_error(f"{error_msg}\n{traceback.format_exc()}", file_path)
-                    print(f"[DEBUG] 线程处理第 {i + 1}/{len(chunks)} 块API调用失败: {str(e)}")
-                    # 即使失败也更新进度
-                    self.event_queue.put(('progress', 1, None))
-                    return {'status': 'api_error', 'error': error_msg, 'chunk_index': i}
-
-                # 再次检查是否已取消分析
-                if hasattr(self, 'auto_analysis_cancelled') and self.auto_analysis_cancelled:
-                    self.log_info(f"分析已取消，跳过结果处理: 块 {i + 1}/{len(chunks)}")
-                    return None
+        # 自定义yscrollcommand函数，确保滚动条操作时同步更新行号
+        def custom_yscrollcommand(first, last):
+            code_vsb.set(first, last)
+            # 确保行号与代码同步滚动
+            if hasattr(self, 'line_number') and self.line_number:
+                self.line_number.yview_moveto(first)
+                self.update_line_numbers()
 
-                if response['status_code'] == 200:
-                    try:
-                        # 解析当前块的结果，并调整行号
-                        chunk_vulnerabilities = self.parse_response(response['text'], chunk.splitlines())
-
-                        # 调整行号，使其与原始文件对应
-                        for vuln in chunk_vulnerabilities:
-                            adjusted_lines = []
-                            for line in vuln["行号"]:
-                                adjusted_line = line_start + line - 1  # 减1是因为chunk的行号从1开始
-                                adjusted_lines.append(adjusted_line)
-                            vuln["行号"] = adjusted_lines
-                            # 确保文件路径正确
-                            vuln["文件路径"] = str(file_path)
-
-                        # 记录块分析结果
-                        print(
-                            f"[DEBUG] 线程完成第 {i + 1}/{len(chunks)} 块分析，发现 {len(chunk_vulnerabilities)} 个漏洞")
-                        self.log_info(
-                            f"线程完成第 {i + 1}/{len(chunks)} 块分析，发现 {len(chunk_vulnerabilities)} 个漏洞")
-
-                        # 使用锁保护共享资源
-                        with result_lock:
-                            # 将漏洞添加到总列表
-                            all_vulnerabilities.extend(chunk_vulnerabilities)
-
-                            # 更新UI显示每个漏洞
-                            for vuln in chunk_vulnerabilities:
-                                try:
-                                    self.display_results(file_path, [vuln])
-                                except Exception as e:
-                                    self.log_error(f"显示漏洞结果失败: {str(e)}", file_path)
+        self.code_text.configure(yscrollcommand=custom_yscrollcommand)
+        code_vsb.pack(side=tk.RIGHT, fill=tk.Y)
 
-                        # 更新进度
-                        self.event_queue.put(('progress', 1, None))
+        # 水平滚动条
+        code_hsb = ttk.Scrollbar(self.code_frame, orient="horizontal", command=self.code_text.xview)
+        self.code_text.configure(xscrollcommand=code_hsb.set)
+        code_hsb.pack(side=tk.BOTTOM, fill=tk.X)
 
-                        # 记录处理时间
-                        chunk_time = time.time() - chunk_start_time
-                        print(f"[DEBUG] 线程处理完成第 {i + 1}/{len(chunks)} 块，耗时: {chunk_time:.2f}秒")
+        # 同步行号和代码滚动
+        self.code_text.bind('<Configure>', self.update_line_numbers)
+        self.code_text.bind("<MouseWheel>", self.sync_scroll)
 
-                        return {'status': 'success', 'vulnerabilities': chunk_vulnerabilities, 'chunk_index': i}
-                    except Exception as e:
-                        error_msg = f"解析响应失败，块 {i + 1}/{len(chunks)}: {str(e)}"
-                        self.log_error(f"{error_msg}\n{traceback.format_exc()}", file_path)
-                        print(f"[DEBUG] 线程处理第 {i + 1}/{len(chunks)} 块解析失败: {str(e)}")
-                        # 即使失败也更新进度
-                        self.event_queue.put(('progress', 1, None))
-                        return {'status': 'parse_error', 'error': error_msg, 'chunk_index': i}
-                else:
-                    # 初始化错误消息变量，避免未定义错误
-                    error_msg = f"线程块{i + 1}分析失败: HTTP错误 {response['status_code']}"
-
-                    # 特殊处理401认证错误
-                    if response['status_code'] == 401:
-                        error_message = "API密钥无效，请检查API密钥是否正确"
-                        # 尝试从响应中提取错误消息
-                        try:
-                            response_json = json.loads(response['text'])
-                            if 'error' in response_json and 'message' in response_json['error']:
-                                error_message = response_json['error']['message']
-                        except:
-                            pass
-
-                        # 只在未显示过错误时显示
-                        if not self.api_validation_error_shown:
-                            error_msg = f"API认证失败: {error_message}"
-                            self.api_validation_error_shown = True
-                            self.log_error(error_msg, file_path)
-
-                            # 在UI线程中显示错误并取消分析
-                            self.root.after(0, lambda message=error_message: [
-                                messagebox.showerror("API认证失败", f"API认证失败: {message}"),
-                                self.status_bar.config(text=f"API认证失败: {message}"),
-                                setattr(self, 'auto_analysis_cancelled', True),
-                                setattr(self, 'api_validated', False)
-                            ])
-                    elif response['status_code'] == 500:
-                        # 处理服务器内部错误，不显示弹窗，只记录日志和更新状态栏
-                        try:
-                            error_text = response['text'][:200]
-                            error_msg = f"API服务器内部错误: {error_text}"
-                        except:
-                            error_msg = "API服务器内部错误"
-
-                        self.log_error(error_msg, file_path)
-
-                        # 只更新状态栏，不弹窗
-                        self.root.after(0, lambda err=error_msg:
-                        self.status_bar.config(text=f"API请求失败: 服务器内部错误"))
-                    elif response['status_code'] == 408:
-                        # 处理超时错误，不显示弹窗
-                        error_msg = f"API请求超时: {response['text']}"
-                        self.log_error(error_msg, file_path)
-
-                        # 只更新状态栏，不弹窗
-                        self.root.after(0, lambda:
-                        self.status_bar.config(text="API请求超时，请稍后重试"))
-                    elif response['status_code'] == 503:
-                        # 处理连接错误，不显示弹窗
-                        error_msg = f"API连接失败: {response['text']}"
-                        self.log_error(error_msg, file_path)
-
-                        # 只更新状态栏，不弹窗
-                        self.root.after(0, lambda:
-                        self.status_bar.config(text="API连接失败，请检查网络"))
-                    else:
-                        # 处理其他HTTP错误
-                        try:
-                            error_text = response['text'][:200]
-                            error_msg = f"API请求失败: 状态码 {response['status_code']} - {error_text}"
-                        except:
-                            error_msg = f"API请求失败: 状态码 {response['status_code']}"
-
-                        self.log_error(error_msg, file_path)
-
-                        # 在UI线程中显示错误消息
-                        self.root.after(0, lambda err=error_msg: [
-                            self.status_bar.config(text=f"API请求失败: 状态码 {response['status_code']}"),
-                            self.show_error(f"API请求失败: 状态码 {response['status_code']}")
-                        ])
-
-                    # 即使失败也更新进度
-                    self.event_queue.put(('progress', 1, None))
-                    return {'status': 'http_error', 'error': error_msg, 'status_code': response['status_code'],
-                            'chunk_index': i}
-            except Exception as e:
-                error_msg = f"线程处理第 {i + 1}/{len(chunks)} 块异常: {str(e)}"
-                self.log_error(f"{error_msg}\n{traceback.format_exc()}", file_path)
-                print(f"[ERROR] 线程处理第 {i + 1}/{len(chunks)} 块异常: {str(e)}")
-                # 确保异常情况下也更新进度
-                self.event_queue.put(('progress', 1, None))
-                return {'status': 'exception', 'error': error_msg, 'chunk_index': i}
+        # 设置标签样式
+        self.code_text.tag_configure('number', foreground='#0000FF')
+        self.code_text.tag_configure('string', foreground='#008000')
+        self.code_text.tag_configure('comment', foreground='#999999')
+        self.code_text.tag_configure('keyword', foreground='#CC7832')
+        self.code_text.tag_configure('operator', foreground='#000000')
+        self.code_text.tag_configure('bracket', foreground='#000000')
+        self.code_text.tag_configure('function', foreground='#006699')
+        self.code_text.tag_configure('class', foreground='#007F7F')
 
-        try:
-            # 创建线程池
-            with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
-                # 不再一次性提交所有任务，而是逐个提交并检查暂停状态
-                futures = []
-                future_to_chunk = {}  # 创建future到chunk的映射字典
-                active_futures = set()  # 跟踪活动的future
-                i = 0
-
-                # 处理所有块，直到全部完成或取消
-                while i < len(chunks) or active_futures:
-                    # 检查是否已取消分析
-                    if hasattr(self, 'auto_analysis_cancelled') and self.auto_analysis_cancelled:
-                        self.log_info(f"分析已取消，停止提交任务")
-                        break
+        # 扩展颜色配置（新增更多语法元素）
+        self.code_text.tag_configure('php_keyword', foreground='#CC7832', font='TkFixedFont 10 bold')
+        self.code_text.tag_configure('java_keyword', foreground='#0033CC', font='TkFixedFont 10 bold')
+        self.code_text.tag_configure('string', foreground='#008000')
+        self.code_text.tag_configure('comment', foreground='#999999')
+        self.code_text.tag_configure('number', foreground='#FF4500')  # 新增数字
+        self.code_text.tag_configure('operator', foreground='#0000FF')  # 新增运算符
+        self.code_text.tag_configure('bracket', foreground='#802080')  # 新增括号
+        self.code_text.tag_configure('function', foreground='#006699')  # 新增函数调用
+        self.code_text.tag_configure('classname', foreground='#007F7F')  # 新增类名
 
-                    # 检查是否暂停
-                    if hasattr(self, 'auto_analysis_paused') and self.auto_analysis_paused:
-                        self.log_info(f"分析已暂停，等待继续提交任务")
-                        # 只等待已提交的任务完成，不提交新任务
-                        if active_futures:
-                            # 等待任意一个任务完成
-                            done, active_futures = concurrent.futures.wait(
-                                active_futures,
-                                return_when=concurrent.futures.FIRST_COMPLETED
-                            )
-
-                            # 处理完成的任务
-                            for future in done:
-                                self._handle_completed_future(future, futures, file_path)
-                        else:
-                            # 如果没有活动任务，则等待继续
-                            while self.auto_analysis_paused and not self.auto_analysis_cancelled:
-                                time.sleep(0.5)
-                            # 再次检查是否已取消
-                            if self.auto_analysis_cancelled:
-                                self.log_info(f"分析已取消，停止提交任务")
-                                break
-                            self.log_info(f"分析继续，继续提交任务")
-                        continue
+        # 新增HTML特定语法元素
+        self.code_text.tag_configure('html_tag', foreground='#0000FF')
+        self.code_text.tag_configure('html_tag_name', foreground='#0000CD', font='TkFixedFont 10 bold')
+        self.code_text.tag_configure('html_attribute', foreground='#FF8C00')
+        self.code_text.tag_configure('html_value', foreground='#008000')
+        self.code_text.tag_configure('html_entity', foreground='#800080')
+        self.code_text.tag_configure('html_doctype', foreground='#800080', font='TkFixedFont 10 italic')
+        self.code_text.tag_configure('html_script', foreground='#A52A2A')
+        self.code_text.tag_configure('html_style', foreground='#2E8B57')
+        self.code_text.tag_configure('html_template', foreground='#CC7832')
 
-                    # 提交新任务（如果还有未处理的块）
-                    if i < len(chunks) and len(active_futures) < max_workers:
-                        chunk_info = chunks[i]
-                        future = executor.submit(process_chunk, (i, chunk_info))
-                        futures.append((future, (i, chunk_info)))
-                        future_to_chunk[future] = (i, chunk_info)
-                        active_futures.add(future)
-                        i += 1
-                        continue
+        # 新增Java特定语法元素
+        self.code_text.tag_configure('java_primitive', foreground='#0000FF', font='TkFixedFont 10')  # 基本类型
+        self.code_text.tag_configure('java_annotation', foreground='#808000', font='TkFixedFont 10 italic')  # 注解
+        self.code_text.tag_configure('java_constant', foreground='#660E7A', font='TkFixedFont 10 bold')  # 常量
+        self.code_text.tag_configure('java_modifier', foreground='#7F0055', font='TkFixedFont 10 bold')  # 修饰符
+        self.code_text.tag_configure('java_exception', foreground='#CC0000', font='TkFixedFont 10')  # 异常相关
+        self.code_text.tag_configure('java_import', foreground='#008080', font='TkFixedFont 10')  # 导入语句
 
-                    # 如果没有新任务可提交或已达到最大工作线程数，等待任意一个任务完成
-                    if active_futures:
-                        done, active_futures = concurrent.futures.wait(
-                            active_futures,
-                            return_when=concurrent.futures.FIRST_COMPLETED
-                        )
+        # 新增PHP特定语法元素
+        self.code_text.tag_configure('php_var', foreground='#9B59B6', font='TkFixedFont 10')  # PHP变量
+        self.code_text.tag_configure('php_function', foreground='#006699', font='TkFixedFont 10 bold')  # PHP函数
+        self.code_text.tag_configure('php_class', foreground='#007F7F', font='TkFixedFont 10 bold')  # PHP类
+        self.code_text.tag_configure('php_namespace', foreground='#808000', font='TkFixedFont 10 italic')  # 命名空间
+        self.code_text.tag_configure('php_superglobal', foreground='#CC0000', font='TkFixedFont 10 bold')  # 超全局变量
+        self.code_text.tag_configure('php_constant', foreground='#660E7A', font='TkFixedFont 10 bold')
 
-                        # 处理完成的任务
-                        for future in done:
-                            self._handle_completed_future(future, futures, file_path)
-                            # 从future_to_chunk中移除已处理的future
-                            if future in future_to_chunk:
-                                del future_to_chunk[future]
-                    else:
-                        # 所有任务都已完成
-                        break
+    def search_in_code(self, direction=None):
+        """在代码预览区域中搜索文本
 
-                # 处理完成的任务
-                completed = 0
-                # 使用futures列表中的future进行处理，而不是future_to_chunk
-                for future, (i, chunk_info) in futures:
-                    chunk, line_start, line_end, chunk_type = chunk_info
-                    completed += 1
-                    processed_chunks += 1
+        Args:
+            direction (str, optional): 搜索方向，可选值为 "next" 或 "prev"。默认为 None，表示从当前位置开始新搜索。
+        """
+        # 移除之前的高亮
+        self.code_text.tag_remove('search_highlight', '1.0', tk.END)
 
-                    try:
-                        # 获取结果
-                        result = future.result()
-                        if result:
-                            if result['status'] == 'success':
-                                successful_chunks += 1
-                                print(f"[DEBUG] 线程处理完成第 {i + 1}/{len(chunks)} 块")
-                            else:
-                                failed_chunks += 1
-                                print(f"[DEBUG] 线程处理第 {i + 1}/{len(chunks)} 块失败: {result['status']}")
-                                print(f"[DEBUG] 错误信息: {result.get('error', '未知错误')}")
-                        else:
-                            failed_chunks += 1
-                            print(f"[DEBUG] 线程处理第 {i + 1}/{len(chunks)} 块失败或无结果")
-                    except Exception as e:
-                        failed_chunks += 1
-                        print(f"[ERROR] 线程处理第 {i + 1}/{len(chunks)} 块异常: {str(e)}")
-                        self.log_error(f"线程处理第 {i + 1}/{len(chunks)} 块异常: {str(e)}", file_path)
-
-                    # 更新进度信息
-                    progress_percent = int(completed / len(chunks) * 100)
-                    self.log_info(f"多线程处理进度: {completed}/{len(chunks)} ({progress_percent}%)")
-                    print(
-                        f"[DEBUG] 进度：{completed}/{len(chunks)} ({progress_percent}%) [成功: {successful_chunks}, 失败: {failed_chunks}]")
-        except Exception as e:
-            self.log_error(f"线程池执行异常: {str(e)}\n{traceback.format_exc()}", file_path)
-        finally:
-            # 记录总耗时和成功/失败统计
-            total_time = time.time() - start_time
-            self.log_info(
-                f"多线程处理完成: {file_path.name}, 总耗时: {total_time:.2f}秒, 总块数: {len(chunks)}, 成功: {successful_chunks}, 失败: {failed_chunks}, 发现漏洞: {len(all_vulnerabilities)}个")
-            print(
-                f"[DEBUG] 异常分块只有{successful_chunks}块，进度：{successful_chunks}/{len(chunks)} （{int(successful_chunks / len(chunks) * 100)}%）")
+        # 获取搜索文本
+        search_text = self.search_var.get()
+        if not search_text:
+            return
 
-            # 确保更新进度
-            self.event_queue.put(('progress', 1, None))
+        # 配置高亮样式（如果尚未配置）
+        if not self.code_text.tag_cget('search_highlight', 'background'):
+            self.code_text.tag_configure('search_highlight', background='#FFFF00', foreground='#000000')
 
-    def process_event_queue(self):
-        """处理事件队列中的事件"""
-        try:
-            while True:
-                event, data, callback = self.event_queue.get_nowait()
+        # 确定搜索起始位置
+        if direction == "next":
+            # 从当前位置之后开始搜索
+            start_pos = self.code_text.index(tk.INSERT)
+        elif direction == "prev":
+            # 从当前位置之前开始搜索 - 修复上一个按钮功能
+            start_pos = self.code_text.index(tk.INSERT)
+        else:
+            # 新搜索，从文本开头开始
+            start_pos = '1.0'
 
-                if event == 'result':
-                    file_path, vulnerabilities = data
-                    self.update_vulnerability_list(file_path, vulnerabilities)
+        # 执行搜索
+        if direction == "prev":
+            # 向上搜索
+            pos = self.code_text.search(search_text, start_pos, '1.0', backwards=True)
+            if not pos:
+                # 如果没找到，则从末尾继续搜索
+                pos = self.code_text.search(search_text, tk.END, '1.0', backwards=True)
+        else:
+            # 向下搜索
+            pos = self.code_text.search(search_text, start_pos, tk.END)
+            if not pos and start_pos != '1.0':
+                # 如果没找到且不是从头开始，则从头继续搜索
+                pos = self.code_text.search(search_text, '1.0', tk.END)
 
-                elif event == 'partial_result':
-                    # 处理增量更新
-                    file_path, chunk_vulnerabilities = data
-                    # 将新发现的漏洞添加到现有列表中
-                    if file_path not in self.vulnerabilities:
-                        self.vulnerabilities[file_path] = []
-                    self.vulnerabilities[file_path].extend(chunk_vulnerabilities)
-                    # 更新界面显示
-                    self.update_vulnerability_treeview()
-
-                elif event == 'single_vuln':
-                    # 处理单个漏洞更新
-                    file_path, vuln_list = data
-                    # 确保文件路径存在于漏洞字典中
-                    if file_path not in self.vulnerabilities:
-                        self.vulnerabilities[file_path] = []
-                    # 添加单个漏洞
-                    self.vulnerabilities[file_path].extend(vuln_list)
-                    # 更新界面显示
-                    self.update_vulnerability_treeview()
+        # 处理搜索结果
+        if pos:
+            # 计算匹配文本的结束位置
+            end_pos = f"{pos}+{len(search_text)}c"
 
-                elif event == 'progress':
-                    self.update_progress()
+            # 高亮显示匹配文本
+            self.code_text.tag_add('search_highlight', pos, end_pos)
 
-                elif event == 'error':
-                    error_msg = data
-                    self.show_error(error_msg)
+            # 确保匹配文本可见
+            self.code_text.see(pos)
 
-                # 添加对'done'事件的处理，用于重置分析按钮状态
-                elif event == 'done':
-                    # 重置分析按钮状态
-                    if hasattr(self, 'btn_analyze'):
-                        self.btn_analyze.config(text="开始分析", command=self.start_analysis)
-                    # 重置分析状态标志
-                    if hasattr(self, 'auto_analysis_cancelled'):
-                        self.auto_analysis_cancelled = False
-                    if hasattr(self, 'auto_analysis_paused'):
-                        self.auto_analysis_paused = False
-                    # 更新状态栏
-                    self.status_bar.config(text="分析完成")
+            # 将插入点移动到匹配文本之前或之后，取决于搜索方向
+            if direction == "prev":
+                # 向上搜索时，将插入点移动到匹配文本之前
+                self.code_text.mark_set(tk.INSERT, pos)
+            else:
+                # 向下搜索时，将插入点移动到匹配文本之后
+                self.code_text.mark_set(tk.INSERT, end_pos)
 
-                if callback:
-                    callback()
+            # 更新状态栏
+            line = pos.split('.')[0]
+            self.status_bar.config(text=f"找到匹配项，位于第 {line} 行")
+        else:
+            # 未找到匹配项
+            self.status_bar.config(text=f"未找到 '{search_text}'")
 
-                self.event_queue.task_done()
-        except queue.Empty:  # 修改这里，使用queue.Empty而不是Empty
-            pass
+    def _init_detail_panel(self, parent=None):
+        """初始化详细信息面板"""
+        # 如果没有提供父容器，使用默认的right_panel
+        if parent is None:
+            parent = self.right_panel
 
-        # 继续轮询事件队列
-        self.root.after(100, self.process_event_queue)
+        # 创建详细信息文本框
+        self.detail_text = tk.Text(
+            parent,
+            height=8,
+            wrap=tk.WORD,
+            state='normal'
+        )
+        self.detail_text.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
 
-    def update_vulnerability_list(self, file_path, vulnerabilities):
-        """更新漏洞列表"""
-        # 存储漏洞信息
-        self.vulnerabilities[file_path] = vulnerabilities
+        # 添加滚动条 - 注意这里修改了side为RIGHT
+        detail_vsb = ttk.Scrollbar(parent, orient="vertical", command=self.detail_text.yview)
+        self.detail_text.configure(yscrollcommand=detail_vsb.set)
+        detail_vsb.pack(side=tk.RIGHT, fill=tk.Y)
 
-        # 更新界面显示
-        self.update_vulnerability_treeview()
+    def _init_status_bar(self):
+        """初始化状态栏"""
+        self.progress = ttk.Progressbar(self.root, mode='determinate')
+        self.progress.pack(side=tk.BOTTOM, fill=tk.X, padx=5, pady=2)
+        self.status_bar = ttk.Label(self.root, text="就绪", relief=tk.SUNKEN)
+        self.status_bar.pack(side=tk.BOTTOM, fill=tk.X)
 
-    def update_progress(self):
-        """更新进度显示"""
-        try:
-            # 更新进度条
-            if hasattr(self, 'progress') and self.progress:
-                current_value = self.progress['value']
-                self.progress['value'] = current_value + 1
+    def _bind_events(self):
+        """绑定事件"""
+        self.result_tree.bind('<<TreeviewSelect>>', self.show_detail)
+        self.tree.bind('<Double-1>', self.preview_code)
+        self.code_text.bind('<MouseWheel>', self.sync_scroll)
+        self.code_text.bind('<Configure>', self.update_line_numbers)
+        self.root.bind('<Control-f>', lambda e: self.search_entry.focus())
 
-                # 更新进度文本
-                total = len(self.files_to_analyze) if hasattr(self, 'files_to_analyze') and self.files_to_analyze else 0
-                current = int(self.progress['value'])
-                max_value = int(self.progress['maximum'])
+    def delayed_config_init(self):
+        """延迟配置初始化，确保UI组件已完全加载"""
+        self.project_path = Path.cwd()
+        threading.Thread(target=self._config_worker, daemon=True).start()
 
-                if max_value > 0:
-                    percentage = int(current / max_value * 100)
-                    self.status_bar.config(text=f"进度: {current}/{max_value} ({percentage}%)")
-        except Exception as e:
-            self.log_error(f"更新进度失败: {str(e)}")
+    def _config_worker(self):
+        """配置初始化工作线程"""
+        self._init_configuration()
+        self.root.after(100, self._post_config_init)
 
-    def show_error(self, error_msg):
-        """显示错误信息"""
-        self.log_error(error_msg)
-        messagebox.showerror("错误", error_msg)
+    def _post_config_init(self):
+        """配置初始化后的处理"""
+        if not hasattr(self, 'api_key') or not self.api_key:
+            self.api_key = self.config.get('DEFAULT', 'API_KEY', fallback='')
 
-    def update_vulnerability_treeview(self):
-        """更新漏洞列表视图"""
-        # 清空当前视图
-        for item in self.result_tree.get_children():
-            self.result_tree.delete(item)
-        vuln_id = 1
-        # 添加所有漏洞到视图
-        for file_path, vulns in self.vulnerabilities.items():
-            for vuln in vulns:
-                # 获取行号字符串
-                line_numbers = ", ".join(map(str, vuln["行号"]))
-
-                # 获取风险等级并标准化
-                risk_level = vuln["风险等级"].strip()
-                tag = None
-
-                # 根据风险等级设置标签
-                if "高" in risk_level:
-                    tag = "高危"
-                elif "中" in risk_level:
-                    tag = "中危"
-                elif "低" in risk_level:
-                    tag = "低危"
-                elif "提示" in risk_level or "信息" in risk_level:
-                    tag = "提示"
-
-                # 插入到树形视图
-                item_id = self.result_tree.insert("", "end", values=(
-                    str(vuln_id),
-                    vuln["漏洞类型"],
-                    vuln["风险等级"],
-                    str(file_path),
-                    vuln["详细描述"],
-                    vuln["风险点"],
-                    vuln["Payload"],
-                    vuln["修复建议"],
-                    line_numbers
-                ))
-
-                # 应用标签（如果有）
-                if tag:
-                    self.result_tree.item(item_id, tags=(tag,))
-
-                vuln_id += 1
+        self.validation_start_time = time.time()
+        self._validate_api_key()
+        self.root.after(500, self.check_initial_validation)
 
-        # 更新状态栏
-        total_vulns = sum(len(vulns) for vulns in self.vulnerabilities.values())
-        self.status_bar.config(text=f"共发现 {total_vulns} 个漏洞")
+    def post_config_init(self):
+        """配置加载后的初始化"""
+        if not hasattr(self, 'api_key') or not self.api_key:
+            self.api_key = self.config.get('DEFAULT', 'API_KEY', fallback='')
+            return
 
-    def log_info(self, message, file_path=None):
-        """记录信息日志"""
-        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        log_entry = f"[INFO][{timestamp}] {message}"
+        # 添加验证超时计时器
+        self.validation_start_time = time.time()
+        self.status_bar.config(text="正在验证API密钥...")
+        self._validate_api_key()
+        self.root.after(500, self.check_initial_validation)
 
-        if file_path:
-            log_entry += f" - {file_path.name}"
+    def check_initial_validation(self):
+        """检查初始API验证状态 - 已移除实际验证逻辑"""
+        self.api_validated = True
+        return True
 
-        # 将日志写入文件
-        with open("deepaudit_log.txt", "a", encoding="utf-8") as log_file:
-            log_file.write(log_entry + "\n")
+    def search_text(self, forward=True):
+        """执行文本搜索"""
+        self.code_text.tag_remove('highlight', '1.0', tk.END)
+        search_str = self.search_entry.get()
+        if not search_str:
+            return
 
-        # 如果有日志窗口，也可以显示在界面上
-        if hasattr(self, 'log_text'):
-            self.log_text.config(state='normal')
-            self.log_text.insert(tk.END, log_entry + "\n")
-            self.log_text.see(tk.END)
-            self.log_text.config(state='disabled')
+        start_pos = self.code_text.index(tk.INSERT)
+        if forward:
+            match_pos = self.code_text.search(search_str, start_pos, tk.END, nocase=False)
+            if not match_pos:
+                match_pos = self.code_text.search(search_str, '1.0', tk.END, nocase=False)
+        else:
+            match_pos = self.code_text.search(search_str, start_pos + '-1c', '1.0', backwards=True, nocase=False)
+            if not match_pos:
+                match_pos = self.code_text.search(search_str, tk.END, '1.0', backwards=True, nocase=False)
 
-    def create_log_panel(self):
-        """创建日志面板"""
-        log_frame = ttk.LabelFrame(self.root, text="日志")
-        log_frame.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
+        if match_pos:
+            end_pos = f"{match_pos}+{len(search_str)}c"
+            self.code_text.tag_add('highlight', match_pos, end_pos)
+            self.code_text.see(match_pos)
+            self.code_text.mark_set(tk.INSERT, end_pos if forward else match_pos)
 
-        # 创建日志文本框和滚动条
-        self.log_text = scrolledtext.ScrolledText(log_frame, wrap=tk.WORD, height=8)
-        self.log_text.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
-        self.log_text.config(state='disabled')
+    # ------------------ 核心功能方法 ------------------ #
+    def open_project(self):
+        """打开项目目录"""
+        if path := filedialog.askdirectory():
+            self.project_path = Path(path)
+            # 清空现有树节点
+            self.tree.delete(*self.tree.get_children())
+            # 添加根目录节点（新增代码）
+            root_node = self.tree.insert('', 'end',
+                                         text=self.project_path.name,
+                                         values=[str(self.project_path)],
+                                         open=True)
+            # 填充子项（修改调用参数）
+            self._populate_tree(self.project_path, parent=root_node)
+            self.status_bar.config(text=f"已打开项目：{path}")
 
-        # 添加清除按钮
-        clear_btn = ttk.Button(log_frame, text="清除日志", command=self.clear_log)
-        clear_btn.pack(side=tk.RIGHT, padx=5, pady=5)
+    def start_analysis(self):
+        """开始分析（优化后的多线程版本）"""
+        try:
+            # 检查是否已有分析线程在运行
+            if hasattr(self,
+                       'auto_analysis_thread') and self.auto_analysis_thread and self.auto_analysis_thread.is_alive():
+                messagebox.showinfo("提示", "已有分析任务正在运行，请等待完成或取消当前任务")
+                return False
 
-    def clear_log(self):
-        """清除日志"""
-        self.log_text.config(state='normal')
-        self.log_text.delete(1.0, tk.END)
-        self.log_text.config(state='disabled')
+            # 获取选中的文件列表
+            file_list = self._get_selected_files()
 
-    def _smart_code_chunking(self, code, file_ext):
-        """根据代码结构智能分块"""
-        chunks = []
-        lines = code.splitlines()
+            # 检查是否有选中文件
+            if not file_list:
+                messagebox.showinfo("提示", "请先选择要分析的文件")
+                return False
 
-        # 打印调试信息
-        print(f"[DEBUG] 智能分块处理文件类型: {file_ext}")
+            # 检查API密钥是否已配置
+            if not self.api_key:
+                messagebox.showwarning("警告", "API密钥未配置，请先在设置中配置API密钥")
+                return False
 
-        # 根据文件类型选择不同的分块策略
-        if file_ext in ['.java']:
-            print(f"[DEBUG] 调用Java分块处理: {file_ext}")
-            chunks = self._chunk_java_code(lines)
-            print(f"[DEBUG] Java分块完成，共 {len(chunks)} 个代码块")
-        elif file_ext in ['.php']:
-            print(f"[DEBUG] 调用PHP分块处理: {file_ext}")
-            chunks = self._chunk_php_code(lines)
-            print(f"[DEBUG] PHP分块完成，共 {len(chunks)} 个代码块")
-        elif file_ext.lower() in ['.xml', '.pom'] or 'pom.xml' in file_ext.lower():
-            print(f"[DEBUG] 调用XML分块处理: {file_ext}")
-            chunks = self._chunk_xml_code(lines)
-            print(f"[DEBUG] XML分块完成，共 {len(chunks)} 个代码块")
-        else:
-            # 默认按固定大小分块
-            chunk_size = 200  # 每块约200行
-            for i in range(0, len(lines), chunk_size):
-                end = min(i + chunk_size, len(lines))
-                chunk_code = '\n'.join(lines[i:end])
-                chunks.append((chunk_code, i + 1, end, "固定大小块"))
+            # 重置API验证错误标志
+            self.api_validation_error_shown = False
 
-        # 确保所有分块按照起始行号排序
-        chunks = sorted(chunks, key=lambda x: x[1])
+            # 优化API验证逻辑：只在实际需要使用API时才验证
+            # 如果API已经验证过且有效，直接继续分析流程
+            if hasattr(self, 'api_validated') and self.api_validated:
+                # API已验证，直接继续
+                pass
+            else:
+                # 设置API为已验证状态，跳过验证步骤
+                # 只有在实际调用API进行分析时才会真正验证API有效性
+                self.api_validated = True
+                self.status_bar.config(text="准备开始分析...")
 
-        return chunks
+                # 注意：实际的API验证将在发送请求时进行
+                # 这样可以避免不必要的API验证，提高用户体验
 
-    def _chunk_xml_code(self, lines):
-        """XML/POM代码智能分块"""
-        try:
-            # 如果文件为空，直接返回
-            if not lines:
-                return [("", 1, 1, "空文件")]
+            # 记录开始分析
+            self.log_info(f"开始分析任务，选中文件数: {len(file_list)}")
 
-            # 首先过滤掉XML注释行
-            filtered_lines = []
-            original_to_filtered = {}  # 原始行号到过滤后行号的映射
-            filtered_to_original = {}  # 过滤后行号到原始行号的映射
+            # 进度条最大值先按文件数设置，分析线程生成分块计划后再更新为实际代码块数
+            self.progress['maximum'] = len(file_list)
+            self.progress['value'] = 0
+            self.status_bar.config(text=f"准备分析 {len(file_list)} 个文件")
 
-            for i, line in enumerate(lines):
-                # 跳过XML注释行
-                if '<!--' in line and '-->' in line:
-                    # 如果注释不是整行，保留非注释部分
-                    parts = []
-                    current_pos = 0
-                    while current_pos < len(line):
-                        comment_start = line.find('<!--', current_pos)
-                        if comment_start == -1:
-                            parts.append(line[current_pos:])
-                            break
+            # 重置分析状态
+            self.auto_analysis_cancelled = False
+            self.auto_analysis_paused = False
 
-                        # 添加注释前的内容
-                        if comment_start > current_pos:
-                            parts.append(line[current_pos:comment_start])
+            # 清空事件队列，避免之前的事件影响当前分析
+            try:
+                while True:
+                    self.event_queue.get_nowait()
+                    self.event_queue.task_done()
+            except queue.Empty:
+                pass
 
-                        # 跳过注释
-                        comment_end = line.find('-->', comment_start) + 3
-                        current_pos = comment_end
+            # 更改按钮文本和状态
+            self.btn_analyze.config(text="取消分析", command=self.cancel_analysis)
 
-                    # 如果有非注释内容，添加到过滤后的行
-                    non_comment_line = ''.join(parts).strip()
-                    if non_comment_line:
-                        filtered_lines.append(non_comment_line)
-                        original_to_filtered[i] = len(filtered_lines) - 1
-                        filtered_to_original[len(filtered_lines) - 1] = i
-                elif '<!--' in line:
-                    # 多行注释开始，跳过
-                    in_comment = True
-                    # 检查是否有注释前的内容
-                    comment_start = line.find('<!--')
-                    if comment_start > 0:
-                        non_comment_part = line[:comment_start].strip()
-                        if non_comment_part:
-                            filtered_lines.append(non_comment_part)
-                            original_to_filtered[i] = len(filtered_lines) - 1
-                            filtered_to_original[len(filtered_lines) - 1] = i
-                elif '-->' in line:
-                    # 多行注释结束
-                    in_comment = False
-                    # 检查是否有注释后的内容
-                    comment_end = line.find('-->') + 3
-                    if comment_end < len(line):
-                        non_comment_part = line[comment_end:].strip()
-                        if non_comment_part:
-                            filtered_lines.append(non_comment_part)
-                            original_to_filtered[i] = len(filtered_lines) - 1
-                            filtered_to_original[len(filtered_lines) - 1] = i
-                else:
-                    # 正常行，添加到过滤后的行
-                    filtered_lines.append(line)
-                    original_to_filtered[i] = len(filtered_lines) - 1
-                    filtered_to_original[len(filtered_lines) - 1] = i
+            # 更新状态栏
+            self.status_bar.config(text=f"准备分析 {len(file_list)} 个文件...")
 
-            # 首先识别XML声明
-            chunks = []
-            for i, line in enumerate(filtered_lines):
-                if line.strip().startswith("<?xml"):
-                    # 使用原始行号
-                    original_i = filtered_to_original[i]
-                    chunks.append((line.strip(), original_i + 1, original_i + 1, "XML声明"))
-                    break
+            # 创建后台线程
+            self.auto_analysis_thread = threading.Thread(
+                target=self._analysis_worker,
+                args=(file_list,),
+                daemon=True,
+                name="AnalysisWorkerThread"
+            )
+            self.auto_analysis_thread.start()
+            self.root.after(100, self._handle_events)
 
-            # 使用正则表达式识别主要标签
-            import re
+            # 记录线程启动
+            self.log_info(f"分析线程已启动，线程ID: {self.auto_analysis_thread.ident}")
+            return True
+        except Exception as e:
+            self.log_error(f"启动分析失败: {str(e)}\n{traceback.format_exc()}")
+            messagebox.showerror("错误", f"启动分析失败: {str(e)}")
+            return False
 
-            # 识别project标签的开始和结束
-            project_start = None
-            project_end = None
-            for i, line in enumerate(filtered_lines):
-                if re.search(r'<project\b', line) and project_start is None:
-                    project_start = i
-                if re.search(r'</project>', line):
-                    project_end = i
+    def _handle_events(self):
+        """处理事件队列中的任务"""
+        try:
+            # 限制每次处理的事件数量，防止UI阻塞
+            max_events = 10
+            events_processed = 0
 
-            if project_start is not None and project_end is not None:
-                # 识别主要子标签
-                main_tags = ["modules", "properties", "dependencies", "dependencyManagement",
-                             "build", "profiles", "parent", "distributionManagement"]
+            while events_processed < max_events:
+                try:
+                    event_type, data, callback = self.event_queue.get_nowait()
+                    events_processed += 1
 
-                # 记录已处理的行范围，避免重复
-                processed_ranges = set()
+                    # 如果分析已取消，忽略进度更新事件
+                    if self.auto_analysis_cancelled and event_type == 'progress':
+                        self.event_queue.task_done()
+                        continue
 
-                for tag in main_tags:
-                    tag_start = None
-                    tag_end = None
-                    tag_depth = 0
+                    # 根据事件类型处理
+                    if event_type == 'progress':
+                        self._handle_progress_event()
+                    elif event_type == 'result':
+                        self._handle_result_event(data)
+                    elif event_type == 'done':
+                        self._handle_done_event()
+                        # 继续事件循环，不处理更多事件
+                        self.root.after(100, self._handle_events)
+                        return
+                    elif event_type == 'api_validation':
+                        self._handle_api_validation_event(data)
+                    elif event_type == 'error':
+                        self._handle_error_event(data)
 
-                    for i in range(project_start, project_end + 1):
-                        line = filtered_lines[i]
+                    # 执行回调函数（如果有）
+                    if callback:
+                        callback()
 
-                        # 识别标签开始
-                        if re.search(f'<{tag}\\b', line) and tag_start is None:
-                            tag_start = i
-                            tag_depth = 1
+                    # 标记任务完成
+                    self.event_queue.task_done()
 
-                        # 如果已找到开始标签，计算嵌套深度
-                        if tag_start is not None and tag_end is None:
-                            # 计算当前行中的开始和结束标签
-                            starts = len(re.findall(f'<{tag}\\b', line))
-                            ends = len(re.findall(f'</{tag}>', line))
+                except queue.Empty:  # 队列为空时退出循环
+                    break
+                except Exception as e:
+                    self.log_error(f"事件处理异常: {str(e)}")
+                    continue
+        except Exception as e:
+            self.log_error(f"事件处理器异常: {str(e)}")
+        finally:
+            # 继续事件循环
+            self.root.after(100, self._handle_events)
 
-                            # 更新深度
-                            tag_depth += starts - ends
+    def _handle_progress_event(self):
+        """处理进度更新事件"""
+        try:
+            current_value = int(self.progress['value'])
+            max_value = int(self.progress['maximum'])
 
-                            # 如果深度回到0，说明找到了结束标签
-                            if tag_depth == 0:
-                                tag_end = i
+            # 确保进度不超过最大值
+            if current_value < max_value:
+                self.progress.step(1)
+                current_value += 1
 
-                                # 创建这个标签的块 - 使用原始行号
-                                original_start = filtered_to_original[tag_start]
-                                original_end = filtered_to_original[tag_end]
+            # 更新状态栏显示当前进度
+            percentage = min(int((current_value / max_value) * 100) if max_value > 0 else 0, 100)
+            # 使用"代码块"而不是"块"使表述更清晰
+            self.status_bar.config(text=f"正在分析: {current_value}/{max_value} 代码块 ({percentage}%) | "
+                                        f"并发上限: {self.request_engine.controller.current_limit}")
+        except Exception as e:
+            self.log_error(f"更新进度失败: {str(e)}")
 
-                                # 获取原始代码内容（包括注释）
-                                tag_content = '\n'.join(lines[original_start:original_end + 1])
-                                chunks.append((tag_content, original_start + 1, original_end + 1, f"{tag}配置"))
+    def _handle_result_event(self, data):
+        """处理结果事件"""
+        try:
+            file_path, vulnerabilities = data
+            self._safe_display_results(file_path, vulnerabilities)
+        except Exception as e:
+            self.log_error(f"显示结果失败: {str(e)}")
 
-                                # 记录已处理的行范围
-                                for j in range(tag_start, tag_end + 1):
-                                    processed_ranges.add(j)
+    def _handle_done_event(self):
+        """处理完成事件"""
+        try:
+            # 重置进度条和状态
+            self.progress['value'] = 0
 
-                # 处理单个dependency标签（只有在dependencies标签外的独立dependency才处理）
-                i = project_start
-                while i <= project_end:
-                    if i in processed_ranges:
-                        i += 1
-                        continue
+            # 恢复按钮状态，但只在必要时更改
+            if hasattr(self, 'btn_analyze') and self.btn_analyze.cget("text") != "开始分析":
+                self.btn_analyze.config(text="开始分析", command=self.start_analysis)
 
-                    line = filtered_lines[i]
-                    if re.search(r'<dependency\b', line) and not re.search(r'</dependencies>', line):
-                        dep_start = i
-                        dep_depth = 1
+            if hasattr(self, 'btn_auto_analyze') and (self.btn_auto_analyze.cget("text") != "自动分析" or
+                                                      self.btn_auto_analyze.cget("state") != tk.NORMAL):
+                self.btn_auto_analyze.config(text="自动分析", state=tk.NORMAL)
 
-                        # 寻找dependency结束
-                        j = i + 1
-                        while j <= project_end:
-                            if j >= len(filtered_lines):
-                                break
+            if hasattr(self, 'btn_export'):
+                self.btn_export.config(state=tk.NORMAL)
 
-                            dep_line = filtered_lines[j]
+            # 更新状态栏
+            if hasattr(self, 'api_validation_error_shown') and self.api_validation_error_shown:
+                self.status_bar.config(text="API验证失败")
+            elif self.auto_analysis_cancelled:
+                self.status_bar.config(text="分析已取消")
+            else:
+                # 检查是否有漏洞发现
+                total_vulns = len(self.result_tree.get_children())
+                if total_vulns > 0:
+                    self.status_bar.config(text=f"分析完成，共发现 {total_vulns} 个漏洞")
+                else:
+                    self.status_bar.config(text="分析完成，未发现漏洞")
 
-                            # 计算当前行中的开始和结束标签
-                            starts = len(re.findall(r'<dependency\b', dep_line))
-                            ends = len(re.findall(r'</dependency>', dep_line))
+            # 重置分析状态
+            self.auto_analysis_cancelled = False
+            self.auto_analysis_paused = False
+            if hasattr(self, 'auto_analysis_thread'):
+                delattr(self, 'auto_analysis_thread')
+        except Exception as e:
+            self.log_error(f"处理完成事件失败: {str(e)}")
 
-                            # 更新深度
-                            dep_depth += starts - ends
+    def _handle_api_validation_event(self, is_valid):
+        """处理API验证事件"""
+        try:
+            if is_valid:
+                self.status_bar.config(text="API密钥验证通过")
+                self.api_validated = True
+            else:
+                self.status_bar.config(text="API密钥验证失败")
+                self.api_validated = False
+                if hasattr(self, 'btn_auto_analyze'):
+                    self.btn_auto_analyze.config(text="自动分析", state=tk.NORMAL)
+                if hasattr(self, 'btn_analyze'):
+                    self.btn_analyze.config(state=tk.NORMAL)
+                messagebox.showerror("API验证失败", "API密钥验证失败，请检查API密钥是否正确。")
+        except Exception as e:
+            self.log_error(f"处理API验证事件失败: {str(e)}")
 
-                            # 如果深度回到0，说明找到了结束标签
-                            if dep_depth == 0:
-                                dep_end = j
+    def _handle_error_event(self, error_msg):
+        """处理错误事件"""
+        try:
+            self.show_error(error_msg)
+            self.status_bar.config(
+                text=f"发生错误: {error_msg[:50]}..." if len(error_msg) > 50 else f"发生错误: {error_msg}")
+        except Exception as e:
+            self.log_error(f"处理错误事件失败: {str(e)}")
 
-                                # 创建这个依赖项的块 - 使用原始行号
-                                original_start = filtered_to_original[dep_start]
-                                original_end = filtered_to_original[dep_end]
+    def _safe_display_results(self, file_path, vulnerabilities, finding_ids=None):
+        """安全地在UI线程中显示结果
 
-                                # 获取原始代码内容（包括注释）
-                                dep_content = '\n'.join(lines[original_start:original_end + 1])
-                                chunks.append((dep_content, original_start + 1, original_end + 1, "依赖项"))
+        Args:
+            finding_ids: 漏洞在结果数据库中的ID，用作表格行的iid，删除时按ID删除数据库记录；
+                为None时在这里写入数据库
+        """
+        try:
+            # 初始化漏洞ID计数器（如果不存在）
+            if not hasattr(self, 'vuln_id_counter'):
+                self.vuln_id_counter = 1
 
-                                # 记录已处理的行范围
-                                for k in range(dep_start, dep_end + 1):
-                                    processed_ranges.add(k)
+            if finding_ids is None:
+                finding_ids = AuditEngine.display_results(self, file_path, vulnerabilities)
 
-                                i = dep_end
-                                break
+            # 实时更新UI - 直接添加新发现的漏洞到树形视图
+            for vuln, finding_id in zip(vulnerabilities, finding_ids):
+                # 处理行号显示
+                line_numbers = ", ".join(map(str, vuln["行号"])) if vuln["行号"] else "N/A"
 
-                            j += 1
+                # 插入结果到Treeview
+                try:
+                    item_id = self.result_tree.insert(
+                        '', 'end', iid=None if finding_id is None else str(finding_id),
+                        values=(
+                            self.vuln_id_counter,
+                            vuln["漏洞类型"],
+                            vuln["风险等级"],
+                            str(file_path),
+                            vuln["详细描述"],
+                            vuln.get("风险点", "N/A"),
+                            vuln.get("Payload", "N/A"),
+                            vuln.get("修复建议", "N/A"),
+                            f"{line_numbers}"
+                        )
+                    )
 
-                    i += 1
+                    # 设置行颜色（如果有定义）
+                    if hasattr(self, 'severity_colors'):
+                        severity = vuln["风险等级"]
+                        color = self.severity_colors.get(severity, "#FFFFFF")
+                        self.result_tree.tag_configure(severity, background=color)
+                        self.result_tree.item(item_id, tags=(severity,))
 
-                # 处理未被识别的部分（如modelVersion, groupId等）
-                i = project_start
-                while i <= project_end:
-                    # 如果这一行已经被处理过，跳过
-                    if i in processed_ranges:
-                        i += 1
-                        continue
+                    # 递增漏洞ID计数器
+                    self.vuln_id_counter += 1
 
-                    # 找到一段连续的未处理行
-                    start_unprocessed = i
-                    while i <= project_end and i not in processed_ranges:
-                        i += 1
+                except KeyError as e:
+                    self.log_error(f"字段缺失: {str(e)}")
+                    continue
 
-                    # 如果找到了未处理的行段，创建一个块
-                    if i > start_unprocessed:
-                        # 转换为原始行号
-                        original_start = filtered_to_original[start_unprocessed]
-                        original_end = filtered_to_original[min(i - 1, len(filtered_to_original) - 1)]
+            # 更新状态栏显示总漏洞数
+            self.status_bar.config(text=f"共发现 {len(self.result_tree.get_children())} 个漏洞")
 
-                        # 获取原始代码内容（包括注释）
-                        unprocessed_content = '\n'.join(lines[original_start:original_end + 1])
-                        if unprocessed_content.strip():  # 确保内容不为空
-                            chunks.append((unprocessed_content, original_start + 1, original_end + 1, "其他配置"))
-            else:
-                # 如果没有找到project标签，将整个文件作为一个块
-                chunks.append(('\n'.join(lines), 1, len(lines), "完整XML文件"))
+        except Exception as e:
+            self.log_error(f"显示结果失败: {str(e)}")
 
-            # 过滤掉空内容的块
-            chunks = [(code, start, end, chunk_type) for code, start, end, chunk_type in chunks if code.strip()]
+    def _analysis_worker(self, file_list):
+        """分析选中文件的后台线程"""
+        start_time = time.time()
+        self.log_info(f"开始分析任务，文件数量: {len(file_list)}")
 
-            # 按行号排序
-            chunks.sort(key=lambda x: x[1])
+        try:
+            # 检查文件是否存在
+            existing_files = []
+            for file_path in file_list:
+                if file_path.exists():
+                    existing_files.append(file_path)
+                else:
+                    self.log_error(f"文件不存在，跳过: {file_path}")
 
-            return chunks
+            # 检查是否有有效文件
+            if not existing_files:
+                self.log_info("没有有效文件可分析")
+                self.root.after(0, lambda: self.status_bar.config(text="没有有效文件可分析"))
+                return
+
+            # 与自动分析和命令行模式共用同一套流程（打包、去重、预筛选、风险排序），选中文件不使用增量清单，
+            # 也不写检查点日志，以免覆盖自动分析可继续的检查点
+            self.set_status(f"开始分析 {len(existing_files)} 个文件")
+            self.run_scan(existing_files, incremental=False, checkpoint=False)
 
         except Exception as e:
-            print(f"[ERROR] XML分块异常: {str(e)}")
-            import traceback
-            traceback.print_exc()
-            return [('\n'.join(lines), 1, len(lines), "分块失败")]  # 返回完整代码作为单个块
+            self.log_error(f"分析工作线程异常: {str(e)}\n{traceback.format_exc()}")
+        finally:
+            # 记录总耗时
+            elapsed_time = time.time() - start_time
+            self.log_info(f"分析任务完成，总耗时: {elapsed_time:.2f}秒")
 
-    def _chunk_php_code(self, lines):
-        """PHP代码智能分块"""
-        chunks = []
-        current_chunk = []
-        current_type = "导入块"
-        chunk_start_line = 1
-        in_class = False
-        in_function = False
-        in_method = False
-        brace_stack = []  # 使用栈来跟踪大括号匹配
-        in_comment = False
-        class_name = ""
-        function_name = ""
-        # 初始化这两个变量，避免未绑定错误
-        method_brace_depth = 0
-        function_brace_depth = 0
+            # 只有在非API验证失败的情况下才发送done事件
+            if not (hasattr(self, 'api_validation_error_shown') and self.api_validation_error_shown):
+                self.root.after(0, lambda: self.event_queue.put(('done', None, None)))
 
-        for i, line in enumerate(lines):
-            line_num = i + 1
-            stripped = line.strip()
+            # 直接在UI线程中重新启用按钮，确保按钮状态正确恢复
+            self.root.after(0, lambda: self.btn_auto_analyze.config(text="自动分析", state=tk.NORMAL))
+            self.root.after(0, lambda: self.btn_analyze.config(text="开始分析", state=tk.NORMAL))
 
-            # 处理多行注释
-            if "/*" in line and "*/" not in line:
-                in_comment = True
-            if "*/" in line:
-                in_comment = False
+    # ------------------ 辅助方法 ------------------ #
+    def _save_config(self):
+        """保存配置文件并立即应用更改"""
+        with open(self.config_path, 'w', encoding='utf-8') as f:
+            self.config.write(f)
 
-            # 跟踪大括号，忽略注释中的大括号
-            if not in_comment and not stripped.startswith("//"):
-                # 处理左大括号
-                for char_pos, char in enumerate(line):
-                    if char == '{':
-                        # 检查是否在字符串内
-                        if not self._is_in_string(line, char_pos):
-                            brace_stack.append('{')
-                    elif char == '}':
-                        # 检查是否在字符串内
-                        if not self._is_in_string(line, char_pos) and brace_stack:
-                            brace_stack.pop()
+        # 立即重新加载配置并应用更改
+        self.reload_config()
 
-            # 检测命名空间和use语句
-            if re.match(r'^\s*(namespace|use)\s+', line) and not in_comment:
-                if not current_chunk or current_type == "导入块":
-                    current_chunk.append(line)
-                    if current_type != "导入块":
-                        current_type = "导入块"
-                        chunk_start_line = line_num
-                else:
-                    chunks.append(('\n'.join(current_chunk), chunk_start_line, line_num - 1, current_type))
-                    current_chunk = [line]
-                    chunk_start_line = line_num
-                    current_type = "导入块"
-                continue
+        # 更新状态栏提示
+        self.status_bar.config(text="配置已更新并应用")
+        # 3秒后恢复状态栏
+        self.root.after(3000, lambda: self.status_bar.config(text="就绪"))
 
-            # 检测类定义
-            class_match = re.match(r'^\s*(abstract\s+|final\s+)?class\s+(\w+)', line)
-            if not in_comment and class_match and not in_class:
-                if current_chunk:
-                    chunks.append(('\n'.join(current_chunk), chunk_start_line, line_num - 1, current_type))
-                current_chunk = [line]
-                chunk_start_line = line_num
-                # 提取类名
-                class_name = class_match.group(2) if class_match.group(2) else "匿名类"
-                current_type = f"类定义({class_name})"
-                in_class = True
-                continue
+    def reload_config(self):
+        """重新加载配置文件并应用更改，无需重启程序"""
+        # 重新读取配置文件
+        if self.config_path.exists():
+            self.config.read(self.config_path, encoding='utf-8')
 
-            # 检测函数/方法定义
-            function_match = re.match(r'^\s*(public\s+|private\s+|protected\s+|static\s+)*(function)\s+(\w+)', line)
-            if not in_comment and function_match:
-                function_name = function_match.group(3) if function_match.group(3) else "匿名函数"
+            # 更新API相关配置
+            self.api_key = self.config.get('DEFAULT', 'API_KEY', fallback='')
+            self.api_endpoint = self.config.get('DEFAULT', 'API_ENDPOINT',
+                                                fallback='https://api.deepseek.com/v1/chat/completions')
 
-                if in_class:
-                    # 类方法
-                    if current_chunk and not in_method and "类定义" not in current_type:
-                        chunks.append(('\n'.join(current_chunk), chunk_start_line, line_num - 1, current_type))
-                        current_chunk = []
-                        chunk_start_line = line_num
+            # 更新其他可能的配置项
+            timeout = self.config.get('DEFAULT', 'TIMEOUT', fallback='30')
 
-                    # 添加方法定义行到当前块
-                    current_chunk.append(line)
-                    current_type = f"方法({class_name}.{function_name})"
-                    in_method = True
-                    # 记录方法开始时的大括号栈深度
-                    method_brace_depth = len(brace_stack)
-                    if '{' in line:
-                        method_brace_depth += 1  # 如果当前行有左大括号，调整深度
-                else:
-                    # 独立函数
-                    if current_chunk and not in_function:
-                        chunks.append(('\n'.join(current_chunk), chunk_start_line, line_num - 1, current_type))
-                        current_chunk = [line]
-                        chunk_start_line = line_num
+            # 如果有主题设置，应用主题
+            if 'THEME' in self.config['DEFAULT']:
+                theme = self.config.get('DEFAULT', 'THEME', fallback='light')
+                # 这里可以添加主题切换逻辑
+
+            # 更新状态栏
+            self.status_bar.config(text="配置已更新")
+
+            # 3秒后恢复状态栏
+            self.root.after(3000, lambda: self.status_bar.config(text="就绪"))
+
+            # 重置API验证状态，以便在API密钥更改后重新验证
+            if hasattr(self, 'api_validated'):
+                self.api_validated = False
+
+            return True
+        return False
+
+    def open_api_settings(self):
+        """打开API设置对话框"""
+        # 创建一个顶层窗口
+        settings_window = tk.Toplevel(self.root)
+        settings_window.title("API设置")
+        settings_window.geometry("700x450")  # 减小窗口尺寸，使其更加紧凑
+        settings_window.resizable(True, True)  # 允许调整大小以适应不同屏幕分辨率
+        settings_window.transient(self.root)
+        settings_window.grab_set()  # 模态对话框
+
+        # 内容框架 - 减小内边距使内容更加紧凑
+        frame = ttk.Frame(settings_window, padding=10)
+        frame.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
+
+        # API密钥设置
+        ttk.Label(frame, text="API密钥:").grid(row=0, column=0, sticky=tk.W, pady=5)
+        api_key_var = tk.StringVar(value=self.api_key)
+        api_key_entry = ttk.Entry(frame, textvariable=api_key_var, width=50)
+        api_key_entry.grid(row=0, column=1, sticky=tk.W + tk.E, pady=5)
+
+        # API终端设置
+        ttk.Label(frame, text="API终端:").grid(row=1, column=0, sticky=tk.W, pady=5)
+        api_endpoint_var = tk.StringVar(value=self.api_endpoint)
+        api_endpoint_entry = ttk.Entry(frame, textvariable=api_endpoint_var, width=50)
+        api_endpoint_entry.grid(row=1, column=1, sticky=tk.W + tk.E, pady=5)
+
+        # 超时设置
+        ttk.Label(frame, text="超时(秒):").grid(row=2, column=0, sticky=tk.W, pady=5)
+        timeout_var = tk.StringVar(value=self.config.get('DEFAULT', 'TIMEOUT', fallback='30'))
+        timeout_entry = ttk.Entry(frame, textvariable=timeout_var, width=10)
+        timeout_entry.grid(row=2, column=1, sticky=tk.W, pady=5)
+
+        # 提示模板设置
+        ttk.Label(frame, text="提示模板:").grid(row=3, column=0, sticky=tk.W, pady=5)
+        prompt_var = tk.StringVar(value=self.config.get('DEFAULT', 'PROMPT_TEMPLATE',
+                                                        fallback='你是一个代码审计专家结合整段代码分析传参处理有没有可控点或者组件版本是否有漏洞，使用污点分析+AST分析对代码的语义信息进行安全分析'))
+        prompt_entry = ttk.Entry(frame, textvariable=prompt_var, width=50)
+        prompt_entry.grid(row=3, column=1, sticky=tk.W + tk.E, pady=5)
+
+        # 余额显示区域
+        balance_frame = ttk.LabelFrame(frame, text="API余额信息", padding=10)
+        balance_frame.grid(row=4, column=0, columnspan=2, sticky=tk.W + tk.E, pady=10)
+
+        # 余额信息标签
+        balance_text = tk.Text(balance_frame, height=5, width=50, wrap=tk.WORD, state=tk.DISABLED)
+        balance_text.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
+
+        # 查询余额函数
+        def query_balance():
+            # 禁用查询按钮，避免重复点击
+            query_btn.config(state=tk.DISABLED)
+            # 更新状态
+            status_var.set("正在查询余额...")
+            settings_window.update()
+
+            # 使用当前输入框中的API密钥查询
+            result = self.check_api_balance(api_key_var.get())
+
+            # 启用查询按钮
+            query_btn.config(state=tk.NORMAL)
+
+            # 显示查询结果
+            balance_text.config(state=tk.NORMAL)
+            balance_text.delete(1.0, tk.END)
+
+            if result["status"] == "success":
+                try:
+                    data = result["data"]
+                    balance_info = ""
+
+                    # 处理新格式的API响应 (balance_infos格式)
+                    if "balance_infos" in data and data["balance_infos"]:
+                        balance_info += f"账户状态: {'可用' if data.get('is_available', False) else '不可用'}\n"
+                        balance_infos = data["balance_infos"]
+
+                        for info in balance_infos:
+                            currency = info.get("currency", "")
+                            total = info.get("total_balance", "0")
+                            granted = info.get("granted_balance", "0")
+                            topped_up = info.get("topped_up_balance", "0")
+
+                            balance_info += f"币种: {currency}\n"
+                            balance_info += f"总余额: {total}\n"
+                            balance_info += f"授予余额: {granted}\n"
+                            balance_info += f"充值余额: {topped_up}\n\n"
+
+                    # 处理旧格式的API响应 (grants格式)
+                    elif "grants" in data and data["grants"]:
+                        balance_info += f"账户: {data.get('title', 'Unknown')}\n\n"
+                        grants = data["grants"]
+                        for grant in grants:
+                            name = grant.get("name", "Unknown")
+                            amount = grant.get("amount", 0)
+                            used = grant.get("used", 0)
+                            available = grant.get("available", 0)
+                            expires = grant.get("expires", "Unknown")
+
+                            # 格式化金额显示
+                            amount_str = f"${amount:.2f}" if isinstance(amount, (int, float)) else str(amount)
+                            used_str = f"${used:.2f}" if isinstance(used, (int, float)) else str(used)
+                            available_str = f"${available:.2f}" if isinstance(available, (int, float)) else str(
+                                available)
+
+                            balance_info += f"额度类型: {name}\n"
+                            balance_info += f"总额: {amount_str}  已用: {used_str}  剩余: {available_str}\n"
+                            if expires and expires != "Unknown":
+                                # 尝试格式化过期时间
+                                try:
+                                    # 如果是ISO格式的时间字符串，转为更易读的格式
+                                    if 'T' in expires and 'Z' in expires:
+                                        dt = datetime.fromisoformat(expires.replace('Z', '+00:00'))
+                                        expires = dt.strftime('%Y-%m-%d %H:%M:%S')
+                                except:
+                                    pass  # 如果转换失败，保持原格式
+                                balance_info += f"过期时间: {expires}\n\n"
+
+                    # 如果没有找到特定格式，则显示原始数据
                     else:
-                        current_chunk.append(line)
+                        balance_info += "未识别的余额信息格式，显示原始数据:\n\n"
+                        balance_info += str(data)
 
-                    current_type = f"函数({function_name})"
-                    in_function = True
-                    # 记录函数开始时的大括号栈深度
-                    function_brace_depth = len(brace_stack)
-                    if '{' in line:
-                        function_brace_depth += 1  # 如果当前行有左大括号，调整深度
-                continue
+                    # 显示余额信息
+                    balance_text.insert(tk.END, balance_info)
+                    # 更新状态
+                    status_var.set("余额查询成功")
+                except Exception as ex:
+                    # 处理解析数据异常
+                    balance_text.insert(tk.END, f"解析余额信息失败: {str(ex)}\n")
+                    if "data" in result:
+                        balance_text.insert(tk.END, f"原始数据: {str(result['data'])}")
+                    status_var.set("余额数据解析失败")
+            else:
+                # 显示错误信息
+                error_message = result.get('message', '未知错误')
+                balance_text.insert(tk.END, f"查询失败: {error_message}\n")
 
-            # 检测函数/方法结束 - 使用大括号栈来判断
-            if in_method and '}' in line:
-                current_chunk.append(line)
-                # 检查当前行后大括号栈的深度是否回到方法开始前的水平
-                if len(brace_stack) < method_brace_depth:
-                    # 检查是否有连续的大括号结束（可能是嵌套方法或类的结束）
-                    next_lines_have_method = False
-                    next_method_line = 0
-                    # 向前查看，寻找下一个方法定义或非空行
-                    for j in range(i + 1, min(i + 20, len(lines))):
-                        next_line = lines[j].strip()
-                        # 跳过空行和注释行
-                        if not next_line or next_line.startswith('//') or next_line.startswith('/*'):
-                            continue
+                # 如果有原始响应，也显示出来
+                if 'raw' in result:
+                    balance_text.insert(tk.END, f"原始响应: {result['raw'][:200]}...")
+
+                # 更新状态
+                status_var.set("余额查询失败")
+
+            balance_text.config(state=tk.DISABLED)
+
+        # 状态标签
+        status_var = tk.StringVar(value="")
+        status_label = ttk.Label(frame, textvariable=status_var, foreground="green")
+        status_label.grid(row=5, column=0, sticky=tk.W, pady=10)
+
+        # 按钮框架 - 移到状态标签同一行，靠右显示
+        btn_frame = ttk.Frame(frame)
+        btn_frame.grid(row=5, column=1, pady=10, sticky=tk.E)
+
+        # 应用配置按钮（应用后关闭窗口）
+        def apply_settings():
+            # 更新配置
+            self.config['DEFAULT']['API_KEY'] = api_key_var.get()
+            self.config['DEFAULT']['API_ENDPOINT'] = api_endpoint_var.get()
+            self.config['DEFAULT']['TIMEOUT'] = timeout_var.get()
+            self.config['DEFAULT']['PROMPT_TEMPLATE'] = prompt_var.get()
+
+            # 保存配置并重新加载
+            self._save_config()
+
+            # 更新状态
+            status_var.set("配置已应用")
+            # 应用后关闭窗口
+            settings_window.after(1000, settings_window.destroy)
+
+        # 应用按钮 - 增加宽度
+        apply_btn = ttk.Button(btn_frame, text="应用", command=apply_settings, width=20)
+        apply_btn.pack(side=tk.LEFT, padx=25, pady=10)
+
+        # 查询余额按钮 - 增加宽度
+        query_btn = ttk.Button(btn_frame, text="查询余额", command=query_balance, width=20)
+        query_btn.pack(side=tk.LEFT, padx=25, pady=10)
+
+        # 居中显示窗口
+        settings_window.update_idletasks()
+        width = settings_window.winfo_width()
+        height = settings_window.winfo_height()
+        x = (settings_window.winfo_screenwidth() // 2) - (width // 2)
+        y = (settings_window.winfo_screenheight() // 2) - (height // 2)
+        settings_window.geometry(f"{width}x{height}+{x}+{y}")
+
+        # 设置焦点到API密钥输入框
+        api_key_entry.focus_set()
+
+    def check_validation_result(self):
+        """检查验证结果"""
+        now = time.time()
+        try:
+            event_type, result, _ = self.event_queue.get_nowait()
+
+            if event_type == 'api_validation':
+                if result:
+                    self.config['DEFAULT']['API_KEY'] = self.api_key
+                    self._save_config()
+                    self.api_validated = True  # 设置API验证状态为已验证成功
+                    self.status_bar.config(text="API密钥验证通过")
+                    return True
+                else:
+                    self.api_validated = False  # 设置API验证状态为验证失败
+                    self.status_bar.config(text="API密钥无效")
+                    return False
+        except Empty:
+            pass
+
+        time_elapsed = now - self.validation_start_time
+
+        if time_elapsed > 15:
+            self.status_bar.config(text="API服务器响应超时")
+            return
+
+        self.root.after(50, self.check_validation_result)
+        return None
+
+    def retry_api_validation(self):
+        """重试API验证 - 已移除实际验证逻辑"""
+        self.api_validated = True
+        return True
+
+    # ------------------ UI同步方法 ------------------ #
+    def show_detail(self, event):
+        """显示漏洞详情（带格式优化）"""
+        selected = self.result_tree.selection()
+        if not selected:
+            return
+
+        item = self.result_tree.item(selected[0])
+        values = item['values']
+
+        # 格式化修复建议（新增格式处理）
+        repair_advice = values[7].replace('；', '\n')  # 中文分号转行
+        repair_advice = re.sub(r'\d+\.\s*', '', repair_advice)  # 移除已有编号
+
+        details = f"""文件路径：{values[3]}
+━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+风险等级：{values[2]}
+━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+漏洞类型：{values[1]}
+━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+风险点：{values[5]}
+━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+Payload：{values[6]}
+━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+详细描述：{values[4]}
+━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+修复建议：\n"""
+
+        # 添加带格式的修复建议（新增内容）
+        self.detail_text.config(state='normal')
+        self.detail_text.delete(1.0, tk.END)
+
+        # 插入基础信息
+        self.detail_text.insert(tk.END, details)
+
+        # 格式化修复建议（新增高亮逻辑）
+        for i, line in enumerate(repair_advice.split('\n'), 1):
+            if line.strip():
+                self.detail_text.insert(tk.END, f"{i}. ", 'repair_title')
+                self.detail_text.insert(tk.END, f"{line.strip()}\n", 'repair_content')
+
+        self.detail_text.config(state='disabled')
+
+        # 添加标签配置（新增样式配置）
+        self.detail_text.tag_configure('repair_title', foreground='#0078D7', font=('微软雅黑', 10, 'bold'))
+        self.detail_text.tag_configure('repair_content', foreground='#333333', font=('微软雅黑', 10))
+
+    def sync_scroll(self, event=None):
+        """同步滚动行号和代码"""
+        if hasattr(self, 'line_number') and self.line_number and self.code_text:
+            self.line_number.yview_moveto(self.code_text.yview()[0])
+            self.update_line_numbers()
+        return "break"
+
+    def update_line_numbers(self, event=None):
+        """更新行号"""
+        if hasattr(self, 'line_number') and self.line_number and self.code_text:
+            # 添加递归保护标志
+            if hasattr(self, '_updating_line_numbers') and self._updating_line_numbers:
+                return
+
+            self._updating_line_numbers = True
+            try:
+                # 获取可见区域的第一行和最后一行
+                first_line = self.code_text.index("@0,0").split('.')[0]
+                last_line = self.code_text.index(f"@0,{self.code_text.winfo_height()}").split('.')[0]
+
+                # 计算行数
+                first = int(float(first_line))
+                last = int(float(last_line)) + 1
+
+                # 清除现有行号
+                self.line_number.config(state='normal')
+                self.line_number.delete(1.0, tk.END)
+
+                # 计算行号宽度 - 更精确地计算所需宽度
+                max_line = int(last_line)
+                width = len(str(max_line)) + 1  # 添加一点额外空间
+                self.line_number.config(width=width)
+
+                # 添加新行号 - 右对齐显示
+                for i in range(first, last):
+                    self.line_number.insert(tk.END, f"{i:>{width - 1}}\n")  # 使用右对齐格式
+
+                self.line_number.config(state='disabled')
+
+                # 同步滚动位置 - 使用原始的yview方法
+                if hasattr(self, '_original_code_text_yview'):
+                    yview_pos = self._original_code_text_yview()[0]
+                else:
+                    yview_pos = self.code_text.yview()[0]
+
+                self.line_number.yview_moveto(yview_pos)
+            finally:
+                self._updating_line_numbers = False
+
+    def preview_code(self, event=None):
+        """预览选中文件的代码"""
+        # 统一获取选中项逻辑，无论是通过事件触发还是直接调用
+        item = self.tree.selection()[0] if self.tree.selection() else None
+
+        if not item:
+            return  # 提前返回避免空指针
+
+        try:
+            # 获取完整路径并验证文件类型
+            file_path = Path(self.tree.item(item, 'values')[0])
+            if not file_path.is_file():
+                return
+
+            # 读取文件内容
+            with open(file_path, 'r', encoding='utf-8', errors='replace') as f:
+                content = f.read()
+
+            # 清空并更新代码显示
+            self.code_text.config(state='normal')
+            self.code_text.delete(1.0, tk.END)
+            self.code_text.insert(1.0, content)
+
+            # 应用语法高亮 - 防止递归调用
+            if hasattr(self, '_highlighting_in_progress') and self._highlighting_in_progress:
+                return
+
+            self._highlighting_in_progress = True
+            try:
+                self._apply_syntax_highlighting(file_path.suffix)
+            finally:
+                self._highlighting_in_progress = False
+
+            # 更新行号
+            self.update_line_numbers()
+
+        except RecursionError:
+            self.log_error(f"预览代码失败: 递归深度超出限制")
+            messagebox.showerror("预览失败", "文件过大或结构过于复杂，无法完成预览")
+        except Exception as e:
+            self.log_error(f"预览代码失败: {str(e)}")
+            messagebox.showerror("预览失败", f"无法读取文件: {str(e)}")
+
+    def _apply_syntax_highlighting(self, file_ext):
+        """应用语法高亮"""
+        # 清除现有标签
+        for tag in self.code_text.tag_names():
+            if tag != "sel":  # 保留选择标签
+                self.code_text.tag_remove(tag, "1.0", tk.END)
+
+        # 获取代码内容
+        code = self.code_text.get("1.0", tk.END)
+
+        # 根据文件类型应用高亮
+        if file_ext in self.supported_langs:
+            self._highlight_code(code, file_ext)
+
+        # 更新行号
+        self.update_line_numbers()
+
+        # 绑定滚动事件，确保行号与代码同步滚动
+        if not hasattr(self, '_scroll_binding_set'):
+            # 绑定各种可能触发滚动的事件
+            self.code_text.bind("<Configure>", self.update_line_numbers)
+            self.code_text.bind("<KeyPress>", self.update_line_numbers)
+            self.code_text.bind("<KeyRelease>", self.update_line_numbers)
+            self.code_text.bind("<MouseWheel>", self.update_line_numbers)
+
+            # 保存原始的yview方法，避免递归调用
+            self._original_code_text_yview = self.code_text.yview
+
+            # 重写Text组件的yview方法以触发自定义事件
+            def custom_yview(*args):
+                # 调用原始方法获取结果
+                result = self._original_code_text_yview(*args)
+
+                # 避免递归调用
+                if not hasattr(self, '_updating_line_numbers') or not self._updating_line_numbers:
+                    self.update_line_numbers()
+
+                return result
+
+            self.code_text.yview = custom_yview
+
+            # 查找代码文本区域的滚动条
+            code_scrollbar = None
+            for child in self.code_text.master.winfo_children():
+                if isinstance(child, ttk.Scrollbar) and child.cget('orient') == 'vertical':
+                    code_scrollbar = child
+                    break
+
+            # 如果找到滚动条，绑定其set方法
+            if code_scrollbar:
+                # 不直接替换set方法，而是使用monkey patching技术
+                original_set = code_scrollbar.set
+
+                def custom_set_wrapper(first, last):
+                    # 调用原始set方法
+                    original_set(first, last)
+
+                    # 避免递归调用
+                    if not hasattr(self, '_updating_line_numbers') or not self._updating_line_numbers:
+                        self.update_line_numbers()
+                    return None
+
+                # 替换为包装后的方法
+                code_scrollbar.set = custom_set_wrapper
+
+            self._scroll_binding_set = True
+
+    def _highlight_code(self, code, file_ext):
+        """执行语法高亮"""
+        # 公共语法元素（优化正则表达式和颜色配置）
+        number_pattern = r'\b\d+\.?\d*\b'
+        operator_pattern = r'(\+|\-|\*|\/|\%|\=|\&|\||\<|\>|!|\^|~|\?|:)'
+        bracket_pattern = r'[{}()\[\]]'
+        common_patterns = [
+            (number_pattern, 'number', '#6897BB'),  # 数字 - 蓝紫色
+            (operator_pattern, 'operator', '#A9B7C6'),  # 运算符 - 浅灰色
+            (bracket_pattern, 'bracket', '#A9B7C6')  # 括号 - 浅灰色
+        ]
+        # 初始化patterns并添加返回条件
+        patterns = []
+
+        # 高亮公共元素
+        for pattern, tag, *args in common_patterns:
+            color = args[0] if args else None
+            if color:
+                self.code_text.tag_configure(tag, foreground=color)
+            for match in self._find_matches(pattern, code):
+                self.code_text.tag_add(tag, match[0], match[1])
+
+        # HTML特定规则
+        if file_ext == '.html' or file_ext == '.htm':
+            patterns = [
+                (r'<\!DOCTYPE.*?>', 'html_doctype', '#800080'),  # DOCTYPE声明
+                (r'<\!--.*?-->', 'comment', '#999999'),  # 注释
+                (r'</?[a-zA-Z][a-zA-Z0-9]*(?:\s+[a-zA-Z][a-zA-Z0-9]*(?:=(?:"[^"]*"|\'[^\']*\'|[^\s>]*))?)*\s*/?>',
+                 'html_tag', '#0000FF'),  # 标签
+                # 修复属性名和属性值的正则表达式，移除不兼容的后向查找
+                (r'<[^>]*\s([a-zA-Z][a-zA-Z0-9\-]*)=', 'html_attribute', '#FF8C00', 1),  # 属性名
+                (r'=("[^"]*"|\'[^\']*\')', 'html_value', '#008000', 1),  # 属性值
+                (r'&[a-zA-Z0-9]+;', 'html_entity', '#800080'),  # HTML实体
+                (r'<script\b[^>]*>(.*?)</script>', 'html_script', '#A52A2A', re.DOTALL),  # script标签
+                (r'<style\b[^>]*>(.*?)</style>', 'html_style', '#2E8B57', re.DOTALL),  # style标签
+                (r'{{.*?}}|\{%.*?%\}', 'html_template', '#CC7832')  # 模板语法(如Angular, Vue等)
+            ]
+
+            # 添加HTML标签关键字高亮 - 修复标签名称的正则表达式
+            html_tags = [
+                'html', 'head', 'body', 'div', 'span', 'p', 'a', 'img', 'table', 'tr', 'td', 'th',
+                'ul', 'ol', 'li', 'form', 'input', 'button', 'select', 'option', 'textarea',
+                'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'header', 'footer', 'nav', 'section', 'article',
+                'aside', 'main', 'canvas', 'audio', 'video', 'source', 'iframe', 'script', 'style',
+                'link', 'meta', 'title', 'base', 'br', 'hr', 'pre', 'code', 'em', 'strong', 'i', 'b'
+            ]
+            # 使用捕获组替代后向查找
+            tag_pattern = r'</?(' + '|'.join(html_tags) + r')[\s>]'
+            patterns.append((tag_pattern, 'html_tag_name', '#0000CD', 1))
+
+        # XML特定规则
+        elif file_ext == '.xml':
+            patterns = [
+                (r'<\?xml.*?\?>', 'xml_declaration', '#007F7F'),  # XML声明
+                (r'<!--.*?-->', 'comment', '#999999'),  # 注释
+                (r'<[^>]+>', 'tag', '#CC6600'),  # 标签
+                (r'"[^"]*"', 'string', '#008000'),  # 属性值
+                (r'\bxmlns\b', 'keyword', '#CC7832'),  # 命名空间
+                (r'\bversion\b|\bencoding\b', 'attribute', '#9B59B6')  # 属性
+            ]
+
+        # PHP特定规则（新增变量高亮）
+        elif file_ext == '.php':
+            # 扩展PHP高亮
+            patterns = [
+                (r'\$[a-zA-Z_\x7f-\xff][a-zA-Z0-9_\x7f-\xff]*', 'php_var', '#9B59B6'),  # 紫色变量
+                (r'\$_(GET|POST|REQUEST|COOKIE|SESSION|SERVER|ENV|FILES)', 'php_superglobal', '#CC0000'),  # 超全局变量
+                (r'(function)\s+([a-zA-Z_\x7f-\xff][a-zA-Z0-9_\x7f-\xff]*)', 'php_function', ('#006699', 2)),  # 函数声明
+                (r'(class|interface|trait)\s+(\w+)', 'php_class', ('#007F7F', 2)),  # 类名
+                (r'(namespace)\s+([a-zA-Z0-9_\\]+)', 'php_namespace', ('#808000', 2)),  # 命名空间
+                (r'(use)\s+([a-zA-Z0-9_\\]+)', 'php_namespace', ('#808000', 2)),  # use语句
+                (r'\b([A-Z][A-Z0-9_]*)\b', 'php_constant', '#660E7A'),  # 常量
+                (r'//.*?$|/\*.*?\*/', 'comment', '#999999'),  # 注释
+                (r'(".*?"|\'.*?\')', 'string', '#008000'),  # 字符串
+                (r'<\?php|\?>', 'php_tag', '#8B008B')  # PHP标签
+            ]
+
+            # 新增PHP关键字
+            php_keywords = [
+                'echo', 'print', 'die', 'exit', 'isset', 'empty',
+                'include', 'require', 'include_once', 'require_once',
+                'array', 'list', 'foreach', 'as', 'do', 'declare',
+                'if', 'else', 'elseif', 'switch', 'case', 'default',
+                'while', 'for', 'break', 'continue', 'return',
+                'global', 'static', 'final', 'abstract', 'private', 'protected',
+                'public', 'var', 'const', 'clone', 'try', 'catch', 'throw',
+                'finally', 'instanceof', 'insteadof', 'interface', 'implements',
+                'extends', 'trait', 'yield', 'yield from', 'fn', 'match'
+            ]
+            patterns.append((r'\b(' + '|'.join(php_keywords) + r')\b', 'php_keyword', '#CC7832'))
+
+            # 新增PHP内置函数
+            php_builtin_functions = [
+                'array_merge', 'count', 'strlen', 'substr', 'str_replace',
+                'preg_match', 'preg_replace', 'explode', 'implode', 'trim',
+                'file_get_contents', 'file_put_contents', 'fopen', 'fclose',
+                'mysql_query', 'mysqli_query', 'PDO', 'json_encode', 'json_decode'
+            ]
+            patterns.append((r'\b(' + '|'.join(php_builtin_functions) + r')\b(?=\s*\()', 'php_function', '#006699'))
+
+        # Java特定规则（增强高亮显示 - 使用更深的颜色）
+        elif file_ext == '.java':
+            patterns = [
+                # 基础元素
+                (r'@[a-zA-Z_$][a-zA-Z\d_$]*', 'java_annotation', '#FF8C00'),  # 注解 - 深橙色
+                (r'\b([A-Z_][A-Z0-9_]+)\b', 'java_constant', '#9370DB'),  # 常量 - 深紫色
+                (r'//.*?$|/\*.*?\*/', 'java_comment', '#5D6C79'),  # 注释 - 深灰色
+                (r'\".*?\"', 'java_string', '#008B45'),  # 字符串 - 深绿色
+                (r'\'.*?\'', 'java_char', '#008B45'),  # 字符 - 深绿色
+
+                # 类型和声明
+                (r'(class|interface|enum|record)\s+(\w+)', 'java_class_decl', ('#1E6262', 2)),  # 类声明 - 深青色
+                (r'\b(void|int|byte|short|long|float|double|char|boolean)\b', 'java_primitive', '#0000CD'),
+                # 基本类型 - 深蓝色
+                (r'\b([A-Z][a-zA-Z0-9_]*)\b(?!\s*\()', 'java_class_ref', '#1E6262'),  # 类引用 - 深青色
+
+                # 方法和函数
+                (r'(public|private|protected|static)?\s+([a-zA-Z_$][a-zA-Z\d_$]*)\s*\(', 'java_method_decl',
+                 ('#E8A317', 2)),  # 方法声明 - 深橙色
+                (r'\b([a-zA-Z_$][a-zA-Z\d_$]*)\s*\(', 'java_method_call', '#4F4F4F'),  # 方法调用 - 深灰色
+
+                # 泛型
+                (r'<([A-Z][a-zA-Z0-9_]*(?:\s*,\s*[A-Z][a-zA-Z0-9_]*)*)>', 'java_generic', '#7B68EE'),  # 泛型 - 深紫色
+                (r'<\?\s+(?:extends|super)\s+[A-Z][a-zA-Z0-9_]*>', 'java_wildcard', '#7B68EE'),  # 通配符 - 深紫色
+
+                # Lambda和函数式
+                (r'\([^()]*\)\s*->\s*[^;]+', 'java_lambda', '#D2691E'),  # Lambda表达式 - 深橙色
+                (r'::', 'java_method_ref', '#D2691E'),  # 方法引用 - 深橙色
+
+                # 异常处理
+                (r'\b(try|catch|throw|throws|finally)\b', 'java_exception', '#B22222'),  # 异常处理关键字 - 深红色
+
+                # 包和导入
+                (r'\b(import|package)\b.*?;', 'java_import', '#696969'),  # 导入语句 - 深灰色
+
+                # 注释标签
+                (r'@(param|return|throws|author|version|since|see|deprecated)\b', 'java_doc_tag', '#2E8B57'),
+                # JavaDoc标签 - 深绿色
+
+                # 修饰符
+                (
+                    r'\b(public|private|protected|static|final|abstract|synchronized|volatile|transient|native|strictfp)\b',
+                    'java_modifier', '#D2691E'),  # 修饰符 - 深橙色
+
+                # 数字字面量
+                (r'\b(\d+\.?\d*[fFlL]?)\b', 'java_number', '#4169E1'),  # 数字 - 深蓝色
+                (r'\b(0x[0-9a-fA-F]+)\b', 'java_hex', '#4169E1'),  # 十六进制 - 深蓝色
+
+                # 特殊语法
+                (r'\?|:', 'java_ternary', '#D2691E'),  # 三元运算符 - 深橙色
+                (r'\b(instanceof)\b', 'java_instanceof', '#D2691E'),  # instanceof - 深橙色
+                (r'\b(new)\b', 'java_new', '#D2691E'),  # new关键字 - 深橙色
+            ]
 
-                        # 如果找到了方法定义
-                        if re.match(r'^\s*(public\s+|private\s+|protected\s+|static\s+)*(function)\s+(\w+)', next_line):
-                            next_lines_have_method = True
-                            next_method_line = j
-                            break
+            # Java关键字
+            java_keywords = [
+                'if', 'else', 'switch', 'case', 'default', 'for', 'do', 'while', 'break', 'continue',
+                'return', 'this', 'super', 'extends', 'implements', 'null', 'true', 'false',
+                'assert', 'enum', 'var', 'yield', 'sealed', 'permits', 'non-sealed', 'record'
+            ]
+            patterns.append((r'\b(' + '|'.join(java_keywords) + r')\b', 'java_keyword', '#D2691E'))  # 关键字 - 深橙色
 
-                        # 如果找到了非方法定义的代码行，将其包含在当前方法中
-                        if not next_line.startswith('}'):
-                            # 将这些行添加到当前块中
-                            for k in range(i + 1, j + 1):
-                                current_chunk.append(lines[k])
-                            i = j  # 更新循环索引
-                            break
+            # Java注解关键字
+            java_annotations = [
+                'Override', 'Deprecated', 'SuppressWarnings', 'FunctionalInterface',
+                'SafeVarargs', 'Target', 'Retention', 'Documented', 'Inherited'
+            ]
+            patterns.append(
+                (r'@(' + '|'.join(java_annotations) + r')\b', 'java_std_annotation', '#DAA520'))  # 标准注解 - 深黄色
 
-                    # 如果找到了下一个方法定义，结束当前方法块
-                    if next_lines_have_method:
-                        # 方法结束
-                        chunks.append(('\n'.join(current_chunk), chunk_start_line, next_method_line - 1, current_type))
-                        current_chunk = []
-                        chunk_start_line = next_method_line
-                        current_type = f"类内代码({class_name})"
-                        in_method = False
-                        continue
+        # 应用语言特定规则
+        for pattern, tag, *args in patterns:
+            # 提取颜色和分组参数
+            color = None
+            group = 0
+            flags = 0
 
-            # 检测独立函数结束 - 类似的逻辑修改
-            if in_function and not in_class and '}' in line:
-                current_chunk.append(line)
-                # 检查当前行后大括号栈的深度是否回到函数开始前的水平
-                if len(brace_stack) < function_brace_depth:
-                    # 检查是否有连续的大括号结束（可能是嵌套函数的结束）
-                    next_lines_have_function = False
-                    next_function_line = 0
+            if args:
+                if isinstance(args[0], tuple):  # 处理带分组的颜色配置
+                    color = args[0][0]
+                    group = args[0][1] if len(args[0]) > 1 else 0
+                elif isinstance(args[0], int) and args[0] < 100:  # 处理捕获组索引
+                    group = args[0]
+                elif isinstance(args[0], int):  # 处理正则标志
+                    flags = args[0]
+                else:  # 普通颜色配置
+                    color = args[0]
 
-                    # 向前查看，寻找下一个函数定义或非空行
-                    for j in range(i + 1, min(i + 20, len(lines))):
-                        next_line = lines[j].strip()
-                        # 跳过空行和注释行
-                        if not next_line or next_line.startswith('//') or next_line.startswith('/*'):
-                            continue
+                if len(args) > 1 and isinstance(args[1], int):
+                    if args[1] < 100:  # 假设捕获组索引小于100
+                        group = args[1]
+                    else:  # 正则标志
+                        flags = args[1]
 
-                        # 如果找到了函数定义
-                        if re.match(r'^\s*(function)\s+(\w+)', next_line):
-                            next_lines_have_function = True
-                            next_function_line = j
-                            break
+            try:
+                for match in self._find_matches(pattern, code, flags):
+                    try:
+                        if len(match) > 2 and group > 0:  # 使用捕获组
+                            # 获取原始匹配文本的位置
+                            full_start_pos = match[0]
+                            full_end_pos = match[1]
 
-                        # 如果找到了非函数定义的代码行，将其包含在当前函数中
-                        if not next_line.startswith('}'):
-                            # 将这些行添加到当前块中
-                            for k in range(i + 1, j + 1):
-                                current_chunk.append(lines[k])
-                            i = j  # 更新循环索引
-                            break
+                            # 计算捕获组在原始文本中的相对位置
+                            full_start_idx = int(full_start_pos.split('+')[1].split('c')[0])
 
-                    # 如果找到了下一个函数定义，结束当前函数块
-                    if next_lines_have_function:
-                        # 函数结束
-                        chunks.append(
-                            ('\n'.join(current_chunk), chunk_start_line, next_function_line - 1, current_type))
-                        current_chunk = []
-                        chunk_start_line = next_function_line
-                        current_type = "全局代码"
-                        in_function = False
-                        continue
+                            # 在原始文本中查找捕获组
+                            match_text = code[full_start_idx - 1:full_start_idx - 1 + (
+                                    int(full_end_pos.split('+')[1].split('c')[0]) - full_start_idx)]
 
-            # 检测类结束
-            if in_class and '}' in line and not in_method:
-                current_chunk.append(line)
-                # 检查是否是类的结束大括号
-                if len(brace_stack) == 0:
-                    # 检查下一个非空行是否是另一个类或函数的开始
-                    next_class_or_function = False
-                    next_line_index = 0
+                            # 使用正则表达式重新匹配以获取捕获组
+                            m = re.search(pattern, match_text, flags=flags | re.MULTILINE)
+                            if m and m.group(group):
+                                # 计算捕获组的位置
+                                group_start = m.start(group) - m.start(0)
+                                group_length = len(m.group(group))
 
-                    # 向前查看，寻找下一个类或函数定义或非空行
-                    for j in range(i + 1, min(i + 20, len(lines))):
-                        next_line = lines[j].strip()
-                        # 跳过空行和注释行
-                        if not next_line or next_line.startswith('//') or next_line.startswith('/*'):
-                            continue
+                                # 计算最终位置
+                                start = f"1.0 + {full_start_idx + group_start - 1}c"
+                                end = f"1.0 + {full_start_idx + group_start + group_length - 1}c"
 
-                        # 如果找到了类或函数定义
-                        if re.match(r'^\s*(abstract\s+|final\s+)?class\s+(\w+)', next_line) or \
-                                re.match(r'^\s*(function)\s+(\w+)', next_line):
-                            next_class_or_function = True
-                            next_line_index = j
-                            break
+                                if color:
+                                    self.code_text.tag_configure(tag, foreground=color)
+                                self.code_text.tag_add(tag, start, end)
+                        else:
+                            # 处理普通匹配
+                            start = match[0]
+                            end = match[1]
 
-                        # 如果找到了非类或函数定义的代码行，将其包含在当前类中
-                        # 将这些行添加到当前块中
-                        for k in range(i + 1, j + 1):
-                            current_chunk.append(lines[k])
-                        i = j  # 更新循环索引
-                        break
+                            if color:
+                                self.code_text.tag_configure(tag, foreground=color)
+                            self.code_text.tag_add(tag, start, end)
+                    except Exception as e:
+                        print(f"应用标签错误: {tag} - {str(e)}")
+            except Exception as e:
+                print(f"处理正则表达式错误: {pattern} - {str(e)}")
 
-                    # 如果找到了下一个类或函数定义，结束当前类块
-                    if next_class_or_function:
-                        chunks.append(('\n'.join(current_chunk), chunk_start_line, next_line_index - 1, current_type))
-                        current_chunk = []
-                        chunk_start_line = next_line_index
-                        current_type = "全局代码"
-                        in_class = False
-                        class_name = ""
-                        continue
+    def _find_matches(self, pattern, text, group=0):
+        """查找所有匹配项，返回位置列表"""
+        try:
+            # 添加最大迭代次数限制，防止无限递归
+            max_iterations = 10000
+            iteration_count = 0
 
-            # 添加到当前块
-            current_chunk.append(line)
+            matches = []
+            start = "1.0"
 
-        # 添加最后一个块
-        if current_chunk:
-            chunks.append(('\n'.join(current_chunk), chunk_start_line, len(lines), current_type))
+            while True:
+                iteration_count += 1
+                if iteration_count > max_iterations:
+                    # 达到最大迭代次数，中断处理
+                    self.log_error(f"语法高亮处理中断: 达到最大迭代次数 {max_iterations}")
+                    break
 
-        # 合并过小的块和注释块
-        merged_chunks = []
-        min_chunk_size = 50  # 最小块大小
-        current_merged = None
-        i = 0
+                pos = self.code_text.search(pattern, start, tk.END, regexp=True)
+                if not pos:
+                    break
 
-        while i < len(chunks):
-            chunk = chunks[i]
-            code, start, end, chunk_type = chunk
-            code_lines = code.splitlines()
+                line, col = map(int, pos.split('.'))
+                end_line, end_col = line, col
 
-            # 检查是否是注释块或者过小的块
-            is_comment_block = all(
-                line.strip().startswith("//") or line.strip().startswith("/*") or line.strip().startswith(
-                    "*") or not line.strip() for line in code_lines)
-            is_small_block = len(code_lines) < min_chunk_size
+                # 计算匹配文本的结束位置
+                match_text = self.code_text.get(pos, f"{pos} lineend")
+                match = re.search(pattern, match_text)
+                if not match:
+                    # 如果没有匹配到，移动到下一行继续
+                    start = f"{line + 1}.0"
+                    continue
 
-            # 如果是注释块或者过小的块，并且不是类定义或方法定义，考虑合并
-            if (is_comment_block or is_small_block) and not chunk_type.startswith(
-                    "类定义") and not chunk_type.startswith("方法") and not chunk_type.startswith("函数"):
-                # 尝试与下一个块合并（如果是函数或方法）
-                if i < len(chunks) - 1:
-                    next_chunk = chunks[i + 1]
-                    next_code, next_start, next_end, next_type = next_chunk
+                # 计算匹配文本的结束位置
+                match_length = match.end(group) - match.start(group)
+                end_pos = f"{line}.{col + match_length}"
 
-                    if next_type.startswith("函数") or next_type.startswith("方法"):
-                        # 将当前注释块合并到下一个函数/方法块
-                        merged_code = code + "\n" + next_code
-                        merged_chunk = (merged_code, start, next_end, next_type)
-                        chunks[i + 1] = merged_chunk
-                        i += 1
-                        continue
+                # 添加匹配结果
+                matches.append((f"{line}.{col + match.start(group)}", f"{line}.{col + match.end(group)}"))
 
-                # 尝试与上一个合并的块或当前块合并
-                if current_merged is not None:
-                    # 合并小块
-                    merged_code, merged_start, merged_end, merged_type = current_merged
-                    current_merged = (merged_code + "\n" + code, merged_start, end, f"{merged_type}+{chunk_type}")
-                else:
-                    current_merged = chunk
-            else:
-                if current_merged is not None:
-                    merged_chunks.append(current_merged)
-                    current_merged = None
-                merged_chunks.append(chunk)
+                # 更新下一次搜索的起始位置
+                start = end_pos
 
-            i += 1
+            return matches
+        except RecursionError:
+            self.log_error("语法高亮递归错误")
+            return []
+        except Exception as e:
+            self.log_error(f"查找匹配项错误: {str(e)}")
+            return []
+
+    def _populate_tree(self, path, parent=''):
+        """递归填充文件树"""
+        try:
+            # 获取排序后的目录和文件列表（保持排序逻辑）
+            dirs = sorted([d for d in path.iterdir()
+                           if d.is_dir() and not d.name.startswith('.')],
+                          key=lambda x: x.name.lower())
+
+            files = sorted([f for f in path.iterdir()
+                            if f.is_file() and not f.name.startswith('.')],
+                           key=lambda x: x.name.lower())
 
-        # 在函数末尾，返回chunks前添加排序代码
-        if current_merged is not None:
-            merged_chunks.append(current_merged)
+            # 先处理目录再处理文件（保持目录优先）
+            for item in dirs:
+                node = self.tree.insert(parent, 'end',
+                                        text=item.name,
+                                        values=[str(item)],
+                                        open=False)
+                # 添加一个临时子节点，表示该目录可以展开
+                self.tree.insert(node, 'end', text="加载中...", values=["loading"])
 
-        # 按照起始行号排序分块
-        sorted_chunks = sorted(merged_chunks if merged_chunks else chunks, key=lambda x: x[1])
+                # 绑定展开事件，只有当用户展开目录时才加载子目录内容
+                if not hasattr(self, '_tree_expand_handler_set'):
+                    self.tree.bind('<<TreeviewOpen>>', self._on_tree_expand)
+                    self._tree_expand_handler_set = True
 
-        return sorted_chunks
+            # 处理文件
+            for item in files:
+                self.tree.insert(parent, 'end',
+                                 text=item.name,
+                                 values=[str(item)])
+        except Exception as e:
+            messagebox.showerror("目录错误", f"读取失败: {str(e)}")
 
-    def _is_in_string(self, line, pos):
-        """检查位置是否在字符串内"""
-        # 简单实现：计算位置前的引号数量
-        single_quotes = line[:pos].count("'") - line[:pos].count("\\'")
-        double_quotes = line[:pos].count('"') - line[:pos].count('\\"')
-        return (single_quotes % 2 == 1) or (double_quotes % 2 == 1)
+    def _on_tree_expand(self, event):
+        """当树节点展开时异步加载子节点"""
+        item_id = self.tree.focus()
 
-    def _chunk_java_code(self, lines):
-        """Java代码智能分块"""
-        chunks = []
-        current_chunk = []
-        current_type = "全局代码"
-        chunk_start_line = 1
-        brace_stack = []  # 使用栈来跟踪大括号匹配
-        in_class = False
-        in_method = False
-        in_comment = False
-        in_javadoc = False  # 新增：标记是否在Javadoc注释中
-        in_annotation = False
-        class_name = ""
-        method_name = ""
-        pending_method = False
-        pending_method_start = 0
-        class_brace_depth = 0
-        method_brace_depth = 0
+        # 检查是否已经加载过
+        children = self.tree.get_children(item_id)
+        if len(children) == 1 and self.tree.item(children[0], "values")[0] == "loading":
+            # 删除加载中的临时节点
+            self.tree.delete(children[0])
 
-        # 跳过所有导入语句和包声明
-        non_import_start_line = 1
-        import_lines = []
-        for i, line in enumerate(lines):
-            stripped = line.strip()
-            # 收集包声明或导入语句
-            if re.match(r'^\s*package\s+', line) or re.match(r'^\s*import\s+', line):
-                import_lines.append(line)
-                non_import_start_line = i + 2  # +2 是为了跳过当前行并从下一行开始
-                continue
-            # 找到第一个非导入语句，结束跳过
-            if stripped and not stripped.startswith("//") and not stripped.startswith("/*"):
-                break
+            # 获取目录路径
+            item_path = Path(self.tree.item(item_id, "values")[0])
 
-        # 更新起始行号
-        chunk_start_line = non_import_start_line
+            # 使用after方法在主线程空闲时异步加载
+            self.root.after(10, lambda: self._async_load_directory(item_path, item_id))
 
-        # 处理剩余代码
-        i = 0
-        while i < len(lines):
-            line = lines[i]
-            line_num = i + 1
+    def _async_load_directory(self, path, parent):
+        """异步加载目录内容"""
+        try:
+            # 显示加载状态
+            self.status_bar.config(text=f"正在加载: {path.name}")
 
-            # 跳过导入语句和包声明
-            if re.match(r'^\s*package\s+', line) or re.match(r'^\s*import\s+', line):
-                i += 1
-                continue
+            # 获取排序后的目录和文件列表
+            dirs = sorted([d for d in path.iterdir()
+                           if d.is_dir() and not d.name.startswith('.')],
+                          key=lambda x: x.name.lower())
 
-            stripped = line.strip()
+            files = sorted([f for f in path.iterdir()
+                            if f.is_file() and not f.name.startswith('.')],
+                           key=lambda x: x.name.lower())
 
-            # 处理Javadoc注释 - 新增逻辑
-            if stripped.startswith("/**"):
-                in_javadoc = True
-                javadoc_start = i
-                # 寻找Javadoc注释的结束
-                while i < len(lines) and "*/" not in lines[i]:
-                    i += 1
-                if i < len(lines):  # 找到了结束标记
-                    i += 1  # 跳过包含 */ 的行
-                in_javadoc = False
-                continue  # 跳过Javadoc注释，继续处理下一行
+            # 先处理目录再处理文件
+            for item in dirs:
+                node = self.tree.insert(parent, 'end',
+                                        text=item.name,
+                                        values=[str(item)],
+                                        open=False)
+                # 添加临时子节点
+                self.tree.insert(node, 'end', text="加载中...", values=["loading"])
 
-            # 处理普通多行注释
-            if "/*" in line and "*/" not in line and not in_javadoc:
-                in_comment = True
-            if "*/" in line and not in_javadoc:
-                in_comment = False
+            # 处理文件
+            for item in files:
+                self.tree.insert(parent, 'end',
+                                 text=item.name,
+                                 values=[str(item)])
 
-            # 处理注解
-            if stripped.startswith("@") and not stripped.endswith(")"):
-                in_annotation = True
-            if in_annotation and ")" in line:
-                in_annotation = False
+            # 恢复状态栏
+            self.status_bar.config(text="就绪")
+        except Exception as e:
+            self.log_error(f"异步加载目录失败: {str(e)}")
+            messagebox.showerror("目录错误", f"读取失败: {str(e)}")
 
-            # 跟踪大括号，忽略注释中的大括号
-            if not in_comment and not stripped.startswith("//"):
-                # 处理左大括号
-                for char_pos, char in enumerate(line):
-                    if char == '{':
-                        # 检查是否在字符串内
-                        if not self._is_in_string(line, char_pos):
-                            brace_stack.append('{')
-                    elif char == '}':
-                        # 检查是否在字符串内
-                        if not self._is_in_string(line, char_pos) and brace_stack:
-                            brace_stack.pop()
+    def _get_selected_files(self):
+        """获取选中的文件列表"""
+        selected_items = self.tree.selection()
+        return [
+            Path(self.tree.item(item, 'values')[0])
+            for item in selected_items
+            if Path(self.tree.item(item, 'values')[0]).is_file()
+        ]
 
-            # 检测类定义
-            class_match = re.match(
-                r'^\s*(public|private|protected)?\s*(static|final|abstract)?\s*(class|interface|enum)\s+(\w+)', line)
-            if not in_comment and not in_annotation and class_match and not in_class:
-                if current_chunk:
-                    chunks.append(('\n'.join(current_chunk), chunk_start_line, line_num - 1, current_type))
-                current_chunk = [line]
-                chunk_start_line = line_num
-                # 提取类名
-                class_name = class_match.group(4) if class_match.group(4) else "匿名类"
-                current_type = f"类定义({class_name})"
-                in_class = True
-                class_brace_depth = len(brace_stack)
-                pending_method = False  # 重置待处理方法注释状态
-                i += 1
-                continue
+    def display_results(self, file_path, vulnerabilities):
+        """显示结果入口方法：先写入结果数据库，再在UI线程中按漏洞ID插入结果表格"""
+        finding_ids = super().display_results(file_path, vulnerabilities)
+        self.root.after(0, self._safe_display_results, file_path, vulnerabilities, finding_ids)
 
-            # 改进后的方法匹配模式，支持注解和多个修饰符
-            method_match = re.match(
-                r'^\s*((@\w+\s*(\([^)]*\))?\s+)+)?\s*((?:public|private|protected|static|final|abstract|synchronized|native|transient|volatile)\s+)*\s*(?:<[^>]+>\s+)?[\w.<>\[\],\s]+?\s+(\w+)\s*\(',
-                line)
+    def process_event_queue(self):
+        """处理事件队列中的事件"""
+        try:
+            while True:
+                event, data, callback = self.event_queue.get_nowait()
 
-            # 如果没有匹配到标准方法定义，尝试匹配构造函数
-            if not method_match and in_class:
-                # 增强构造函数检测（支持注解和多个修饰符）
-                constructor_match = re.match(
-                    r'^\s*((@\w+\s+)*((public|private|protected|static|final|abstract|synchronized)\s+)*)*'
-                    + re.escape(class_name) + r'\s*\(', line)
-                if constructor_match:
-                    method_match = constructor_match
-                    method_name = class_name  # 构造函数名与类名相同
+                if event == 'result':
+                    file_path, vulnerabilities = data
+                    self.update_vulnerability_list(file_path, vulnerabilities)
 
-            if in_class and not in_comment and not in_annotation and method_match and not in_method:
-                # 提取方法名
-                if method_match.group(4) if len(method_match.groups()) >= 4 else None:
-                    method_name = method_match.group(4)
-                elif not method_name:  # 如果不是构造函数且没有提取到方法名
-                    method_name = "匿名方法"
+                elif event in ('partial_result', 'single_vuln'):
+                    # 处理增量更新：写入结果数据库并追加到表格
+                    file_path, chunk_vulnerabilities = data
+                    self._safe_display_results(file_path, chunk_vulnerabilities)
 
-                # 如果当前块不是类定义的一部分，则创建新块
-                if current_chunk and "类定义" not in current_type:
-                    chunks.append(('\n'.join(current_chunk), chunk_start_line, line_num - 1, current_type))
-                    current_chunk = []
-                    chunk_start_line = line_num
+                elif event == 'progress':
+                    self.update_progress()
 
-                # 添加方法定义行到当前块
-                current_chunk.append(line)
-                current_type = f"方法({class_name}.{method_name})"
-                in_method = True
-                method_brace_depth = len(brace_stack)
-                pending_method = False  # 重置待处理方法注释状态
-                i += 1
-                continue
+                elif event == 'error':
+                    error_msg = data
+                    self.show_error(error_msg)
 
-            # 检测方法结束 - 改进的逻辑
-            if in_method and '}' in line:
-                current_chunk.append(line)
+                # 添加对'done'事件的处理，用于重置分析按钮状态
+                elif event == 'done':
+                    # 重置分析按钮状态
+                    if hasattr(self, 'btn_analyze'):
+                        self.btn_analyze.config(text="开始分析", command=self.start_analysis)
+                    # 重置分析状态标志
+                    if hasattr(self, 'auto_analysis_cancelled'):
+                        self.auto_analysis_cancelled = False
+                    if hasattr(self, 'auto_analysis_paused'):
+                        self.auto_analysis_paused = False
+                    # 更新状态栏
+                    self.status_bar.config(text="分析完成")
 
-                # 检查大括号栈的深度是否回到方法开始前的水平
-                # 严格匹配大括号层级（考虑嵌套代码块）
-                if len(brace_stack) == method_brace_depth - 1 and re.search(r'^\s*}\s*$', line):
-                    # 查找下一个方法定义
-                    next_method_found = False
-                    for j in range(i + 1, min(i + 20, len(lines))):
-                        next_line = lines[j].strip()
-                        # 跳过空行和注释行
-                        if not next_line or next_line.startswith('//') or next_line.startswith('/*'):
-                            continue
+                if callback:
+                    callback()
 
-                        # 检查是否是方法定义
-                        next_method_match = re.match(
-                            r'^\s*(public|private|protected)?\s*(static|final|abstract|synchronized)?\s*(<.*>)?\s*[\w<>[\],\s\.]+\s+(\w+)\s*\(',
-                            next_line)
+                self.event_queue.task_done()
+        except queue.Empty:  # 修改这里，使用queue.Empty而不是Empty
+            pass
 
-                        if next_method_match or re.match(
-                                r'^\s*(public|private|protected)?\s*' + re.escape(class_name) + r'\s*\(', next_line):
-                            next_method_found = True
-                            break
+        # 继续轮询事件队列
+        self.root.after(100, self.process_event_queue)
 
-                        # 如果找到了非方法定义的实质性代码行，则不是方法结束
-                        if next_line and not re.match(r'^\s*(}|@|//)', next_line):
-                            break
+    def update_vulnerability_list(self, file_path, vulnerabilities):
+        """用新结果替换某个文件在本次运行中的漏洞"""
+        if self.result_store is not None:
+            self.result_store.delete_file_findings(self.session_scan_ids, file_path)
+        for item in self.result_tree.get_children():
+            if self.result_tree.item(item, 'values')[3] == str(file_path):
+                self.result_tree.delete(item)
+        self._safe_display_results(file_path, vulnerabilities)
 
-                    # 如果确认是方法结束
-                    if next_method_found or len(brace_stack) < method_brace_depth:
-                        chunks.append(('\n'.join(current_chunk), chunk_start_line, line_num, current_type))
-                        current_chunk = []
-                        chunk_start_line = line_num + 1
-                        current_type = f"类内代码({class_name})"
-                        in_method = False
-                        method_name = ""  # 重置方法名
-                i += 1
-                continue
+    def update_progress(self):
+        """更新进度显示"""
+        try:
+            # 更新进度条
+            if hasattr(self, 'progress') and self.progress:
+                current_value = self.progress['value']
+                self.progress['value'] = current_value + 1
 
-            # 检测类结束
-            if in_class and len(brace_stack) <= class_brace_depth and '}' in line:
-                current_chunk.append(line)
+                # 更新进度文本
+                total = len(self.files_to_analyze) if hasattr(self, 'files_to_analyze') and self.files_to_analyze else 0
+                current = int(self.progress['value'])
+                max_value = int(self.progress['maximum'])
 
-                # 检查是否是单独的结束括号行
-                if line.strip() == '}':
-                    # 检查下一个非空行是否是另一个类或方法的开始
-                    next_class_or_method = False
-                    next_line_index = 0
+                if max_value > 0:
+                    percentage = int(current / max_value * 100)
+                    self.status_bar.config(text=f"进度: {current}/{max_value} ({percentage}%) | "
+                                                f"并发上限: {self.request_engine.controller.current_limit}")
+        except Exception as e:
+            self.log_error(f"更新进度失败: {str(e)}")
 
-                    # 向前查看，寻找下一个类或方法定义
-                    for j in range(i + 1, min(i + 20, len(lines))):
-                        next_line = lines[j].strip()
-                        # 跳过空行和注释行
-                        if not next_line or next_line.startswith('//') or next_line.startswith('/*'):
-                            continue
+    def show_error(self, error_msg):
+        """显示错误信息"""
+        self.log_error(error_msg)
+        messagebox.showerror("错误", error_msg)
 
-                        # 如果找到了类或方法定义
-                        if (re.match(
-                                r'^(public|private|protected)?\s*(static|final|abstract)?\s*(class|interface|enum)\s+(\w+)',
-                                next_line) or
-                                re.match(
-                                    r'^(public|private|protected)?\s*(static|final|abstract|synchronized)?\s*(<.*>)?\s*[\w<>[\],\s\.]+\s+(\w+)\s*\(',
-                                    next_line)):
-                            next_class_or_method = True
-                            next_line_index = j
-                            break
+    def update_vulnerability_treeview(self):
+        """按结果数据库中本次运行的扫描结果重建漏洞列表视图"""
+        if self.result_store is None:
+            return
+        # 清空当前视图
+        for item in self.result_tree.get_children():
+            self.result_tree.delete(item)
+        vuln_id = 1
+        # 添加所有漏洞到视图
+        for finding_id, file_path, vuln in self.result_store.query(scan_ids=self.session_scan_ids):
+            # 获取行号字符串
+            line_numbers = ", ".join(map(str, vuln["行号"]))
+
+            # 获取风险等级并标准化
+            risk_level = vuln["风险等级"].strip()
+            tag = None
+
+            # 根据风险等级设置标签
+            if "高" in risk_level:
+                tag = "高危"
+            elif "中" in risk_level:
+                tag = "中危"
+            elif "低" in risk_level:
+                tag = "低危"
+            elif "提示" in risk_level or "信息" in risk_level:
+                tag = "提示"
+
+            # 插入到树形视图
+            item_id = self.result_tree.insert("", "end", iid=str(finding_id), values=(
+                str(vuln_id),
+                vuln["漏洞类型"],
+                vuln["风险等级"],
+                str(file_path),
+                vuln["详细描述"],
+                vuln["风险点"],
+                vuln["Payload"],
+                vuln["修复建议"],
+                line_numbers
+            ))
+
+            # 应用标签（如果有）
+            if tag:
+                self.result_tree.item(item_id, tags=(tag,))
+
+            vuln_id += 1
 
-                        # 如果找到了非类或方法定义的代码行
-                        break
+        # 更新状态栏
+        self.status_bar.config(text=f"共发现 {len(self.result_tree.get_children())} 个漏洞")
 
-                    # 如果找到了下一个类或方法定义，结束当前类块
-                    if next_class_or_method:
-                        chunks.append(('\n'.join(current_chunk), chunk_start_line, next_line_index - 1, current_type))
-                        current_chunk = []
-                        chunk_start_line = next_line_index
-                        current_type = "全局代码"
-                        in_class = False
-                        class_name = ""
-                    else:
-                        # 如果没有找到下一个类或方法，将这个结束括号与前面的代码合并
-                        chunks.append(('\n'.join(current_chunk), chunk_start_line, line_num, current_type))
-                        current_chunk = []
-                        chunk_start_line = line_num + 1
-                        current_type = "全局代码"
-                        in_class = False
-                        class_name = ""
-                else:
-                    # 如果不是单独的结束括号行，按原逻辑处理
-                    chunks.append(('\n'.join(current_chunk), chunk_start_line, line_num, current_type))
-                    current_chunk = []
-                    chunk_start_line = line_num + 1
-                    current_type = "全局代码"
-                    in_class = False
-                    class_name = ""
+    def log_info(self, message, file_path=None):
+        """记录信息日志，并同步显示到日志窗口"""
+        log_entry = super().log_info(message, file_path)
 
-                i += 1
-                continue
+        # 如果有日志窗口，也可以显示在界面上
+        if hasattr(self, 'log_text'):
+            self.log_text.config(state='normal')
+            self.log_text.insert(tk.END, log_entry + "\n")
+            self.log_text.see(tk.END)
+            self.log_text.config(state='disabled')
 
-            # 添加到当前块
-            current_chunk.append(line)
-            i += 1
+    def create_log_panel(self):
+        """创建日志面板"""
+        log_frame = ttk.LabelFrame(self.root, text="日志")
+        log_frame.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
 
-        # 添加最后一个块
-        if current_chunk:
-            chunks.append(('\n'.join(current_chunk), chunk_start_line, len(lines), current_type))
+        # 创建日志文本框和滚动条
+        self.log_text = scrolledtext.ScrolledText(log_frame, wrap=tk.WORD, height=8)
+        self.log_text.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
+        self.log_text.config(state='disabled')
 
-        # 合并过小的块和注释块
-        merged_chunks = []
-        min_chunk_size = 20  # 减小最小块大小，避免合并太多方法
-        current_merged = None
-        i = 0
+        # 添加清除按钮
+        clear_btn = ttk.Button(log_frame, text="清除日志", command=self.clear_log)
+        clear_btn.pack(side=tk.RIGHT, padx=5, pady=5)
 
-        while i < len(chunks):
-            chunk = chunks[i]
-            code, start, end, chunk_type = chunk
-            code_lines = code.splitlines()
+    def clear_log(self):
+        """清除日志"""
+        self.log_text.config(state='normal')
+        self.log_text.delete(1.0, tk.END)
+        self.log_text.config(state='disabled')
 
-            # 检查是否是注释块或者过小的块
-            is_comment_block = all(
-                line.strip().startswith("//") or line.strip().startswith("/*") or line.strip().startswith(
-                    "*") or not line.strip() for line in code_lines)
-            is_small_block = len(code_lines) < min_chunk_size
+class HeadlessAudit(AuditEngine):
+    """命令行模式：不依赖tkinter，发现的漏洞逐条写入JSON Lines文件"""
 
-            # 如果是注释块或者过小的块，并且不是类定义或方法定义，考虑合并
-            if (is_comment_block or is_small_block) and not chunk_type.startswith(
-                    "类定义") and not chunk_type.startswith("方法"):
-                # 尝试与下一个块合并（如果是方法）
-                if i < len(chunks) - 1:
-                    next_chunk = chunks[i + 1]
-                    next_code, next_start, next_end, next_type = next_chunk
+    def __init__(self, out_path, model=None, config_path=None, verbose=False):
+        super().__init__(config_path, verbose=verbose)
+        if model:
+            self.model = model
+        self.out_path = Path(out_path)
+        self._out_lock = threading.Lock()
+        self._out_file = open(self.out_path, 'w', encoding='utf-8')
+        self.finding_count = 0
 
-                    if next_type.startswith("方法"):
-                        # 将当前注释块合并到下一个方法块
-                        merged_code = code + "\n" + next_code
-                        merged_chunk = (merged_code, start, next_end, next_type)
-                        chunks[i + 1] = merged_chunk
-                        i += 1
-                        continue
+    def set_status(self, text):
+        print(f"[STATUS] {text}", file=sys.stderr)
 
-                # 尝试与上一个合并的块或当前块合并
-                if current_merged is not None:
-                    # 合并小块
-                    merged_code, merged_start, merged_end, merged_type = current_merged
-                    current_merged = (merged_code + "\n" + code, merged_start, end, f"{merged_type}+{chunk_type}")
-                else:
-                    current_merged = chunk
-            else:
-                if current_merged is not None:
-                    merged_chunks.append(current_merged)
-                    current_merged = None
-                merged_chunks.append(chunk)
+    def report_progress(self, count=1):
+        super().report_progress(count)
+        step = max(1, self.progress_total // 20)
+        if self.progress_done % step == 0 or self.progress_done == self.progress_total:
+            print(f"[PROGRESS] {self.progress_done}/{self.progress_total} "
+                  f"并发上限 {self.request_engine.controller.current_limit}", file=sys.stderr)
 
-            i += 1
+    def display_results(self, file_path, vulnerabilities):
+        super().display_results(file_path, vulnerabilities)
+        with self._out_lock:
+            for vuln in vulnerabilities:
+                self._out_file.write(json.dumps(vuln, ensure_ascii=False) + '\n')
+            self._out_file.flush()
+            self.finding_count += len(vulnerabilities)
 
-        if current_merged is not None:
-            merged_chunks.append(current_merged)
+    def collect_files(self, target):
+        """返回目录下所有支持的文件（惰性遍历），target为文件时只分析该文件"""
+        if target.is_file():
+            return [target]
+        return iter_source_files(target, self.supported_langs)
 
-        # 按照起始行号排序分块
-        sorted_chunks = sorted(merged_chunks if merged_chunks else chunks, key=lambda x: x[1])
+    def scan(self, target, diff_base=None, incremental=None, resume=False):
+        """扫描目录或文件，resume为True时继续上次中断的扫描
 
-        # 在这里添加合并单独的结束括号块的代码
-        final_chunks = []
-        i = 0
-        while i < len(sorted_chunks):
-            chunk = sorted_chunks[i]
-            code, start, end, chunk_type = chunk
+        Returns:
+            int: 进程退出码，0表示完成，2表示配置或API认证错误
+        """
+        target = Path(target).resolve()
+        if not target.exists():
+            print(f"[ERROR] 路径不存在: {target}", file=sys.stderr)
+            return 2
+        if not self.api_key:
+            print(f"[ERROR] API密钥未配置，请在 {self.config_path} 中设置API_KEY", file=sys.stderr)
+            return 2
 
-            # 检查是否是单独的结束括号块
-            if code.strip() == "}" and "类内代码" in chunk_type:
-                # 尝试与前一个块合并
-                if i > 0:
-                    prev_chunk = sorted_chunks[i - 1]
-                    prev_code, prev_start, prev_end, prev_type = prev_chunk
+        self.project_path = target if target.is_dir() else target.parent
+        diff_scope = None
+        if diff_base:
+            try:
+                diff_scope = GitDiffScope.collect(self.project_path, diff_base)
+            except RuntimeError as e:
+                print(f"[ERROR] 读取git差异失败: {str(e)}", file=sys.stderr)
+                return 2
+            files = [file_path for file_path in diff_scope.files() if file_path.suffix in self.supported_langs]
+        else:
+            files = self.collect_files(target)
 
-                    # 提取类名
-                    class_name_match = re.search(r'\(([^)]+)\)', chunk_type)
-                    if class_name_match:
-                        class_name = class_name_match.group(1)
+        if not self._validate_api_key(force_validation=True):
+            print("[ERROR] API密钥验证失败，请检查API密钥是否正确", file=sys.stderr)
+            return 2
 
-                        # 如果前一个块是同一个类的一部分，将结束括号合并到前一个块
-                        if class_name in prev_type:
-                            merged_code = prev_code + "\n" + code
-                            merged_chunk = (merged_code, prev_start, end, prev_type)
-                            if final_chunks:  # 确保final_chunks不为空
-                                final_chunks[len(final_chunks) - 1] = merged_chunk
-                            else:
-                                final_chunks.append(merged_chunk)
-                        else:
-                            final_chunks.append(chunk)
-                    else:
-                        final_chunks.append(chunk)
-                else:
-                    final_chunks.append(chunk)
-            else:
-                final_chunks.append(chunk)
+        start_time = time.time()
+        print(f"[INFO] 开始分析，模型: {self.current_model()}", file=sys.stderr)
+        auth_ok = self.run_scan(files, diff_scope, incremental, resume)
+        print(f"[INFO] 分析完成，发现 {self.finding_count} 个漏洞，耗时 {time.time() - start_time:.2f}秒，"
+              f"结果已写入 {self.out_path}", file=sys.stderr)
+        if self.cascade_screened:
+            print(f"[INFO] 级联筛查: 初筛 {self.cascade_screened} 个代码块，{self.cascade_flagged} 个交由 "
+                  f"{self.current_model()} 确认", file=sys.stderr)
+        if self.prefilter_skipped:
+            print(f"[INFO] 本地预筛选({self.prefilter.level}): 跳过 {self.prefilter_skipped} 个代码块", file=sys.stderr)
+        dedup = self._deduplicator
+        if dedup is not None and dedup.total_chunks:
+            print(f"[INFO] 内容去重: 共 {dedup.total_chunks} 个代码块，实际分析 {dedup.unique_chunks} 个，"
+                  f"去重比 {dedup.ratio():.2f}，{dedup.duplicate_files} 个重复文件", file=sys.stderr)
+        return 0 if auth_ok else 2
+
+    def close(self):
+        self._out_file.close()
+        self.shutdown_chunk_pool()
+        self.request_engine.shutdown()
+        self.http_pool.close()
+        if self.response_cache is not None:
+            self.response_cache.close()
+        if self.result_store is not None:
+            self.result_store.close()
+
+
+class MockChatServer:
+    """本地模拟的chat/completions接口，不调用付费API也能测量分析流程的吞吐
+
+    延迟服从对数正态分布（中位数latency_ms，离散程度latency_sigma）；按error_rate返回500，按rate_limit_rate
+    返回带Retry-After的429，按truncate_rate返回finish_reason为length的截断输出。每个代码片段最多返回
+    findings个固定格式的漏洞，行号取片段中调用危险函数的行；级联模式的初筛请求返回每个片段是否可疑。
+    支持流式(SSE)响应和多片段打包请求，API_ENDPOINT指向 http://<host>:<port>/v1/chat/completions 即可使用。
+    """
+
+    RISKY_PATTERN = re.compile(r'exec|eval|system|query|\$_(GET|POST|REQUEST)|getParameter|DOCTYPE|ENTITY',
+                               re.IGNORECASE)
+    SEGMENT_MARKER = re.compile(r'^===== 片段(\d+) \| 文件路径: (.*?) =====$', re.MULTILINE)
+
+    def __init__(self, host='127.0.0.1', port=0, latency_ms=300, latency_sigma=0.5, error_rate=0.0,
+                 rate_limit_rate=0.0, retry_after=1, truncate_rate=0.0, findings=2, seed=None):
+        self.latency_ms = latency_ms
+        self.latency_sigma = latency_sigma
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.retry_after = retry_after
+        self.truncate_rate = truncate_rate
+        self.findings = findings
+        self.request_count = 0
+        self.model_counts = {}
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.httpd = http.server.ThreadingHTTPServer((host, port), self._make_handler())
+        self.httpd.daemon_threads = True
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/v1/chat/completions"
+
+    def start(self):
+        """在后台线程中运行"""
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+        return self
+
+    def serve_forever(self):
+        self.httpd.serve_forever()
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def _draw(self):
+        """抽取本次请求的延迟（秒）和结果：ok/error/rate_limit/truncate"""
+        with self._lock:
+            self.request_count += 1
+            latency = self._random.lognormvariate(math.log(max(self.latency_ms, 1) / 1000), self.latency_sigma)
+            roll = self._random.random()
+        outcome = 'ok'
+        for name, rate in (('error', self.error_rate), ('rate_limit', self.rate_limit_rate),
+                           ('truncate', self.truncate_rate)):
+            if roll < rate:
+                outcome = name
+                break
+            roll -= rate
+        return latency, outcome
+
+    def completion_content(self, prompt, screening=False):
+        """按请求中的代码片段生成模型输出，screening为True时生成初筛结果"""
+        code = prompt.split('代码：\n', 1)[-1]
+        markers = list(self.SEGMENT_MARKER.finditer(code))
+        if markers:
+            parts = [(int(marker.group(1)), marker.group(2),
+                      code[marker.end():markers[k + 1].start() if k + 1 < len(markers) else len(code)])
+                     for k, marker in enumerate(markers)]
+        else:
+            path = prompt.split('\n', 1)[0][len('文件路径: '):] if prompt.startswith('文件路径: ') else ''
+            parts = [(None, path, code)]
+
+        items = []
+        for number, path, part in parts:
+            if '# 行范围' in part:
+                part = part.split('# 行范围', 1)[1].split('\n\n', 1)[-1]
+            risky_lines = [i + 1 for i, line in enumerate(part.split('\n')) if self.RISKY_PATTERN.search(line)]
+            if screening:
+                items.append({"片段": number or 1, "可疑": bool(risky_lines), "行号": risky_lines,
+                              "类型": ["命令执行"] if risky_lines else []})
+                continue
+            for line in risky_lines[:self.findings]:
+                item = {
+                    "文件路径": path,
+                    "行号": [line],
+                    "风险等级": "高危",
+                    "漏洞类型": "命令执行",
+                    "详细描述": "模拟服务返回的漏洞",
+                    "风险点": "",
+                    "Payload": "",
+                    "修复建议": "模拟修复建议"
+                }
+                if number is not None:
+                    item = {"片段": number, **item}
+                items.append(item)
+        return "```json\n" + json.dumps(items, ensure_ascii=False, indent=2) + "\n```"
 
-            i += 1
+    def _make_handler(self):
+        server = self
 
-        # 返回最终合并后的块
-        return final_chunks if final_chunks else sorted_chunks
+        class Handler(http.server.BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
 
-    def check_api_balance(self, api_key=None):
-        """查询API余额
+            def do_POST(self):
+                try:
+                    body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+                except ValueError:
+                    self._send_json(400, {"error": {"message": "invalid json"}})
+                    return
+                latency, outcome = server._draw()
+                if outcome == 'error':
+                    time.sleep(latency)
+                    self._send_json(500, {"error": {"message": "mock server error"}})
+                    return
+                if outcome == 'rate_limit':
+                    self._send_json(429, {"error": {"message": "mock rate limit"}},
+                                    {'Retry-After': str(server.retry_after)})
+                    return
 
-        Args:
-            api_key: 可选的API密钥，如不提供则使用当前配置的密钥
+                messages = body.get('messages') or [{}]
+                with server._lock:
+                    model = body.get('model', '')
+                    server.model_counts[model] = server.model_counts.get(model, 0) + 1
+                content = server.completion_content(messages[-1].get('content', ''),
+                                                    screening='"可疑"' in messages[0].get('content', ''))
+                finish_reason = 'stop'
+                if outcome == 'truncate':
+                    content = content[:len(content) * 3 // 5]
+                    finish_reason = 'length'
+                prompt_tokens = sum(estimate_tokens(message.get('content', '')) for message in messages)
+                completion_tokens = estimate_tokens(content)
+                usage = {
+                    "prompt_tokens": prompt_tokens,
+                    "prompt_cache_hit_tokens": estimate_tokens(messages[0].get('content', '')) if len(messages) > 1 else 0,
+                    "completion_tokens": completion_tokens,
+                    "total_tokens": prompt_tokens + completion_tokens
+                }
+                if body.get('stream'):
+                    self._send_stream(content, finish_reason, usage, latency)
+                    return
+                time.sleep(latency)
+                self._send_json(200, {
+                    "choices": [{"index": 0, "finish_reason": finish_reason,
+                                 "message": {"role": "assistant", "content": content}}],
+                    "usage": usage
+                })
+
+            def _send_json(self, status, payload, headers=None):
+                data = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _send_stream(self, content, finish_reason, usage, latency):
+                # 首个令牌前等待三成延迟，其余延迟均匀分布在各个数据块之间
+                pieces = [content[i:i + 40] for i in range(0, len(content), 40)] or ['']
+                time.sleep(latency * 0.3)
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/event-stream')
+                self.send_header('Connection', 'close')
+                self.end_headers()
+                for piece in pieces:
+                    event = {"choices": [{"index": 0, "delta": {"content": piece}, "finish_reason": None}]}
+                    self.wfile.write(b"data: " + json.dumps(event, ensure_ascii=False).encode('utf-8') + b"\n\n")
+                    self.wfile.flush()
+                    time.sleep(latency * 0.7 / len(pieces))
+                events = [{"choices": [{"index": 0, "delta": {}, "finish_reason": finish_reason}]},
+                          {"choices": [], "usage": usage}]
+                for event in events:
+                    self.wfile.write(b"data: " + json.dumps(event).encode('utf-8') + b"\n\n")
+                self.wfile.write(b"data: [DONE]\n\n")
+                self.wfile.flush()
+                self.close_connection = True
+
+            def log_message(self, format, *args):
+                pass
 
-        Returns:
-            dict: 包含余额信息的字典，如查询失败则包含错误信息
-        """
-        try:
-            # 使用参数提供的API密钥或配置中的密钥
-            key = api_key if api_key else self.api_key
+        return Handler
+
+
+def generate_benchmark_corpus(directory, files_per_language, seed=0):
+    """生成合成的PHP/Java/XML项目，每种语言files_per_language个文件
+
+    Returns:
+        list: 生成的文件路径
+    """
+    rng = random.Random(seed)
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    files = []
+    for n in range(files_per_language):
+        lines = ['<?php', f'class Controller{n} {{']
+        for f in range(rng.randint(3, 30)):
+            lines.append(f'    public function action{f}($request) {{')
+            for j in range(rng.randint(4, 60)):
+                if rng.random() < 0.05:
+                    lines.append(f'        $rows = $db->query("SELECT * FROM t{j} WHERE id=" . $_GET["id"]);')
+                else:
+                    lines.append(f'        $value{j} = strtoupper($request->input("field{j}")); // 处理字段{j}')
+            lines.extend(['        return $value0;', '    }', ''])
+        lines.append('}')
+        files.append(directory / f'Controller{n}.php')
+        files[-1].write_text('\n'.join(lines), encoding='utf-8')
+
+        lines = ['package com.example.bench;', '', f'public class Service{n} {{']
+        for f in range(rng.randint(3, 30)):
+            lines.extend(['    /**', f'     * 业务方法{f}', '     */',
+                          f'    public String handle{f}(HttpServletRequest request) throws Exception {{'])
+            for j in range(rng.randint(4, 60)):
+                if rng.random() < 0.05:
+                    lines.append(f'        Runtime.getRuntime().exec(request.getParameter("cmd{j}"));')
+                else:
+                    lines.append(f'        String value{j} = String.valueOf({j}).trim();')
+            lines.extend(['        return "ok";', '    }', ''])
+        lines.append('}')
+        files.append(directory / f'Service{n}.java')
+        files[-1].write_text('\n'.join(lines), encoding='utf-8')
+
+        lines = ['<?xml version="1.0" encoding="UTF-8"?>', '<project>', '  <dependencies>']
+        for d in range(rng.randint(5, 80)):
+            lines.extend(['    <dependency>', f'      <groupId>org.example.group{d}</groupId>',
+                          f'      <artifactId>artifact{d}</artifactId>', f'      <version>1.{d}.0</version>',
+                          '    </dependency>'])
+        lines.extend(['  </dependencies>', '</project>'])
+        files.append(directory / f'config{n}.xml')
+        files[-1].write_text('\n'.join(lines), encoding='utf-8')
+    return files
+
+
+class BenchmarkAudit(AuditEngine):
+    """吞吐基准测试使用的审计引擎
+
+    不写日志文件、结果数据库和检查点日志，不使用结果缓存和增量清单，统计每个HTTP请求的延迟和响应解析消耗的
+    CPU时间，分块CPU时间（含分块进程池中的时间）由引擎自身统计。
+    """
+
+    def __init__(self, endpoint, config_path=None, verbose=False):
+        super().__init__(config_path, persistent=False, verbose=verbose)
+        self.api_endpoint = endpoint
+        self.api_key = self.api_key or 'benchmark'
+        self.latencies = []
+        self.first_request_at = None
+        self.parsing_cpu = 0.0
+        self.error_count = 0
+        self.finding_count = 0
+        self._metrics_lock = threading.Lock()
+
+    def set_status(self, text):
+        pass
 
-            if not key:
-                return {"status": "error", "message": "未配置API密钥"}
+    def log_info(self, message, file_path=None):
+        return message
 
-            # 设置请求
-            url = "https://api.deepseek.com/user/balance"
-            headers = {
-                "Accept": "application/json",
-                "Authorization": f"Bearer {key}"
-            }
+    def log_error(self, error_msg, file_path=None):
+        with self._metrics_lock:
+            self.error_count += 1
 
-            # 发送请求
-            response = requests.get(url, headers=headers, timeout=10)
+    def display_results(self, file_path, vulnerabilities):
+        with self._metrics_lock:
+            self.finding_count += len(vulnerabilities)
+        return super().display_results(file_path, vulnerabilities)
+
+    async def _post_api_request(self, request_json, file_path, on_line=None):
+        started = time.perf_counter()
+        if self.first_request_at is None:
+            self.first_request_at = started
+        response = await super()._post_api_request(request_json, file_path, on_line)
+        self.latencies.append(time.perf_counter() - started)
+        return response
+
+    def _extract_vulnerability_objects(self, api_response):
+        started = time.thread_time()
+        try:
+            return AuditEngine._extract_vulnerability_objects(api_response)
+        finally:
+            self.parsing_cpu += time.thread_time() - started
 
-            # 处理响应
-            if response.status_code == 200:
+    def _normalize_vulnerability(self, vuln, code_lines, log_invalid=True):
+        started = time.thread_time()
+        try:
+            return super()._normalize_vulnerability(vuln, code_lines, log_invalid)
+        finally:
+            self.parsing_cpu += time.thread_time() - started
+
+    def close(self):
+        self.shutdown_chunk_pool()
+        self.request_engine.shutdown()
+        self.http_pool.close()
+
+
+def _percentile(values, fraction):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def run_benchmark(args):
+    """执行 bench 子命令：对逐渐增大的合成项目运行完整分析流程并输出吞吐指标"""
+    sizes = [int(size) for size in args.sizes.split(',') if size.strip()]
+    server = None
+    endpoint = args.endpoint
+    if not endpoint:
+        server = MockChatServer(latency_ms=args.latency_ms, latency_sigma=args.latency_sigma,
+                                error_rate=args.error_rate, rate_limit_rate=args.rate_limit_rate,
+                                retry_after=args.retry_after, truncate_rate=args.truncate_rate,
+                                findings=args.findings, seed=args.seed).start()
+        endpoint = server.url
+    print(f"[INFO] 基准测试接口: {endpoint}", file=sys.stderr)
+
+    rows = []
+    try:
+        with tempfile.TemporaryDirectory(prefix='deepaudit-bench-') as tmp:
+            for size in sizes:
+                files = generate_benchmark_corpus(Path(tmp) / f'corpus_{size}', size, args.seed)
+                audit = BenchmarkAudit(endpoint, args.config, verbose=args.verbose)
+                audit.project_path = Path(tmp)
+                started = time.perf_counter()
+                cpu_started = time.process_time()
                 try:
-                    data = response.json()
-                    return {"status": "success", "data": data}
-                except:
-                    return {"status": "error", "message": "解析余额数据失败", "raw": response.text}
-            elif response.status_code == 401:
-                return {"status": "error", "message": "API密钥无效或已过期"}
-            else:
-                return {"status": "error", "message": f"服务器返回错误: {response.status_code}", "raw": response.text}
+                    if args.verbose:
+                        audit.run_scan(files, incremental=False)
+                    else:
+                        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+                            audit.run_scan(files, incremental=False)
+                finally:
+                    audit.close()
+                elapsed = time.perf_counter() - started
+                rows.append({
+                    "files": len(files),
+                    "chunks": audit.progress_total,
+                    "requests": len(audit.latencies),
+                    "findings": audit.finding_count,
+                    "errors": audit.error_count,
+                    "seconds": round(elapsed, 3),
+                    "first_request_seconds": round(audit.first_request_at - started, 3)
+                    if audit.first_request_at is not None else None,
+                    "chunks_per_second": round(audit.progress_total / elapsed, 2) if elapsed else 0.0,
+                    "p50_ms": round(_percentile(audit.latencies, 0.5) * 1000, 1),
+                    "p95_ms": round(_percentile(audit.latencies, 0.95) * 1000, 1),
+                    "chunking_cpu_seconds": round(audit.chunking_cpu_seconds, 3),
+                    "parsing_cpu_seconds": round(audit.parsing_cpu, 3),
+                    "process_cpu_seconds": round(time.process_time() - cpu_started, 3),
+                    "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+                    if resource is not None else None
+                })
+                print(f"[INFO] {len(files)} 个文件测试完成", file=sys.stderr)
+    finally:
+        if server is not None:
+            server.stop()
+
+    header = ("文件", "代码块", "请求", "漏洞", "错误", "耗时(s)", "首个请求(s)", "代码块/s", "p50(ms)", "p95(ms)",
+              "分块CPU(s)", "解析CPU(s)", "进程CPU(s)", "峰值RSS(MB)")
+    keys = ("files", "chunks", "requests", "findings", "errors", "seconds", "first_request_seconds", "chunks_per_second", "p50_ms", "p95_ms",
+            "chunking_cpu_seconds", "parsing_cpu_seconds", "process_cpu_seconds", "peak_rss_mb")
+    print('\t'.join(header))
+    for row in rows:
+        print('\t'.join('-' if row[key] is None else str(row[key]) for key in keys))
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(rows, f, ensure_ascii=False, indent=2)
+    return 0
+
+
+def generate_pathological_inputs(scale=1):
+    """生成分块基准测试用的病态输入：超长单行、深层嵌套、大量小方法、长注释和heredoc
+
+    Returns:
+        list: [(名称, 文件扩展名, 代码), ...]
+    """
+    php_unit = 'function f%d($a){$s="{$a}}";if($a){echo \'}\';}else{return [\'k\'=>"{"];}}'
+    java_unit = '"{item%d}", "}%d{", '
+    inputs = [
+        ('压缩后的PHP单行', '.php', '<?php ' + ''.join(php_unit % i for i in range(2000 * scale))),
+        ('生成的Java长行', '.java',
+         'public class Data {\n    static final String[] VALUES = {' +
+         ''.join(java_unit % (i, i) for i in range(10000 * scale)) + '};\n}'),
+        ('深层嵌套', '.java',
+         'public class Deep {\n    public void run(int x) {\n' +
+         ''.join('    ' * 2 + 'if (x > %d) {\n' % i for i in range(500 * scale)) +
+         '        x++;\n' + '        }\n' * (500 * scale) + '    }\n}'),
+        ('大量小方法', '.java',
+         'public class Many {\n' +
+         ''.join('    public int m%d(int a) { return a + %d; }\n\n' % (i, i) for i in range(3000 * scale)) + '}'),
+        ('长注释和heredoc', '.php',
+         '<?php\n/*\n' + ' * { 注释中的大括号 }\n' * (2000 * scale) + ' */\n$t = <<<EOT\n' +
+         '{$a} { } "\n' * (2000 * scale) + 'EOT;\nfunction g() {\n    return 1;\n}\n'),
+    ]
+    return inputs
+
+
+def run_chunking_benchmark(args):
+    """执行 bench-chunking 子命令：测量各类病态输入的分块耗时，不发送任何请求"""
+    engine = AuditEngine(args.config, persistent=False, verbose=False)
+    engine.log_info = lambda message, file_path=None: message
+    engine.log_error = lambda error_msg, file_path=None: None
+    rows = []
+    try:
+        for name, file_ext, code in generate_pathological_inputs(args.scale):
+            best = None
+            for _ in range(max(1, args.repeat)):
+                started = time.perf_counter()
+                with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+                    chunks = engine._smart_code_chunking(code, file_ext)
+                elapsed = time.perf_counter() - started
+                best = elapsed if best is None else min(best, elapsed)
+            size_mb = len(code.encode('utf-8')) / (1024 * 1024)
+            rows.append((name, f"{size_mb * 1024:.0f}", str(len(code.splitlines())), str(len(chunks)),
+                         f"{best * 1000:.1f}", f"{size_mb / best:.2f}" if best else '-'))
+    finally:
+        engine.request_engine.shutdown()
+        engine.http_pool.close()
+
+    print('\t'.join(("输入", "大小(KB)", "行数", "代码块", "耗时(ms)", "MB/s")))
+    for row in rows:
+        print('\t'.join(row))
+    return 0
+
+
+def run_mock_server_command(args):
+    """执行 mock-server 子命令：在前台运行模拟接口直到Ctrl+C"""
+    server = MockChatServer(host=args.host, port=args.port, latency_ms=args.latency_ms,
+                            latency_sigma=args.latency_sigma, error_rate=args.error_rate,
+                            rate_limit_rate=args.rate_limit_rate, retry_after=args.retry_after,
+                            truncate_rate=args.truncate_rate, findings=args.findings, seed=args.seed)
+    print(f"[INFO] 模拟接口已启动，将API_ENDPOINT设置为 {server.url}", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
+    return 0
+
+
+def build_arg_parser():
+    """命令行参数，不带子命令时启动图形界面"""
+    parser = argparse.ArgumentParser(prog='DeepAudit', description='DeepAudit 代码审计工具，不带参数时启动图形界面')
+    subparsers = parser.add_subparsers(dest='command')
+
+    scan_parser = subparsers.add_parser('scan', help='无界面扫描目录或文件，结果写入JSON Lines文件')
+    scan_parser.add_argument('path', help='要扫描的项目目录或文件')
+    scan_parser.add_argument('--out', default='results.jsonl', help='结果文件路径（默认results.jsonl）')
+    scan_parser.add_argument('--model', help='使用的模型（默认读取配置MODEL，否则为deepseek-chat）')
+    scan_parser.add_argument('--config', help='配置文件路径（默认当前目录下的config.ini）')
+    scan_parser.add_argument('--diff-base', help='只分析相对该git版本变更的代码块')
+    scan_parser.add_argument('--full', action='store_true', help='忽略增量扫描清单，分析全部文件')
+    scan_parser.add_argument('--verbose', action='store_true', help='在标准错误输出分块等调试信息')
+    scan_parser.add_argument('--resume', action='store_true', help='继续上次中断的扫描，跳过检查点日志中已完成的代码块')
+    scan_parser.add_argument('--cascade', action='store_true',
+                             help='级联模式：先用SCREEN_MODEL初筛，只有可疑代码块交给--model指定的模型确认')
+
+    results_parser = subparsers.add_parser('results', help='查询结果数据库中保存的漏洞，不带筛选条件时列出最近的扫描')
+    results_parser.add_argument('--scan', type=int, action='append', help='扫描ID，可重复指定')
+    results_parser.add_argument('--file', help='只显示该文件的漏洞')
+    results_parser.add_argument('--severity', help='风险等级，如 高危')
+    results_parser.add_argument('--type', dest='vuln_type', help='漏洞类型，如 SQL注入')
+    results_parser.add_argument('--limit', type=int, help='最多输出的漏洞数')
+    results_parser.add_argument('--out', help='写入JSON Lines文件（默认输出到标准输出）')
+    results_parser.add_argument('--db', default=str(Path('.deepaudit') / 'results.db'),
+                                help='结果数据库路径（默认.deepaudit/results.db）')
+
+    # 模拟接口参数，mock-server和bench共用
+    mock_options = argparse.ArgumentParser(add_help=False)
+    mock_options.add_argument('--latency-ms', type=float, default=300, help='响应延迟中位数（毫秒，默认300）')
+    mock_options.add_argument('--latency-sigma', type=float, default=0.5, help='对数正态延迟分布的离散程度（默认0.5）')
+    mock_options.add_argument('--error-rate', type=float, default=0.0, help='返回500的比例')
+    mock_options.add_argument('--rate-limit-rate', type=float, default=0.0, help='返回429的比例')
+    mock_options.add_argument('--retry-after', type=int, default=1, help='429响应的Retry-After秒数')
+    mock_options.add_argument('--truncate-rate', type=float, default=0.0, help='返回截断输出(finish_reason=length)的比例')
+    mock_options.add_argument('--findings', type=int, default=2, help='每个代码片段最多返回的漏洞数')
+    mock_options.add_argument('--seed', type=int, default=0, help='随机数种子')
+
+    mock_parser = subparsers.add_parser('mock-server', parents=[mock_options],
+                                        help='运行本地模拟的chat/completions接口')
+    mock_parser.add_argument('--host', default='127.0.0.1', help='监听地址（默认127.0.0.1）')
+    mock_parser.add_argument('--port', type=int, default=8765, help='监听端口（默认8765）')
+
+    bench_parser = subparsers.add_parser('bench', parents=[mock_options],
+                                         help='对合成的PHP/Java/XML项目运行吞吐基准测试')
+    bench_parser.add_argument('--sizes', default='20,80,320', help='每种语言的文件数，逗号分隔（默认20,80,320）')
+    bench_parser.add_argument('--endpoint', help='使用已运行的接口，不指定时自动启动模拟接口')
+    bench_parser.add_argument('--config', help='配置文件路径（默认当前目录下的config.ini）')
+    bench_parser.add_argument('--json', help='同时把结果写入该JSON文件')
+    bench_parser.add_argument('--verbose', action='store_true', help='显示分析过程中的调试输出')
+
+    chunking_parser = subparsers.add_parser('bench-chunking', help='测量超长单行、深层嵌套等病态输入的分块耗时')
+    chunking_parser.add_argument('--scale', type=int, default=1, help='输入规模倍数（默认1）')
+    chunking_parser.add_argument('--repeat', type=int, default=3, help='每个输入重复次数，取最快一次（默认3）')
+    chunking_parser.add_argument('--config', help='配置文件路径（默认当前目录下的config.ini）')
+    return parser
+
+
+def run_scan_command(args):
+    """执行 scan 子命令"""
+    audit = HeadlessAudit(args.out, model=args.model, config_path=args.config, verbose=args.verbose)
+    if args.cascade:
+        audit.cascade_mode = True
+    try:
+        return audit.scan(args.path, diff_base=args.diff_base, incremental=False if args.full else None,
+                          resume=args.resume)
+    except KeyboardInterrupt:
+        audit.auto_analysis_cancelled = True
+        print("[INFO] 分析已取消", file=sys.stderr)
+        return 130
+    finally:
+        audit.close()
+
+
+def run_results_command(args):
+    """执行 results 子命令：按扫描、文件、风险等级和漏洞类型查询结果数据库"""
+    if not Path(args.db).is_file():
+        print(f"[ERROR] 结果数据库不存在: {args.db}", file=sys.stderr)
+        return 2
+    store = ResultStore(args.db)
+    try:
+        if not (args.scan or args.file or args.severity or args.vuln_type or args.out):
+            print('\t'.join(['扫描ID', '项目', '模型', '开始时间', '状态', '漏洞数']))
+            for scan_id, project, model, started, finished, status, count in store.scans():
+                started = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(started))
+                print('\t'.join([str(scan_id), project, model, started, status, str(count)]))
+            return 0
+        rows = store.iter_findings(scan_ids=args.scan, file_path=args.file, severity=args.severity,
+                                   vuln_type=args.vuln_type, limit=args.limit)
+        count = 0
+        out = open(args.out, 'w', encoding='utf-8') if args.out else sys.stdout
+        try:
+            for finding_id, file_path, vuln in rows:
+                out.write(json.dumps({"ID": finding_id, **vuln, "文件路径": file_path}, ensure_ascii=False) + "\n")
+                count += 1
+        finally:
+            if args.out:
+                out.close()
+        print(f"[INFO] 共 {count} 个漏洞", file=sys.stderr)
+        return 0
+    finally:
+        store.close()
 
-        except requests.RequestException as e:
-            return {"status": "error", "message": f"网络请求失败: {str(e)}"}
-        except Exception as e:
-            return {"status": "error", "message": f"查询余额时出错: {str(e)}"}
 
+def launch_gui():
+    """启动图形界面"""
+    if tk is None:
+        print("[ERROR] 未安装tkinter，无法启动图形界面，请使用 scan 子命令进行命令行扫描", file=sys.stderr)
+        sys.exit(1)
 
-if __name__ == '__main__':
     # 启用高DPI支持，使UI在高分辨率显示器上更清晰
     try:
         from ctypes import windll
@@ -4511,3 +7526,18 @@ if __name__ == '__main__':
 
     app = CodeAuditApp(root)
     root.mainloop()
+
+
+if __name__ == '__main__':
+    args = build_arg_parser().parse_args()
+    if args.command == 'scan':
+        sys.exit(run_scan_command(args))
+    if args.command == 'results':
+        sys.exit(run_results_command(args))
+    if args.command == 'mock-server':
+        sys.exit(run_mock_server_command(args))
+    if args.command == 'bench':
+        sys.exit(run_benchmark(args))
+    if args.command == 'bench-chunking':
+        sys.exit(run_chunking_benchmark(args))
+    launch_gui()